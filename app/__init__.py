@@ -5,8 +5,20 @@ Este pacote contém toda a lógica da aplicação Email Analyzer,
 incluindo serviços, provedores, utilitários e templates.
 """
 
-from .app import create_app, main
+__all__ = ["create_app", "main"]
 
 __version__ = "1.0.0"
 __author__ = "Isabela Mattos"
 __description__ = "Sistema inteligente de análise e curadoria de emails"
+
+
+def __getattr__(name):
+    """
+    `create_app`/`main` são importados só quando usados: os processos de
+    extração de PDF importam `app.utils` e não devem carregar Flask, Gemini etc.
+    """
+    if name in __all__:
+        from . import app as app_module
+
+        return getattr(app_module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -12,28 +12,48 @@ Para devs iniciantes:
 - Sempre há tratamento de erro para evitar que a aplicação quebre
 """
 
-import io
 import os
+import asyncio
+import atexit
+import threading
+import itertools
 import json
 import logging
 import re
 import hashlib
-from typing import Tuple, Any, List, Optional
+import sqlite3
+import time
+from datetime import datetime, timezone
+import click
+from typing import Tuple, Any, Callable, Iterator, List, Optional
 from functools import wraps
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, current_app, g, request, jsonify, send_from_directory
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_caching import Cache
 from flask_cors import CORS
 from dotenv import load_dotenv
-import PyPDF2
 
 # Imports Locais
 from .config import load_config
 from .providers.gemini_client import GeminiClient
-from .services.email_analyzer import EmailAnalyzerService
+from .providers.gemini_pool import GeminiClientPool
+from .providers.resilience import STATE_CLOSED, AdaptiveConcurrencyLimiter, CircuitBreaker, deadline_scope
+from .services.email_analyzer import BATCH_SYSTEM_INSTRUCTION, SYSTEM_INSTRUCTION, EmailAnalyzerService
+from .services.analysis_store import AnalysisStore
+from .services.cache_warmup import WarmupReport, iter_snapshot, recent_entries, warm_cache, write_snapshot
+from .services.job_manager import JobManager, create_job_store
+from .services.single_flight import SingleFlight
+from .services.near_duplicate import NearDuplicateIndex
+from .services.pre_classifier import LABEL_GEMINI, PreClassifier, iter_training_samples, local_analysis, split_holdout
 from .utils.text_preprocess import basic_preprocess
-from .utils.email_sender import EmailSender
+from .utils.concurrency import map_bounded
+from .utils.pdf_extractor import PdfExtractor, PdfExtractionError
+from .utils.email_stream import iter_emails_from_stream, stream_size
+from .utils.mail_parser import EmailRecord, iter_mbox, parse_eml
+from .utils.email_scanner import prepare_text, scan_emails, truncation_point
+from .utils.smart_truncate import DEFAULT_TOKEN_BUDGET
+from .utils import metrics
 
 # Configuração de logging
 logging.basicConfig(
@@ -42,39 +62,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Sistema de Jobs Assíncronos removido - usando processamento síncrono
-
-# Regex compiladas para melhor performance
-EMAIL_PATTERN = re.compile(
-    r'From:\s*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})',
-    re.IGNORECASE
-)
-EMAIL_SEPARATOR_PATTERN = re.compile(
-    r'\n\n(?:From:\s+[^\n]+@[^\n]+\.[^\n]+|De:\s+[^\n]+@[^\n]+\.[^\n]+|Message-ID:\s+<[^>]+>|---)',
-    re.IGNORECASE
-)
+# Arquivos lidos em streaming (sem carregar tudo na memória)
+STREAMED_EXTENSIONS = (".txt", ".eml", ".mbox")
 
+# Limites por rota (também aplicados pelo modo ASGI, ver app/asgi.py)
+WEBHOOK_RATE_LIMIT = "30 per minute"
+ANALYZE_RATE_LIMIT = "20 per minute"
 
-def extract_text_from_pdf_safe(file_stream, max_chars: int = 1000) -> str:
-    """Extrai texto do PDF de forma ultra rápida."""
-    try:
-        pdf = PyPDF2.PdfReader(file_stream)
-        texto = ""
-        
-        # Processa apenas as primeiras 3 páginas
-        for i, pagina in enumerate(pdf.pages[:3]):
-            if len(texto) > max_chars:
-                break
-            page_text = pagina.extract_text() or ""
-            texto += page_text
-            
-        return re.sub(r'\s+', ' ', texto[:max_chars]).strip()
-    except:
-        return ""
+# Namespace das chaves de análise (v1 usava `analysis:<8 hex>` de parte do email)
+CACHE_NAMESPACE = "analysis:v2"
+LEGACY_CACHE_KEY_PATTERN = re.compile(r'analysis:[0-9a-f]{8}$')
 
 
-def read_text_from_upload(max_file_size_mb: int = 5) -> Tuple[str, str]:
-    """Lê conteúdo de .txt ou .pdf de forma rápida."""
+def read_text_from_upload(max_file_size_mb: int = 5, pdf_extractor: Optional[PdfExtractor] = None) -> Tuple[str, str]:
+    """
+    Lê conteúdo de .txt ou .pdf de forma rápida.
+    PDFs são extraídos fora da thread da requisição (pool de processos).
+    """
     # Texto do formulário
     if request.form.get("email_text"):
         return request.form["email_text"], "text"
@@ -104,89 +108,216 @@ def read_text_from_upload(max_file_size_mb: int = 5) -> Tuple[str, str]:
         except:
             return "", "txt_error"
     elif filename.endswith(".pdf"):
+        if pdf_extractor is None:
+            pdf_extractor = PdfExtractor()
         try:
-            with io.BytesIO(file_data) as buf:
-                texto = extract_text_from_pdf_safe(buf)
-            return texto, "pdf"
-        except:
+            with metrics.time_stage("pdf_extract"):
+                return pdf_extractor.extract(file_data), "pdf"
+        except PdfExtractionError as e:
+            logger.warning(f"Falha ao extrair PDF {file.filename}: {e}")
             return "", "pdf_error"
     else:
         return "", "unsupported"
 
 
-def extract_sender_from_email(email_content: str) -> str:
-    """Extrai o email do remetente do conteúdo do email."""
-    match = EMAIL_PATTERN.search(email_content)
-    if match:
-        return match.group(1).strip()
-    return ""
+def read_emails_from_upload(max_file_size_mb: int = 5, pdf_extractor: Optional[PdfExtractor] = None,
+                            token_budget: int = DEFAULT_TOKEN_BUDGET) -> Tuple[Iterator[EmailRecord], str]:
+    """
+    Lê a requisição e devolve um iterador de emails (EmailRecord) + a origem.
+    
+    - .txt: dividido em streaming, direto do arquivo temporário do upload
+    - .eml/.mbox: lidos com o parser de email da stdlib (cabeçalhos reais)
+    A memória usada não cresce com o tamanho do arquivo.
+    """
+    file = request.files.get("email_file")
+    has_inline_text = request.form.get("email_text") or request.is_json
+    
+    if not has_inline_text and file and file.filename.lower().endswith(STREAMED_EXTENSIONS):
+        if stream_size(file.stream) > max_file_size_mb * 1024 * 1024:
+            return iter(()), "file_too_large"
+        
+        filename = file.filename.lower()
+        if filename.endswith(".eml"):
+            return iter([parse_eml(file.stream)]), "eml"
+        if filename.endswith(".mbox"):
+            return iter_mbox(file.stream), "mbox"
+        texts = iter_emails_from_stream(file.stream)
+        return (EmailRecord.from_text(text) for text in texts), "txt"
+    
+    raw_text, origin = read_text_from_upload(max_file_size_mb, pdf_extractor)
+    if not raw_text:
+        return iter(()), origin
+    with metrics.time_stage("split"):
+        scanned_emails = scan_emails(raw_text, token_budget)
+    return (scanned.to_record() for scanned in scanned_emails), origin
 
 
 def split_multiple_emails(content: str) -> List[str]:
     """
     Divide um arquivo com múltiplos emails em uma lista de emails individuais.
-    Usa separadores como ---, === ou múltiplos From:
+    Usa separadores como ---, === ou múltiplos From: (ver `scan_emails`)
     """
-    # Tenta dividir por separadores explícitos primeiro (---, ===)
-    separator_pattern = re.compile(r'\n[-=]{3,}\n', re.MULTILINE)
-    parts = separator_pattern.split(content)
-    
-    # Se encontrou separadores, processa as partes
-    if len(parts) > 1:
-        emails: List[str] = []
-        for part in parts:
-            cleaned = part.strip()
-            if cleaned and len(cleaned) > 50:  # Ignora fragmentos muito pequenos
-                emails.append(cleaned)
-        return emails if emails else [content.strip()]
-    
-    # Se não encontrou separadores, verifica se há múltiplos "From:"
-    from_pattern = re.compile(r'^From:\s', re.MULTILINE | re.IGNORECASE)
-    from_matches = list(from_pattern.finditer(content))
-    
-    # Se encontrou múltiplos "From:", divide por eles
-    if len(from_matches) > 1:
-        emails: List[str] = []
-        for i, match in enumerate(from_matches):
-            start = match.start()
-            end = from_matches[i + 1].start() if i + 1 < len(from_matches) else len(content)
-            email_part = content[start:end].strip()
-            if email_part and len(email_part) > 50:
-                emails.append(email_part)
-        return emails if emails else [content.strip()]
-    
-    # Caso contrário, retorna o conteúdo completo como um único email
-    return [content.strip()]
+    return [scanned.text for scanned in scan_emails(content)]
 
 
 def truncate_text_for_gemini(text: str, max_chars: int = 1000) -> str:
-    """Trunca texto para Gemini de forma rápida."""
-    if len(text) <= max_chars:
-        return text
-    
-    truncated = text[:max_chars]
-    last_period = truncated.rfind('.')
-    if last_period > max_chars * 0.8:
-        truncated = truncated[:last_period + 1]
+    """Corte simples por caracteres (o pipeline usa `prepare_for_gemini`, com orçamento de tokens)."""
+    return text[:truncation_point(text, max_chars)]
+
+
+def prepare_for_gemini(email_content: str, token_budget: int = DEFAULT_TOKEN_BUDGET) -> str:
+    """Trunca (orçamento de tokens) e pré-processa o email no formato enviado ao Gemini."""
+    return prepare_text(email_content, token_budget)
+
+
+def gemini_input_for(record: EmailRecord, token_budget: int = DEFAULT_TOKEN_BUDGET) -> str:
+    """Texto para o Gemini, reaproveitando o que o scanner já calculou."""
+    return record.gemini_input or prepare_for_gemini(record.content, token_budget)
+
+
+def build_cache_version(model_name: str, prompt_version: str) -> str:
+    """
+    Carimbo de versão das análises em cache: muda sempre que o modelo
+    (GEMINI_MODEL) ou o template do prompt mudam, invalidando o cache antigo.
+    """
+    stamp = f"{model_name}|{prompt_version}"
+    return hashlib.sha256(stamp.encode('utf-8')).hexdigest()[:12]
+
+
+def get_cache_key(gemini_input: str, cache_version: str) -> str:
+    """
+    Gera a chave de cache a partir do texto COMPLETO enviado ao Gemini.
     
-    return truncated
+    - SHA-256 inteiro (64 hex): sem colisões práticas entre emails diferentes
+    - `cache_version`: separa entradas de modelos/prompts diferentes
+    - Namespace `analysis:v2`: chaves antigas (`analysis:<8 hex>`) nunca são lidas
+    """
+    content_hash = hashlib.sha256(gemini_input.encode('utf-8')).hexdigest()
+    return cache_key_prefix(cache_version) + content_hash
+
+
+def cache_key_prefix(cache_version: str) -> str:
+    """Início comum das chaves de análise de uma versão (modelo + prompt)."""
+    return f"{CACHE_NAMESPACE}:{cache_version}:"
+
+
+def purge_legacy_cache_keys(redis_client, key_prefix: str = "flask_cache_") -> int:
+    """
+    Apaga do Redis as chaves de análise no formato antigo (`analysis:<8 hex>`).
+    Elas já não são lidas (namespace v2), isto apenas libera memória antes do TTL.
+    """
+    removed = 0
+    for key in redis_client.scan_iter(match=f"{key_prefix}analysis:*", count=500):
+        name = key.decode() if isinstance(key, bytes) else key
+        if LEGACY_CACHE_KEY_PATTERN.fullmatch(name[len(key_prefix):]):
+            removed += redis_client.delete(key)
+    return removed
+
+
+def build_result_data(result: dict, record: EmailRecord) -> dict:
+    """Monta a resposta padronizada da API a partir do JSON retornado pelo Gemini."""
+    categoria = result.get("categoria", "N/A")
+    atencao = result.get("atencao_humana", "NÃO")
+    resumo = result.get("resumo", "N/A")
+    sugestao = result.get("sugestao_resposta_ou_acao", "N/A")
+    acao_modelo = str(result.get("acao", "")).upper()  # RESPOSTA_AUTOMATICA ou ENCAMINHAR_CURADORIA
+
+    if atencao.upper() == "SIM" or acao_modelo == "ENCAMINHAR_CURADORIA":
+        acao = "📧 Encaminhar para curadoria humana"
+    elif categoria.lower() == "spam":
+        acao = "🚫 Spam detectado"
+    else:
+        acao = "✅ Processado com sucesso"
+
+    return {
+        "categoria": categoria,
+        "atencao_humana": atencao,
+        "resumo": resumo,
+        "sugestao": sugestao,
+        "acao": acao,
+        "acao_modelo": acao_modelo,  # Decide os envios em background (ver outbound_dispatcher)
+        **build_record_fields(record),
+        "cached": False
+    }
+
+
+# Texto no lugar do resumo/sugestão de uma análise reaproveitada de outro email
+NEAR_DUPLICATE_SUMMARY = "Análise reaproveitada de um email quase idêntico (classificação sem resumo próprio)"
+NEAR_DUPLICATE_SUGGESTION = "Mesma classificação do email original; consulte o conteúdo deste email antes de responder"
+
+
+def build_near_duplicate_fields(original_result: dict, record: EmailRecord) -> dict:
+    """
+    Resposta para um email quase idêntico a outro já analisado.
+    Só a classificação é reaproveitada: o resumo e a sugestão do original citam
+    o remetente e os detalhes DELE (mostrá-los aqui vazaria dados de outro cliente).
+    """
+    result_data = {field: original_result[field] for field in ("categoria", "atencao_humana", "acao", "acao_modelo")
+                   if field in original_result}
+    result_data.update({
+        "resumo": NEAR_DUPLICATE_SUMMARY,
+        "sugestao": NEAR_DUPLICATE_SUGGESTION,
+        **build_record_fields(record),
+    })
+    return result_data
+
+
+def build_record_fields(record: EmailRecord) -> dict:
+    """Campos da resposta que vêm dos cabeçalhos do email (lidos uma única vez)."""
+    fields = {"sender": record.sender or 'Não identificado'}
+    if record.message_id:
+        fields["message_id"] = record.message_id
+    return fields
+
+
+def is_reusable_analysis(result_data: dict) -> bool:
+    """Análises de fallback (falha do Gemini/JSON) não devem ser reaproveitadas."""
+    if result_data.get("categoria") in ("Erro", "❌ ERRO"):
+        return False
+    return not str(result_data.get("resumo", "")).startswith("Erro ao")
 
 
-def get_cache_key(email_content: str) -> str:
-    """Gera chave de cache rápida."""
-    content_sample = email_content[:500] if len(email_content) > 500 else email_content
-    content_hash = hashlib.sha256(content_sample.encode('utf-8')).hexdigest()
-    return f"analysis:{content_hash[:8]}"
+def build_error_result(error: Exception) -> dict:
+    """Resposta padrão quando a análise de um email falha (o lote continua)."""
+    return {
+        "categoria": "❌ ERRO",
+        "atencao_humana": "SIM",
+        "resumo": f"Falha na análise: {str(error)}",
+        "sugestao": "Verifique o conteúdo e tente novamente",
+        "sender": "Não identificado",
+        "acao": "⚠️ Erro no processamento",
+        "cached": False
+    }
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[float]:
+    """Data ISO 8601 (ex.: 2025-01-06 ou 2025-01-06T12:00:00+00:00) -> timestamp Unix (sem fuso = UTC)."""
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Data inválida: {value!r} (use ISO 8601, ex.: 2025-01-06T12:00:00)")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
 
 
-# Função de processamento assíncrono removida - usando processamento síncrono
+def is_async_request() -> bool:
+    """Verifica se o cliente pediu processamento assíncrono (async=true)."""
+    value = request.args.get("async") or request.form.get("async")
+    if value is None and request.is_json:
+        data = request.get_json(silent=True) or {}
+        value = data.get("async")
+    return str(value).lower() in ("1", "true", "sim", "yes")
 
 
 def require_api_key(f):
     """Decorator para validar API key quando necessário."""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        config = getattr(decorated_function, '_config', None)
+        # Config do app que está atendendo a requisição (cada create_app tem a sua)
+        config = current_app.extensions.get("mailmind", {}).get("config")
         
         if not config or not config.api_key_required:
             return f(*args, **kwargs)
@@ -229,7 +360,8 @@ def create_app() -> Flask:
     # Configuração de Cache
     cache_config = {
         'CACHE_TYPE': config.cache_type,
-        'CACHE_DEFAULT_TIMEOUT': config.cache_default_timeout
+        'CACHE_DEFAULT_TIMEOUT': config.cache_default_timeout,
+        'CACHE_THRESHOLD': config.cache_threshold
     }
     
     if config.redis_url:
@@ -268,13 +400,140 @@ def create_app() -> Flask:
         except ImportError:
             logger.warning("sentry-sdk não instalado, monitoramento desabilitado")
     
-    # 1. Configuração do Gemini Client
-    client = GeminiClient(
+    # 1. Configuração do Gemini Client (um pool quando há várias chaves ou modelos)
+    gemini_options = dict(
         api_key=config.gemini_api_key, 
         model_name=config.model_name,
-        timeout=config.gemini_timeout
+        timeout=config.gemini_timeout,
+        endpoint=config.gemini_endpoint,
+        system_instruction=SYSTEM_INSTRUCTION if config.gemini_system_instruction else None,
+        batch_system_instruction=BATCH_SYSTEM_INSTRUCTION if config.gemini_system_instruction else None,
+        breaker=CircuitBreaker(config.circuit_failure_threshold, config.circuit_recovery_seconds)
     )
-    service = EmailAnalyzerService(client=client)
+    if config.adaptive_concurrency_enabled:
+        gemini_options["limiter"] = AdaptiveConcurrencyLimiter(
+            initial_limit=config.gemini_concurrency_initial,
+            min_limit=config.gemini_concurrency_min,
+            max_limit=config.gemini_concurrency_max,
+            queue_timeout=config.gemini_queue_timeout
+        )
+        metrics.set_gemini_concurrency_limit(gemini_options["limiter"].limit)
+    if len(config.gemini_api_keys) > 1 or len(config.gemini_models) > 1:
+        client = GeminiClientPool(
+            api_keys=config.gemini_api_keys,
+            model_names=config.gemini_models,
+            rpm_limit=config.gemini_key_rpm,
+            tpm_limit=config.gemini_key_tpm,
+            cooldown_seconds=config.gemini_key_cooldown_seconds,
+            **gemini_options
+        )
+    else:
+        if config.gemini_models:
+            gemini_options["model_name"] = config.gemini_models[0]
+        client = GeminiClient(**gemini_options)
+    if not config.lazy_startup:
+        client.preload()  # Paga o import do SDK agora, não na primeira análise
+    service = EmailAnalyzerService(client=client, use_system_instruction=config.gemini_system_instruction)
+    
+    # Single-flight: coalesce análises idênticas em andamento (entre workers via Redis)
+    shared_cache = bool(config.redis_url) and config.cache_type.startswith("Redis")
+    single_flight = SingleFlight(
+        redis_url=config.redis_url if shared_cache else None,
+        lease_seconds=config.single_flight_lease_seconds
+    )
+    
+    # Histórico persistente (SQLite): consultado antes do Gemini e em /api/analyses
+    analysis_store = None
+    if config.analysis_store_path:
+        try:
+            analysis_store = AnalysisStore(
+                config.analysis_store_path,
+                batch_size=config.analysis_store_batch_size,
+                queue_size=config.analysis_store_queue_size
+            )
+            atexit.register(analysis_store.close)  # Grava o que ainda está na fila
+        except sqlite3.Error as e:
+            logger.warning(f"Falha ao abrir o histórico {config.analysis_store_path}: {e}. Histórico desativado")
+    
+    # Pré-classificador local: spam/notificações óbvias não vão ao Gemini
+    pre_classifier = None
+    if config.pre_classifier_model_path:
+        try:
+            pre_classifier = PreClassifier.load(config.pre_classifier_model_path, config.pre_classifier_threshold)
+            logger.info(f"Pré-classificador carregado de {config.pre_classifier_model_path} "
+                        f"(limiar={pre_classifier.threshold}, calibração={pre_classifier.calibration})")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Falha ao carregar o pré-classificador: {e}. Todos os emails vão ao Gemini")
+    
+    # Extração de PDF em processos isolados (limites de tempo, memória e caracteres)
+    pdf_extractor = PdfExtractor(
+        max_chars=config.max_pdf_chars,
+        max_pages=config.pdf_max_pages,
+        timeout=config.pdf_timeout,
+        max_memory_mb=config.pdf_max_memory_mb,
+        max_workers=config.pdf_workers
+    )
+    
+    # Versão das análises em cache (modelo + template do prompt)
+    cache_version = build_cache_version(",".join(sorted(config.gemini_models)) or config.model_name,
+                                        service.prompt_version())
+    logger.info(f"Versão do cache de análises: {CACHE_NAMESPACE}:{cache_version}")
+    
+    # Índice de quase-duplicatas (emails de template reaproveitam a análise da mesma versão)
+    near_duplicates = None
+    if config.near_duplicate_enabled:
+        near_duplicates = NearDuplicateIndex(
+            threshold=config.near_duplicate_threshold,
+            max_entries=config.near_duplicate_max_entries,
+            db_path=config.near_duplicate_db_path,
+            cache_version=cache_version
+        )
+    
+    # Aquecimento do cache em memória: instância nova do Cloud Run começa vazia
+    # (o cache no Redis já é compartilhado entre as instâncias e não precisa)
+    cache_warmup: Optional[WarmupReport] = None
+    if config.cache_warmup_entries and not shared_cache:
+        if config.cache_warmup_snapshot and os.path.exists(config.cache_warmup_snapshot):
+            cache_warmup = WarmupReport(source="snapshot")
+        elif config.cache_warmup_snapshot:
+            logger.warning(f"Snapshot do cache {config.cache_warmup_snapshot} não encontrado")
+        if cache_warmup is None and analysis_store is not None:
+            cache_warmup = WarmupReport(source="analysis_store")
+    
+    def iter_recent_analyses() -> Iterator[Tuple[str, str]]:
+        """(chave do cache, resultado em JSON) do histórico, das análises mais novas para as mais antigas."""
+        prefix = cache_key_prefix(cache_version)
+        return recent_entries(analysis_store.iter_recent(cache_version), lambda content_hash: prefix + content_hash)
+    
+    def run_cache_warmup() -> None:
+        """Carrega as análises recentes no cache, dentro dos limites de entradas, tempo e memória."""
+        if cache_warmup.source == "snapshot":
+            entries = iter_snapshot(config.cache_warmup_snapshot, cache_key_prefix(cache_version))
+        else:
+            entries = iter_recent_analyses()
+        try:
+            with app.app_context():
+                warm_cache(
+                    lambda chunk: cache.set_many(chunk, timeout=config.cache_default_timeout),
+                    entries,
+                    cache_warmup,
+                    # Acima do limite do SimpleCache, as primeiras entradas seriam descartadas
+                    max_entries=min(config.cache_warmup_entries, config.cache_threshold),
+                    max_seconds=config.cache_warmup_seconds,
+                    max_bytes=config.cache_warmup_max_mb * 1024 * 1024
+                )
+            metrics.record_cache_warmup(cache_warmup.source, cache_warmup.loaded, cache_warmup.seconds)
+            logger.info(f"Cache aquecido com {cache_warmup.loaded} análise(s) de {cache_warmup.source} "
+                        f"em {cache_warmup.seconds:.2f}s")
+        except Exception as e:
+            cache_warmup.status = "failed"
+            logger.warning(f"Falha no aquecimento do cache ({cache_warmup.source}): {e}")
+    
+    if cache_warmup is not None:
+        if config.cache_warmup_background:
+            threading.Thread(target=run_cache_warmup, name="cache-warmup", daemon=True).start()
+        else:
+            run_cache_warmup()
     
     # 2. Configuração do Mailer (SMTP)
     smtp_enabled = os.getenv("SMTP_ENABLED", "true").lower() == "true"
@@ -282,13 +541,19 @@ def create_app() -> Flask:
     
     if smtp_enabled and config.smtp_host:
         try:
+            from .utils.email_sender import EmailSender  # smtplib/ssl só com SMTP configurado
+
             mailer = EmailSender(
                 host=config.smtp_host,
                 port=config.smtp_port,
                 username=config.smtp_user,
                 password=config.smtp_password,
                 default_from=config.noreply_address,
-                timeout=config.smtp_timeout
+                timeout=config.smtp_timeout,
+                pool_size=config.smtp_pool_size,
+                max_messages_per_connection=config.smtp_max_messages_per_connection,
+                idle_timeout=config.smtp_idle_timeout,
+                starttls=config.smtp_starttls
             )
             logger.info("SMTP configurado com sucesso")
         except Exception as e:
@@ -298,8 +563,367 @@ def create_app() -> Flask:
     if mailer is None:
         logger.info("SMTP não configurado - modo simulação ativado")
     
-    # Armazena config no decorator
-    require_api_key._config = config
+    # Envios depois da análise (resumo do curador, respostas automáticas) em background
+    outbound = None
+    if mailer is not None and (config.curator_address or config.auto_reply_enabled):
+        from .services.outbound_dispatcher import OutboundDispatcher
+
+        outbound = OutboundDispatcher(
+            mailer,
+            config.curator_address,
+            auto_reply=config.auto_reply_enabled,
+            reply_from=config.noreply_address or None,
+            workers=config.outbound_workers,
+            digest_seconds=config.outbound_digest_seconds,
+            digest_max=config.outbound_digest_max,
+            max_attempts=config.outbound_max_attempts,
+            retry_seconds=config.outbound_retry_seconds,
+            queue_size=config.outbound_queue_size
+        )
+        atexit.register(outbound.close)  # Encerramento do worker: manda o resumo pendente
+        logger.info(f"Envios em background: curador={config.curator_address or 'nenhum'}, "
+                    f"resposta automática={'sim' if config.auto_reply_enabled else 'não'}")
+    
+    # --- Pipeline de análise ---
+    
+    def answer_without_gemini(record: EmailRecord) -> Tuple[str, str, Optional[dict]]:
+        """
+        Etapas locais, antes do Gemini: cache exato -> quase-duplicata -> pré-classificador.
+        Devolve (texto para o Gemini, chave de cache, resultado ou None).
+        """
+        # Chave = texto exato que iria ao Gemini
+        gemini_input = gemini_input_for(record, config.gemini_token_budget)
+        cache_key = get_cache_key(gemini_input, cache_version)
+        with metrics.time_stage("cache_lookup"):
+            cached_result = cache.get(cache_key)
+        
+        if cached_result:
+            metrics.count_cache("hit")
+            return gemini_input, cache_key, cached_response(cached_result, record)
+        
+        stored = find_stored(cache_key, record)
+        if stored:
+            return gemini_input, cache_key, stored
+        
+        near_duplicate = find_near_duplicate(cache_key, gemini_input, record)
+        if near_duplicate:
+            return gemini_input, cache_key, near_duplicate
+        metrics.count_cache("miss")
+        
+        return gemini_input, cache_key, pre_classify(cache_key, gemini_input, record)
+    
+    def store_analysis(cache_key: str, gemini_input: str, record: EmailRecord, analysis: dict) -> dict:
+        """Resposta padronizada de uma análise nova do Gemini (guardada no cache, no índice e no histórico)."""
+        result_data = build_result_data(analysis, record)
+        reusable = is_reusable_analysis(result_data)
+        if reusable:
+            cache.set(cache_key, result_data, timeout=config.cache_default_timeout)
+        remember_analysis(cache_key, gemini_input, result_data)
+        record_history(cache_key, result_data, reusable)
+        return result_data
+    
+    def process_email(record: EmailRecord) -> dict:
+        """
+        Analisa um único email: cache -> Gemini -> resposta padronizada.
+        Erros ficam isolados neste email (o lote continua processando).
+        """
+        try:
+            gemini_input, cache_key, result_data = answer_without_gemini(record)
+            if result_data:
+                return result_data
+            
+            def compute() -> dict:
+                return store_analysis(cache_key, gemini_input, record, service.analyze(gemini_input))
+            
+            # Emails idênticos em paralelo compartilham uma única chamada ao Gemini
+            result_data, coalesced = single_flight.do(cache_key, compute, lambda: cache.get(cache_key))
+            if coalesced:
+                metrics.count_cache("coalesced")
+                result_data = cached_response(result_data, record)
+                result_data.update({'cached': False, 'coalesced': True})
+            return result_data
+            
+        except Exception as e:
+            logger.error(f"Erro ao processar email: {e}")
+            return build_error_result(e)
+    
+    async def process_email_async(record: EmailRecord, gemini_slots: Optional[asyncio.Semaphore] = None) -> dict:
+        """
+        Versão assíncrona de `process_email` (modo ASGI, ver app/asgi.py).
+        Enquanto espera o Gemini, o event loop atende outras requisições.
+        Cache, índice de quase-duplicatas e Redis são síncronos: rodam em threads.
+        `gemini_slots` limita as chamadas simultâneas ao Gemini.
+        """
+        try:
+            gemini_input, cache_key, result_data = await asyncio.to_thread(answer_without_gemini, record)
+            if result_data:
+                return result_data
+            
+            async def compute() -> dict:
+                if gemini_slots is None:
+                    analysis = await service.analyze_async(gemini_input)
+                else:
+                    async with gemini_slots:
+                        analysis = await service.analyze_async(gemini_input)
+                return await asyncio.to_thread(store_analysis, cache_key, gemini_input, record, analysis)
+            
+            # Mesmo single-flight do caminho síncrono (inclusive o lease no Redis entre workers)
+            result_data, coalesced = await single_flight.do_async(cache_key, compute, lambda: cache.get(cache_key))
+            if coalesced:
+                metrics.count_cache("coalesced")
+                result_data = cached_response(result_data, record)
+                result_data.update({'cached': False, 'coalesced': True})
+            return result_data
+            
+        except Exception as e:
+            logger.error(f"Erro ao processar email: {e}")
+            return build_error_result(e)
+    
+    def cached_response(cached_result: dict, record: EmailRecord) -> dict:
+        """Resposta a partir do cache (remetente e Message-ID vêm sempre do email atual)."""
+        result_data = cached_result.copy()
+        result_data.pop('message_id', None)
+        result_data.update(build_record_fields(record))
+        result_data['cached'] = True
+        return result_data
+    
+    def find_stored(cache_key: str, record: EmailRecord) -> Optional[dict]:
+        """
+        Análise do mesmo texto no histórico (o cache expirou ou o processo
+        reiniciou): responde sem Gemini e devolve a análise ao cache.
+        """
+        if analysis_store is None:
+            return None
+        with metrics.time_stage("store_lookup"):
+            stored = analysis_store.find(cache_key)
+        if stored is None:
+            return None
+        metrics.count_cache("store_hit")
+        cache.set(cache_key, stored, timeout=config.cache_default_timeout)
+        return cached_response(stored, record)
+    
+    def record_history(cache_key: str, result_data: dict, reusable: bool = False) -> None:
+        """Enfileira a análise no histórico (gravação em background, em lotes)."""
+        if analysis_store is not None:
+            analysis_store.add(cache_key, result_data, reusable)
+    
+    def find_near_duplicate(cache_key: str, gemini_input: str, record: EmailRecord) -> Optional[dict]:
+        """
+        Procura a análise de um email quase idêntico já visto. Se achar, reusa
+        só a classificação (sem Gemini) marcando `near_duplicate_of` para auditoria.
+        """
+        if near_duplicates is None:
+            return None
+        with metrics.time_stage("near_duplicate_lookup"):
+            fingerprint = near_duplicates.fingerprint(basic_preprocess(gemini_input))
+            match = near_duplicates.find(fingerprint) if fingerprint is not None else None
+        if match is None:
+            return None
+        metrics.count_cache("near_duplicate")
+        
+        original_key, original_result, score = match
+        result_data = build_near_duplicate_fields(original_result, record)
+        result_data.update({
+            'cached': False,
+            'near_duplicate_of': original_key,
+            'similarity': round(score, 3)
+        })
+        cache.set(cache_key, result_data, timeout=config.cache_default_timeout)
+        record_history(cache_key, result_data)
+        return result_data
+    
+    def pre_classify(cache_key: str, gemini_input: str, record: EmailRecord) -> Optional[dict]:
+        """
+        Resolve localmente spam/notificações quando o classificador tem confiança
+        suficiente. A resposta vem marcada com `classified_by` e `confidence`.
+        Não vai para o cache nem para o índice de quase-duplicatas (só para o histórico).
+        """
+        if pre_classifier is None:
+            return None
+        with metrics.time_stage("pre_classify"):
+            decision = pre_classifier.decide(basic_preprocess(gemini_input))
+        if decision is None:
+            metrics.count_pre_classifier(LABEL_GEMINI)
+            return None
+        
+        label, confidence = decision
+        metrics.count_pre_classifier(label)
+        result_data = build_result_data(local_analysis(label, confidence), record)
+        result_data.update({'classified_by': 'pre_classifier', 'confidence': round(confidence, 4)})
+        record_history(cache_key, result_data)
+        return result_data
+    
+    def remember_analysis(cache_key: str, gemini_input: str, result_data: dict) -> None:
+        """Registra uma análise nova do Gemini no índice de quase-duplicatas."""
+        if near_duplicates is None or not is_reusable_analysis(result_data):
+            return
+        fingerprint = near_duplicates.fingerprint(basic_preprocess(gemini_input))
+        if fingerprint is not None:
+            near_duplicates.add(cache_key, fingerprint, result_data)
+    
+    def analyze_pack(pack: List[Tuple[str, EmailRecord, str]]) -> List[dict]:
+        """
+        Analisa um pacote de emails (cache_key, EmailRecord, texto p/ Gemini) com
+        uma única chamada ao Gemini. Roda em threads do lote, por isso abre o
+        app context.
+        """
+        with app.app_context():
+            try:
+                analyses = service.analyze_batch([gemini_input for _, _, gemini_input in pack])
+            except Exception as e:
+                # Falha inesperada do pacote: cada email tenta sozinho (erros isolados)
+                logger.error(f"Erro ao processar pacote de emails: {e}")
+                return [process_email(record) for _, record, _ in pack]
+            
+            results = []
+            for (cache_key, record, gemini_input), analysis in zip(pack, analyses):
+                try:
+                    result_data = store_analysis(cache_key, gemini_input, record, analysis)
+                except Exception as e:
+                    logger.error(f"Erro ao processar email: {e}")
+                    result_data = build_error_result(e)
+                results.append(result_data)
+            return results
+    
+    def process_batch(emails: List[EmailRecord], on_result: Optional[Callable[[int, dict], None]] = None) -> List[dict]:
+        """
+        Analisa um lote de emails mantendo a ordem de entrada:
+        1. Busca todos no cache de uma vez (get_many)
+        2. Agrupa os que faltam em pacotes de até `gemini_pack_size` emails
+        3. Analisa os pacotes em paralelo (até `batch_concurrency` por vez)
+        
+        `on_result(indice, resultado)` é chamado assim que cada email fica
+        pronto (usado pelos jobs assíncronos para mostrar resultados parciais).
+        """
+        results: List[Optional[dict]] = [None] * len(emails)
+        
+        def report(index: int, result_data: dict) -> None:
+            results[index] = result_data
+            if on_result:
+                on_result(index, result_data)
+        
+        gemini_inputs = [gemini_input_for(record, config.gemini_token_budget) for record in emails]
+        cache_keys = [get_cache_key(gemini_input, cache_version) for gemini_input in gemini_inputs]
+        
+        try:
+            with metrics.time_stage("cache_lookup"):
+                cached_results = cache.get_many(*cache_keys)
+        except Exception as e:
+            logger.warning(f"Falha ao consultar cache do lote: {e}")
+            cached_results = [None] * len(emails)
+        
+        pending: List[Tuple[int, str, EmailRecord, str]] = []
+        for index, cached_result in enumerate(cached_results):
+            if cached_result:
+                metrics.count_cache("hit")
+                report(index, cached_response(cached_result, emails[index]))
+                continue
+            
+            stored = find_stored(cache_keys[index], emails[index])
+            if stored:
+                report(index, stored)
+                continue
+            
+            near_duplicate = find_near_duplicate(cache_keys[index], gemini_inputs[index], emails[index])
+            if near_duplicate:
+                report(index, near_duplicate)
+                continue
+            metrics.count_cache("miss")
+            
+            pre_classified = pre_classify(cache_keys[index], gemini_inputs[index], emails[index])
+            if pre_classified:
+                report(index, pre_classified)
+            else:
+                pending.append((index, cache_keys[index], emails[index], gemini_inputs[index]))
+        
+        pack_size = config.gemini_pack_size
+        packs = [pending[i:i + pack_size] for i in range(0, len(pending), pack_size)]
+        
+        def run_pack(pack: List[Tuple[int, str, EmailRecord, str]]) -> None:
+            analyses = analyze_pack([item[1:] for item in pack])
+            for (index, _, _, _), result_data in zip(pack, analyses):
+                report(index, result_data)
+        
+        map_bounded(run_pack, packs, config.batch_concurrency)
+        return results
+    
+    def dispatch_outbound(record: EmailRecord, result_data: dict) -> None:
+        """Enfileira o que enviar por email sobre a análise (não espera o SMTP)."""
+        if outbound is not None:
+            outbound.submit(record, result_data)
+    
+    def process_job_batch(emails: List[EmailRecord], on_result: Callable[[int, dict], None]) -> List[dict]:
+        """Processa o lote de um job em background (fora da requisição)."""
+        def report(index: int, result_data: dict) -> None:
+            on_result(index, result_data)
+            dispatch_outbound(emails[index], result_data)
+        
+        with app.app_context():
+            return process_batch(emails, report)
+    
+    # 3. Jobs assíncronos: pool de workers + store (memória ou Redis)
+    job_store = create_job_store(config.job_store, config.redis_url, config.job_ttl)
+    jobs = JobManager(job_store, process_job_batch, max_workers=config.job_workers)
+    logger.info(f"Jobs assíncronos: store={type(job_store).__name__}, workers={config.job_workers}")
+    
+    # --- Comandos de manutenção (flask --app wsgi <comando>) ---
+    
+    @app.cli.command("purge-legacy-cache")
+    def purge_legacy_cache():
+        """Remove do Redis as análises em cache no formato de chave antigo."""
+        if not config.redis_url:
+            print("REDIS_URL não configurada: o cache em memória já começa vazio.")
+            return
+        import redis
+        
+        removed = purge_legacy_cache_keys(
+            redis.Redis.from_url(config.redis_url),
+            cache_config.get('CACHE_KEY_PREFIX', 'flask_cache_')
+        )
+        print(f"{removed} chave(s) de cache antigas removidas.")
+    
+    @app.cli.command("export-cache-snapshot")
+    @click.argument("output")
+    @click.option("--entries", default=None, type=int, help="Análises no snapshot (padrão: CACHE_WARMUP_ENTRIES)")
+    def export_cache_snapshot(output, entries):
+        """Grava as análises mais recentes do histórico em um snapshot para o aquecimento do cache."""
+        if analysis_store is None:
+            raise click.ClickException("ANALYSIS_STORE_PATH não configurado: não há histórico para exportar.")
+        written = write_snapshot(output, itertools.islice(iter_recent_analyses(), entries or config.cache_warmup_entries))
+        print(f"{written} análise(s) gravadas em {output} (versão {cache_version}).")
+    
+    @app.cli.command("train-pre-classifier")
+    @click.argument("analyses_path")
+    @click.option("--output", default=None, help="Arquivo do modelo (padrão: PRE_CLASSIFIER_MODEL_PATH)")
+    @click.option("--holdout", default=0.2, show_default=True, help="Fração das análises usada só para calibrar")
+    @click.option("--target-precision", default=0.99, show_default=True,
+                  help="Precisão mínima das decisões locais no holdout")
+    def train_pre_classifier(analyses_path, output, holdout, target_precision):
+        """Treina o pré-classificador a partir de análises do Gemini em JSONL."""
+        output = output or config.pre_classifier_model_path or "pre_classifier.json"
+        # O texto passa pelo mesmo preparo da análise (truncar + pré-processar)
+        samples = iter_training_samples(
+            analyses_path,
+            lambda text: basic_preprocess(prepare_for_gemini(text, config.gemini_token_budget))
+        )
+        train_samples, held_out = split_holdout(samples, holdout)
+        try:
+            model = PreClassifier.train(train_samples)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        
+        if held_out:
+            report = model.calibrate(held_out, target_precision)
+            if report["threshold"] is None:
+                print(f"Nenhum limiar atinge {target_precision:.1%} de precisão em {report['held_out']} "
+                      f"análises de holdout: o atalho fica desligado.")
+            else:
+                print(f"Holdout ({report['held_out']} análises): precisão {report['precision']:.1%} com limiar "
+                      f"{report['threshold']:.10g}; {report['coverage']:.1%} dos emails dispensariam o Gemini.")
+        else:
+            print(f"Sem holdout: limiar padrão {model.threshold} (precisão não medida).")
+        model.save(output)
+        print(f"Modelo salvo em {output}: {model.documents}")
     
     # --- Rotas da Aplicação ---
     
@@ -313,11 +937,6 @@ def create_app() -> Flask:
         """Rota de teste para verificar se o deploy está funcionando."""
         return jsonify({"message": "Rota de teste funcionando!", "timestamp": "2025-01-06"})
     
-    @app.route("/analyze/status/test")
-    def test_status_route():
-        """Teste específico para a rota de status."""
-        return jsonify({"message": "Rota de status funcionando!", "job_id": "test"})
-    
     @app.route("/health")
     def health():
         """Endpoint de health check para monitoramento."""
@@ -329,6 +948,8 @@ def create_app() -> Flask:
                 _ = client.model
             except Exception:
                 gemini_status = "unhealthy"
+            if gemini_status == "healthy" and client.breaker.state != STATE_CLOSED:
+                gemini_status = "degraded"  # Circuito aberto: emails vão para curadoria
             
             return jsonify({
                 'status': 'healthy',
@@ -337,9 +958,17 @@ def create_app() -> Flask:
                 'components': {
                     'gemini': gemini_status,
                     'smtp': 'configured' if mailer else 'not_configured',
+                    'outbound': outbound.stats() if outbound is not None else 'disabled',
+                    'analysis_store': analysis_store.stats() if analysis_store is not None else 'disabled',
+                    'cache_warmup': cache_warmup.as_dict() if cache_warmup is not None else 'disabled',
                     'cache': config.cache_type,
                     'rate_limiting': 'enabled' if config.rate_limit_enabled else 'disabled'
-                }
+                },
+                'single_flight': single_flight.stats(),
+                'gemini_circuit': client.breaker.stats(),
+                'gemini_concurrency': client.limiter.stats() if client.limiter is not None else 'disabled',
+                'gemini_keys': client.stats() if isinstance(client, GeminiClientPool) else 'single',
+                'near_duplicates': len(near_duplicates) if near_duplicates is not None else 'disabled'
             })
         except Exception as e:
             logger.error(f"Health check falhou: {e}")
@@ -348,10 +977,8 @@ def create_app() -> Flask:
                 'error': str(e)
             }), 500
     
-    # Rotas de jobs assíncronos removidas - usando processamento síncrono
-    
     @app.route("/webhook/email", methods=["POST"])
-    @app.limiter.limit("30 per minute")
+    @app.limiter.limit(WEBHOOK_RATE_LIMIT)
     @require_api_key
     def webhook_email():
         """Webhook para receber emails automaticamente."""
@@ -373,139 +1000,61 @@ def create_app() -> Flask:
             # Constrói o email formatado
             formatted_email = f"From: {sender}\nSubject: {subject}\n\n{email_content}"
             
-            # Verifica cache
-            cache_key = get_cache_key(formatted_email)
-            cached_result = cache.get(cache_key)
-            
-            if cached_result:
-                cached_result['cached'] = True
-                return jsonify(cached_result)
-            
-            # Processa diretamente (síncrono)
-            try:
-                truncated = truncate_text_for_gemini(formatted_email, 1000)
-                preprocessed = basic_preprocess(truncated) if len(truncated) > 500 else truncated
-                
-                result = service.analyze(preprocessed)
-                
-                categoria = result.get("categoria", "N/A")
-                atencao = result.get("atencao_humana", "NÃO")
-                resumo = result.get("resumo", "N/A")
-                sugestao = result.get("sugestao_resposta_ou_acao", "N/A")
-                
-                if atencao.upper() == "SIM":
-                    acao = "📧 Encaminhar para curadoria humana"
-                elif categoria.lower() == "spam":
-                    acao = "🚫 Spam detectado"
-                else:
-                    acao = "✅ Processado com sucesso"
-                
-                result_data = {
-                    "categoria": categoria,
-                    "atencao_humana": atencao,
-                    "resumo": resumo,
-                    "sugestao": sugestao,
-                    "acao": acao,
-                    "sender": extract_sender_from_email(formatted_email) or 'Não identificado',
-                    "cached": False
-                }
-                
-                cache.set(cache_key, result_data, timeout=config.cache_default_timeout)
-                return jsonify(result_data)
-                
-            except Exception as e:
-                logger.error(f"Erro na análise do webhook: {e}")
-                return jsonify({
-                    "categoria": "❌ ERRO",
-                    "atencao_humana": "SIM",
-                    "resumo": f"Falha na análise: {str(e)}",
-                    "sugestao": "Verifique o conteúdo e tente novamente",
-                    "sender": "Não identificado",
-                    "acao": "⚠️ Erro no processamento",
-                    "cached": False
-                })
+            # Processa diretamente (síncrono), dentro do prazo da requisição
+            record = EmailRecord.from_text(formatted_email)
+            with deadline_scope(config.request_deadline):
+                result_data = process_email(record)
+            dispatch_outbound(record, result_data)
+            return jsonify(result_data)
             
         except Exception as e:
             return jsonify({"error": "Erro interno do servidor"}), 500
     
     @app.route("/analyze", methods=["POST"])
-    @app.limiter.limit("20 per minute")
+    @app.limiter.limit(ANALYZE_RATE_LIMIT)
     def analyze():
         """Rota principal para análise de emails via interface web."""
         try:
-            raw_text, origin = read_text_from_upload(config.max_file_size_mb)
+            with metrics.time_stage("upload_parse"):
+                email_iterator, origin = read_emails_from_upload(config.max_file_size_mb, pdf_extractor, config.gemini_token_budget)
+                
+                # Lê no máximo um email além do limite: arquivos enormes param cedo
+                async_mode = is_async_request()
+                max_emails = config.max_batch_size if async_mode else 10  # Reduzido para 10 emails
+                emails = list(itertools.islice(email_iterator, max_emails + 1))
             
-            if not raw_text:
+            if not emails:
                 if origin == "file_too_large":
                     return jsonify({"error": f"📁 Arquivo muito grande. Limite de {config.max_file_size_mb}MB."}), 400
                 elif origin == "unsupported":
-                    return jsonify({"error": "📝 Formato não suportado. Use .txt ou .pdf"}), 400
-                return jsonify({"error": "📝 Envie um arquivo .txt/.pdf ou cole o texto do e-mail."}), 400
+                    return jsonify({"error": "📝 Formato não suportado. Use .txt, .pdf, .eml ou .mbox"}), 400
+                elif origin == "pdf_error":
+                    return jsonify({"error": "📄 Não foi possível ler o PDF (arquivo inválido, grande ou complexo demais)."}), 400
+                return jsonify({"error": "📝 Envie um arquivo .txt/.pdf/.eml/.mbox ou cole o texto do e-mail."}), 400
             
-            # Detecta múltiplos emails
-            emails = split_multiple_emails(raw_text)
+            # Modo assíncrono: devolve o job_id na hora e processa em background
+            if async_mode:
+                if len(emails) > max_emails:
+                    return jsonify({"error": f"⚠️ Limite de {config.max_batch_size} emails por lote excedido"}), 400
+                
+                job_id = jobs.submit(emails)
+                return jsonify({
+                    "job_id": job_id,
+                    "status": "queued",
+                    "total_emails": len(emails),
+                    "status_url": f"/analyze/status/{job_id}"
+                }), 202
             
             # Limita emails
-            if len(emails) > 10:  # Reduzido para 10 emails
-                return jsonify({"error": f"⚠️ Limite de 10 emails por lote excedido"}), 400
+            if len(emails) > max_emails:
+                return jsonify({"error": f"⚠️ Limite de 10 emails por lote excedido (use async=true para até {config.max_batch_size})"}), 400
             
-            # Para múltiplos emails, processa diretamente
+            # Para múltiplos emails, agrupa em pacotes e processa em paralelo (ordem preservada)
             if len(emails) > 1:
-                results = []
-                
-                for email_content in emails:
-                    try:
-                        # Verifica cache primeiro
-                        cache_key = get_cache_key(email_content)
-                        cached_result = cache.get(cache_key)
-                        
-                        if cached_result:
-                            result_data = cached_result.copy()
-                            result_data['cached'] = True
-                            results.append(result_data)
-                        else:
-                            # Processa diretamente
-                            truncated = truncate_text_for_gemini(email_content, 1000)
-                            preprocessed = basic_preprocess(truncated) if len(truncated) > 500 else truncated
-                            
-                            result = service.analyze(preprocessed)
-                            
-                            categoria = result.get("categoria", "N/A")
-                            atencao = result.get("atencao_humana", "NÃO")
-                            resumo = result.get("resumo", "N/A")
-                            sugestao = result.get("sugestao_resposta_ou_acao", "N/A")
-                            
-                            if atencao.upper() == "SIM":
-                                acao = "📧 Encaminhar para curadoria humana"
-                            elif categoria.lower() == "spam":
-                                acao = "🚫 Spam detectado"
-                            else:
-                                acao = "✅ Processado com sucesso"
-                            
-                            result_data = {
-                                "categoria": categoria,
-                                "atencao_humana": atencao,
-                                "resumo": resumo,
-                                "sugestao": sugestao,
-                                "acao": acao,
-                                "sender": extract_sender_from_email(email_content) or 'Não identificado',
-                                "cached": False
-                            }
-                            
-                            cache.set(cache_key, result_data, timeout=config.cache_default_timeout)
-                            results.append(result_data)
-                            
-                    except Exception as e:
-                        logger.error(f"Erro ao processar email: {e}")
-                        results.append({
-                            "categoria": "❌ ERRO",
-                            "atencao_humana": "SIM",
-                            "resumo": f"Falha na análise: {str(e)}",
-                            "sugestao": "Verifique o conteúdo e tente novamente",
-                            "sender": "Não identificado",
-                            "acao": "⚠️ Erro no processamento",
-                            "cached": False
-                        })
+                with deadline_scope(config.request_deadline):
+                    results = process_batch(emails)
+                for record, result_data in zip(emails, results):
+                    dispatch_outbound(record, result_data)
                 
                 return jsonify({
                     "total_emails": len(emails),
@@ -513,64 +1062,55 @@ def create_app() -> Flask:
                     "message": f"✅ Análise concluída para {len(emails)} email(s)"
                 })
             
-            else:
-                # Análise individual - processa diretamente
-                email_content = emails[0]
-                cache_key = get_cache_key(email_content)
-                cached_result = cache.get(cache_key)
-                
-                if cached_result:
-                    response = cached_result.copy()
-                    response['cached'] = True
-                    return jsonify(response)
-                
-                # Processa diretamente
-                try:
-                    truncated = truncate_text_for_gemini(email_content, 1000)
-                    preprocessed = basic_preprocess(truncated) if len(truncated) > 500 else truncated
-                    
-                    result = service.analyze(preprocessed)
-                    
-                    categoria = result.get("categoria", "N/A")
-                    atencao = result.get("atencao_humana", "NÃO")
-                    resumo = result.get("resumo", "N/A")
-                    sugestao = result.get("sugestao_resposta_ou_acao", "N/A")
-                    
-                    if atencao.upper() == "SIM":
-                        acao = "📧 Encaminhar para curadoria humana"
-                    elif categoria.lower() == "spam":
-                        acao = "🚫 Spam detectado"
-                    else:
-                        acao = "✅ Processado com sucesso"
-                    
-                    response = {
-                        "categoria": categoria,
-                        "atencao_humana": atencao,
-                        "resumo": resumo,
-                        "sugestao": sugestao,
-                        "acao": acao,
-                        "sender": extract_sender_from_email(email_content) or 'Não identificado',
-                        "cached": False
-                    }
-                    
-                    cache.set(cache_key, response, timeout=config.cache_default_timeout)
-                    return jsonify(response)
-                    
-                except Exception as e:
-                    logger.error(f"Erro na análise: {e}")
-                    return jsonify({
-                        "categoria": "❌ ERRO",
-                        "atencao_humana": "SIM",
-                        "resumo": f"Falha na análise: {str(e)}",
-                        "sugestao": "Verifique o conteúdo e tente novamente",
-                        "sender": "Não identificado",
-                        "acao": "⚠️ Erro no processamento",
-                        "cached": False
-                    })
+            # Análise individual - processa diretamente
+            with deadline_scope(config.request_deadline):
+                result_data = process_email(emails[0])
+            dispatch_outbound(emails[0], result_data)
+            return jsonify(result_data)
                 
         except Exception as e:
             return jsonify({"error": "❌ Erro interno do servidor"}), 500
     
+    @app.route("/analyze/status/<job_id>")
+    def analyze_status(job_id):
+        """Progresso e resultados parciais de um job assíncrono."""
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job não encontrado ou expirado", "job_id": job_id}), 404
+        return jsonify(job)
+    
+    @app.route("/api/analyses")
+    @require_api_key
+    def list_analyses():
+        """
+        Histórico de análises, das mais novas para as mais antigas.
+        Filtros: sender, categoria, atencao_humana, since/until (ISO 8601).
+        Paginação: `limit` (até 500) e `cursor` (o `next_cursor` da página anterior).
+        """
+        if analysis_store is None:
+            return jsonify({"error": "Histórico de análises desativado (defina ANALYSIS_STORE_PATH)"}), 503
+        try:
+            page = analysis_store.query(
+                limit=request.args.get("limit", 50, type=int),
+                before_id=request.args.get("cursor", type=int),
+                sender=request.args.get("sender"),
+                categoria=request.args.get("categoria"),
+                atencao_humana=request.args.get("atencao_humana"),
+                since=parse_timestamp(request.args.get("since")),
+                until=parse_timestamp(request.args.get("until"))
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(page)
+    
+    @app.route("/outbound/dead-letters")
+    @require_api_key
+    def outbound_dead_letters():
+        """Envios de email que desistimos de fazer (mais recentes no fim)."""
+        if outbound is None:
+            return jsonify({"enabled": False, "dead_letters": []})
+        return jsonify({"enabled": True, "dead_letters": outbound.dead_letters()})
+    
     @app.route("/test/<test_type>")
     @app.limiter.limit("60 per minute")
     def test_mock(test_type):
@@ -616,6 +1156,38 @@ def create_app() -> Flask:
             "cached": False
         })
     
+    # --- Métricas (Prometheus) ---
+    
+    # Endpoints sem métricas de requisição (o próprio /metrics e arquivos estáticos)
+    untracked_endpoints = {"metrics", "serve_static", "serve_docs", None}
+    
+    @app.before_request
+    def start_request_metrics():
+        if not config.metrics_enabled or request.endpoint in untracked_endpoints:
+            return
+        g.metrics_operation = f"request:{request.endpoint}"
+        g.metrics_started = time.perf_counter()
+        metrics.IN_FLIGHT.labels(g.metrics_operation).inc()
+    
+    @app.teardown_request
+    def finish_request_metrics(error=None):
+        operation = g.pop("metrics_operation", None)
+        if operation is None:
+            return
+        metrics.IN_FLIGHT.labels(operation).dec()
+        metrics.observe_stage(operation, time.perf_counter() - g.pop("metrics_started"))
+    
+    @app.route("/metrics")
+    @app.limiter.exempt
+    def metrics_endpoint():
+        """Métricas no formato de texto do Prometheus (agregadas entre workers)."""
+        if not config.metrics_enabled:
+            return jsonify({"error": "Endpoint não encontrado"}), 404
+        if not metrics.AVAILABLE:
+            return jsonify({"error": "prometheus_client não instalado"}), 503
+        body, content_type = metrics.render_latest()
+        return Response(body, content_type=content_type)
+    
     @app.route('/static/<path:filename>')
     def serve_static(filename):
         """Serve arquivos estáticos."""
@@ -646,17 +1218,22 @@ def create_app() -> Flask:
             "message": "Ocorreu um erro inesperado"
         }), 500
     
+    # Peças usadas pelo modo ASGI (app/asgi.py), que atende as rotas de análise sem prender threads
+    app.extensions["mailmind"] = {
+        "config": config,
+        "process_email_async": process_email_async,
+        "dispatch_outbound": dispatch_outbound,
+        "analysis_store": analysis_store,
+    }
+    
     return app
 
 
-# Exportar app para gunicorn
-app = create_app()
-
-
 def main():
     """Função principal para executar a aplicação localmente."""
     config = load_config()
     logger.info(f"🚀 Iniciando MailMind em http://localhost:{config.port}")
+    app = create_app()  # O gunicorn usa `wsgi:app` (um app por worker, criado só lá)
     app.run(host="0.0.0.0", port=config.port, debug=False)
 
 
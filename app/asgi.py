@@ -0,0 +1,243 @@
+"""
+Modo ASGI: as mesmas rotas do app Flask, com as análises rodando no event loop.
+
+Uso (na raiz do projeto):
+    uvicorn asgi:app --host 0.0.0.0 --port 8080 --workers 2
+
+Para devs iniciantes:
+- No gunicorn (WSGI) cada requisição ocupa uma thread enquanto espera o
+  Gemini: com 2 workers x 8 threads, no máximo 16 análises por instância.
+- Aqui as rotas que passam a maior parte do tempo esperando o Gemini
+  (POST /webhook/email e POST /analyze com JSON de um email) são atendidas
+  direto no event loop com `await`: centenas de análises em andamento por
+  worker, sem uma thread para cada.
+- Todo o resto (uploads, lotes, jobs, páginas, /metrics...) vai para o app
+  Flask de sempre, através do adaptador WSGI -> ASGI do `asgiref`, rodando
+  num pool de threads próprio (ASGI_FLASK_THREADS). O adaptador padrão usa
+  uma única thread por worker e atenderia essas rotas uma de cada vez.
+- Um semáforo (ASGI_GEMINI_CONCURRENCY) limita as chamadas simultâneas ao
+  Gemini por worker; as requisições além disso esperam a sua vez no loop.
+- Cache, quase-duplicatas, pré-classificador, prazo (REQUEST_DEADLINE),
+  circuit breaker, API key e limites por rota continuam valendo.
+"""
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from flask import Flask
+from limits import parse as parse_rate_limit
+
+from .app import ANALYZE_RATE_LIMIT, WEBHOOK_RATE_LIMIT, create_app
+from .providers.resilience import deadline_scope
+from .utils import metrics
+from .utils.email_scanner import scan_emails
+from .utils.mail_parser import EmailRecord
+
+logger = logging.getLogger(__name__)
+
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+_TRUE_VALUES = ("1", "true", "sim", "yes")
+
+
+class _PooledWsgiInstance(WsgiToAsgiInstance):
+    """Uma requisição repassada ao Flask, executada no pool de threads do adaptador."""
+
+    def __init__(self, wsgi_application: Any, executor: ThreadPoolExecutor) -> None:
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body: Any) -> None:
+        # `WsgiToAsgiInstance.run_wsgi_app` é "thread sensitive" (sempre a mesma thread)
+        run = WsgiToAsgiInstance.__dict__["run_wsgi_app"].func
+        await sync_to_async(run, thread_sensitive=False, executor=self.executor)(self, body)
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """`WsgiToAsgi` que atende várias requisições ao mesmo tempo (até `max_threads`)."""
+
+    def __init__(self, wsgi_application: Any, max_threads: int) -> None:
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="asgi-flask")
+
+    async def __call__(self, scope: Dict[str, Any], receive: Receive, send: Send) -> None:
+        await _PooledWsgiInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+
+class MailMindASGI:
+    """Aplicação ASGI: rotas de análise assíncronas + app Flask para o resto."""
+
+    def __init__(self, flask_app: Flask) -> None:
+        self.flask_app = flask_app
+        pipeline = flask_app.extensions["mailmind"]
+        self.config = pipeline["config"]
+        self.wsgi = PooledWsgiToAsgi(flask_app, self.config.asgi_flask_threads)
+        self.process_email_async = pipeline["process_email_async"]
+        self.dispatch_outbound = pipeline["dispatch_outbound"]
+        self._gemini_slots: Optional[asyncio.Semaphore] = None
+
+        # (método, caminho) -> handler que devolve (status, resposta) ou None para usar o Flask
+        self.routes = {
+            ("POST", "/webhook/email"): (self.webhook_email, WEBHOOK_RATE_LIMIT),
+            ("POST", "/analyze"): (self.analyze, ANALYZE_RATE_LIMIT),
+        }
+
+    async def __call__(self, scope: Dict[str, Any], receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+
+        route = self.routes.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if route is None or not _is_json(scope):
+            await self.wsgi(scope, receive, send)
+            return
+
+        handler, rate_limit = route
+        body = await _read_body(receive)
+        try:
+            payload = json.loads(body or b"null")
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict) or not self._authorized(scope, handler):
+            # JSON inválido ou API key ausente/errada: o Flask responde com a mensagem de sempre
+            await self.wsgi(scope, _replay(body, receive), send)
+            return
+
+        if self._rate_limited(scope, rate_limit):
+            await _send_json(send, 429, {
+                "error": "Rate limit excedido",
+                "message": "Muitas requisições. Tente novamente em alguns minutos."
+            })
+            return
+
+        operation = f"request:{handler.__name__}"
+        with metrics.track_in_flight(operation), metrics.time_stage(operation):
+            try:
+                response = await handler(scope, payload)
+            except Exception as e:
+                logger.error(f"Erro no modo ASGI ({scope['path']}): {e}")
+                response = (500, {"error": "Erro interno do servidor"})
+        if response is None:
+            await self.wsgi(scope, _replay(body, receive), send)
+            return
+        await _send_json(send, *response)
+
+    # --- Rotas assíncronas (mesmas respostas das rotas do Flask) ---
+
+    async def webhook_email(self, scope: Dict[str, Any], data: Dict[str, Any]) -> Optional[Tuple[int, dict]]:
+        email_content = data.get('email_content', data.get('content', ''))
+        if not email_content:
+            return None  # O Flask responde o 400
+        formatted_email = f"From: {data.get('sender', '')}\nSubject: {data.get('subject', '')}\n\n{email_content}"
+        record = EmailRecord.from_text(formatted_email)
+        with deadline_scope(self.config.request_deadline):
+            result_data = await self.process_email_async(record, self.gemini_slots)
+        self.dispatch_outbound(record, result_data)
+        return 200, result_data
+
+    async def analyze(self, scope: Dict[str, Any], data: Dict[str, Any]) -> Optional[Tuple[int, dict]]:
+        """Só o caso de um email (lotes e jobs continuam no Flask, com pacotes e pool de threads)."""
+        email_content = data.get("email_content")
+        if not email_content or _is_async_request(scope, data):
+            return None
+        emails = scan_emails(email_content, self.config.gemini_token_budget)
+        if len(emails) != 1:
+            return None
+        record = emails[0].to_record()
+        with deadline_scope(self.config.request_deadline):
+            result_data = await self.process_email_async(record, self.gemini_slots)
+        self.dispatch_outbound(record, result_data)
+        return 200, result_data
+
+    # --- Apoio ---
+
+    @property
+    def gemini_slots(self) -> asyncio.Semaphore:
+        """Semáforo criado no primeiro uso, dentro do event loop do worker."""
+        if self._gemini_slots is None:
+            self._gemini_slots = asyncio.Semaphore(self.config.asgi_gemini_concurrency)
+        return self._gemini_slots
+
+    def _authorized(self, scope: Dict[str, Any], handler: Callable) -> bool:
+        """Mesma regra do `require_api_key` (só o webhook exige a chave)."""
+        if handler != self.webhook_email or not self.config.api_key_required:
+            return True
+        return _header(scope, "x-api-key") in self.config.valid_api_keys
+
+    def _rate_limited(self, scope: Dict[str, Any], rate_limit: str) -> bool:
+        """Aplica o limite da rota no mesmo storage do Flask-Limiter (memória ou Redis)."""
+        limiter = self.flask_app.limiter
+        if not limiter.enabled:
+            return False
+        client = (scope.get("client") or ("desconhecido", 0))[0]
+        return not limiter.limiter.hit(parse_rate_limit(rate_limit), "asgi", scope["path"], client)
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.wsgi.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def _header(scope: Dict[str, Any], name: str) -> str:
+    for key, value in scope.get("headers", []):
+        if key.decode("latin-1").lower() == name:
+            return value.decode("latin-1")
+    return ""
+
+
+def _is_json(scope: Dict[str, Any]) -> bool:
+    return _header(scope, "content-type").split(";")[0].strip().lower() == "application/json"
+
+
+def _is_async_request(scope: Dict[str, Any], data: Dict[str, Any]) -> bool:
+    query = scope.get("query_string", b"").decode("latin-1")
+    flags = [value for key, _, value in (pair.partition("=") for pair in query.split("&")) if key == "async"]
+    value = flags[0] if flags else data.get("async")
+    return str(value).lower() in _TRUE_VALUES
+
+
+async def _read_body(receive: Receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def _replay(body: bytes, receive: Receive) -> Receive:
+    """Entrega de novo o corpo já lido (para repassar a requisição ao Flask)."""
+    delivered = False
+
+    async def replay_receive() -> Dict[str, Any]:
+        nonlocal delivered
+        if not delivered:
+            delivered = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+    return replay_receive
+
+
+async def _send_json(send: Send, status: int, payload: dict) -> None:
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def create_asgi_app(flask_app: Optional[Flask] = None) -> MailMindASGI:
+    """Cria a aplicação ASGI (por padrão, com um app Flask novo)."""
+    return MailMindASGI(flask_app or create_app())
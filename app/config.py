@@ -1,6 +1,6 @@
 import os
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Tuple
 from dotenv import load_dotenv
 
 
@@ -24,15 +24,77 @@ class AppConfig:
     # Configurações de performance
     max_file_size_mb: int = 10  # Aumentado para 10MB
     max_pdf_chars: int = 50000  # Aumentado para 50k caracteres
+    pdf_max_pages: int = 200  # Páginas lidas no máximo por PDF
+    pdf_timeout: int = 20  # Segundos para extrair o texto de um PDF
+    pdf_max_memory_mb: int = 512  # Memória máxima de cada processo de extração
+    pdf_workers: int = 2  # Processos dedicados à extração de PDF
     max_batch_size: int = 50
+    batch_concurrency: int = 5  # Chamadas ao Gemini em paralelo por requisição
+    gemini_pack_size: int = 5  # Emails enviados juntos em um único prompt
+    gemini_token_budget: int = 250  # Tokens (estimados) de cada email enviados ao Gemini
+    gemini_system_instruction: bool = True  # Instruções fixas no system_instruction do modelo
     smtp_timeout: int = 60  # Aumentado para 60 segundos
+    smtp_starttls: bool = True
+    smtp_pool_size: int = 2  # Conexões SMTP autenticadas mantidas abertas
+    smtp_max_messages_per_connection: int = 100  # Mensagens antes de trocar a conexão
+    smtp_idle_timeout: int = 60  # Conexão parada por mais tempo é fechada
+    outbound_workers: int = 2  # Threads que enviam os emails da fila em background
+    outbound_digest_seconds: int = 60  # Espera máxima para juntar emails no resumo do curador
+    outbound_digest_max: int = 25  # Emails por resumo do curador
+    outbound_max_attempts: int = 5  # Tentativas de um envio antes da lista de dead letters
+    outbound_retry_seconds: int = 30  # Espera base entre tentativas (dobra a cada falha)
+    outbound_queue_size: int = 10000  # Envios pendentes em memória (acima disso viram dead letters)
+    auto_reply_enabled: bool = False  # Resposta automática ao remetente dos emails sem curadoria
     gemini_timeout: int = 60  # 1 minuto para Gemini (mais rápido)
+    gemini_endpoint: Optional[str] = None  # Endpoint alternativo da API (ex.: stub local para testes de carga)
+    gemini_api_keys: Tuple[str, ...] = ()  # Várias chaves: as chamadas são distribuídas entre elas (pool)
+    gemini_models: Tuple[str, ...] = ()  # Modelos equivalentes para o pool (vazio = só o model_name)
+    gemini_key_rpm: int = 0  # Cota de requisições por minuto de cada chave (0 = desconhecida)
+    gemini_key_tpm: int = 0  # Cota de tokens por minuto de cada chave (0 = desconhecida)
+    gemini_key_cooldown_seconds: int = 30  # Tempo sem usar uma chave que recebeu 429
     request_timeout: int = 600  # 10 minutos para requisições HTTP
+    request_deadline: int = 90  # Tempo total com o Gemini (somando retries) por requisição síncrona
+    circuit_failure_threshold: int = 5  # Falhas seguidas do Gemini que abrem o circuito
+    circuit_recovery_seconds: int = 30  # Tempo com o circuito aberto antes da chamada de teste
+    adaptive_concurrency_enabled: bool = True  # Limite adaptativo (AIMD) de chamadas simultâneas ao Gemini
+    gemini_concurrency_initial: int = 32  # Limite inicial de chamadas simultâneas por worker
+    gemini_concurrency_min: int = 2
+    gemini_concurrency_max: int = 256
+    gemini_queue_timeout: int = 10  # Espera máxima por uma vaga antes de ir para curadoria
+    asgi_gemini_concurrency: int = 200  # Chamadas simultâneas ao Gemini por worker no modo ASGI
+    asgi_flask_threads: int = 16  # Threads para as rotas que o modo ASGI repassa ao Flask
+    
+    # Configurações de jobs assíncronos
+    job_store: str = "memory"  # "memory" ou "redis" (compartilhado entre workers)
+    job_workers: int = 2  # Lotes processados em paralelo em background
+    job_ttl: int = 3600  # Tempo que o resultado de um job fica disponível
     
     # Configurações de cache
     cache_type: str = "SimpleCache"
     cache_default_timeout: int = 3600
+    cache_threshold: int = 500  # Máximo de análises no cache em memória (SimpleCache)
+    cache_warmup_entries: int = 500  # Análises carregadas no cache ao subir (0 = sem aquecimento)
+    cache_warmup_seconds: float = 5.0  # Tempo máximo do aquecimento
+    cache_warmup_max_mb: int = 50  # Memória máxima (JSON das análises) carregada no aquecimento
+    cache_warmup_snapshot: Optional[str] = None  # Snapshot JSONL; sem ele, usa o histórico SQLite
+    cache_warmup_background: bool = True  # Aquece em uma thread (a instância já atende enquanto isso)
     redis_url: Optional[str] = None
+    single_flight_lease_seconds: int = 30  # Tempo máximo de espera por uma análise idêntica em andamento
+    
+    # Configurações de quase-duplicatas (SimHash)
+    near_duplicate_enabled: bool = True
+    near_duplicate_threshold: float = 0.9  # Similaridade mínima (0 a 1) para reaproveitar
+    near_duplicate_max_entries: int = 10000  # Limite de memória do índice
+    near_duplicate_db_path: Optional[str] = None  # Arquivo SQLite opcional para persistir o índice
+    
+    # Histórico persistente de análises (SQLite em modo WAL)
+    analysis_store_path: Optional[str] = None  # Sem caminho = desligado
+    analysis_store_batch_size: int = 500  # Análises gravadas por transação
+    analysis_store_queue_size: int = 100000  # Análises esperando gravação (acima disso são descartadas do histórico)
+    
+    # Pré-classificador local (spam/notificações sem chamar o Gemini)
+    pre_classifier_model_path: Optional[str] = None  # Sem modelo = desligado
+    pre_classifier_threshold: Optional[float] = None  # Confiança mínima para dispensar o Gemini (None = a calibrada no treino)
     
     # Configurações de segurança
     rate_limit_enabled: bool = True
@@ -41,6 +103,8 @@ class AppConfig:
     valid_api_keys: list = None
     
     # Configurações de monitoramento
+    metrics_enabled: bool = True  # Endpoint /metrics (Prometheus)
+    lazy_startup: bool = True  # SDK do Gemini importado só na primeira análise (boot mais rápido)
     sentry_dsn: Optional[str] = None
     environment: str = "development"
 
@@ -55,7 +119,9 @@ def load_config(dotenv_path: Optional[str] = None) -> AppConfig:
     else:
         load_dotenv()
 
-    gemini_api_key = os.getenv("GEMINI_API_KEY")
+    # Várias chaves (separadas por vírgula) formam um pool; a primeira vale como a chave principal
+    gemini_api_keys = tuple(key.strip() for key in os.getenv("GEMINI_API_KEYS", "").split(",") if key.strip())
+    gemini_api_key = os.getenv("GEMINI_API_KEY") or (gemini_api_keys[0] if gemini_api_keys else None)
     if not gemini_api_key:
         raise RuntimeError(
             "GEMINI_API_KEY não encontrada. Defina no arquivo .env na raiz do projeto."
@@ -63,6 +129,7 @@ def load_config(dotenv_path: Optional[str] = None) -> AppConfig:
 
     # Permite override do modelo via env, mas define um padrão seguro
     model_name = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+    gemini_models = tuple(name.strip() for name in os.getenv("GEMINI_MODELS", "").split(",") if name.strip())
 
     # SMTP Configuration
     smtp_host = os.getenv("SMTP_HOST", "")
@@ -79,15 +146,73 @@ def load_config(dotenv_path: Optional[str] = None) -> AppConfig:
     # Performance Configuration
     max_file_size_mb = int(os.getenv("MAX_FILE_SIZE_MB", "10"))
     max_pdf_chars = int(os.getenv("MAX_PDF_CHARS", "50000"))
+    pdf_max_pages = int(os.getenv("PDF_MAX_PAGES", "200"))
+    pdf_timeout = int(os.getenv("PDF_TIMEOUT", "20"))
+    pdf_max_memory_mb = int(os.getenv("PDF_MAX_MEMORY_MB", "512"))
+    pdf_workers = max(1, int(os.getenv("PDF_WORKERS", "2")))
     max_batch_size = int(os.getenv("MAX_BATCH_SIZE", "50"))
+    batch_concurrency = max(1, int(os.getenv("BATCH_CONCURRENCY", "5")))
+    gemini_pack_size = max(1, int(os.getenv("GEMINI_PACK_SIZE", "5")))
+    gemini_token_budget = max(32, int(os.getenv("GEMINI_TOKEN_BUDGET", "250")))
+    gemini_system_instruction = os.getenv("GEMINI_SYSTEM_INSTRUCTION", "true").lower() == "true"
     smtp_timeout = int(os.getenv("SMTP_TIMEOUT", "60"))
+    smtp_starttls = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+    smtp_pool_size = max(1, int(os.getenv("SMTP_POOL_SIZE", "2")))
+    smtp_max_messages_per_connection = max(1, int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100")))
+    smtp_idle_timeout = int(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
+    outbound_workers = max(1, int(os.getenv("OUTBOUND_WORKERS", "2")))
+    outbound_digest_seconds = max(0, int(os.getenv("OUTBOUND_DIGEST_SECONDS", "60")))
+    outbound_digest_max = max(1, int(os.getenv("OUTBOUND_DIGEST_MAX", "25")))
+    outbound_max_attempts = max(1, int(os.getenv("OUTBOUND_MAX_ATTEMPTS", "5")))
+    outbound_retry_seconds = max(1, int(os.getenv("OUTBOUND_RETRY_SECONDS", "30")))
+    outbound_queue_size = max(1, int(os.getenv("OUTBOUND_QUEUE_SIZE", "10000")))
+    auto_reply_enabled = os.getenv("AUTO_REPLY_ENABLED", "false").lower() == "true"
     gemini_timeout = int(os.getenv("GEMINI_TIMEOUT", "600"))
+    gemini_endpoint = os.getenv("GEMINI_ENDPOINT") or None
+    gemini_key_rpm = max(0, int(os.getenv("GEMINI_KEY_RPM", "0")))
+    gemini_key_tpm = max(0, int(os.getenv("GEMINI_KEY_TPM", "0")))
+    gemini_key_cooldown_seconds = max(1, int(os.getenv("GEMINI_KEY_COOLDOWN_SECONDS", "30")))
     request_timeout = int(os.getenv("REQUEST_TIMEOUT", "600"))
+    request_deadline = int(os.getenv("REQUEST_DEADLINE", "90"))
+    circuit_failure_threshold = max(1, int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")))
+    circuit_recovery_seconds = int(os.getenv("CIRCUIT_RECOVERY_SECONDS", "30"))
+    adaptive_concurrency_enabled = os.getenv("ADAPTIVE_CONCURRENCY_ENABLED", "true").lower() == "true"
+    gemini_concurrency_min = max(1, int(os.getenv("GEMINI_CONCURRENCY_MIN", "2")))
+    gemini_concurrency_max = max(gemini_concurrency_min, int(os.getenv("GEMINI_CONCURRENCY_MAX", "256")))
+    gemini_concurrency_initial = min(gemini_concurrency_max, max(gemini_concurrency_min,
+                                     int(os.getenv("GEMINI_CONCURRENCY_INITIAL", "32"))))
+    gemini_queue_timeout = max(0, int(os.getenv("GEMINI_QUEUE_TIMEOUT", "10")))
+    asgi_gemini_concurrency = max(1, int(os.getenv("ASGI_GEMINI_CONCURRENCY", "200")))
+    asgi_flask_threads = max(1, int(os.getenv("ASGI_FLASK_THREADS", "16")))
+    
+    # Async Jobs Configuration
+    job_store = os.getenv("JOB_STORE", "memory").lower()
+    job_workers = max(1, int(os.getenv("JOB_WORKERS", "2")))
+    job_ttl = int(os.getenv("JOB_TTL", "3600"))
     
     # Cache Configuration
     cache_type = os.getenv("CACHE_TYPE", "SimpleCache")
+    cache_threshold = max(1, int(os.getenv("CACHE_THRESHOLD", "500")))
+    cache_warmup_entries = max(0, int(os.getenv("CACHE_WARMUP_ENTRIES", "500")))
+    cache_warmup_seconds = max(0.0, float(os.getenv("CACHE_WARMUP_SECONDS", "5")))
+    cache_warmup_max_mb = max(1, int(os.getenv("CACHE_WARMUP_MAX_MB", "50")))
+    cache_warmup_snapshot = os.getenv("CACHE_WARMUP_SNAPSHOT") or None
+    cache_warmup_background = os.getenv("CACHE_WARMUP_BACKGROUND", "true").lower() == "true"
     cache_default_timeout = int(os.getenv("CACHE_DEFAULT_TIMEOUT", "3600"))
     redis_url = os.getenv("REDIS_URL")
+    single_flight_lease_seconds = int(os.getenv("SINGLE_FLIGHT_LEASE_SECONDS", "30"))
+    
+    # Near-Duplicate Configuration
+    near_duplicate_enabled = os.getenv("NEAR_DUPLICATE_ENABLED", "true").lower() == "true"
+    near_duplicate_threshold = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9"))
+    near_duplicate_max_entries = int(os.getenv("NEAR_DUPLICATE_MAX_ENTRIES", "10000"))
+    near_duplicate_db_path = os.getenv("NEAR_DUPLICATE_DB_PATH") or None
+    analysis_store_path = os.getenv("ANALYSIS_STORE_PATH") or None
+    analysis_store_batch_size = max(1, int(os.getenv("ANALYSIS_STORE_BATCH_SIZE", "500")))
+    analysis_store_queue_size = max(1, int(os.getenv("ANALYSIS_STORE_QUEUE_SIZE", "100000")))
+    pre_classifier_model_path = os.getenv("PRE_CLASSIFIER_MODEL_PATH") or None
+    pre_classifier_threshold_str = os.getenv("PRE_CLASSIFIER_THRESHOLD", "")
+    pre_classifier_threshold = float(pre_classifier_threshold_str) if pre_classifier_threshold_str else None
     
     # Security Configuration
     rate_limit_enabled = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
@@ -99,6 +224,8 @@ def load_config(dotenv_path: Optional[str] = None) -> AppConfig:
     valid_api_keys = [key.strip() for key in api_keys_str.split(",") if key.strip()] if api_keys_str else []
     
     # Monitoring Configuration
+    metrics_enabled = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    lazy_startup = os.getenv("LAZY_STARTUP", "true").lower() == "true"
     sentry_dsn = os.getenv("SENTRY_DSN")
     environment = os.getenv("ENVIRONMENT", "development")
 
@@ -115,17 +242,73 @@ def load_config(dotenv_path: Optional[str] = None) -> AppConfig:
         port=port,
         max_file_size_mb=max_file_size_mb,
         max_pdf_chars=max_pdf_chars,
+        pdf_max_pages=pdf_max_pages,
+        pdf_timeout=pdf_timeout,
+        pdf_max_memory_mb=pdf_max_memory_mb,
+        pdf_workers=pdf_workers,
         max_batch_size=max_batch_size,
+        batch_concurrency=batch_concurrency,
+        gemini_pack_size=gemini_pack_size,
+        gemini_token_budget=gemini_token_budget,
+        gemini_system_instruction=gemini_system_instruction,
         smtp_timeout=smtp_timeout,
+        smtp_starttls=smtp_starttls,
+        smtp_pool_size=smtp_pool_size,
+        smtp_max_messages_per_connection=smtp_max_messages_per_connection,
+        smtp_idle_timeout=smtp_idle_timeout,
+        outbound_workers=outbound_workers,
+        outbound_digest_seconds=outbound_digest_seconds,
+        outbound_digest_max=outbound_digest_max,
+        outbound_max_attempts=outbound_max_attempts,
+        outbound_retry_seconds=outbound_retry_seconds,
+        outbound_queue_size=outbound_queue_size,
+        auto_reply_enabled=auto_reply_enabled,
         gemini_timeout=gemini_timeout,
+        gemini_endpoint=gemini_endpoint,
+        gemini_api_keys=gemini_api_keys,
+        gemini_models=gemini_models,
+        gemini_key_rpm=gemini_key_rpm,
+        gemini_key_tpm=gemini_key_tpm,
+        gemini_key_cooldown_seconds=gemini_key_cooldown_seconds,
         request_timeout=request_timeout,
+        request_deadline=request_deadline,
+        circuit_failure_threshold=circuit_failure_threshold,
+        circuit_recovery_seconds=circuit_recovery_seconds,
+        adaptive_concurrency_enabled=adaptive_concurrency_enabled,
+        gemini_concurrency_initial=gemini_concurrency_initial,
+        gemini_concurrency_min=gemini_concurrency_min,
+        gemini_concurrency_max=gemini_concurrency_max,
+        gemini_queue_timeout=gemini_queue_timeout,
+        asgi_gemini_concurrency=asgi_gemini_concurrency,
+        asgi_flask_threads=asgi_flask_threads,
+        job_store=job_store,
+        job_workers=job_workers,
+        job_ttl=job_ttl,
         cache_type=cache_type,
+        cache_threshold=cache_threshold,
+        cache_warmup_entries=cache_warmup_entries,
+        cache_warmup_seconds=cache_warmup_seconds,
+        cache_warmup_max_mb=cache_warmup_max_mb,
+        cache_warmup_snapshot=cache_warmup_snapshot,
+        cache_warmup_background=cache_warmup_background,
         cache_default_timeout=cache_default_timeout,
         redis_url=redis_url,
+        single_flight_lease_seconds=single_flight_lease_seconds,
+        near_duplicate_enabled=near_duplicate_enabled,
+        near_duplicate_threshold=near_duplicate_threshold,
+        near_duplicate_max_entries=near_duplicate_max_entries,
+        near_duplicate_db_path=near_duplicate_db_path,
+        analysis_store_path=analysis_store_path,
+        analysis_store_batch_size=analysis_store_batch_size,
+        analysis_store_queue_size=analysis_store_queue_size,
+        pre_classifier_model_path=pre_classifier_model_path,
+        pre_classifier_threshold=pre_classifier_threshold,
         rate_limit_enabled=rate_limit_enabled,
         rate_limit_default=rate_limit_default,
         api_key_required=api_key_required,
         valid_api_keys=valid_api_keys,
+        metrics_enabled=metrics_enabled,
+        lazy_startup=lazy_startup,
         sentry_dsn=sentry_dsn,
         environment=environment,
     )
@@ -1,9 +1,86 @@
-from typing import Any
-import google.generativeai as genai
-from dataclasses import dataclass
+from typing import Any, AsyncIterator, Iterator, Optional
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
 import logging
+import threading
 import time
 
+from .resilience import (
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    ConcurrencyLimitError,
+    DeadlineExceededError,
+    backoff_with_jitter,
+    remaining_time,
+)
+
+try:
+    from ..utils import metrics
+except ImportError:
+    from utils import metrics
+
+
+class KeyedGenerativeModel:
+    """
+    `genai.GenerativeModel` com clientes próprios, criados com a sua chave.
+    
+    Para devs iniciantes: `genai.configure(api_key=...)` troca a chave do
+    processo inteiro; aqui cada modelo carrega a sua, então várias chaves
+    (ver `GeminiClientPool`) podem ser usadas ao mesmo tempo.
+    
+    O SDK (`google.generativeai`, ~0,8s só para importar) é carregado na
+    primeira chamada, não ao criar o app: a instância do Cloud Run sobe e
+    responde ao /health sem pagar esse import. `load()` antecipa a carga
+    (usado com `LAZY_STARTUP=false`).
+    """
+
+    def __init__(self, model_name: str, *, api_key: str, endpoint: Optional[str] = None,
+                 system_instruction: Optional[str] = None) -> None:
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self._client_options = {"api_key": api_key}
+        self._transport = None
+        if endpoint:
+            # Endpoint alternativo: REST (HTTP/JSON) permite apontar para um servidor local
+            self._client_options["api_endpoint"] = endpoint
+            self._transport = "rest"
+        self._model: Any = None
+        self._lock = threading.Lock()
+
+    def load(self) -> Any:
+        """Importa o SDK e cria o modelo (uma vez só, mesmo com várias threads)."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.ai.generativelanguage as glm
+                    import google.generativeai as genai
+
+                    model = genai.GenerativeModel(self.model_name, system_instruction=self.system_instruction)
+                    model._client = glm.GenerativeServiceClient(
+                        client_options=self._client_options,
+                        transport=self._transport
+                    )
+                    self._model = model
+        return self._model
+
+    @property
+    def _client(self) -> Any:
+        return self.load()._client
+
+    def generate_content(self, *args: Any, **kwargs: Any) -> Any:
+        return self.load().generate_content(*args, **kwargs)
+
+    async def generate_content_async(self, *args: Any, **kwargs: Any) -> Any:
+        model = self.load()
+        if model._async_client is None:
+            import google.ai.generativelanguage as glm
+
+            # Criado já dentro do event loop (o canal gRPC assíncrono fica preso a ele)
+            model._async_client = glm.GenerativeServiceAsyncClient(client_options=self._client_options)
+        return await model.generate_content_async(*args, **kwargs)
+
 
 @dataclass
 class GeminiClient:
@@ -14,68 +91,291 @@ class GeminiClient:
     api_key: str
     model_name: str
     timeout: int = 600  # 10 minutos de timeout para análise de arquivos grandes
+    endpoint: Optional[str] = None  # Ex.: "http://localhost:8090" (servidor stub para testes de carga)
+    system_instruction: Optional[str] = None  # Parte fixa do prompt, enviada à parte do conteúdo de cada chamada
+    batch_system_instruction: Optional[str] = None  # Idem para chamadas em lote (`batch=True`), em outro modelo
+    max_retries: int = 3
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)  # Compartilhado pelas threads do processo
+    limiter: Optional[AdaptiveConcurrencyLimiter] = None  # Limite adaptativo de chamadas simultâneas (None = sem limite)
 
     def __post_init__(self) -> None:
-        # 1. Configura a API Key globalmente
-        genai.configure(api_key=self.api_key)
+        if self.endpoint:
+            logging.info(f"GeminiClient usando endpoint alternativo: {self.endpoint}")
         
-        # 2. Inicializa o modelo uma única vez
-        self.model = genai.GenerativeModel(self.model_name)
+        # Inicializa os modelos uma única vez (com a instrução fixa de cada formato, se houver)
+        self.model = self._build_model(self.model_name, self.api_key, self.system_instruction)
+        self.batch_model = None
+        if self.batch_system_instruction:
+            self.batch_model = self._build_model(self.model_name, self.api_key, self.batch_system_instruction)
         
         logging.info(f"GeminiClient inicializado com modelo: {self.model_name}")
 
-    def _attempt_generate(self, prompt: str, is_json: bool, temperature: float, max_output_tokens: int) -> Any:
-        """Helper interno para realizar a chamada e o retry com backoff."""
-        max_retries = 3
-        
-        # Define a configuração de geração, incluindo JSON mime type se necessário
+    def _build_model(self, model_name: str, api_key: str, system_instruction: Optional[str]) -> Any:
+        """Modelo com a chave própria (sem `genai.configure`, que é global ao processo)."""
+        return KeyedGenerativeModel(
+            model_name, api_key=api_key, endpoint=self.endpoint, system_instruction=system_instruction
+        )
+
+    def _models(self) -> list:
+        """Todos os modelos do cliente (o pool tem um por chave e modelo)."""
+        return [model for model in (self.model, self.batch_model) if model is not None]
+
+    def preload(self) -> None:
+        """Carrega o SDK e cria os clientes agora, em vez de na primeira chamada."""
+        for model in self._models():
+            load = getattr(model, "load", None)  # Modelos falsos (benchmarks/testes) não têm
+            if load is not None:
+                load()
+
+    def _model_for(self, batch: bool) -> Any:
+        """
+        Modelo da próxima tentativa, com a instrução do formato pedido (o
+        individual, se não houver um de lote). Chamado a cada tentativa.
+        """
+        return self.batch_model if batch and self.batch_model is not None else self.model
+
+    def _generation_config(self, is_json: bool, temperature: float, max_output_tokens: int) -> dict:
+        """Configuração de geração, incluindo JSON mime type se necessário."""
         config = {
             "temperature": temperature,
             "max_output_tokens": max_output_tokens,
         }
         if is_json:
             config["response_mime_type"] = "application/json"
+        return config
+
+    def _before_attempt(self) -> float:
+        """
+        Verifica prazo e circuit breaker antes de uma tentativa e devolve o
+        timeout dela (no máximo o tempo que resta do prazo).
+        """
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            error = DeadlineExceededError("Prazo da requisição esgotado antes da chamada ao Gemini")
+            metrics.count_gemini_failure(error)
+            raise error
+        
+        # Circuito aberto: falha na hora em vez de prender a thread
+        if not self.breaker.allow_request():
+            error = CircuitOpenError("Gemini indisponível (circuit breaker aberto)")
+            metrics.count_gemini_failure(error)
+            raise error
+        
+        return self.timeout if remaining is None else min(self.timeout, remaining)
+
+    @staticmethod
+    def _request_options(attempt_timeout: float) -> dict:
+        """
+        Opções de cada chamada ao SDK. `retry: None` desliga o retry interno do
+        SDK (até 600s em erros 503 dentro de uma única "tentativa"): os retries
+        são os daqui, que respeitam o prazo e alimentam o circuit breaker.
+        """
+        return {"timeout": attempt_timeout, "retry": None}
+
+    def _after_success(self, response: Any, model: Any) -> Any:
+        logging.info("Chamada ao Gemini bem-sucedida")
+        self.breaker.record_success()
+        metrics.record_token_usage(response)
+        return response
+
+    def _after_attempt(self, model: Any) -> None:
+        """Fim da tentativa, qualquer que seja o resultado (chamado num `finally`)."""
+
+    def _after_cancel(self, model: Any) -> None:
+        """Tentativa interrompida sem resultado (ex.: `asyncio.CancelledError`)."""
+        self.breaker.release_probe()
+
+    def _retry_wait(self, attempt: int, error: Exception) -> float:
+        """Espera antes da próxima tentativa: backoff exponencial com jitter."""
+        return backoff_with_jitter(attempt)
+
+    def _after_failure(self, attempt: int, error: Exception, model: Any) -> float:
+        """
+        Registra a falha e devolve quanto esperar antes da próxima tentativa.
+        Relança a exceção se não houver mais tentativas (ou tempo para elas).
+        `model` é o modelo da tentativa (usado pelas subclasses, ex.: o pool).
+        """
+        self.breaker.record_failure()
+        wait_time = self._retry_wait(attempt, error)
+        remaining = remaining_time()
+        out_of_time = remaining is not None and remaining <= wait_time
+        
+        if attempt == self.max_retries - 1 or out_of_time:
+            # Falha final (sem tentativas ou sem tempo para mais uma)
+            reason = "prazo da requisição esgotado" if out_of_time else f"{self.max_retries} tentativas"
+            logging.error(f"Falha final após {attempt + 1} tentativa(s) ({reason}): {error}")
+            metrics.count_gemini_failure(error)
+            raise error
+        
+        # Tentativa falhou, espera (com jitter) e tenta novamente
+        logging.warning(f"Tentativa {attempt + 1} falhou: {error}. Tentando novamente em {wait_time:.1f}s...")
+        metrics.count_gemini_retry(error)
+        return wait_time
+
+    def _queue_timeout(self) -> float:
+        """Espera máxima na fila do limitador: `queue_timeout`, sem passar do prazo da requisição."""
+        remaining = remaining_time()
+        timeout = self.limiter.queue_timeout
+        return timeout if remaining is None else max(0.0, min(timeout, remaining))
+
+    def _limit_error(self) -> ConcurrencyLimitError:
+        error = ConcurrencyLimitError(
+            f"Gemini no limite de {self.limiter.limit} chamadas simultâneas e a fila esgotou o tempo"
+        )
+        logging.warning(str(error))
+        metrics.count_gemini_failure(error)
+        return error
+
+    def _release_slot(self, call: dict) -> None:
+        """Devolve a vaga do limitador com a latência e o erro da chamada (se ela chegou a ser feita)."""
+        started = call.get("started")
+        self.limiter.release(None if started is None else time.perf_counter() - started, call.get("error"))
+        metrics.set_gemini_concurrency_limit(self.limiter.limit)
+
+    @contextmanager
+    def _limiter_slot(self) -> Iterator[dict]:
+        """
+        Ocupa uma vaga do limitador durante a tentativa. Preencha `call["started"]`
+        antes da chamada e `call["error"]` se ela falhar: é o que ajusta o limite.
+        """
+        if self.limiter is None:
+            yield {}
+            return
+        with metrics.time_stage("gemini_queue_wait"):
+            acquired = self.limiter.acquire(self._queue_timeout())
+        if not acquired:
+            raise self._limit_error()
+        call: dict = {}
+        try:
+            yield call
+        finally:
+            self._release_slot(call)
+
+    @asynccontextmanager
+    async def _limiter_slot_async(self) -> AsyncIterator[dict]:
+        """Versão assíncrona de `_limiter_slot` (a fila espera no event loop)."""
+        if self.limiter is None:
+            yield {}
+            return
+        with metrics.time_stage("gemini_queue_wait"):
+            acquired = await self.limiter.acquire_async(self._queue_timeout())
+        if not acquired:
+            raise self._limit_error()
+        call: dict = {}
+        try:
+            yield call
+        finally:
+            self._release_slot(call)
+
+    def _attempt_generate(self, prompt: str, is_json: bool, temperature: float, max_output_tokens: int,
+                          batch: bool = False) -> Any:
+        """
+        Helper interno para realizar a chamada e o retry com backoff.
+        Respeita o limitador de concorrência, o circuit breaker e o prazo da
+        requisição (`deadline_scope`).
+        """
+        config = self._generation_config(is_json, temperature, max_output_tokens)
         
-        for attempt in range(max_retries):
-            try:
-                logging.info(f"Tentativa {attempt + 1}/{max_retries} de chamada ao Gemini")
-                
-                response = self.model.generate_content(
-                    prompt,
-                    generation_config=config,
-                    request_options={"timeout": self.timeout}
-                )
-                
-                # Sucesso: Retorna a resposta
-                logging.info("Chamada ao Gemini bem-sucedida")
-                return response
-                
-            except Exception as e:
-                if attempt == max_retries - 1:
-                    # Falha final
-                    logging.error(f"Falha final após {max_retries} tentativas: {e}")
+        for attempt in range(self.max_retries):
+            with self._limiter_slot() as call:
+                attempt_timeout = self._before_attempt()
+                model = self._model_for(batch)
+                try:
+                    logging.info(f"Tentativa {attempt + 1}/{self.max_retries} de chamada ao Gemini")
+                    call["started"] = time.perf_counter()
+                    with metrics.track_in_flight("gemini_call"), metrics.time_stage("gemini_call"):
+                        response = model.generate_content(
+                            prompt,
+                            generation_config=config,
+                            request_options=self._request_options(attempt_timeout)
+                        )
+                    return self._after_success(response, model)
+                except Exception as e:
+                    call["error"] = e
+                    wait_time = self._after_failure(attempt, e, model)
+                except BaseException:
+                    self._after_cancel(model)
                     raise
-                else:
-                    # Tentativa falhou, espera e tenta novamente
-                    wait_time = 2 ** attempt
-                    logging.warning(f"Tentativa {attempt + 1} falhou: {e}. Tentando novamente em {wait_time}s...")
-                    time.sleep(wait_time)  # Backoff exponencial
-
-    def generate_json(self, prompt: str, *, temperature: float = 0.2, max_output_tokens: int = 2048) -> str:
-        """Gera conteúdo em formato JSON (string) a partir do prompt fornecido."""
+                finally:
+                    self._after_attempt(model)
+            # A espera do backoff fica fora do limitador: a vaga já foi devolvida
+            with metrics.time_stage("gemini_retry_wait"):
+                time.sleep(wait_time)  # Backoff exponencial com jitter
+
+    async def _attempt_generate_async(self, prompt: str, is_json: bool, temperature: float, max_output_tokens: int,
+                                      batch: bool = False) -> Any:
+        """
+        Versão assíncrona de `_attempt_generate` (mesmos retries, limitador,
+        prazo e circuit breaker): enquanto espera o Gemini, o event loop
+        atende outras requisições em vez de prender uma thread.
+        """
+        config = self._generation_config(is_json, temperature, max_output_tokens)
+        
+        for attempt in range(self.max_retries):
+            async with self._limiter_slot_async() as call:
+                attempt_timeout = self._before_attempt()
+                model = self._model_for(batch)
+                try:
+                    logging.info(f"Tentativa {attempt + 1}/{self.max_retries} de chamada assíncrona ao Gemini")
+                    call["started"] = time.perf_counter()
+                    with metrics.track_in_flight("gemini_call"), metrics.time_stage("gemini_call"):
+                        request_options = self._request_options(attempt_timeout)
+                        if self.endpoint:
+                            # Endpoint alternativo usa REST, que não tem cliente assíncrono no SDK: roda em uma thread
+                            response = await asyncio.to_thread(
+                                model.generate_content, prompt,
+                                generation_config=config, request_options=request_options
+                            )
+                        else:
+                            response = await model.generate_content_async(
+                                prompt, generation_config=config, request_options=request_options
+                            )
+                    return self._after_success(response, model)
+                except Exception as e:
+                    call["error"] = e
+                    wait_time = self._after_failure(attempt, e, model)
+                except BaseException:
+                    # CancelledError (cliente desconectou, wait_for): sem veredito sobre o Gemini
+                    self._after_cancel(model)
+                    raise
+                finally:
+                    self._after_attempt(model)
+            with metrics.time_stage("gemini_retry_wait"):
+                await asyncio.sleep(wait_time)
+
+    @staticmethod
+    def _check_response(response: Any) -> None:
+        """Validação de Conteúdo: acesso seguro ao texto da resposta."""
+        if not response.candidates or not response.candidates[0].content.parts:
+            logging.error(f"Resposta inválida do Gemini: candidates={response.candidates}")
+            raise ValueError("Resposta inválida do Gemini: nenhum conteúdo retornado")
+
+    def generate_json(self, prompt: str, *, temperature: float = 0.2, max_output_tokens: int = 2048,
+                      batch: bool = False) -> str:
+        """Gera conteúdo em formato JSON (string) a partir do prompt fornecido (`batch`: prompt de lote)."""
         
         response = self._attempt_generate(
             prompt, 
             is_json=True, 
             temperature=temperature, 
-            max_output_tokens=max_output_tokens
+            max_output_tokens=max_output_tokens,
+            batch=batch
         )
+        self._check_response(response)
+        return response.text
+
+    async def generate_json_async(self, prompt: str, *, temperature: float = 0.2, max_output_tokens: int = 2048,
+                                  batch: bool = False) -> str:
+        """Versão assíncrona de `generate_json` (usa a API assíncrona do SDK)."""
         
-        # Validação de Conteúdo: Acesso seguro ao texto da resposta
-        if not response.candidates or not response.candidates[0].content.parts:
-            logging.error(f"Resposta inválida do Gemini: candidates={response.candidates}")
-            raise ValueError("Resposta inválida do Gemini: nenhum conteúdo retornado")
-            
+        response = await self._attempt_generate_async(
+            prompt,
+            is_json=True,
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+            batch=batch
+        )
+        self._check_response(response)
         return response.text
 
     def generate_content(self, prompt: str, *, temperature: float = 0.2, max_output_tokens: int = 2048):
@@ -87,9 +387,5 @@ class GeminiClient:
             temperature=temperature, 
             max_output_tokens=max_output_tokens
         )
-        
-        # Validação de Conteúdo
-        if not response.candidates or not response.candidates[0].content.parts:
-            raise ValueError("Resposta inválida do Gemini: nenhum conteúdo retornado")
-            
+        self._check_response(response)
         return response
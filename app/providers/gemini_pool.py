@@ -0,0 +1,198 @@
+"""
+Pool de chaves (e modelos) do Gemini com roteamento pela cota livre.
+
+Para devs iniciantes:
+- Cada chave da API tem a sua cota por minuto: requisições (RPM) e tokens
+  (TPM). Com uma chave só, todo o tráfego divide a mesma cota; com várias, o
+  pool distribui as chamadas entre elas.
+- Cada par (chave, modelo) é um "slot". O pool conta as requisições e os
+  tokens de cada slot em uma janela deslizante (os últimos 60s) e manda a
+  próxima tentativa para o slot com mais folga (a menor fração de cota usada).
+  Sem limites configurados, vai para o slot menos ocupado.
+- Um 429 (cota esgotada) deixa o slot "de castigo" por `cooldown_seconds`;
+  se outro slot estiver livre, a próxima tentativa vai para ele na hora, sem
+  esperar o backoff.
+- Os retries, o prazo da requisição e o circuit breaker são os do
+  `GeminiClient` (o pool é uma subclasse que só escolhe o modelo de cada
+  tentativa). Cada modelo tem os seus clientes, com a sua chave, então o
+  `genai.configure` global não é usado.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from .gemini_client import GeminiClient
+from .resilience import is_rate_limited
+
+
+def mask_key(api_key: str) -> str:
+    """Identificação da chave para logs e /health, sem expô-la."""
+    return f"...{api_key[-4:]}"
+
+
+class SlidingWindow:
+    """Soma dos valores registrados nos últimos `seconds` segundos (não é thread-safe: use com o lock do pool)."""
+
+    def __init__(self, seconds: float) -> None:
+        self.seconds = seconds
+        self._events: Deque[Tuple[float, int]] = deque()
+        self._total = 0
+
+    def add(self, now: float, amount: int = 1) -> None:
+        self._events.append((now, amount))
+        self._total += amount
+
+    def total(self, now: float) -> int:
+        # Descarta o que saiu da janela
+        while self._events and self._events[0][0] <= now - self.seconds:
+            self._total -= self._events.popleft()[1]
+        return self._total
+
+
+class KeySlot:
+    """Um par (chave, modelo) do pool, com o uso recente e o castigo após 429."""
+
+    def __init__(self, label: str, model_name: str, model: Any, batch_model: Any, window_seconds: float) -> None:
+        self.label = label
+        self.model_name = model_name
+        self.model = model
+        self.batch_model = batch_model
+        self.requests = SlidingWindow(window_seconds)
+        self.tokens = SlidingWindow(window_seconds)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.rate_limited = 0  # Total de 429 recebidos
+
+    def headroom(self, now: float, rpm_limit: int, tpm_limit: int) -> float:
+        """Fração da cota ainda livre na janela (1 = intocada; 0 ou menos = esgotada)."""
+        fractions = [1.0]
+        if rpm_limit:
+            fractions.append(1 - self.requests.total(now) / rpm_limit)
+        if tpm_limit:
+            fractions.append(1 - self.tokens.total(now) / tpm_limit)
+        return min(fractions)
+
+
+@dataclass
+class GeminiClientPool(GeminiClient):
+    """
+    GeminiClient que distribui as tentativas entre várias chaves e modelos.
+    `api_key` e `model_name` valem quando `api_keys` / `model_names` estão vazios.
+    """
+    api_keys: Sequence[str] = ()
+    model_names: Sequence[str] = ()
+    rpm_limit: int = 0  # Requisições por minuto de cada chave (0 = desconhecido)
+    tpm_limit: int = 0  # Tokens por minuto de cada chave (0 = desconhecido)
+    cooldown_seconds: float = 30.0  # Tempo sem usar um slot que recebeu 429
+    window_seconds: float = 60.0
+    clock: Callable[[], float] = time.monotonic
+
+    def __post_init__(self) -> None:
+        keys = list(self.api_keys) or [self.api_key]
+        model_names = list(self.model_names) or [self.model_name]
+
+        self.slots: List[KeySlot] = []
+        for api_key in keys:
+            for model_name in model_names:
+                model = self._build_model(model_name, api_key, self.system_instruction)
+                batch_model = None
+                if self.batch_system_instruction:
+                    batch_model = self._build_model(model_name, api_key, self.batch_system_instruction)
+                self.slots.append(KeySlot(mask_key(api_key), model_name, model, batch_model, self.window_seconds))
+
+        self._lock = threading.Lock()
+        self._slot_by_model: Dict[int, KeySlot] = {}
+        for slot in self.slots:
+            for model in (slot.model, slot.batch_model):
+                if model is not None:
+                    self._slot_by_model[id(model)] = slot
+
+        # Compatibilidade com quem lê `client.model` (ex.: /health)
+        self.model = self.slots[0].model
+        self.batch_model = self.slots[0].batch_model
+        logging.info(f"GeminiClientPool inicializado com {len(keys)} chave(s) e modelo(s) {model_names}")
+
+    def _models(self) -> list:
+        return [model for slot in self.slots for model in (slot.model, slot.batch_model) if model is not None]
+
+    def _pick_slot(self, now: float) -> KeySlot:
+        """Slot fora de castigo com mais folga (empate: menos chamadas em andamento e na janela)."""
+        ready = [slot for slot in self.slots if slot.cooldown_until <= now]
+        if not ready:
+            # Todos de castigo: usa o que sai primeiro (o retry do cliente cuida de um novo 429)
+            return min(self.slots, key=lambda slot: slot.cooldown_until)
+        return max(ready, key=lambda slot: (
+            slot.headroom(now, self.rpm_limit, self.tpm_limit),
+            -slot.in_flight,
+            -slot.requests.total(now),
+        ))
+
+    def _model_for(self, batch: bool) -> Any:
+        with self._lock:
+            now = self.clock()
+            slot = self._pick_slot(now)
+            slot.requests.add(now)
+            slot.in_flight += 1
+        if batch and slot.batch_model is not None:
+            return slot.batch_model
+        return slot.model
+
+    def _slot_of(self, model: Any) -> Optional[KeySlot]:
+        return self._slot_by_model.get(id(model))
+
+    def _after_success(self, response: Any, model: Any) -> Any:
+        slot = self._slot_of(model)
+        if slot is not None:
+            usage = getattr(response, "usage_metadata", None)
+            tokens = getattr(usage, "total_token_count", 0) or 0
+            if tokens:
+                with self._lock:
+                    slot.tokens.add(self.clock(), tokens)
+        return super()._after_success(response, model)
+
+    def _after_failure(self, attempt: int, error: Exception, model: Any) -> float:
+        slot = self._slot_of(model)
+        if slot is not None and is_rate_limited(error):
+            with self._lock:
+                slot.cooldown_until = self.clock() + self.cooldown_seconds
+                slot.rate_limited += 1
+            logging.warning(f"Chave {slot.label} ({slot.model_name}) recebeu 429: "
+                            f"fora de uso por {self.cooldown_seconds:.0f}s")
+        return super()._after_failure(attempt, error, model)
+
+    def _after_attempt(self, model: Any) -> None:
+        # Num `finally`: vale também para tentativas canceladas (sem sucesso nem falha)
+        slot = self._slot_of(model)
+        if slot is not None:
+            with self._lock:
+                slot.in_flight -= 1
+
+    def _retry_wait(self, attempt: int, error: Exception) -> float:
+        if is_rate_limited(error):
+            with self._lock:
+                now = self.clock()
+                if any(slot.cooldown_until <= now for slot in self.slots):
+                    # Cota de uma chave esgotada não é motivo para esperar: outra está livre
+                    return 0.0
+        return super()._retry_wait(attempt, error)
+
+    def stats(self) -> List[dict]:
+        """Uso de cada slot na janela atual (para o /health)."""
+        with self._lock:
+            now = self.clock()
+            return [
+                {
+                    "key": slot.label,
+                    "model": slot.model_name,
+                    "requests_in_window": slot.requests.total(now),
+                    "tokens_in_window": slot.tokens.total(now),
+                    "in_flight": slot.in_flight,
+                    "headroom": round(slot.headroom(now, self.rpm_limit, self.tpm_limit), 3),
+                    "cooldown_remaining": round(max(0.0, slot.cooldown_until - now), 1),
+                    "rate_limited_total": slot.rate_limited,
+                }
+                for slot in self.slots
+            ]
@@ -0,0 +1,321 @@
+"""
+Proteções para chamadas ao Gemini: circuit breaker, prazo (deadline) e backoff.
+
+Para devs iniciantes:
+- Circuit breaker funciona como um disjuntor. FECHADO: chamadas passam
+  normalmente. Depois de `failure_threshold` falhas seguidas ele ABRE: por
+  `recovery_timeout` segundos nenhuma chamada é feita (falha na hora, sem
+  ocupar a thread). Passado esse tempo fica MEIO-ABERTO: UMA chamada de teste
+  passa; se der certo ele fecha, se falhar abre de novo.
+- Deadline é o prazo final da requisição. Cada tentativa usa no máximo o tempo
+  que ainda resta e nenhum retry começa se não houver tempo para ele.
+  O prazo fica em um `contextvars.ContextVar`, então vale para a thread da
+  requisição (e para as threads do lote, que copiam o contexto).
+- O backoff entre tentativas tem "jitter" (parte aleatória) para que várias
+  threads não tentem de novo todas no mesmo instante.
+- O limitador adaptativo (AIMD, como o controle de congestionamento do TCP)
+  decide quantas chamadas ao Gemini podem estar em andamento ao mesmo tempo.
+  Enquanto as respostas chegam rápido, o limite SOBE devagar (+1 a cada
+  "rodada" de `limit` respostas); um 429 ou um pico de latência CORTA o
+  limite pela metade. Quem passa do limite espera numa fila por no máximo
+  `queue_timeout` segundos e depois desiste (o email vai para curadoria).
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, Iterator, Optional
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+_deadline: ContextVar[Optional[float]] = ContextVar("gemini_deadline", default=None)
+
+
+class CircuitOpenError(Exception):
+    """Circuito aberto: o Gemini está falhando e a chamada nem foi feita."""
+
+
+class DeadlineExceededError(Exception):
+    """Não resta tempo do prazo da requisição para (mais) uma tentativa."""
+
+
+class ConcurrencyLimitError(Exception):
+    """A fila do limitador de concorrência esgotou o tempo: a chamada nem foi feita."""
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """O erro é um 429 (`ResourceExhausted` do google.api_core)?"""
+    return getattr(error, "code", None) == 429
+
+
+class CircuitBreaker:
+    """
+    Disjuntor compartilhado por todas as threads do processo (thread-safe).
+
+    - `allow_request()`: pode chamar agora?
+    - `record_success()` / `record_failure()`: resultado da chamada
+    - `release_probe()`: chamada cancelada, sem resultado (libera a de teste)
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30,
+                 clock=time.monotonic) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == STATE_CLOSED:
+                return True
+            if state == STATE_HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True  # Só uma chamada de teste por vez
+                self._state = STATE_HALF_OPEN
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = STATE_CLOSED
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._probe_in_flight or self._consecutive_failures >= self.failure_threshold:
+                self._state = STATE_OPEN
+                self._opened_at = self._clock()
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """
+        Chamada cancelada antes do resultado (cliente desconectou, `wait_for`
+        esgotou): não diz nada sobre o Gemini, mas a vaga da chamada de teste
+        precisa voltar, senão o circuito meio-aberto recusaria tudo para sempre.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._consecutive_failures,
+                "rejected_calls": self._rejected,
+            }
+
+    def _current_state(self) -> str:
+        """Estado considerando o tempo de recuperação (com o lock)."""
+        if self._state == STATE_OPEN and self._clock() - self._opened_at >= self.recovery_timeout:
+            return STATE_HALF_OPEN
+        return self._state
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Define o prazo das chamadas ao Gemini feitas dentro do bloco.
+    Um prazo externo mais curto (já definido) continua valendo.
+    """
+    if seconds is None:
+        yield
+        return
+    new_deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(new_deadline if current is None else min(current, new_deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Segundos que restam do prazo atual (None = sem prazo)."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def backoff_with_jitter(attempt: int, base: float = 1.0, cap: float = 8.0, rng: random.Random = random) -> float:
+    """
+    Espera antes da próxima tentativa: metade fixa + metade aleatória
+    ("equal jitter") de min(cap, base * 2^tentativa).
+    """
+    ceiling = min(cap, base * (2 ** attempt))
+    return ceiling / 2 + rng.uniform(0, ceiling / 2)
+
+
+class _Waiter:
+    """Quem espera uma vaga no limitador; `granted` = a vaga já é dele."""
+    __slots__ = ("notify", "granted")
+
+    def __init__(self, notify: Callable[[], None]) -> None:
+        self.notify = notify
+        self.granted = False
+
+
+def _resolve(future: "asyncio.Future[None]") -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limite adaptativo (AIMD) de chamadas simultâneas, compartilhado pelas
+    threads e pelo event loop do processo (thread-safe).
+
+    - `acquire(timeout)` / `await acquire_async(timeout)`: espera uma vaga
+      (fila por ordem de chegada); False se o tempo acabar
+    - `release(latency, error)`: devolve a vaga e informa como foi a chamada
+      (`latency=None`: a chamada nem foi feita, não conta para o ajuste)
+    """
+
+    def __init__(self, initial_limit: int = 16, min_limit: int = 1, max_limit: int = 256,
+                 queue_timeout: float = 10.0, decrease_factor: float = 0.5,
+                 latency_spike_factor: float = 3.0, clock=time.monotonic) -> None:
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.queue_timeout = queue_timeout
+        self.decrease_factor = decrease_factor
+        self.latency_spike_factor = latency_spike_factor
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._limit = float(min(self.max_limit, max(self.min_limit, initial_limit)))
+        self._in_flight = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._baseline_latency: Optional[float] = None  # Média móvel (EWMA) das latências
+        self._last_decrease = float("-inf")
+        self._rejected = 0
+        self._decreases = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self, timeout: float) -> bool:
+        """Espera (bloqueando a thread) por no máximo `timeout` segundos."""
+        with self._lock:
+            if self._try_take():
+                return True
+            if timeout <= 0:
+                self._rejected += 1
+                return False
+            event = threading.Event()
+            waiter = _Waiter(event.set)
+            self._waiters.append(waiter)
+        event.wait(timeout)
+        with self._lock:
+            return self._settle(waiter)
+
+    async def acquire_async(self, timeout: float) -> bool:
+        """Igual a `acquire`, mas espera no event loop sem prender uma thread."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_take():
+                return True
+            if timeout <= 0:
+                self._rejected += 1
+                return False
+            future = loop.create_future()
+            waiter = _Waiter(lambda: loop.call_soon_threadsafe(_resolve, future))
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            with self._lock:
+                if self._settle(waiter):
+                    # A vaga chegou junto com o cancelamento: devolve para o próximo
+                    self._in_flight -= 1
+                    self._grant_waiters()
+            raise
+        with self._lock:
+            return self._settle(waiter)
+
+    def release(self, latency: Optional[float] = None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if latency is not None:
+                self._adjust(latency, error)
+            self._grant_waiters()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self._in_flight,
+                "queued": len(self._waiters),
+                "baseline_latency": round(self._baseline_latency, 3) if self._baseline_latency is not None else None,
+                "decreases": self._decreases,
+                "rejected_calls": self._rejected,
+            }
+
+    def _try_take(self) -> bool:
+        """Pega uma vaga livre, sem furar a fila (com o lock)."""
+        if not self._waiters and self._in_flight < self.limit:
+            self._in_flight += 1
+            return True
+        return False
+
+    def _settle(self, waiter: _Waiter) -> bool:
+        """Depois da espera: a vaga foi entregue? Se não, sai da fila (com o lock)."""
+        if waiter.granted:
+            return True
+        self._waiters.remove(waiter)
+        self._rejected += 1
+        return False
+
+    def _grant_waiters(self) -> None:
+        """Entrega as vagas livres aos primeiros da fila (com o lock)."""
+        while self._waiters and self._in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self._in_flight += 1
+            waiter.notify()
+
+    def _adjust(self, latency: float, error: Optional[BaseException]) -> None:
+        """Aumento aditivo / corte multiplicativo conforme o resultado da chamada (com o lock)."""
+        if error is not None:
+            if is_rate_limited(error):
+                self._decrease()
+            return  # Outros erros ficam com o circuit breaker: o limite só não sobe
+
+        baseline = self._baseline_latency
+        spike = baseline is not None and latency > baseline * self.latency_spike_factor
+        # A referência acompanha devagar a latência real (inclusive se ela mudar de patamar)
+        self._baseline_latency = latency if baseline is None else baseline * 0.95 + latency * 0.05
+        if spike:
+            self._decrease()
+        elif self._in_flight + 1 >= self._limit / 2:
+            # Só sobe se o limite atual está sendo usado (senão cresceria sem medir nada)
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+    def _decrease(self) -> None:
+        # No máximo um corte por "rodada" (a latência típica): as chamadas que
+        # falham juntas no mesmo pico não derrubam o limite várias vezes
+        now = self._clock()
+        if now - self._last_decrease < max(1.0, self._baseline_latency or 0.0):
+            return
+        self._last_decrease = now
+        self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+        self._decreases += 1
@@ -0,0 +1,299 @@
+"""
+Histórico persistente das análises (SQLite em modo WAL).
+
+Para devs iniciantes:
+- O cache do Flask guarda cada análise por `CACHE_DEFAULT_TIMEOUT` (1h) e
+  some num reinício. O AnalysisStore grava todas as análises em um arquivo
+  SQLite: depois que o cache expira, o mesmo email ainda é respondido daqui
+  (sem pagar o Gemini de novo), e o histórico pode ser consultado em
+  `GET /api/analyses`.
+- Gravar não pode atrasar a requisição: `add` só coloca a análise em uma fila
+  em memória e uma thread "escritora" grava em lotes (uma transação para até
+  `batch_size` linhas). Isso aguenta milhares de inserções por segundo.
+- No modo WAL, leituras não esperam a escrita: cada thread lê por uma conexão
+  própria enquanto a escritora grava.
+- Se a fila encher (disco lento demais), a análise é descartada do histórico
+  com um aviso: a resposta ao usuário nunca espera o disco.
+- Só análises novas do Gemini (sem falha) são reaproveitadas pela consulta
+  antes do Gemini; as do pré-classificador e de quase-duplicatas entram só
+  no histórico.
+"""
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parseaddr
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS analyses ("
+    " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+    " content_hash TEXT NOT NULL,"
+    " cache_version TEXT NOT NULL,"
+    " created_at REAL NOT NULL,"
+    " sender TEXT NOT NULL,"
+    " categoria TEXT NOT NULL,"
+    " atencao_humana TEXT NOT NULL,"
+    " reusable INTEGER NOT NULL,"
+    " result TEXT NOT NULL)",
+    # Índices de uma coluna: o SQLite guarda o id junto, então "filtro + ORDER BY id"
+    # (a paginação da API) percorre o índice já na ordem, sem ordenar nada
+    "CREATE INDEX IF NOT EXISTS idx_analyses_hash ON analyses(content_hash, cache_version)",
+    "CREATE INDEX IF NOT EXISTS idx_analyses_sender ON analyses(sender)",
+    "CREATE INDEX IF NOT EXISTS idx_analyses_categoria ON analyses(categoria)",
+    "CREATE INDEX IF NOT EXISTS idx_analyses_atencao ON analyses(atencao_humana)",
+    "CREATE INDEX IF NOT EXISTS idx_analyses_created ON analyses(created_at)",
+)
+
+INSERT_SQL = (
+    "INSERT INTO analyses (content_hash, cache_version, created_at, sender, categoria, atencao_humana, reusable, result)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+# Filtros aceitos por `query` (nome do parâmetro -> condição SQL)
+QUERY_FILTERS = {
+    "sender": "sender = ?",
+    "categoria": "categoria = ?",
+    "atencao_humana": "atencao_humana = ?",
+    "since": "created_at >= ?",
+    "until": "created_at < ?",
+}
+
+MAX_PAGE_SIZE = 500
+
+
+def split_cache_key(cache_key: str) -> Tuple[str, str]:
+    """(hash do conteúdo, versão) a partir da chave `analysis:v2:<versão>:<sha256>`."""
+    _, cache_version, content_hash = cache_key.rsplit(":", 2)
+    return content_hash, cache_version
+
+
+def normalize_sender(sender: str) -> str:
+    """Endereço em minúsculas (o filtro por remetente ignora o nome de exibição)."""
+    address = parseaddr(sender or "")[1]
+    return (address or sender or "").strip().lower()
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")  # Seguro com WAL; só o último commit pode se perder numa queda de energia
+    return db
+
+
+class AnalysisStore:
+    """
+    Histórico de análises em SQLite.
+
+    - `add(cache_key, result_data, reusable)`: enfileira a gravação (não bloqueia)
+    - `find(cache_key)`: última análise reaproveitável do mesmo conteúdo
+    - `query(...)`: página do histórico, da mais nova para a mais antiga
+    - `flush()` / `close()`: esperam a fila ser gravada
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        batch_size: int = 500,
+        queue_size: int = 100000,
+        flush_seconds: float = 0.2
+    ) -> None:
+        self.db_path = db_path
+        self.batch_size = max(1, batch_size)
+        self.queue_size = max(1, queue_size)
+        self.flush_seconds = flush_seconds
+
+        self._db = connect(db_path)  # Conexão da thread escritora
+        for statement in SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+
+        self._queue: "queue.Queue[Any]" = queue.Queue()  # Linhas, pedidos de flush (Event) e None (parar)
+        self._readers = threading.local()  # Uma conexão de leitura por thread
+        self._lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+        logger.info(f"Histórico de análises em {db_path} (SQLite WAL)")
+
+    # --- Escrita (assíncrona, em lotes) ---
+
+    def add(self, cache_key: str, result_data: Dict[str, Any], reusable: bool = True) -> None:
+        """Enfileira a análise para gravação; nunca espera o disco."""
+        if self._closed:
+            return
+        if self._queue.qsize() >= self.queue_size:
+            with self._lock:
+                self.dropped += 1
+            logger.warning("Fila do histórico de análises cheia: análise não gravada")
+            return
+        content_hash, cache_version = split_cache_key(cache_key)
+        self._queue.put((
+            content_hash,
+            cache_version,
+            time.time(),
+            normalize_sender(result_data.get("sender", "")),
+            str(result_data.get("categoria", "")),
+            str(result_data.get("atencao_humana", "")),
+            int(reusable),
+            json.dumps(result_data, ensure_ascii=False),
+        ))
+        self._ensure_writer()
+
+    def flush(self, timeout: float = 10) -> bool:
+        """Espera a fila atual ser gravada (útil em testes e no encerramento)."""
+        if self._writer is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 10) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        with self._lock:
+            writer = self._writer
+        if writer is None:
+            self._db.close()
+            return
+        self._queue.put(None)  # A escritora grava o que falta e fecha a conexão
+        writer.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None and not self._closed:
+                self._writer = threading.Thread(target=self._write_loop, name="analysis-store", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            rows: List[tuple] = []
+            waiters: List[threading.Event] = []
+            # Junta o que chegar em até `flush_seconds` (ou `batch_size` linhas) numa transação
+            stop = self._take(self._queue.get(), rows, waiters)
+            deadline = time.monotonic() + self.flush_seconds
+            while not stop and not waiters and len(rows) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                stop = self._take(item, rows, waiters)
+            self._write(rows)
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                self._db.close()
+                return
+
+    @staticmethod
+    def _take(item: Any, rows: List[tuple], waiters: List[threading.Event]) -> bool:
+        """Separa o item da fila: linha, pedido de flush ou parada (devolve True)."""
+        if item is None:
+            return True
+        if isinstance(item, threading.Event):
+            waiters.append(item)
+        else:
+            rows.append(item)
+        return False
+
+    def _write(self, rows: List[tuple]) -> None:
+        if not rows:
+            return
+        try:
+            with self._db:  # Uma transação para o lote inteiro
+                self._db.executemany(INSERT_SQL, rows)
+            with self._lock:
+                self.written += len(rows)
+        except sqlite3.Error as e:
+            with self._lock:
+                self.dropped += len(rows)
+            logger.warning(f"Falha ao gravar {len(rows)} análise(s) no histórico: {e}")
+
+    # --- Leitura ---
+
+    def _reader(self) -> sqlite3.Connection:
+        db = getattr(self._readers, "db", None)
+        if db is None:
+            db = connect(self.db_path)
+            db.execute("PRAGMA query_only=1")
+            self._readers.db = db
+        return db
+
+    def find(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Análise mais recente (reaproveitável) do mesmo texto com o mesmo modelo/prompt."""
+        content_hash, cache_version = split_cache_key(cache_key)
+        try:
+            row = self._reader().execute(
+                "SELECT result FROM analyses WHERE content_hash = ? AND cache_version = ? AND reusable = 1"
+                " ORDER BY id DESC LIMIT 1",
+                (content_hash, cache_version)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Falha ao consultar o histórico de análises: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def iter_recent(self, cache_version: str) -> Iterator[Tuple[str, str]]:
+        """
+        (hash do conteúdo, resultado em JSON) das análises reaproveitáveis da
+        versão, das mais novas para as mais antigas (lidas aos poucos: quem
+        consome pode parar quando quiser).
+        """
+        cursor = self._reader().execute(
+            "SELECT content_hash, result FROM analyses WHERE cache_version = ? AND reusable = 1 ORDER BY id DESC",
+            (cache_version,)
+        )
+        try:
+            yield from cursor
+        finally:
+            cursor.close()  # Libera a leitura (no WAL, leitura aberta segura o checkpoint)
+
+    def query(self, limit: int = 50, before_id: Optional[int] = None, **filters: Any) -> Dict[str, Any]:
+        """
+        Página do histórico (mais novas primeiro). Filtros: sender, categoria,
+        atencao_humana, since/until (timestamp Unix). `next_cursor` é o
+        `before_id` da próxima página (None = acabou).
+        """
+        unknown = set(filters) - set(QUERY_FILTERS)
+        if unknown:
+            raise ValueError(f"Filtro(s) desconhecido(s): {', '.join(sorted(unknown))}")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        conditions, params = [], []
+        for name, value in filters.items():
+            if value is None or value == "":
+                continue
+            conditions.append(QUERY_FILTERS[name])
+            params.append(normalize_sender(value) if name == "sender" else value)
+        if before_id is not None:
+            conditions.append("id < ?")
+            params.append(int(before_id))
+
+        sql = "SELECT id, created_at, result FROM analyses"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id DESC LIMIT ?"
+        rows = self._reader().execute(sql, (*params, limit + 1)).fetchall()
+
+        items = [
+            {
+                "id": row_id,
+                "created_at": datetime.fromtimestamp(created_at, timezone.utc).isoformat(timespec="seconds"),
+                **json.loads(result),
+            }
+            for row_id, created_at, result in rows[:limit]
+        ]
+        next_cursor = items[-1]["id"] if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,119 @@
+"""
+Aquecimento do cache de análises quando uma instância nova sobe.
+
+Para devs iniciantes:
+- No Cloud Run cada instância nova começa com o SimpleCache vazio: logo depois
+  de escalar, quase toda análise é "miss" e vai ao Gemini. O aquecimento
+  carrega no cache as análises mais recentes antes (ou logo depois) de
+  começar a atender.
+- Fontes: o histórico SQLite (`ANALYSIS_STORE_PATH`) ou um arquivo de
+  snapshot em JSONL (uma linha `{"cache_key": ..., "result": {...}}`), gerado
+  por `flask --app wsgi export-cache-snapshot` e copiado para a imagem ou
+  para um volume.
+- O aquecimento tem limites: número de entradas, tempo e memória (tamanho do
+  JSON das análises). O que passar de qualquer um deles fica de fora: a
+  instância nunca demora a subir por causa do cache.
+- Só entram análises da versão atual do modelo/prompt (as outras nunca
+  seriam lidas).
+"""
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Entradas gravadas no cache por chamada de set_many
+WARMUP_CHUNK = 100
+
+
+@dataclass
+class WarmupReport:
+    """Resultado do aquecimento (aparece no /health)."""
+    source: str
+    status: str = "running"  # running, done ou failed
+    loaded: int = 0
+    bytes_loaded: int = 0
+    seconds: float = 0.0
+    stopped_by: str = ""  # entries, seconds, memory ou vazio (a fonte acabou)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def iter_snapshot(path: str, cache_prefix: str) -> Iterator[Tuple[str, str]]:
+    """(chave, resultado em JSON) das linhas do snapshot com a versão atual; linhas inválidas são puladas."""
+    with open(path, encoding="utf-8") as snapshot:
+        for line in snapshot:
+            try:
+                entry = json.loads(line)
+                cache_key, result = entry["cache_key"], entry["result"]
+            except (ValueError, TypeError, KeyError):
+                continue
+            if isinstance(result, dict) and cache_key.startswith(cache_prefix):
+                yield cache_key, json.dumps(result, ensure_ascii=False)
+
+
+def write_snapshot(path: str, entries: Iterable[Tuple[str, str]]) -> int:
+    """Grava (chave, resultado em JSON) no formato lido por `iter_snapshot`; devolve quantas linhas."""
+    written = 0
+    with open(path, "w", encoding="utf-8") as snapshot:
+        for cache_key, result in entries:
+            snapshot.write(f'{{"cache_key": {json.dumps(cache_key)}, "result": {result}}}\n')
+            written += 1
+    return written
+
+
+def warm_cache(
+    set_many: Callable[[Dict[str, dict]], Any],
+    entries: Iterable[Tuple[str, str]],
+    report: WarmupReport,
+    max_entries: int,
+    max_seconds: float,
+    max_bytes: int,
+    clock: Callable[[], float] = time.monotonic
+) -> WarmupReport:
+    """
+    Copia as entradas (chave, resultado em JSON) para o cache até a fonte
+    acabar ou um dos limites ser atingido. `report` é atualizado no caminho.
+    """
+    started = clock()
+    chunk: Dict[str, dict] = {}
+
+    def save_chunk() -> None:
+        if chunk:
+            set_many(chunk)
+            report.loaded += len(chunk)
+            chunk.clear()
+
+    for cache_key, result in entries:
+        if report.loaded + len(chunk) >= max_entries:
+            report.stopped_by = "entries"
+            break
+        if clock() - started >= max_seconds:
+            report.stopped_by = "seconds"
+            break
+        size = len(result.encode("utf-8"))
+        if report.bytes_loaded + size > max_bytes:
+            report.stopped_by = "memory"
+            break
+        chunk[cache_key] = json.loads(result)
+        report.bytes_loaded += size
+        if len(chunk) >= WARMUP_CHUNK:
+            save_chunk()
+    save_chunk()
+
+    report.seconds = round(clock() - started, 3)
+    report.status = "done"
+    return report
+
+
+def recent_entries(rows: Iterable[Tuple[str, str]], make_key: Callable[[str], str]) -> Iterator[Tuple[str, str]]:
+    """(hash, resultado) do histórico -> (chave do cache, resultado), sem repetir conteúdo."""
+    seen: set = set()
+    for content_hash, result in rows:
+        if content_hash not in seen:
+            seen.add(content_hash)
+            yield make_key(content_hash), result
+
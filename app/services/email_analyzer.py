@@ -1,11 +1,70 @@
 from dataclasses import dataclass
+import hashlib
 import json
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 try:
     from ..providers.gemini_client import GeminiClient
+    from ..providers.resilience import CircuitOpenError, ConcurrencyLimitError, DeadlineExceededError
+    from ..utils import metrics
 except ImportError:
     from providers.gemini_client import GeminiClient
+    from providers.resilience import CircuitOpenError, ConcurrencyLimitError, DeadlineExceededError
+    from utils import metrics
+
+
+# Instruções e formato de resposta compartilhados pelo prompt individual e pelo prompt em lote
+ANALYSIS_INSTRUCTIONS = """INSTRUÇÕES:
+- Categorize corretamente
+- Sugira ação específica
+- Determine se precisa de curadoria humana
+- NO RESUMO: Faça um resumo completo do conteúdo do email, incluindo quem enviou, o assunto e os pontos principais
+
+CATEGORIAS: Spam, Produtivo, Reclamação, Consulta, Urgente, Outro
+"""
+
+RESULT_SCHEMA = """{
+  "atencao_humana": "SIM" ou "NÃO",
+  "categoria": "uma das categorias acima",
+  "resumo": "resumo completo do conteúdo do email: remetente, assunto e pontos principais",
+  "sugestao_resposta_ou_acao": "sugestão específica de ação",
+  "acao": "RESPOSTA_AUTOMATICA" ou "ENCAMINHAR_CURADORIA"
+}"""
+
+# Partes fixas do prompt enviadas como `system_instruction` (uma vez, na criação do
+# modelo): cada chamada leva só o(s) email(s). Uma instrução por formato, para a
+# chamada individual não pagar pelas regras do lote (e vice-versa).
+SYSTEM_INSTRUCTION = f"""Analise o email corporativo e responda APENAS em JSON válido.
+
+{ANALYSIS_INSTRUCTIONS}
+Responda com um objeto JSON:
+
+{RESULT_SCHEMA}"""
+
+BATCH_SYSTEM_INSTRUCTION = f"""Analise os emails corporativos ("### EMAIL <n>") e responda APENAS em JSON válido.
+
+{ANALYSIS_INSTRUCTIONS}
+Responda com um array JSON, um objeto por email, com o campo "indice" (o número n) e os campos:
+
+{RESULT_SCHEMA}"""
+
+# Orçamento de tokens de saída por email em uma chamada em lote
+BATCH_OUTPUT_TOKENS_PER_EMAIL = 2048
+
+
+def unavailable_result(reason: str) -> Dict[str, Any]:
+    """
+    Resultado imediato quando o Gemini não pode ser chamado (circuito aberto
+    ou prazo esgotado): o email vai para curadoria humana. O resumo começa com
+    "Erro ao" para não ser guardado no cache nem reaproveitado.
+    """
+    return {
+        "categoria": "Outro",
+        "atencao_humana": "SIM",
+        "resumo": f"Erro ao analisar: {reason}",
+        "sugestao_resposta_ou_acao": "Revisar manualmente - análise automática indisponível no momento",
+        "acao": "ENCAMINHAR_CURADORIA"
+    }
 
 
 @dataclass
@@ -13,57 +72,91 @@ class EmailAnalyzerService:
     """
     Camada de serviço: prepara o prompt, chama o provedor (Gemini) e
     valida a saída (JSON). Mantém funções curtas e responsabilidades claras.
+
+    Com `use_system_instruction=True` as instruções e o schema ficam no
+    `system_instruction` do cliente (SYSTEM_INSTRUCTION para um email,
+    BATCH_SYSTEM_INSTRUCTION para lotes) e os prompts levam só os emails.
+    O cliente precisa ter sido criado com essas instruções.
     """
     client: GeminiClient
+    use_system_instruction: bool = False
 
     def build_prompt(self, email_content: str) -> str:
+        if self.use_system_instruction:
+            return f"Email: {email_content}"
         return f"""Analise este email corporativo e responda APENAS em JSON válido.
 
-INSTRUÇÕES:
-- Categorize corretamente
-- Sugira ação específica
-- Determine se precisa de curadoria humana
-- NO RESUMO: Faça um resumo completo do conteúdo do email, incluindo quem enviou, o assunto e os pontos principais
-
-CATEGORIAS: Spam, Produtivo, Reclamação, Consulta, Urgente, Outro
-
+{ANALYSIS_INSTRUCTIONS}
 Responda APENAS em JSON:
 
-{{
-  "atencao_humana": "SIM" ou "NÃO",
-  "categoria": "uma das categorias acima",
-  "resumo": "resumo completo do conteúdo do email: remetente, assunto e pontos principais",
-  "sugestao_resposta_ou_acao": "sugestão específica de ação",
-  "acao": "RESPOSTA_AUTOMATICA" ou "ENCAMINHAR_CURADORIA"
-}}
+{RESULT_SCHEMA}
 
 Email: {email_content}"""
 
+    def prompt_version(self) -> str:
+        """
+        Impressão digital curta dos templates de prompt. Qualquer mudança no
+        texto das instruções gera outra versão (e invalida o cache de análises).
+        """
+        templates = self.build_prompt("{email}") + self.build_batch_prompt(["{email}", "{email}"])
+        if self.use_system_instruction:
+            templates = SYSTEM_INSTRUCTION + BATCH_SYSTEM_INSTRUCTION + templates
+        return hashlib.sha256(templates.encode("utf-8")).hexdigest()[:12]
+
+    def build_batch_prompt(self, emails: List[str]) -> str:
+        """
+        Monta UM prompt para vários emails: as instruções vão uma única vez
+        e cada email é identificado pelo seu índice.
+        """
+        blocks = "\n\n".join(
+            f"### EMAIL {index}\n{email_content}" for index, email_content in enumerate(emails)
+        )
+        if self.use_system_instruction:
+            return f"Analise cada um dos {len(emails)} emails abaixo.\n\n{blocks}"
+        return f"""Analise cada um dos {len(emails)} emails corporativos abaixo e responda APENAS em JSON válido.
+
+{ANALYSIS_INSTRUCTIONS}
+Responda APENAS com um array JSON contendo um objeto por email, no formato:
+
+[
+  {{"indice": 0, ...}},
+  {{"indice": 1, ...}}
+]
+
+Onde cada objeto tem o campo "indice" (número do email) e os campos:
+
+{RESULT_SCHEMA}
+
+{blocks}"""
+
     def analyze(self, email_content: str) -> Dict[str, Any]:
         prompt = self.build_prompt(email_content)
         logging.debug("Enviando prompt ao Gemini (tamanho=%d)", len(prompt))
         
         try:
             result_str = self.client.generate_json(prompt)
-            logging.debug("Resposta recebida (tamanho=%d)", len(result_str) if isinstance(result_str, str) else -1)
-            
-            # Tenta fazer parse do JSON
-            result = json.loads(result_str)
-            
-            # Valida se tem os campos mínimos necessários
-            if "categoria" not in result:
-                logging.warning("Resposta JSON sem campo 'categoria', tentando extrair")
-                # Retorna estrutura padrão se não tiver categoria
-                return {
-                    "categoria": "Outro",
-                    "atencao_humana": "SIM",
-                    "resumo": result.get("resumo", "Análise incompleta"),
-                    "sugestao_resposta_ou_acao": result.get("sugestao_resposta_ou_acao", "Revisar manualmente"),
-                    "acao": "ENCAMINHAR_CURADORIA"
-                }
-            
-            return result
-            
+        except Exception as e:
+            return self._failure_result(e)
+        return self._parse_result(result_str)
+
+    async def analyze_async(self, email_content: str) -> Dict[str, Any]:
+        """Versão assíncrona de `analyze` (mesmo prompt, mesmos fallbacks)."""
+        prompt = self.build_prompt(email_content)
+        logging.debug("Enviando prompt assíncrono ao Gemini (tamanho=%d)", len(prompt))
+        
+        try:
+            result_str = await self.client.generate_json_async(prompt)
+        except Exception as e:
+            return self._failure_result(e)
+        return self._parse_result(result_str)
+
+    def _parse_result(self, result_str: str) -> Dict[str, Any]:
+        """Faz o parse do JSON de um email (ou devolve o fallback para curadoria)."""
+        logging.debug("Resposta recebida (tamanho=%d)", len(result_str) if isinstance(result_str, str) else -1)
+        try:
+            with metrics.time_stage("json_parse"):
+                result = json.loads(result_str)
+                return self._validate_result(result)
         except (json.JSONDecodeError, TypeError) as e:
             # Retorna estrutura padrão em caso de falha de JSON
             logging.error(f"Erro ao fazer parse do JSON: {e}")
@@ -76,14 +169,108 @@ Email: {email_content}"""
                 "sugestao_resposta_ou_acao": "Revisar manualmente - resposta do modelo não estava no formato esperado",
                 "acao": "ENCAMINHAR_CURADORIA"
             }
+
+    def _failure_result(self, error: Exception) -> Dict[str, Any]:
+        """Resultado quando a chamada ao Gemini falhou (circuito aberto, prazo ou erro)."""
+        if isinstance(error, CircuitOpenError):
+            logging.warning("Gemini indisponível (circuito aberto): email encaminhado para curadoria")
+            return unavailable_result("serviço de IA temporariamente indisponível")
+        if isinstance(error, DeadlineExceededError):
+            logging.warning("Prazo da requisição esgotado: email encaminhado para curadoria")
+            return unavailable_result("tempo limite da requisição esgotado")
+        if isinstance(error, ConcurrencyLimitError):
+            logging.warning("Gemini no limite de chamadas simultâneas: email encaminhado para curadoria")
+            return unavailable_result("serviço de IA sobrecarregado no momento")
+        logging.error(f"Erro inesperado na análise: {error}")
+        return {
+            "categoria": "Erro",
+            "atencao_humana": "SIM",
+            "resumo": f"Erro ao analisar email: {str(error)}",
+            "sugestao_resposta_ou_acao": "Revisar manualmente",
+            "acao": "ENCAMINHAR_CURADORIA"
+        }
+
+    def analyze_batch(self, emails: List[str]) -> List[Dict[str, Any]]:
+        """
+        Analisa vários emails com UMA chamada ao Gemini.
+
+        A resposta esperada é um array JSON com um objeto por email (campo
+        "indice"). Cada item é validado separadamente; apenas os emails cujo
+        item falhou voltam a ser analisados individualmente com `analyze`.
+        Retorna os resultados na mesma ordem de `emails`.
+        """
+        if len(emails) <= 1:
+            return [self.analyze(email_content) for email_content in emails]
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(emails)
+        prompt = self.build_batch_prompt(emails)
+        logging.debug("Enviando prompt em lote ao Gemini (emails=%d, tamanho=%d)", len(emails), len(prompt))
+
+        try:
+            result_str = self.client.generate_json(
+                prompt, max_output_tokens=BATCH_OUTPUT_TOKENS_PER_EMAIL * len(emails), batch=True
+            )
+            with metrics.time_stage("json_parse"):
+                for index, item in self._parse_batch_items(result_str, len(emails)):
+                    results[index] = self._validate_result(item)
+        except (json.JSONDecodeError, TypeError, ValueError) as e:
+            logging.warning(f"Resposta em lote inválida, analisando individualmente: {e}")
+        except ConcurrencyLimitError as e:
+            # Sobrecarga: repetir email a email só enfileiraria mais chamadas
+            return [self._failure_result(e) for _ in emails]
         except Exception as e:
-            logging.error(f"Erro inesperado na análise: {e}")
+            logging.error(f"Erro na chamada em lote ao Gemini, analisando individualmente: {e}")
+
+        # Fallback só para os itens que não vieram (ou vieram inválidos)
+        missing = [index for index, result in enumerate(results) if result is None]
+        if missing:
+            logging.info(f"Lote: {len(missing)}/{len(emails)} email(s) reanalisados individualmente")
+        for index in missing:
+            results[index] = self.analyze(emails[index])
+
+        return results
+
+    def _parse_batch_items(self, result_str: str, total: int) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Faz o parse do array JSON do lote e devolve pares (indice, objeto).
+        Itens sem índice válido, repetidos ou sem 'categoria' são descartados
+        (e depois reanalisados individualmente).
+        """
+        parsed = json.loads(result_str)
+        # Alguns modelos embrulham o array em um objeto
+        if isinstance(parsed, dict):
+            parsed = parsed.get("resultados") or parsed.get("results") or []
+        if not isinstance(parsed, list):
+            raise ValueError("Resposta em lote não é um array JSON")
+
+        items: Dict[int, Dict[str, Any]] = {}
+        for item in parsed:
+            if not isinstance(item, dict) or "categoria" not in item:
+                continue
+            try:
+                index = int(item.get("indice"))
+            except (TypeError, ValueError):
+                continue
+            if 0 <= index < total and index not in items:
+                item.pop("indice", None)
+                items[index] = item
+        return list(items.items())
+
+    def _validate_result(self, result: Any) -> Dict[str, Any]:
+        """Garante os campos mínimos do resultado de um email."""
+        if not isinstance(result, dict):
+            raise TypeError("Resultado do Gemini não é um objeto JSON")
+
+        # Valida se tem os campos mínimos necessários
+        if "categoria" not in result:
+            logging.warning("Resposta JSON sem campo 'categoria', tentando extrair")
+            # Retorna estrutura padrão se não tiver categoria
             return {
-                "categoria": "Erro",
+                "categoria": "Outro",
                 "atencao_humana": "SIM",
-                "resumo": f"Erro ao analisar email: {str(e)}",
-                "sugestao_resposta_ou_acao": "Revisar manualmente",
+                "resumo": result.get("resumo", "Análise incompleta"),
+                "sugestao_resposta_ou_acao": result.get("sugestao_resposta_ou_acao", "Revisar manualmente"),
                 "acao": "ENCAMINHAR_CURADORIA"
             }
 
-
+        return result
@@ -0,0 +1,235 @@
+"""
+Jobs assíncronos de análise de emails.
+
+Para devs iniciantes:
+- Um lote grande (até `max_batch_size` emails) pode levar minutos no Gemini.
+  Em vez de segurar a requisição HTTP aberta, criamos um "job": a rota
+  devolve um `job_id` na hora e o processamento continua em background.
+- O cliente consulta `GET /analyze/status/<job_id>` para ver o progresso e os
+  resultados parciais (um por email, assim que ficam prontos).
+- O estado dos jobs fica em um "JobStore". Em memória funciona com um único
+  processo; com vários workers do gunicorn use o Redis, que é compartilhado.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from ..utils.mail_parser import EmailRecord
+except ImportError:
+    from utils.mail_parser import EmailRecord
+
+logger = logging.getLogger(__name__)
+
+# Status possíveis de um job
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# Assinatura do processador: recebe os emails (já lidos) e um callback(indice, resultado)
+BatchProcessor = Callable[[List[EmailRecord], Callable[[int, dict], None]], List[dict]]
+
+
+class JobStore(ABC):
+    """
+    Interface de armazenamento do estado dos jobs. Um store sem algum destes
+    métodos falha já ao ser criado (TypeError), não no meio de uma requisição.
+    """
+
+    @abstractmethod
+    def create(self, job_id: str, total: int) -> None:
+        ...
+
+    @abstractmethod
+    def set_status(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        ...
+
+    @abstractmethod
+    def record_result(self, job_id: str, index: int, result: dict) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+
+def _job_view(meta: Dict[str, Any], results: Dict[int, dict]) -> Dict[str, Any]:
+    """Monta a resposta pública de um job (progresso + resultados parciais)."""
+    total = int(meta["total"])
+    completed = len(results)
+    return {
+        "job_id": meta["job_id"],
+        "status": meta["status"],
+        "total_emails": total,
+        "completed": completed,
+        "progress": int(completed * 100 / total) if total else 100,
+        "results": [{"index": index, **results[index]} for index in sorted(results)],
+        "error": meta.get("error"),
+        "created_at": float(meta["created_at"]),
+        "finished_at": float(meta["finished_at"]) if meta.get("finished_at") else None,
+    }
+
+
+class InMemoryJobStore(JobStore):
+    """
+    JobStore em memória (padrão). Só enxerga jobs do próprio processo.
+    Jobs terminados expiram após `ttl` segundos.
+    """
+
+    def __init__(self, ttl: int = 3600) -> None:
+        self.ttl = ttl
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id: str, total: int) -> None:
+        with self._lock:
+            self._evict_expired()
+            self._jobs[job_id] = {
+                "meta": {"job_id": job_id, "status": JOB_QUEUED, "total": total, "created_at": time.time()},
+                "results": {},
+            }
+
+    def set_status(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return
+            job["meta"]["status"] = status
+            if error:
+                job["meta"]["error"] = error
+            if status in (JOB_DONE, JOB_FAILED):
+                job["meta"]["finished_at"] = time.time()
+
+    def record_result(self, job_id: str, index: int, result: dict) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job["results"][index] = result
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return None
+            return _job_view(dict(job["meta"]), dict(job["results"]))
+
+    def _evict_expired(self) -> None:
+        """Remove jobs terminados há mais de `ttl` segundos (chamar com o lock)."""
+        limit = time.time() - self.ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["meta"].get("finished_at") and job["meta"]["finished_at"] < limit
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class RedisJobStore(JobStore):
+    """
+    JobStore no Redis: compartilhado entre workers do gunicorn e instâncias.
+    Cada job usa dois hashes (metadados e resultados) com expiração `ttl`.
+    """
+
+    def __init__(self, redis_url: str, ttl: int = 3600, prefix: str = "mailmind:job:") -> None:
+        import redis  # Import tardio: só é necessário quando este store é usado
+
+        self.ttl = ttl
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(redis_url, decode_responses=True)
+
+    def _meta_key(self, job_id: str) -> str:
+        return f"{self.prefix}{job_id}"
+
+    def _results_key(self, job_id: str) -> str:
+        return f"{self.prefix}{job_id}:results"
+
+    def create(self, job_id: str, total: int) -> None:
+        meta_key = self._meta_key(job_id)
+        pipe = self._redis.pipeline()
+        pipe.hset(meta_key, mapping={
+            "job_id": job_id, "status": JOB_QUEUED, "total": total, "created_at": time.time()
+        })
+        pipe.expire(meta_key, self.ttl)
+        pipe.execute()
+
+    def set_status(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        fields: Dict[str, Any] = {"status": status}
+        if error:
+            fields["error"] = error
+        if status in (JOB_DONE, JOB_FAILED):
+            fields["finished_at"] = time.time()
+        self._redis.hset(self._meta_key(job_id), mapping=fields)
+
+    def record_result(self, job_id: str, index: int, result: dict) -> None:
+        results_key = self._results_key(job_id)
+        pipe = self._redis.pipeline()
+        pipe.hset(results_key, str(index), json.dumps(result, ensure_ascii=False))
+        pipe.expire(results_key, self.ttl)
+        pipe.execute()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        pipe = self._redis.pipeline()
+        pipe.hgetall(self._meta_key(job_id))
+        pipe.hgetall(self._results_key(job_id))
+        meta, raw_results = pipe.execute()
+        if not meta:
+            return None
+        results = {int(index): json.loads(value) for index, value in raw_results.items()}
+        return _job_view(meta, results)
+
+
+class JobManager:
+    """
+    Recebe lotes, cria o job no store e processa em um pool de threads.
+    O processamento de cada lote é delegado ao `processor` (o mesmo pipeline
+    da rota síncrona), que avisa cada resultado pronto via callback.
+    """
+
+    def __init__(self, store: JobStore, processor: BatchProcessor, max_workers: int = 2) -> None:
+        self.store = store
+        self.processor = processor
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mailmind-job")
+
+    def submit(self, emails: List[EmailRecord]) -> str:
+        """Enfileira o lote e devolve o `job_id` imediatamente."""
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id, total=len(emails))
+        self._executor.submit(self._run, job_id, emails)
+        logger.info(f"Job {job_id} enfileirado com {len(emails)} email(s)")
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def _run(self, job_id: str, emails: List[EmailRecord]) -> None:
+        self.store.set_status(job_id, JOB_RUNNING)
+
+        def on_result(index: int, result: dict) -> None:
+            self.store.record_result(job_id, index, result)
+
+        try:
+            self.processor(emails, on_result)
+            self.store.set_status(job_id, JOB_DONE)
+            logger.info(f"Job {job_id} concluído")
+        except Exception as e:
+            logger.error(f"Job {job_id} falhou: {e}")
+            self.store.set_status(job_id, JOB_FAILED, error=str(e))
+
+
+def create_job_store(store_type: str, redis_url: Optional[str], ttl: int) -> JobStore:
+    """Escolhe o JobStore pela configuração (cai para memória se faltar Redis)."""
+    if store_type == "redis":
+        if redis_url:
+            try:
+                return RedisJobStore(redis_url, ttl=ttl)
+            except ImportError:
+                logger.warning("Pacote redis não instalado, usando JobStore em memória")
+        else:
+            logger.warning("JOB_STORE=redis sem REDIS_URL, usando JobStore em memória")
+    return InMemoryJobStore(ttl=ttl)
@@ -0,0 +1,226 @@
+"""
+Reaproveitamento de análises de emails quase idênticos (SimHash + LSH).
+
+Para devs iniciantes:
+- Boa parte dos emails é "template": notificações e newsletters que só mudam
+  nome, data ou um código de rastreio. O cache exato nunca acerta nesses casos.
+- SimHash resume o texto em uma "impressão digital" de 64 bits. Textos parecidos
+  geram impressões com poucos bits diferentes (distância de Hamming pequena).
+- Para não comparar com todos os emails já vistos, dividimos os 64 bits em
+  faixas ("bands", técnica LSH): só comparamos com quem coincide em pelo menos
+  uma faixa inteira. Com 8 faixas, qualquer par com até 7 bits diferentes é
+  encontrado com certeza.
+- A memória é limitada (LRU): os emails menos usados saem primeiro. Opcionalmente
+  o índice é salvo em um arquivo SQLite para sobreviver a reinícios.
+- Cada entrada guarda a versão do cache (modelo + prompt, ver
+  `build_cache_version`): trocar o GEMINI_MODEL ou o prompt invalida as
+  análises antigas aqui também, como nas chaves `analysis:v2:<versão>`.
+"""
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_BITS = 64
+_MASK = (1 << FINGERPRINT_BITS) - 1
+
+# Números (datas, IDs, valores) viram um único token para não diferenciar templates
+_DIGITS_PATTERN = re.compile(r"\d+")
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def _hash64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens usados na impressão digital (minúsculas, números mascarados)."""
+    return _TOKEN_PATTERN.findall(_DIGITS_PATTERN.sub("0", text.lower()))
+
+
+def simhash(tokens: List[str], shingle_size: int = 2) -> int:
+    """
+    Impressão digital SimHash de 64 bits a partir de "shingles" (grupos de
+    `shingle_size` palavras seguidas), que capturam também a ordem do texto.
+    """
+    if len(tokens) >= shingle_size:
+        shingles = [" ".join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)]
+    else:
+        shingles = tokens
+
+    weights = [0] * FINGERPRINT_BITS
+    for shingle in shingles:
+        value = _hash64(shingle)
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def similarity(a: int, b: int) -> float:
+    """Similaridade entre impressões: 1.0 = idênticas, 0.0 = todos os bits diferentes."""
+    return 1.0 - bin((a ^ b) & _MASK).count("1") / FINGERPRINT_BITS
+
+
+class NearDuplicateIndex:
+    """
+    Índice em memória (LRU) de impressões digitais -> análise já feita.
+
+    - `fingerprint(texto)`: impressão do texto (ou None se for curto demais)
+    - `find(impressao)`: análise mais parecida acima do limiar, se houver
+    - `add(chave, impressao, resultado)`: registra uma análise nova
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        max_entries: int = 10000,
+        bands: int = 8,
+        min_tokens: int = 30,
+        db_path: Optional[str] = None,
+        cache_version: str = "",
+    ) -> None:
+        if FINGERPRINT_BITS % bands:
+            raise ValueError(f"bands deve dividir {FINGERPRINT_BITS}")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.bands = bands
+        self.min_tokens = min_tokens
+        self.cache_version = cache_version
+        self._band_bits = FINGERPRINT_BITS // bands
+        self._band_mask = (1 << self._band_bits) - 1
+
+        # chave -> (impressão, resultado, versão); ordem = uso mais recente no final
+        self._entries: "OrderedDict[str, Tuple[int, Dict[str, Any], str]]" = OrderedDict()
+        self._buckets: List[Dict[int, Set[str]]] = [{} for _ in range(bands)]
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes_since_trim = 0
+
+        if db_path:
+            self._open_db(db_path)
+
+    def fingerprint(self, text: str) -> Optional[int]:
+        tokens = tokenize(text)
+        if len(tokens) < self.min_tokens:
+            return None  # Textos curtos geram impressões pouco confiáveis
+        return simhash(tokens)
+
+    def find(self, fingerprint: int) -> Optional[Tuple[str, Dict[str, Any], float]]:
+        """Retorna (chave, resultado, similaridade) do vizinho mais parecido."""
+        with self._lock:
+            candidates: Set[str] = set()
+            for band, value in enumerate(self._band_values(fingerprint)):
+                candidates.update(self._buckets[band].get(value, ()))
+
+            best: Optional[Tuple[str, float]] = None
+            for key in candidates:
+                entry_fingerprint, _, version = self._entries[key]
+                if version != self.cache_version:
+                    continue  # Analisado com outro modelo/prompt
+                score = similarity(fingerprint, entry_fingerprint)
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (key, score)
+
+            if best is None:
+                return None
+            key, score = best
+            self._entries.move_to_end(key)
+            return key, dict(self._entries[key][1]), score
+
+    def add(self, key: str, fingerprint: int, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._insert(key, fingerprint, result, self.cache_version)
+            self._persist(key, fingerprint, result)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _band_values(self, fingerprint: int) -> List[int]:
+        return [(fingerprint >> (band * self._band_bits)) & self._band_mask for band in range(self.bands)]
+
+    def _insert(self, key: str, fingerprint: int, result: Dict[str, Any], version: str) -> None:
+        """Insere no LRU e nas faixas; remove o menos usado se passar do limite (com o lock)."""
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (fingerprint, result, version)
+        for band, value in enumerate(self._band_values(fingerprint)):
+            self._buckets[band].setdefault(value, set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+
+    def _remove(self, key: str) -> None:
+        fingerprint, _, _ = self._entries.pop(key)
+        for band, value in enumerate(self._band_values(fingerprint)):
+            bucket = self._buckets[band].get(value)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][value]
+
+    # --- Persistência opcional (SQLite) ---
+
+    def _open_db(self, db_path: str) -> None:
+        try:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS near_duplicates ("
+                " cache_key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL,"
+                " result TEXT NOT NULL, updated_at REAL NOT NULL,"
+                " cache_version TEXT NOT NULL DEFAULT '')"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(near_duplicates)")}
+            if "cache_version" not in columns:
+                # Arquivo de antes da versão: as linhas antigas ficam com '' e nunca são usadas
+                self._db.execute("ALTER TABLE near_duplicates ADD COLUMN cache_version TEXT NOT NULL DEFAULT ''")
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_near_duplicates_updated ON near_duplicates(updated_at)"
+            )
+            rows = self._db.execute(
+                "SELECT cache_key, fingerprint, result FROM near_duplicates WHERE cache_version = ?"
+                " ORDER BY updated_at DESC LIMIT ?",
+                (self.cache_version, self.max_entries)
+            ).fetchall()
+            # Insere do mais antigo para o mais novo, mantendo a ordem do LRU
+            for key, fingerprint, result in reversed(rows):
+                self._insert(key, int(fingerprint, 16), json.loads(result), self.cache_version)
+            logger.info(f"Índice de quase-duplicatas carregado com {len(rows)} entrada(s) de {db_path}")
+        except sqlite3.Error as e:
+            logger.warning(f"Falha ao abrir índice persistente {db_path}: {e}. Usando só memória")
+            self._db = None
+
+    def _persist(self, key: str, fingerprint: int, result: Dict[str, Any]) -> None:
+        """Grava a entrada no SQLite e, de tempos em tempos, apaga as mais antigas (com o lock)."""
+        if self._db is None:
+            return
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO near_duplicates (cache_key, fingerprint, result, updated_at, cache_version)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, format(fingerprint, "016x"), json.dumps(result, ensure_ascii=False), time.time(),
+                 self.cache_version)
+            )
+            self._writes_since_trim += 1
+            if self._writes_since_trim >= 500:
+                self._writes_since_trim = 0
+                self._db.execute(
+                    "DELETE FROM near_duplicates WHERE cache_key NOT IN ("
+                    " SELECT cache_key FROM near_duplicates ORDER BY updated_at DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Falha ao persistir quase-duplicata: {e}")
@@ -0,0 +1,409 @@
+"""
+Envio de emails depois da análise (curadoria e resposta automática), em background.
+
+Para devs iniciantes:
+- Uma conversa SMTP pode levar segundos (ou até o `SMTP_TIMEOUT` inteiro se o
+  servidor estiver lento). Por isso as rotas só colocam o envio em uma fila
+  (`submit`, que nunca bloqueia nem lança exceção) e respondem na hora;
+  threads "workers" esvaziam a fila usando o pool do `EmailSender`.
+- Emails que precisam de curadoria (atencao_humana = SIM) não viram um email
+  cada: entram em um "resumo" (digest) enviado ao curador a cada
+  `digest_seconds` ou quando junta `digest_max` emails.
+- Respostas automáticas (opcionais) vão para o remetente de emails resolvidos
+  sem curadoria. Nunca respondemos spam, notificações ("Outro") ou endereços
+  do tipo no-reply/mailer-daemon (evita loops entre robôs).
+- Um envio que falha volta para a fila depois de um backoff; recusas
+  definitivas (códigos 5xx) ou tentativas esgotadas vão para a lista de
+  "dead letters" (consultada em /outbound/dead-letters).
+- A fila fica em memória: o que ainda não foi enviado se perde se o processo
+  morrer de repente (no encerramento normal, `close` envia o que falta).
+"""
+import heapq
+import itertools
+import logging
+import queue
+import re
+import smtplib
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from email.utils import parseaddr
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+try:
+    from ..providers.resilience import backoff_with_jitter
+    from ..utils import metrics
+    from ..utils.mail_parser import EmailRecord
+except ImportError:
+    from providers.resilience import backoff_with_jitter
+    from utils import metrics
+    from utils.mail_parser import EmailRecord
+
+logger = logging.getLogger(__name__)
+
+KIND_CURATOR = "curator"
+KIND_REPLY = "reply"
+
+# Ação decidida pelo modelo (campo `acao_modelo` da análise)
+MODEL_ACTION_CURATOR = "ENCAMINHAR_CURADORIA"
+MODEL_ACTION_REPLY = "RESPOSTA_AUTOMATICA"
+
+# Categorias que nunca recebem resposta automática (spam, notificações, falhas da análise)
+NO_REPLY_CATEGORIES = {"spam", "outro", "erro", "❌ erro"}
+
+# Remetentes automáticos: responder só criaria um loop de emails entre robôs
+AUTOMATED_SENDER_PATTERN = re.compile(r"^(no-?reply|nao-?responda|mailer-daemon|postmaster|bounces?)\b", re.IGNORECASE)
+
+# Trecho do email original que vai no resumo do curador (o resto fica no sistema)
+DIGEST_EXCERPT_CHARS = 2000
+
+AUTO_REPLY_BODY = """Olá,
+
+Recebemos o seu email e ele já está sendo tratado pela nossa equipe.
+Se precisar complementar alguma informação, basta responder a esta mensagem.
+
+Esta é uma resposta automática do MailMind.
+"""
+
+
+@dataclass
+class OutboundItem:
+    """Um email a enviar (um resumo do curador ou uma resposta), com as tentativas feitas."""
+    kind: str
+    to_address: str
+    subject: str
+    body: str
+    in_reply_to: str = ""
+    emails: int = 1  # Emails analisados que este envio cobre (o resumo junta vários)
+    attempts: int = 0
+    last_error: str = ""
+
+
+def is_permanent_failure(error: Exception) -> bool:
+    """Recusa definitiva (endereço inválido, conteúdo rejeitado...): repetir não adianta."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    code = getattr(error, "smtp_code", None)
+    return isinstance(error, smtplib.SMTPResponseException) and isinstance(code, int) and 500 <= code < 600
+
+
+def needs_curator(result_data: dict) -> bool:
+    """
+    Vale a ação decidida pelo modelo (`acao_modelo`); `atencao_humana` só
+    decide quando ela falta (análises antigas no cache ou sem esse campo).
+    """
+    model_action = str(result_data.get("acao_modelo", "")).upper()
+    if model_action in (MODEL_ACTION_CURATOR, MODEL_ACTION_REPLY):
+        return model_action == MODEL_ACTION_CURATOR
+    return str(result_data.get("atencao_humana", "")).upper() == "SIM"
+
+
+def reply_address(record: EmailRecord, result_data: dict) -> Optional[str]:
+    """
+    Para quem responder automaticamente (None = não responder): só emails
+    resolvidos sem curadoria pelo Gemini (ou reaproveitados dele), de um
+    remetente humano e de uma categoria que espera resposta.
+    """
+    if needs_curator(result_data) or result_data.get("classified_by"):
+        return None
+    if str(result_data.get("categoria", "")).lower() in NO_REPLY_CATEGORIES:
+        return None
+    address = parseaddr(record.sender or "")[1]
+    if "@" not in address or AUTOMATED_SENDER_PATTERN.match(address):
+        return None
+    return address
+
+
+def format_digest_entry(number: int, record: EmailRecord, result_data: dict) -> str:
+    """Bloco de um email no resumo enviado ao curador."""
+    lines = [
+        f"{number}. [{result_data.get('categoria', 'N/A')}] De: {record.sender or 'Não identificado'}",
+        f"   Assunto: {record.subject or '(sem assunto)'}",
+    ]
+    if record.message_id:
+        lines.append(f"   Message-ID: {record.message_id}")
+    lines += [
+        f"   Resumo: {result_data.get('resumo', 'N/A')}",
+        f"   Sugestão: {result_data.get('sugestao', 'N/A')}",
+        "   --- Conteúdo original ---",
+        record.content[:DIGEST_EXCERPT_CHARS].strip(),
+    ]
+    if len(record.content) > DIGEST_EXCERPT_CHARS:
+        lines.append("   [... conteúdo cortado ...]")
+    return "\n".join(lines)
+
+
+class OutboundDispatcher:
+    """
+    Fila de envios com workers em background.
+
+    - `submit(record, result_data)`: decide o que enviar para o email analisado
+    - `flush()`: manda agora o resumo do curador que está acumulando
+    - `close()`: envia o que falta e para os workers (no encerramento do worker)
+    - `stats()` / `dead_letters()`: para o /health e para a rota de dead letters
+    """
+
+    def __init__(
+        self,
+        mailer: Any,
+        curator_address: str = "",
+        *,
+        auto_reply: bool = False,
+        reply_from: Optional[str] = None,
+        workers: int = 2,
+        digest_seconds: float = 60,
+        digest_max: int = 25,
+        max_attempts: int = 5,
+        retry_seconds: float = 30,
+        queue_size: int = 10000,
+        send_batch_size: int = 20,
+        dead_letter_size: int = 500,
+        clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.mailer = mailer
+        self.curator_address = curator_address
+        self.auto_reply = auto_reply
+        self.reply_from = reply_from
+        self.workers = max(1, workers)
+        self.digest_seconds = digest_seconds
+        self.digest_max = max(1, digest_max)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_seconds = retry_seconds
+        self.queue_size = max(1, queue_size)
+        self.send_batch_size = max(1, send_batch_size)
+        self.clock = clock
+
+        self._queue: "queue.Queue[Optional[OutboundItem]]" = queue.Queue()
+        self._cond = threading.Condition()
+        self._digest: List[str] = []  # Blocos do resumo do curador ainda não enviado
+        self._digest_due = 0.0
+        self._retries: List[Tuple[float, int, OutboundItem]] = []  # Heap (quando, ordem, envio)
+        self._retry_order = itertools.count()
+        self._dead: Deque[Dict[str, Any]] = deque(maxlen=dead_letter_size)
+        self._seen: "OrderedDict[Tuple[str, str], None]" = OrderedDict()  # (tipo, Message-ID) já enfileirados
+        self._threads: List[threading.Thread] = []
+        self._started = False
+        self._closed = False
+        self.sent = 0
+        self.retried = 0
+        self.dead_lettered = 0
+
+    # --- Entrada (chamada pelas rotas; nunca bloqueia) ---
+
+    def submit(self, record: EmailRecord, result_data: dict) -> None:
+        """Enfileira o resumo do curador e/ou a resposta automática deste email."""
+        try:
+            if needs_curator(result_data) and self.curator_address:
+                if self._first_time(KIND_CURATOR, record):
+                    self._add_to_digest(record, result_data)
+            elif self.auto_reply:
+                address = reply_address(record, result_data)
+                if address and self._first_time(KIND_REPLY, record):
+                    subject = record.subject or "sua mensagem"
+                    self._enqueue(OutboundItem(
+                        kind=KIND_REPLY,
+                        to_address=address,
+                        subject=subject if subject.lower().startswith("re:") else f"Re: {subject}",
+                        body=AUTO_REPLY_BODY,
+                        in_reply_to=record.message_id,
+                    ))
+        except Exception as e:
+            logger.error(f"Falha ao enfileirar envio do email de {record.sender}: {e}")
+
+    def flush(self) -> None:
+        with self._cond:
+            self._release_digest()
+
+    def close(self, timeout: float = 10) -> None:
+        """Envia o resumo pendente, espera a fila esvaziar (até `timeout`s) e para os workers."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._release_digest()
+            lost, self._retries = self._retries, []
+            self._cond.notify_all()
+        for _, _, item in lost:
+            self._dead_letter(item, "processo encerrado antes de um novo envio")
+        for _ in self._threads:
+            self._queue.put(None)
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "queued": self._queue.qsize(),
+                "pending_digest": len(self._digest),
+                "scheduled_retries": len(self._retries),
+                "sent": self.sent,
+                "retried": self.retried,
+                "dead_letters": self.dead_lettered,
+                "auto_reply": self.auto_reply,
+            }
+
+    def dead_letters(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            return list(self._dead)
+
+    # --- Fila ---
+
+    def _first_time(self, kind: str, record: EmailRecord) -> bool:
+        """O mesmo email reenviado (retry do webhook, lote repetido) não gera um segundo envio."""
+        if not record.message_id:
+            return True
+        key = (kind, record.message_id)
+        with self._cond:
+            if key in self._seen:
+                return False
+            self._seen[key] = None
+            if len(self._seen) > self.queue_size:
+                self._seen.popitem(last=False)
+        return True
+
+    def _add_to_digest(self, record: EmailRecord, result_data: dict) -> None:
+        self._ensure_started()
+        with self._cond:
+            if not self._digest:
+                self._digest_due = self.clock() + self.digest_seconds
+            self._digest.append(format_digest_entry(len(self._digest) + 1, record, result_data))
+            if len(self._digest) >= self.digest_max:
+                self._release_digest()
+            self._cond.notify()
+
+    def _release_digest(self) -> None:
+        """Transforma o resumo acumulado em um envio para o curador (chamar com o lock)."""
+        if not self._digest:
+            return
+        entries, self._digest = self._digest, []
+        body = (f"{len(entries)} email(s) aguardando curadoria humana no MailMind.\n\n"
+                + "\n\n".join(entries) + "\n")
+        self._enqueue(OutboundItem(
+            kind=KIND_CURATOR,
+            to_address=self.curator_address,
+            subject=f"[MailMind] {len(entries)} email(s) para curadoria",
+            body=body,
+            emails=len(entries),
+        ))
+
+    def _enqueue(self, item: OutboundItem) -> None:
+        self._ensure_started()
+        if self._queue.qsize() >= self.queue_size:
+            self._dead_letter(item, "fila de envio cheia")
+            return
+        self._queue.put(item)
+
+    def _ensure_started(self) -> None:
+        """Threads só nascem no primeiro envio (criar o app não deixa nada rodando)."""
+        if self._started:
+            return
+        with self._cond:
+            if self._started or self._closed:
+                return
+            self._started = True
+            self._threads = [threading.Thread(target=self._work, name=f"outbound-{i}", daemon=True)
+                             for i in range(self.workers)]
+            scheduler = threading.Thread(target=self._schedule, name="outbound-scheduler", daemon=True)
+        for thread in self._threads:
+            thread.start()
+        scheduler.start()
+
+    # --- Threads ---
+
+    def _schedule(self) -> None:
+        """Libera o resumo do curador no prazo e devolve à fila os retries que venceram."""
+        with self._cond:
+            while not self._closed:
+                now = self.clock()
+                if self._digest and now >= self._digest_due:
+                    self._release_digest()
+                while self._retries and self._retries[0][0] <= now:
+                    self._queue.put(heapq.heappop(self._retries)[2])
+
+                wakeups = [when for when, _, _ in self._retries[:1]]
+                if self._digest:
+                    wakeups.append(self._digest_due)
+                self._cond.wait(max(0.0, min(wakeups) - now) if wakeups else None)
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            # Junta o que mais estiver na fila: vai tudo pela mesma sessão SMTP
+            while len(batch) < self.send_batch_size:
+                try:
+                    extra = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if extra is None:
+                    self._queue.put(None)  # O sinal de parada é de outro worker (ou o nosso, depois)
+                    break
+                batch.append(extra)
+            self._send(batch)
+
+    def _send(self, batch: List[OutboundItem]) -> None:
+        try:
+            with metrics.time_stage("smtp_send"):
+                errors = self.mailer.send_many([self._build_message(item) for item in batch])
+        except Exception as e:
+            errors = [e] * len(batch)  # Ex.: nenhuma conexão livre no pool dentro do timeout
+
+        for item, error in zip(batch, errors):
+            if error is None:
+                metrics.count_outbound(item.kind, "sent")
+                with self._cond:
+                    self.sent += 1
+            else:
+                self._failed(item, error)
+
+    def _build_message(self, item: OutboundItem) -> EmailMessage:
+        from_address = self.reply_from if item.kind == KIND_REPLY else None
+        msg = self.mailer.build_message(item.to_address, item.subject, item.body, from_address=from_address)
+        if item.in_reply_to:
+            msg["In-Reply-To"] = item.in_reply_to
+            msg["References"] = item.in_reply_to
+        msg["Auto-Submitted"] = "auto-generated"  # RFC 3834: outros robôs não respondem
+        return msg
+
+    def _failed(self, item: OutboundItem, error: Exception) -> None:
+        item.attempts += 1
+        item.last_error = f"{type(error).__name__}: {error}"
+        if is_permanent_failure(error) or item.attempts >= self.max_attempts:
+            self._dead_letter(item, item.last_error)
+            return
+
+        delay = backoff_with_jitter(item.attempts - 1, base=self.retry_seconds, cap=self.retry_seconds * 16)
+        logger.warning(f"Envio para {item.to_address} falhou ({item.last_error}); "
+                       f"tentativa {item.attempts + 1} em {delay:.0f}s")
+        metrics.count_outbound(item.kind, "retry")
+        with self._cond:
+            if self._closed:
+                lost = True
+            else:
+                lost = False
+                self.retried += 1
+                heapq.heappush(self._retries, (self.clock() + delay, next(self._retry_order), item))
+                self._cond.notify()
+        if lost:
+            self._dead_letter(item, item.last_error)
+
+    def _dead_letter(self, item: OutboundItem, reason: str) -> None:
+        logger.error(f"Envio para {item.to_address} desistido após {item.attempts} tentativa(s): {reason}")
+        metrics.count_outbound(item.kind, "dead_letter")
+        with self._cond:
+            self.dead_lettered += 1
+            self._dead.append({
+                "kind": item.kind,
+                "to": item.to_address,
+                "subject": item.subject,
+                "emails": item.emails,
+                "attempts": item.attempts,
+                "error": reason,
+                "failed_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            })
@@ -0,0 +1,287 @@
+"""
+Pré-classificador local: resolve sem o Gemini os emails óbvios (spam e
+notificações automáticas).
+
+Para devs iniciantes:
+- É um Naive Bayes multinomial com "hashing trick": cada palavra (e cada par
+  de palavras seguidas) vira um número entre 0 e `n_features` via CRC32, e o
+  modelo guarda só quantas vezes cada número apareceu em cada classe.
+  Classificar um email é somar alguns logaritmos: poucos microssegundos.
+- Classes: "Spam", "Outro" (notificações que não pedem ação) e "gemini"
+  (todo o resto, que continua indo para o Gemini).
+- Só pula o Gemini quando a classe prevista é Spam/Outro E a confiança passa
+  do limiar (PRE_CLASSIFIER_THRESHOLD). Na dúvida, o email segue o caminho normal.
+- O treino é offline, a partir das análises do Gemini exportadas em JSONL
+  (uma linha por email: {"text": ..., "categoria": ..., "atencao_humana": ...}):
+      flask --app wsgi train-pre-classifier analises.jsonl --output pre_classifier.json
+- Naive Bayes soma cada palavra como se fosse uma evidência independente
+  (e palavras + pares contam a mesma coisa duas vezes): em emails longos a
+  confiança vira 0,9999... até quando o modelo erra. Por isso:
+  1. a soma é "temperada": vale no máximo `effective_features` palavras;
+  2. o treino separa parte das análises (holdout), ajusta essa temperatura
+     nelas e salva no modelo o menor limiar que atinge a precisão pedida.
+- O modelo é um JSON pequeno (contagens esparsas); o CRC32 é estável entre
+  processos, então o mesmo arquivo vale para todos os workers.
+"""
+import json
+import logging
+import math
+import re
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LABEL_SPAM = "Spam"
+LABEL_OTHER = "Outro"
+LABEL_GEMINI = "gemini"
+# Classes que podem dispensar o Gemini
+SHORT_CIRCUIT_LABELS = (LABEL_SPAM, LABEL_OTHER)
+
+MODEL_FORMAT = 1
+DEFAULT_FEATURES = 1 << 18
+# Limiar de modelos salvos sem calibração
+DEFAULT_THRESHOLD = 0.97
+# Quantas palavras "independentes" um email vale, no máximo (temperatura da soma)
+DEFAULT_EFFECTIVE_FEATURES = 5.0
+# Valores testados na calibração (o de menor log-loss no holdout é o escolhido)
+_EFFECTIVE_FEATURES_GRID = (1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0, 50.0)
+
+_TOKEN_PATTERN = re.compile(r"[\wÀ-ÿ'-]+")
+_DIGITS_PATTERN = re.compile(r"\d+")
+
+
+def extract_features(text: str, n_features: int = DEFAULT_FEATURES) -> List[int]:
+    """Índices (hash) das palavras e pares de palavras do texto; números viram "0"."""
+    tokens = _TOKEN_PATTERN.findall(_DIGITS_PATTERN.sub("0", text.lower()))
+    grams = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    return [zlib.crc32(gram.encode("utf-8")) % n_features for gram in grams]
+
+
+def label_for_analysis(analysis: Dict[str, Any]) -> Optional[str]:
+    """
+    Classe de treino a partir de uma análise do Gemini (None = não usar no treino).
+    "Outro" só conta como notificação quando não pediu atenção humana.
+    """
+    if str(analysis.get("resumo", "")).startswith("Erro ao"):
+        return None  # Fallback de falha, não é uma análise de verdade
+    category = analysis.get("categoria")
+    if category in (None, "Erro", "❌ ERRO"):
+        return None
+    if category == LABEL_SPAM:
+        return LABEL_SPAM
+    if category == LABEL_OTHER and str(analysis.get("atencao_humana", "")).upper() in ("NÃO", "NAO"):
+        return LABEL_OTHER
+    return LABEL_GEMINI
+
+
+def local_analysis(label: str, confidence: float) -> Dict[str, Any]:
+    """Resultado no formato do Gemini para um email resolvido localmente."""
+    if label == LABEL_SPAM:
+        summary = "Email identificado como spam pelo classificador local"
+        suggestion = "Ignorar ou mover para a pasta de spam"
+    else:
+        summary = "Notificação automática identificada pelo classificador local"
+        suggestion = "Nenhuma ação necessária"
+    return {
+        "categoria": label,
+        "atencao_humana": "NÃO",
+        "resumo": f"{summary} (confiança {confidence:.1%})",
+        "sugestao_resposta_ou_acao": suggestion,
+        "acao": "RESPOSTA_AUTOMATICA",
+    }
+
+
+class PreClassifier:
+    """
+    Naive Bayes multinomial sobre features com hash.
+
+    - `train(amostras)`: cria o modelo a partir de pares (texto, classe)
+    - `predict(texto)`: (classe, confiança)
+    - `decide(texto)`: (classe, confiança) só se der para pular o Gemini
+    - `calibrate(amostras)`: escolhe o limiar pela precisão medida em amostras fora do treino
+    - `save(caminho)` / `load(caminho)`: modelo em JSON (com o limiar calibrado)
+
+    `threshold=None` desliga o atalho (nenhum limiar atingiu a precisão pedida).
+    """
+
+    def __init__(
+        self,
+        documents: Dict[str, int],
+        counts: Dict[str, Dict[int, int]],
+        n_features: int = DEFAULT_FEATURES,
+        alpha: float = 1.0,
+        threshold: Optional[float] = DEFAULT_THRESHOLD,
+        calibration: Optional[Dict[str, Any]] = None,
+        effective_features: float = DEFAULT_EFFECTIVE_FEATURES,
+    ) -> None:
+        if LABEL_GEMINI not in documents or len(documents) < 2:
+            raise ValueError("O treino precisa de exemplos da classe 'gemini' e de pelo menos mais uma classe")
+        self.documents = documents
+        self.counts = counts
+        self.n_features = n_features
+        self.alpha = alpha
+        self.threshold = threshold
+        self.calibration = calibration
+        self.effective_features = effective_features
+
+        # Logaritmos pré-calculados: prever é só somar
+        total_documents = sum(documents.values())
+        self.classes = sorted(documents)
+        self._log_prior = {label: math.log(documents[label] / total_documents) for label in self.classes}
+        self._log_prob: Dict[str, Dict[int, float]] = {}
+        self._log_unseen: Dict[str, float] = {}
+        for label in self.classes:
+            denominator = sum(counts.get(label, {}).values()) + alpha * n_features
+            self._log_prob[label] = {
+                feature: math.log((count + alpha) / denominator) for feature, count in counts.get(label, {}).items()
+            }
+            self._log_unseen[label] = math.log(alpha / denominator)
+
+    @classmethod
+    def train(cls, samples: Iterable[Tuple[str, str]], n_features: int = DEFAULT_FEATURES,
+              alpha: float = 1.0, threshold: Optional[float] = DEFAULT_THRESHOLD) -> "PreClassifier":
+        documents: Dict[str, int] = {}
+        counts: Dict[str, Dict[int, int]] = {}
+        for text, label in samples:
+            documents[label] = documents.get(label, 0) + 1
+            label_counts = counts.setdefault(label, {})
+            for feature in extract_features(text, n_features):
+                label_counts[feature] = label_counts.get(feature, 0) + 1
+        return cls(documents, counts, n_features, alpha, threshold)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        return self._predict(extract_features(text, self.n_features), self.effective_features)
+
+    def _probabilities(self, features: List[int], effective_features: float) -> Dict[str, float]:
+        # Emails com mais palavras que `effective_features` têm a soma escalada para baixo
+        weight = min(1.0, effective_features / len(features)) if features else 1.0
+        scores = {}
+        for label in self.classes:
+            log_prob, unseen = self._log_prob[label], self._log_unseen[label]
+            scores[label] = self._log_prior[label] + weight * sum(log_prob.get(feature, unseen) for feature in features)
+
+        # Softmax estável
+        best = max(scores.values())
+        exps = {label: math.exp(score - best) for label, score in scores.items()}
+        total = sum(exps.values())
+        return {label: value / total for label, value in exps.items()}
+
+    def _predict(self, features: List[int], effective_features: float) -> Tuple[str, float]:
+        probabilities = self._probabilities(features, effective_features)
+        best = max(self.classes, key=probabilities.__getitem__)
+        return best, probabilities[best]
+
+    def decide(self, text: str) -> Optional[Tuple[str, float]]:
+        """(classe, confiança) quando o Gemini pode ser dispensado; None caso contrário."""
+        if self.threshold is None:
+            return None
+        label, confidence = self.predict(text)
+        if label in SHORT_CIRCUIT_LABELS and confidence >= self.threshold:
+            return label, confidence
+        return None
+
+    def calibrate(self, samples: Iterable[Tuple[str, str]], target_precision: float = 0.99) -> Dict[str, Any]:
+        """
+        Escolhe o menor limiar cujas decisões locais acertam pelo menos
+        `target_precision` das vezes nas amostras (que NÃO podem ter sido usadas
+        no treino). Guarda o limiar no modelo e devolve o relatório.
+        """
+        featurized = [(extract_features(text, self.n_features), label) for text, label in samples]
+        total = len(featurized)
+
+        # 1. Temperatura: a que melhor prevê as classes do holdout (menor log-loss)
+        def log_loss(effective_features: float) -> float:
+            return -sum(math.log(max(self._probabilities(features, effective_features).get(label, 0.0), 1e-12))
+                        for features, label in featurized)
+        if featurized:
+            self.effective_features = min(_EFFECTIVE_FEATURES_GRID, key=log_loss)
+
+        # 2. Limiar: (confiança, acertou?) de cada atalho possível
+        decisions: List[Tuple[float, bool]] = []
+        for features, label in featurized:
+            predicted, confidence = self._predict(features, self.effective_features)
+            if predicted in SHORT_CIRCUIT_LABELS:
+                decisions.append((confidence, predicted == label))
+        decisions.sort(key=lambda decision: decision[0], reverse=True)
+
+        # Percorre do mais confiante para o menos; o limiar só pode cair entre confianças diferentes
+        threshold, precision, covered = None, None, 0
+        correct = 0
+        for index, (confidence, hit) in enumerate(decisions):
+            correct += hit
+            is_last_of_tie = index + 1 == len(decisions) or decisions[index + 1][0] < confidence
+            if is_last_of_tie and correct / (index + 1) >= target_precision:
+                threshold, precision, covered = confidence, correct / (index + 1), index + 1
+
+        self.threshold = threshold
+        self.calibration = {
+            "target_precision": target_precision,
+            "effective_features": self.effective_features,
+            "precision": precision,
+            "coverage": covered / total if total else 0.0,  # Fração dos emails que dispensariam o Gemini
+            "held_out": total,
+        }
+        return {"threshold": threshold, **self.calibration}
+
+    def save(self, path: str) -> None:
+        payload = {
+            "format": MODEL_FORMAT,
+            "n_features": self.n_features,
+            "alpha": self.alpha,
+            "documents": self.documents,
+            "threshold": self.threshold,
+            "effective_features": self.effective_features,
+            "calibration": self.calibration,
+            "counts": {label: {str(feature): count for feature, count in features.items()}
+                       for label, features in self.counts.items()},
+        }
+        with open(path, "w", encoding="utf-8") as handle:
+            json.dump(payload, handle, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: str, threshold: Optional[float] = None) -> "PreClassifier":
+        """`threshold` substitui o limiar salvo no modelo (calibrado no treino)."""
+        with open(path, encoding="utf-8") as handle:
+            payload = json.load(handle)
+        if payload.get("format") != MODEL_FORMAT:
+            raise ValueError(f"Formato de modelo não suportado: {payload.get('format')!r}")
+        counts = {label: {int(feature): count for feature, count in features.items()}
+                  for label, features in payload["counts"].items()}
+        if threshold is None:
+            threshold = payload["threshold"] if "threshold" in payload else DEFAULT_THRESHOLD
+        return cls(payload["documents"], counts, payload["n_features"], payload["alpha"], threshold,
+                   payload.get("calibration"), payload.get("effective_features", DEFAULT_EFFECTIVE_FEATURES))
+
+
+def split_holdout(samples: Iterable[Tuple[str, str]], fraction: float) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+    """
+    Separa (treino, holdout). A escolha usa o CRC32 do texto: é reprodutível e
+    emails repetidos caem sempre do mesmo lado (não "vazam" para o holdout).
+    """
+    train, held_out = [], []
+    for text, label in samples:
+        bucket = zlib.crc32(text.encode("utf-8")) % 1000
+        (held_out if bucket < fraction * 1000 else train).append((text, label))
+    return train, held_out
+
+
+def iter_training_samples(path: str, text_preprocessor=None) -> Iterable[Tuple[str, str]]:
+    """
+    Lê o JSONL de análises e devolve pares (texto, classe).
+    O texto vem de "text" (ou "email_content"); linhas inválidas são ignoradas.
+    """
+    with open(path, encoding="utf-8") as handle:
+        for line_number, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.warning(f"Linha {line_number} ignorada: JSON inválido")
+                continue
+            text = entry.get("text") or entry.get("email_content")
+            label = label_for_analysis(entry)
+            if not text or label is None:
+                continue
+            yield (text_preprocessor(text) if text_preprocessor else text), label
@@ -0,0 +1,246 @@
+"""
+Single-flight: uma única chamada ao Gemini por email idêntico em andamento.
+
+Para devs iniciantes:
+- Quando o mesmo email chega várias vezes ao mesmo tempo (ex.: disparo de uma
+  lista de emails), todas as requisições erram o cache, porque o resultado só
+  é salvo quando a primeira análise termina.
+- Aqui a primeira requisição vira a "líder" e chama o Gemini; as demais com a
+  mesma chave esperam e reaproveitam o resultado dela ("coalescidas").
+- Dentro do processo usamos um `threading.Event`. Entre workers do gunicorn
+  usamos um "lease" curto no Redis (SET NX PX): quem não pegou o lease espera
+  o resultado aparecer no cache compartilhado.
+- `do_async` é a mesma ideia para o event loop (modo ASGI): as requisições
+  esperam um `asyncio.Future` e as chamadas ao Redis rodam em threads, para
+  não travar as outras requisições do loop.
+"""
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Libera o lease só se ele ainda for nosso (evita apagar o lease de outro worker)
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class _InFlightCall:
+    """Chamada em andamento dentro do processo (resultado compartilhado)."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Agrupa chamadas concorrentes com a mesma chave em uma só execução.
+
+    `do(chave, calcular, buscar)` devolve `(resultado, coalescido)`:
+    - `calcular()` só roda na requisição líder
+    - `buscar()` lê o resultado do cache compartilhado (usado entre workers)
+    """
+
+    def __init__(
+        self,
+        redis_url: Optional[str] = None,
+        lease_seconds: float = 30,
+        poll_interval: float = 0.1,
+        key_prefix: str = "mailmind:inflight:",
+    ) -> None:
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.key_prefix = key_prefix
+        self._calls: Dict[str, _InFlightCall] = {}
+        self._async_calls: Dict[str, "asyncio.Future[Any]"] = {}
+        self._lock = threading.Lock()
+        self._counters = {"leader_calls": 0, "coalesced_local": 0, "coalesced_remote": 0, "lease_timeouts": 0}
+
+        self._redis = None
+        if redis_url:
+            try:
+                import redis  # Import tardio: só necessário com Redis configurado
+
+                self._redis = redis.Redis.from_url(redis_url)
+                self._release = self._redis.register_script(_RELEASE_SCRIPT)
+            except ImportError:
+                logger.warning("Pacote redis não instalado, single-flight apenas local")
+
+    def do(self, key: str, compute: Callable[[], Any], fetch: Callable[[], Any]) -> Tuple[Any, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _InFlightCall()
+                self._calls[key] = call
+
+        if not is_leader:
+            # Outra thread deste processo já está calculando: espera por ela
+            if call.done.wait(timeout=self.lease_seconds):
+                self._count("coalesced_local")
+                if call.error:
+                    raise call.error
+                return call.result, True
+            # Líder demorou além do lease: segue sozinho
+            self._count("lease_timeouts")
+            return compute(), False
+
+        try:
+            call.result, coalesced = self._run_leader(key, compute, fetch)
+            return call.result, coalesced
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def do_async(
+        self, key: str, compute: Callable[[], Awaitable[Any]], fetch: Callable[[], Any]
+    ) -> Tuple[Any, bool]:
+        """Como `do`, mas `compute` é uma corrotina (`fetch` continua síncrono e roda numa thread)."""
+        pending = self._async_calls.get(key)
+        if pending is not None:
+            # Outra requisição deste loop já está calculando: espera por ela
+            try:
+                result = await asyncio.wait_for(asyncio.shield(pending), self.lease_seconds)
+            except asyncio.TimeoutError:
+                self._count("lease_timeouts")
+                return await compute(), False
+            self._count("coalesced_local")
+            return result, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_calls[key] = future
+        try:
+            result, coalesced = await self._run_leader_async(key, compute, fetch)
+            future.set_result(result)
+            return result, coalesced
+        except BaseException as e:
+            # Erro (ou cancelamento) do líder: quem estava esperando recebe o erro
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("Chamada líder cancelada"))
+            future.exception()  # Marca como lida (pode não haver ninguém esperando)
+            raise
+        finally:
+            self._async_calls.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores de chamadas líderes e coalescidas (para monitoramento)."""
+        with self._lock:
+            return {**self._counters, "in_flight": len(self._calls) + len(self._async_calls)}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _run_leader(self, key: str, compute: Callable[[], Any], fetch: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Líder do processo: tenta o lease no Redis (se houver) e calcula."""
+        if self._redis is None:
+            self._count("leader_calls")
+            return compute(), False
+
+        lease_key = f"{self.key_prefix}{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = self._redis.set(lease_key, token, nx=True, px=int(self.lease_seconds * 1000))
+        except Exception as e:
+            # Redis fora do ar: degrada para coalescência só local
+            logger.warning(f"Single-flight sem Redis ({e}), calculando localmente")
+            self._count("leader_calls")
+            return compute(), False
+
+        if acquired:
+            try:
+                self._count("leader_calls")
+                return compute(), False
+            finally:
+                try:
+                    self._release(keys=[lease_key], args=[token])
+                except Exception as e:
+                    logger.warning(f"Falha ao liberar lease {lease_key}: {e}")
+
+        # Outro worker está calculando: espera o resultado aparecer no cache
+        deadline = time.monotonic() + self.lease_seconds
+        while time.monotonic() < deadline:
+            result = fetch()
+            if result is not None:
+                self._count("coalesced_remote")
+                return result, True
+            try:
+                if not self._redis.exists(lease_key):
+                    break  # Líder terminou (ou falhou) sem gravar resultado
+            except Exception:
+                break
+            time.sleep(self.poll_interval)
+        else:
+            self._count("lease_timeouts")
+
+        result = fetch()
+        if result is not None:
+            self._count("coalesced_remote")
+            return result, True
+
+        self._count("leader_calls")
+        return compute(), False
+
+    async def _run_leader_async(
+        self, key: str, compute: Callable[[], Awaitable[Any]], fetch: Callable[[], Any]
+    ) -> Tuple[Any, bool]:
+        """Mesmo fluxo de `_run_leader`, sem bloquear o event loop."""
+        if self._redis is None:
+            self._count("leader_calls")
+            return await compute(), False
+
+        lease_key = f"{self.key_prefix}{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = await asyncio.to_thread(
+                self._redis.set, lease_key, token, nx=True, px=int(self.lease_seconds * 1000)
+            )
+        except Exception as e:
+            logger.warning(f"Single-flight sem Redis ({e}), calculando localmente")
+            self._count("leader_calls")
+            return await compute(), False
+
+        if acquired:
+            try:
+                self._count("leader_calls")
+                return await compute(), False
+            finally:
+                try:
+                    await asyncio.to_thread(self._release, keys=[lease_key], args=[token])
+                except Exception as e:
+                    logger.warning(f"Falha ao liberar lease {lease_key}: {e}")
+
+        deadline = time.monotonic() + self.lease_seconds
+        while time.monotonic() < deadline:
+            result = await asyncio.to_thread(fetch)
+            if result is not None:
+                self._count("coalesced_remote")
+                return result, True
+            try:
+                if not await asyncio.to_thread(self._redis.exists, lease_key):
+                    break
+            except Exception:
+                break
+            await asyncio.sleep(self.poll_interval)
+        else:
+            self._count("lease_timeouts")
+
+        result = await asyncio.to_thread(fetch)
+        if result is not None:
+            self._count("coalesced_remote")
+            return result, True
+
+        self._count("leader_calls")
+        return await compute(), False
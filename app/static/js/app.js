@@ -165,10 +165,12 @@ class EmailAnalyzer {
   }
 
   handleFileSelect(file) {
-    const allowedTypes = ["text/plain", "application/pdf"];
+    const allowedExtensions = [".txt", ".pdf", ".eml", ".mbox"];
+    const fileName = file.name.toLowerCase();
 
-    if (!allowedTypes.includes(file.type)) {
-      this.showToast("Apenas arquivos .txt e .pdf são permitidos", "error");
+    // .eml/.mbox costumam chegar sem MIME type no navegador: valida pela extensão
+    if (!allowedExtensions.some((extension) => fileName.endsWith(extension))) {
+      this.showToast("Apenas arquivos .txt, .pdf, .eml e .mbox são permitidos", "error");
       return;
     }
 
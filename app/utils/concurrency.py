@@ -0,0 +1,39 @@
+"""
+Helpers de concorrência para processar lotes de emails.
+
+Para devs iniciantes:
+- A maior parte do tempo de análise é espera de rede (Gemini), então threads
+  resolvem bem: enquanto uma espera, as outras trabalham.
+- O número de threads é limitado (max_workers) para não estourar a quota do
+  Gemini nem os recursos do worker do gunicorn.
+- Cada item roda com uma cópia do contexto (`contextvars`) de quem chamou:
+  assim o prazo da requisição (deadline) também vale dentro das threads.
+"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def map_bounded(func: Callable[[T], R], items: Iterable[T], max_workers: int) -> List[R]:
+    """
+    Aplica `func` a cada item com no máximo `max_workers` execuções simultâneas.
+    Retorna os resultados na MESMA ordem dos itens de entrada.
+
+    Exceções não são engolidas: `func` deve tratar seus próprios erros se o
+    lote precisar continuar quando um item falha.
+    """
+    items = list(items)
+
+    # Sem ganho em paralelizar: evita criar threads à toa
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    workers = min(max_workers, len(items))
+    # Um contexto por item: o mesmo Context não pode rodar em duas threads ao mesmo tempo
+    contexts = [contextvars.copy_context() for _ in items]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mailmind-batch") as executor:
+        # executor.map preserva a ordem de entrada
+        return list(executor.map(lambda context, item: context.run(func, item), contexts, items))
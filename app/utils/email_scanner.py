@@ -0,0 +1,130 @@
+"""
+Pré-scanner de emails em uma única passada.
+
+Para devs iniciantes:
+- Antes, cada email era percorrido várias vezes: uma regex para dividir o
+  arquivo, outra para achar o remetente, um fatiamento para truncar, outra
+  regex para normalizar espaços e mais uma para separar palavras.
+- Aqui o conteúdo é percorrido UMA vez para achar as fronteiras (---/=== ou
+  linhas "From:"). Remetente e assunto são buscados direto no conteúdo original
+  (pos/endpos, sem copiar o trecho) e a busca para no primeiro resultado, que
+  fica nas primeiras linhas do email.
+- A preparação para o Gemini (truncar + normalizar + tirar stopwords) é feita
+  em uma passada só sobre o trecho truncado: separar as palavras já descarta
+  os espaços, então a normalização separa é desnecessária. O truncamento usa
+  um orçamento de tokens (ver smart_truncate.py).
+- Todas as regex são compiladas uma vez, no carregamento do módulo.
+"""
+import re
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from .mail_parser import EMAIL_PATTERN, SUBJECT_PATTERN, EmailRecord
+from .smart_truncate import DEFAULT_TOKEN_BUDGET, smart_truncate
+from .text_preprocess import _DEFAULT_STOPWORDS
+
+# Fronteiras entre emails
+SEPARATOR_PATTERN = re.compile(r"\n[-=]{3,}\n")
+FROM_LINE_PATTERN = re.compile(r"^From:\s", re.MULTILINE | re.IGNORECASE)
+# "Subject:" logo no começo do email (onde `^` não casa quando usamos pos)
+SUBJECT_AT_START_PATTERN = re.compile(r"Subject:[ \t]*(.*)$", re.IGNORECASE | re.MULTILINE)
+_TOKEN_PATTERN = re.compile(r"[\wÀ-ÿ'-]+")
+_STOPWORDS = frozenset(_DEFAULT_STOPWORDS)
+
+# Abaixo deste tamanho o texto truncado vai ao Gemini sem pré-processamento
+PREPROCESS_MIN_CHARS = 500
+
+
+@dataclass
+class ScannedEmail:
+    """Um email encontrado pelo scanner, com tudo o que o pipeline precisa."""
+    text: str  # Email sem espaços nas pontas
+    start: int  # Posição inicial do trecho no conteúdo original
+    end: int  # Posição final (exclusiva) do trecho no conteúdo original
+    sender: str  # Primeiro endereço após "From:" (ou "")
+    subject: str  # Primeira linha "Subject:" (ou "")
+    gemini_input: str  # Texto final enviado ao Gemini
+
+    def to_record(self) -> EmailRecord:
+        return EmailRecord(
+            content=self.text,
+            sender=self.sender,
+            subject=self.subject,
+            gemini_input=self.gemini_input,
+        )
+
+
+def truncation_point(text: str, max_chars: int) -> int:
+    """Onde cortar o texto: até `max_chars`, recuando ao último ponto se estiver perto do fim."""
+    if len(text) <= max_chars:
+        return len(text)
+    last_period = text.rfind(".", 0, max_chars)
+    if last_period > max_chars * 0.8:
+        return last_period + 1
+    return max_chars
+
+
+def prepare_text(text: str, token_budget: int = DEFAULT_TOKEN_BUDGET) -> str:
+    """
+    Texto enviado ao Gemini: `smart_truncate` dentro do orçamento de tokens e,
+    quando o trecho passa de 500 caracteres, minúsculas sem stopwords (como `basic_preprocess`).
+    """
+    truncated = smart_truncate(text, token_budget)
+    if len(truncated) <= PREPROCESS_MIN_CHARS:
+        return truncated
+    tokens = _TOKEN_PATTERN.findall(truncated.lower())
+    return " ".join(token for token in tokens if token not in _STOPWORDS)
+
+
+def scan_emails(content: str, token_budget: int = DEFAULT_TOKEN_BUDGET, min_length: int = 50) -> List[ScannedEmail]:
+    """
+    Divide o conteúdo em emails (mesmas regras de `split_multiple_emails`) e já
+    devolve remetente, assunto e texto para o Gemini.
+    """
+    # Separadores explícitos têm prioridade; sem eles, cada linha "From:" abre um email
+    bounds: List[Tuple[int, int]] = []
+    previous_end = 0
+    for match in SEPARATOR_PATTERN.finditer(content):
+        bounds.append((previous_end, match.start()))
+        previous_end = match.end()
+    if bounds:
+        bounds.append((previous_end, len(content)))
+    else:
+        starts = [match.start() for match in FROM_LINE_PATTERN.finditer(content)]
+        if len(starts) > 1:
+            bounds = list(zip(starts, starts[1:] + [len(content)]))
+        else:
+            bounds = [(0, len(content))]
+
+    emails = []
+    for start, end in bounds:
+        scanned = _build_email(content, start, end, token_budget)
+        if scanned.text and (len(bounds) == 1 or len(scanned.text) > min_length):
+            emails.append(scanned)
+
+    if not emails:
+        emails = [_build_email(content, 0, len(content), token_budget)]
+    return emails
+
+
+def _build_email(content: str, start: int, end: int, token_budget: int) -> ScannedEmail:
+    raw = content[start:end]
+    text = raw.strip()
+    # Depois do strip o email começa no primeiro caractere não-branco (conta como início de linha)
+    text_start = start + len(raw) - len(raw.lstrip())
+
+    # Cabeçalhos: as buscas usam pos/endpos no conteúdo original, sem copiar o trecho,
+    # e param no primeiro resultado (normalmente nas primeiras linhas do email)
+    sender_match = EMAIL_PATTERN.search(content, start, end)
+    subject_match = SUBJECT_AT_START_PATTERN.match(content, text_start, end)
+    if subject_match is None:
+        subject_match = SUBJECT_PATTERN.search(content, start, end)
+
+    return ScannedEmail(
+        text=text,
+        start=start,
+        end=end,
+        sender=sender_match.group(1) if sender_match else "",
+        subject=subject_match.group(1).strip() if subject_match else "",
+        gemini_input=prepare_text(text, token_budget),
+    )
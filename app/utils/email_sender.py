@@ -1,23 +1,82 @@
 import smtplib
+import threading
+import time
 from email.message import EmailMessage
-from typing import Optional
+from typing import Iterable, List, Optional
 import logging
 
+# Erros de uma sessão reaproveitada que caiu (servidor fechou por inatividade,
+# rede...): nada foi aceito ainda, então dá para reconectar e reenviar
+_DEAD_SESSION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError)
+
+
+def session_survives(error: Exception) -> bool:
+    """
+    A sessão continua utilizável depois deste erro? Recusas de uma mensagem
+    (remetente, destinatários ou conteúdo) já vêm com RSET do smtplib; o
+    código 421 é o servidor encerrando a conexão.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code != 421
+
+
+def worth_reconnecting(error: Exception, session: "SmtpSession") -> bool:
+    """
+    Vale reenviar a mensagem por uma sessão nova? Sim para o 421 (servidor
+    encerrando a conexão: a mensagem não foi aceita) e para uma sessão
+    reaproveitada que caiu. Uma conexão nova que já caiu não adianta insistir.
+    """
+    if isinstance(error, smtplib.SMTPResponseException) and error.smtp_code == 421:
+        return True
+    return isinstance(error, _DEAD_SESSION_ERRORS) and session.sent > 0
+
+
+class SmtpSession:
+    """Uma conexão SMTP autenticada do pool, com a contagem de uso."""
+
+    def __init__(self, smtp: smtplib.SMTP) -> None:
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        try:
+            self.smtp.quit()
+        except Exception:
+            self.smtp.close()  # Conexão já caída: só libera o socket
+
 
 class EmailSender:
     """
     Cliente SMTP para envio de emails.
     Suporta configuração flexível de host, porta e credenciais.
+
+    Para devs iniciantes:
+    - Abrir uma conexão SMTP custa caro (TCP, STARTTLS e login: várias idas e
+      voltas ao servidor). Por isso o EmailSender mantém até `pool_size`
+      sessões já autenticadas e as reaproveita entre envios (thread-safe).
+    - Uma sessão é fechada e trocada depois de `max_messages_per_connection`
+      mensagens ou de `idle_timeout` segundos parada (os servidores derrubam
+      conexões ociosas). Se mesmo assim ela tiver caído (ou o servidor
+      responder 421), o envio reconecta e tenta de novo uma vez.
+    - `send_many` manda várias mensagens seguidas pela mesma sessão, trocando
+      de sessão no meio do lote quando ela chega ao máximo de mensagens.
     """
-    
+
     def __init__(
-        self, 
-        host: str, 
-        port: int, 
-        username: str, 
-        password: str, 
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
         default_from: Optional[str] = None,
-        timeout: int = 30
+        timeout: int = 30,
+        *,
+        pool_size: int = 2,
+        max_messages_per_connection: int = 100,
+        idle_timeout: float = 60,
+        starttls: bool = True
     ) -> None:
         self.host = host
         self.port = port
@@ -25,43 +84,159 @@ class EmailSender:
         self.password = password
         self.default_from = default_from or username
         self.timeout = timeout
-        
-        logging.info(f"EmailSender configurado: {host}:{port}")
+        self.pool_size = max(1, pool_size)
+        self.max_messages_per_connection = max(1, max_messages_per_connection)
+        self.idle_timeout = idle_timeout
+        self.starttls = starttls
+
+        self._lock = threading.Lock()
+        self._idle: List[SmtpSession] = []  # Sessões livres (a última usada no fim)
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self.connections_opened = 0
+
+        logging.info(f"EmailSender configurado: {host}:{port} (até {self.pool_size} conexões)")
+
+    def build_message(
+        self,
+        to_address: str,
+        subject: str,
+        body: str,
+        *,
+        from_address: Optional[str] = None
+    ) -> EmailMessage:
+        """Monta a mensagem (texto) com o remetente padrão se nenhum for informado."""
+        msg = EmailMessage()
+        msg["From"] = from_address or self.default_from
+        msg["To"] = to_address
+        msg["Subject"] = subject
+        msg.set_content(body)
+        return msg
 
     def send(
-        self, 
-        to_address: str, 
-        subject: str, 
-        body: str, 
-        *, 
+        self,
+        to_address: str,
+        subject: str,
+        body: str,
+        *,
         from_address: Optional[str] = None
     ) -> None:
         """
         Envia um email usando as configurações SMTP.
-        
+
         Args:
             to_address: Email do destinatário
             subject: Assunto do email
             body: Corpo do email (texto)
             from_address: Email do remetente (opcional, usa default_from se não especificado)
-        
+
         Raises:
             smtplib.SMTPException: Em caso de erro no envio
         """
-        msg = EmailMessage()
-        msg["From"] = from_address or self.default_from
-        msg["To"] = to_address
-        msg["Subject"] = subject
-        msg.set_content(body)
+        msg = self.build_message(to_address, subject, body, from_address=from_address)
+        error = self.send_many([msg])[0]
+        if error is not None:
+            logging.error(f"Erro ao enviar email para {to_address}: {error}")
+            raise error
+        logging.info(f"Email enviado com sucesso para {to_address}")
+
+    def send_many(self, messages: Iterable[EmailMessage]) -> List[Optional[Exception]]:
+        """
+        Envia as mensagens em sequência por uma única sessão do pool.
+        Uma mensagem recusada não interrompe as outras: devolve, na mesma
+        ordem, None (enviada) ou a exceção de cada uma.
+
+        Raises:
+            TimeoutError: Nenhuma conexão do pool ficou livre dentro do timeout
+        """
+        messages = list(messages)
+        if not messages:
+            return []
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"Nenhuma conexão SMTP livre em {self.timeout}s")
+        session: Optional[SmtpSession] = None
+        results: List[Optional[Exception]] = []
+        try:
+            for msg in messages:
+                try:
+                    if session is not None and session.sent >= self.max_messages_per_connection:
+                        session.close()  # O limite por conexão vale também no meio do lote
+                        session = None
+                    if session is None:
+                        session = self._checkout()
+                    try:
+                        self._deliver(session, msg)
+                    except Exception as e:
+                        if not worth_reconnecting(e, session):
+                            raise
+                        logging.info(f"Conexão SMTP caiu ({e}), reconectando")
+                        session.close()
+                        session = None
+                        session = self._connect()
+                        self._deliver(session, msg)
+                    results.append(None)
+                except Exception as e:
+                    results.append(e)
+                    if session is not None and not session_survives(e):
+                        session.close()
+                        session = None  # Próxima mensagem abre (ou pega) outra sessão
+        finally:
+            if session is not None:
+                self._checkin(session)
+            self._slots.release()
+        return results
+
+    def close(self) -> None:
+        """Fecha as sessões livres (ex.: ao encerrar o worker)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session in idle:
+            session.close()
+
+    @staticmethod
+    def _deliver(session: SmtpSession, msg: EmailMessage) -> None:
+        session.smtp.send_message(msg)
+        session.sent += 1
+        session.last_used = time.monotonic()
+
+    def _checkout(self) -> SmtpSession:
+        """Sessão livre ainda válida (a mais recente) ou uma nova conexão."""
+        now = time.monotonic()
+        expired = []
+        session = None
+        with self._lock:
+            while self._idle:
+                candidate = self._idle.pop()
+                if now - candidate.last_used < self.idle_timeout:
+                    session = candidate
+                    break
+                expired.append(candidate)
+            # As que sobraram são mais antigas ainda: se a mais nova expirou, elas também
+            if session is None:
+                expired.extend(self._idle)
+                self._idle = []
+        for old in expired:
+            old.close()
+        return session if session is not None else self._connect()
+
+    def _checkin(self, session: SmtpSession) -> None:
+        """Devolve a sessão ao pool, ou a fecha se já enviou o máximo por conexão."""
+        if session.sent >= self.max_messages_per_connection:
+            session.close()
+            return
+        with self._lock:
+            self._idle.append(session)
 
+    def _connect(self) -> SmtpSession:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
         try:
-            with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
                 smtp.starttls()
-                if self.username:
-                    smtp.login(self.username, self.password)
-                smtp.send_message(msg)
-                
-            logging.info(f"Email enviado com sucesso para {to_address}")
-        except Exception as e:
-            logging.error(f"Erro ao enviar email para {to_address}: {e}")
+            if self.username:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
             raise
+        with self._lock:
+            self.connections_opened += 1
+        return SmtpSession(smtp)
@@ -0,0 +1,105 @@
+"""
+Divisão de arquivos grandes com vários emails, sem carregar tudo na memória.
+
+Para devs iniciantes:
+- `split_multiple_emails` recebe o arquivo inteiro como string e cria várias
+  cópias dele (decode, split, finditer). Com 10MB isso pesa na memória.
+- Aqui lemos o arquivo LINHA A LINHA direto do upload (o Werkzeug guarda
+  arquivos grandes em um arquivo temporário em disco) e devolvemos um email
+  de cada vez com `yield` (um gerador). Só o email atual fica na memória.
+- As regras são as mesmas: separadores `---`/`===` em uma linha sozinha têm
+  prioridade; sem eles, cada linha começando com `From:` inicia um email.
+"""
+import os
+import re
+from typing import BinaryIO, Iterator, List
+
+SEPARATOR_LINE_PATTERN = re.compile(r"[-=]{3,}")
+FROM_LINE_PATTERN = re.compile(r"From:\s", re.IGNORECASE)
+
+# Modos de divisão (decididos em uma primeira leitura do arquivo)
+MODE_SEPARATOR = "separator"
+MODE_FROM = "from"
+MODE_SINGLE = "single"
+
+
+def stream_size(stream: BinaryIO) -> int:
+    """Tamanho do arquivo em bytes sem lê-lo (usa seek/tell)."""
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def _iter_lines(stream: BinaryIO, encoding: str) -> Iterator[str]:
+    """Lê o arquivo do início, uma linha por vez (bytes -> str)."""
+    stream.seek(0)
+    for raw_line in stream:
+        yield raw_line.decode(encoding, errors="ignore")
+
+
+def _is_separator(line: str) -> bool:
+    return SEPARATOR_LINE_PATTERN.fullmatch(line.rstrip("\r\n")) is not None
+
+
+def detect_split_mode(stream: BinaryIO, encoding: str = "utf-8") -> str:
+    """Primeira passada: descobre como o arquivo deve ser dividido."""
+    from_lines = 0
+    for line_number, line in enumerate(_iter_lines(stream, encoding)):
+        # Separador só conta depois de uma quebra de linha (como o "\n---\n" original)
+        if line_number > 0 and _is_separator(line):
+            return MODE_SEPARATOR
+        if FROM_LINE_PATTERN.match(line):
+            from_lines += 1
+    return MODE_FROM if from_lines > 1 else MODE_SINGLE
+
+
+def _iter_parts(stream: BinaryIO, mode: str, encoding: str) -> Iterator[str]:
+    """Segunda passada: devolve os trechos brutos entre as fronteiras."""
+    buffer: List[str] = []
+    # No modo From:, o texto antes do primeiro "From:" é descartado
+    collecting = mode != MODE_FROM
+
+    for line_number, line in enumerate(_iter_lines(stream, encoding)):
+        if mode == MODE_SEPARATOR and line_number > 0 and _is_separator(line):
+            yield "".join(buffer)
+            buffer = []
+            continue
+        if mode == MODE_FROM and FROM_LINE_PATTERN.match(line):
+            if collecting:
+                yield "".join(buffer)
+            buffer = []
+            collecting = True
+        if collecting:
+            buffer.append(line)
+
+    if collecting:
+        yield "".join(buffer)
+
+
+def iter_emails_from_stream(stream: BinaryIO, min_length: int = 50, encoding: str = "utf-8") -> Iterator[str]:
+    """
+    Gera os emails de um arquivo (binário, com seek) um de cada vez.
+    Trechos com até `min_length` caracteres são ignorados, como no split original;
+    se nenhum trecho sobrar, o arquivo inteiro vira um único email.
+    """
+    mode = detect_split_mode(stream, encoding)
+
+    if mode == MODE_SINGLE:
+        content = "".join(_iter_lines(stream, encoding)).strip()
+        if content:
+            yield content
+        return
+
+    found_any = False
+    for part in _iter_parts(stream, mode, encoding):
+        cleaned = part.strip()
+        if cleaned and len(cleaned) > min_length:
+            found_any = True
+            yield cleaned
+
+    if not found_any:
+        content = "".join(_iter_lines(stream, encoding)).strip()
+        if content:
+            yield content
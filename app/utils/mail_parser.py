@@ -0,0 +1,188 @@
+"""
+Leitura de emails no formato padrão (.eml e mbox) com o parser da stdlib.
+
+Para devs iniciantes:
+- Um arquivo .eml é UM email completo (cabeçalhos + corpo MIME). Um arquivo
+  mbox é vários emails seguidos, cada um começando com uma linha "From ".
+- Em vez de adivinhar remetente e fronteiras com regex, usamos o módulo
+  `email` do Python, que entende cabeçalhos, codificações e partes MIME.
+- Os cabeçalhos são lidos UMA vez e guardados em um `EmailRecord`; as etapas
+  seguintes (cache, resposta da API) reaproveitam esses campos.
+- Do corpo pegamos só o texto: a parte text/plain, ou text/html convertida em
+  texto. Anexos são pulados sem decodificar o conteúdo deles.
+"""
+import re
+from dataclasses import dataclass
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesFeedParser
+from email.utils import parseaddr
+from html.parser import HTMLParser
+from typing import BinaryIO, Iterator, List, Optional
+
+EMAIL_PATTERN = re.compile(
+    r'From:\s*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})',
+    re.IGNORECASE
+)
+SUBJECT_PATTERN = re.compile(r'^Subject:[ \t]*(.*)$', re.IGNORECASE | re.MULTILINE)
+
+# Linha que inicia uma mensagem no mbox e a versão "escapada" no corpo (mboxrd)
+MBOX_FROM_LINE = b"From "
+_MBOX_ESCAPED_FROM = re.compile(rb"^>(>*From )")
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def extract_sender_from_email(email_content: str) -> str:
+    """Extrai o email do remetente do conteúdo do email."""
+    match = EMAIL_PATTERN.search(email_content)
+    if match:
+        return match.group(1).strip()
+    return ""
+
+
+@dataclass
+class EmailRecord:
+    """
+    Um email pronto para análise, com os cabeçalhos já extraídos.
+    `content` é o texto enviado à análise (cabeçalhos principais + corpo).
+    """
+    content: str
+    sender: str = ""
+    subject: str = ""
+    message_id: str = ""
+    date: str = ""
+    in_reply_to: str = ""
+    gemini_input: str = ""  # Texto já preparado para o Gemini (preenchido pelo scanner)
+
+    @classmethod
+    def from_text(cls, text: str) -> "EmailRecord":
+        """Email em texto livre (colado ou .txt): cabeçalhos por regex, uma vez só."""
+        subject_match = SUBJECT_PATTERN.search(text)
+        return cls(
+            content=text,
+            sender=extract_sender_from_email(text),
+            subject=subject_match.group(1).strip() if subject_match else "",
+        )
+
+
+class _HTMLToText(HTMLParser):
+    """Converte HTML em texto simples (ignora script/style, quebra linha em blocos)."""
+
+    _BLOCK_TAGS = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "table"}
+    _SKIP_TAGS = {"script", "style", "head"}
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self._parts: List[str] = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self._BLOCK_TAGS:
+            self._parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in self._BLOCK_TAGS:
+            self._parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._parts.append(data)
+
+    def text(self) -> str:
+        lines = (line.strip() for line in "".join(self._parts).splitlines())
+        return "\n".join(line for line in lines if line)
+
+
+def html_to_text(html: str) -> str:
+    parser = _HTMLToText()
+    parser.feed(html)
+    parser.close()
+    return parser.text()
+
+
+def extract_body(message: EmailMessage) -> str:
+    """
+    Texto do corpo: primeira parte text/plain; se não houver, text/html
+    convertida. Anexos nunca são decodificados.
+    """
+    html_part: Optional[EmailMessage] = None
+    for part in message.walk():
+        if part.is_multipart() or part.is_attachment():
+            continue
+        content_type = part.get_content_type()
+        if content_type == "text/plain":
+            return _decode_text(part)
+        if content_type == "text/html" and html_part is None:
+            html_part = part
+
+    if html_part is not None:
+        return html_to_text(_decode_text(html_part))
+    return ""
+
+
+def _decode_text(part: EmailMessage) -> str:
+    try:
+        return part.get_content()
+    except (LookupError, UnicodeError):
+        # Charset desconhecido/errado: decodifica os bytes de forma tolerante
+        payload = part.get_payload(decode=True) or b""
+        return payload.decode("utf-8", errors="ignore")
+
+
+def record_from_message(message: EmailMessage) -> EmailRecord:
+    """Extrai os cabeçalhos uma única vez e monta o texto para análise."""
+    from_header = str(message.get("From", "") or "")
+    subject = str(message.get("Subject", "") or "").strip()
+    body = extract_body(message).strip()
+    return EmailRecord(
+        content=f"From: {from_header}\nSubject: {subject}\n\n{body}",
+        sender=parseaddr(from_header)[1],
+        subject=subject,
+        message_id=str(message.get("Message-ID", "") or "").strip(),
+        date=str(message.get("Date", "") or "").strip(),
+        in_reply_to=str(message.get("In-Reply-To", "") or "").strip(),
+    )
+
+
+def _new_parser() -> BytesFeedParser:
+    return BytesFeedParser(policy=policy.default)
+
+
+def parse_eml(stream: BinaryIO) -> EmailRecord:
+    """Lê um arquivo .eml em blocos (sem um `read()` do arquivo inteiro)."""
+    stream.seek(0)
+    parser = _new_parser()
+    for chunk in iter(lambda: stream.read(_CHUNK_SIZE), b""):
+        parser.feed(chunk)
+    return record_from_message(parser.close())
+
+
+def iter_mbox(stream: BinaryIO) -> Iterator[EmailRecord]:
+    """
+    Percorre um arquivo mbox linha a linha e devolve um EmailRecord por
+    mensagem, sem carregar o arquivo todo na memória.
+    """
+    stream.seek(0)
+    parser: Optional[BytesFeedParser] = None
+    previous_blank = True
+
+    for line in stream:
+        # Nova mensagem: linha "From " no início do arquivo ou após linha em branco
+        if line.startswith(MBOX_FROM_LINE) and previous_blank:
+            if parser is not None:
+                yield record_from_message(parser.close())
+            parser = _new_parser()
+            previous_blank = False
+            continue
+
+        previous_blank = not line.strip()
+        if parser is not None:
+            parser.feed(_MBOX_ESCAPED_FROM.sub(rb"\1", line))
+
+    if parser is not None:
+        yield record_from_message(parser.close())
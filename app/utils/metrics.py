@@ -0,0 +1,206 @@
+"""
+Métricas do pipeline no formato do Prometheus (endpoint /metrics).
+
+Para devs iniciantes:
+- Cada etapa do pipeline (leitura do upload, extração de PDF, divisão dos
+  emails, consulta ao cache, chamada ao Gemini, parse do JSON...) é medida
+  com um histograma: `with time_stage("cache_lookup"): ...`.
+- Contadores registram acertos/erros do cache, retries e falhas do Gemini
+  (por tipo de exceção) e tokens gastos; gauges mostram o que está em
+  andamento agora.
+- Com vários workers do gunicorn, cada processo tem a sua memória. Definindo
+  PROMETHEUS_MULTIPROC_DIR (uma pasta vazia, antes de iniciar o gunicorn), o
+  `prometheus_client` grava os valores em arquivos mmap nessa pasta e o
+  /metrics de qualquer worker soma todos eles.
+- `prometheus_client` é opcional: sem ele, todas as funções viram no-op e o
+  /metrics responde 503.
+- Atualizar uma métrica custa uma soma em memória: pode ficar sempre ligado.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Tuple
+
+# Faixas dos histogramas (segundos): de 1ms até chamadas longas ao Gemini
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _NoopMetric:
+    """Substituto quando o prometheus_client não está instalado."""
+
+    def labels(self, *args: Any, **kwargs: Any) -> "_NoopMetric":
+        return self
+
+    def observe(self, value: float) -> None:
+        pass
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def dec(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    # O gunicorn.conf.py cria a pasta; outros servidores (uvicorn, flask run) não
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram
+
+    AVAILABLE = True
+except ImportError:
+    prometheus_client = None
+    AVAILABLE = False
+
+if AVAILABLE:
+    STAGE_SECONDS = Histogram(
+        "mailmind_stage_duration_seconds",
+        "Tempo gasto em cada etapa do pipeline de análise",
+        ["stage"],
+        buckets=STAGE_BUCKETS,
+    )
+    CACHE_EVENTS = Counter(
+        "mailmind_cache_events_total",
+        "Consultas ao cache de análises por resultado (hit, miss, coalesced, near_duplicate)",
+        ["result"],
+    )
+    GEMINI_RETRIES = Counter(
+        "mailmind_gemini_retries_total",
+        "Tentativas do Gemini que falharam e foram repetidas, por tipo de exceção",
+        ["exception"],
+    )
+    GEMINI_FAILURES = Counter(
+        "mailmind_gemini_failures_total",
+        "Chamadas ao Gemini que falharam de vez (após os retries), por tipo de exceção",
+        ["exception"],
+    )
+    GEMINI_TOKENS = Counter(
+        "mailmind_gemini_tokens_total",
+        "Tokens informados pelo Gemini em usage_metadata (prompt, output)",
+        ["kind"],
+    )
+    PRE_CLASSIFIER_DECISIONS = Counter(
+        "mailmind_pre_classifier_decisions_total",
+        "Decisões do pré-classificador local (Spam, Outro = sem Gemini; gemini = seguiu para o Gemini)",
+        ["decision"],
+    )
+    IN_FLIGHT = Gauge(
+        "mailmind_in_flight",
+        "Operações em andamento (requisições por endpoint e chamadas ao Gemini)",
+        ["operation"],
+        multiprocess_mode="livesum",
+    )
+    GEMINI_CONCURRENCY_LIMIT = Gauge(
+        "mailmind_gemini_concurrency_limit",
+        "Chamadas simultâneas ao Gemini permitidas agora pelo limitador adaptativo (AIMD)",
+        multiprocess_mode="livesum",
+    )
+    CACHE_WARMUP_ENTRIES = Counter(
+        "mailmind_cache_warmup_entries_total",
+        "Análises carregadas no cache pelo aquecimento ao subir a instância, por fonte",
+        ["source"],
+    )
+    OUTBOUND_EMAILS = Counter(
+        "mailmind_outbound_emails_total",
+        "Envios em background (curator = resumo do curador, reply = resposta automática) por resultado",
+        ["kind", "result"],
+    )
+else:
+    STAGE_SECONDS = CACHE_EVENTS = GEMINI_RETRIES = GEMINI_FAILURES = GEMINI_TOKENS = _NoopMetric()
+    PRE_CLASSIFIER_DECISIONS = IN_FLIGHT = GEMINI_CONCURRENCY_LIMIT = OUTBOUND_EMAILS = _NoopMetric()
+    CACHE_WARMUP_ENTRIES = _NoopMetric()
+
+
+@contextmanager
+def time_stage(stage: str) -> Iterator[None]:
+    """Mede a duração do bloco no histograma da etapa (também quando há exceção)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def track_in_flight(operation: str) -> Iterator[None]:
+    """Conta a operação como "em andamento" enquanto o bloco executa."""
+    gauge = IN_FLIGHT.labels(operation)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+def count_cache(result: str) -> None:
+    CACHE_EVENTS.labels(result).inc()
+
+
+def count_pre_classifier(decision: str) -> None:
+    PRE_CLASSIFIER_DECISIONS.labels(decision).inc()
+
+
+def count_gemini_retry(error: BaseException) -> None:
+    GEMINI_RETRIES.labels(type(error).__name__).inc()
+
+
+def count_gemini_failure(error: BaseException) -> None:
+    GEMINI_FAILURES.labels(type(error).__name__).inc()
+
+
+def set_gemini_concurrency_limit(limit: int) -> None:
+    GEMINI_CONCURRENCY_LIMIT.set(limit)
+
+
+def record_cache_warmup(source: str, entries: int, seconds: float) -> None:
+    """Duração (etapa "cache_warmup" do histograma) e entradas carregadas pelo aquecimento."""
+    STAGE_SECONDS.labels("cache_warmup").observe(seconds)
+    CACHE_WARMUP_ENTRIES.labels(source).inc(entries)
+
+
+def count_outbound(kind: str, result: str) -> None:
+    OUTBOUND_EMAILS.labels(kind, result).inc()
+
+
+def record_token_usage(response: Any) -> None:
+    """Soma os tokens de `response.usage_metadata` (se a resposta trouxer)."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    if prompt_tokens:
+        GEMINI_TOKENS.labels("prompt").inc(prompt_tokens)
+    if output_tokens:
+        GEMINI_TOKENS.labels("output").inc(output_tokens)
+
+
+def is_multiprocess() -> bool:
+    return bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def render_latest() -> Tuple[bytes, str]:
+    """
+    Texto no formato de exposição do Prometheus e o content-type.
+    Em modo multiprocesso, agrega os arquivos de todos os workers.
+    """
+    if not AVAILABLE:
+        raise RuntimeError("prometheus_client não instalado")
+    if is_multiprocess():
+        from prometheus_client import CollectorRegistry, multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
@@ -0,0 +1,214 @@
+"""
+Extração de texto de PDFs em processos isolados.
+
+Para devs iniciantes:
+- Extrair texto de PDF é trabalho pesado de CPU. Rodando na thread da
+  requisição, ele disputa o GIL com as outras threads do worker do gunicorn
+  e um PDF malformado pode travar o worker inteiro.
+- Aqui a extração roda em PROCESSOS separados (até `max_workers`), cada um
+  com limite de memória e ligado ao app por um pipe.
+- O tempo máximo de cada arquivo começa a contar quando um processo recebe o
+  PDF (a espera na fila não conta). Se estourar, só aquele processo é
+  encerrado; os outros PDFs em andamento continuam.
+- As páginas são lidas uma a uma e a leitura para assim que o limite de
+  caracteres (`max_pdf_chars`) é atingido, sem processar o resto do arquivo.
+"""
+import io
+import logging
+import multiprocessing
+import re
+import threading
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+# Cada processo é trocado depois de tantos PDFs (não acumula memória)
+_TASKS_PER_PROCESS = 50
+# Tempo máximo para um processo novo ficar pronto (import do PyPDF2, etc.)
+_STARTUP_TIMEOUT = 30
+
+
+class PdfExtractionError(Exception):
+    """PDF não pôde ser processado (tempo, memória ou arquivo inválido)."""
+
+
+class _WorkerGone(PdfExtractionError):
+    """O processo morreu parado no pool, antes de receber o PDF (dá para tentar em outro)."""
+
+
+def extract_pdf_text(data: bytes, max_chars: int, max_pages: int) -> str:
+    """
+    Lê o PDF página a página e para ao atingir `max_chars` ou `max_pages`.
+    Roda dentro do processo do pool (mas também funciona no processo atual).
+    """
+    import PyPDF2  # Import tardio: só os processos de extração precisam dele
+
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    parts = []
+    total_chars = 0
+    for page_number, page in enumerate(reader.pages):
+        if page_number >= max_pages or total_chars >= max_chars:
+            break
+        page_text = page.extract_text() or ""
+        parts.append(page_text)
+        total_chars += len(page_text)
+
+    return _WHITESPACE_PATTERN.sub(" ", "\n".join(parts)[:max_chars]).strip()
+
+
+def _limit_worker_memory(max_memory_mb: int) -> None:
+    """Limita a memória do processo de extração (RLIMIT_AS) quando suportado."""
+    try:
+        import resource
+
+        limit = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        pass  # Windows/macOS sem suporte: segue só com o limite de tempo
+
+
+def _worker_loop(conn, max_memory_mb: int) -> None:
+    """Processo de extração: recebe PDFs pelo pipe e devolve (status, texto ou erro)."""
+    _limit_worker_memory(max_memory_mb)
+    import PyPDF2  # noqa: F401 - carregado antes do primeiro PDF (não conta no tempo dele)
+
+    conn.send(("ready", ""))
+    while True:
+        try:
+            data, max_chars, max_pages = conn.recv()
+        except EOFError:
+            return  # App fechou o pipe
+        try:
+            result = ("ok", extract_pdf_text(data, max_chars, max_pages))
+        except MemoryError:
+            result = ("memory", "")
+        except Exception as e:
+            result = ("error", str(e))
+        conn.send(result)
+
+
+class _ExtractionProcess:
+    """Um processo de extração e a ponta do pipe usada pelo app."""
+
+    def __init__(self, context, max_memory_mb: int) -> None:
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_loop, args=(child_conn, max_memory_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+        if not self.conn.poll(_STARTUP_TIMEOUT):
+            self.stop()
+            raise PdfExtractionError("Processo de extração de PDF não iniciou")
+        self.conn.recv()
+
+    def run(self, data: bytes, max_chars: int, max_pages: int, timeout: float) -> Tuple[str, str]:
+        """Envia o PDF e espera a resposta por até `timeout` segundos."""
+        self.tasks += 1
+        try:
+            self.conn.send((data, max_chars, max_pages))
+        except OSError as e:  # BrokenPipeError/ConnectionResetError: o processo já não existia
+            raise _WorkerGone(f"Processo de extração encerrado antes de receber o PDF: {e}")
+        if not self.conn.poll(timeout):
+            raise multiprocessing.TimeoutError()
+        return self.conn.recv()
+
+    def stop(self) -> None:
+        self.conn.close()
+        self.process.kill()
+        self.process.join(timeout=1)
+
+
+class PdfExtractor:
+    """
+    Processos de extração de texto de PDF com limites por arquivo.
+
+    - `timeout`: tempo máximo (segundos) de extração de um arquivo
+    - `max_memory_mb`: memória máxima de cada processo de extração
+    - `max_chars` / `max_pages`: orçamento de texto; a leitura para ao atingir
+    - `max_workers`: PDFs extraídos ao mesmo tempo (os demais esperam a vez)
+    """
+
+    def __init__(
+        self,
+        max_chars: int = 50000,
+        max_pages: int = 200,
+        timeout: float = 20,
+        max_memory_mb: int = 512,
+        max_workers: int = 2,
+    ) -> None:
+        self.max_chars = max_chars
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self.max_memory_mb = max_memory_mb
+        self.max_workers = max_workers
+        self._idle: List[_ExtractionProcess] = []
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._lock = threading.Lock()
+
+    def extract(self, data: bytes) -> str:
+        """Extrai o texto do PDF ou lança PdfExtractionError."""
+        with self._slots:  # Espera na fila (não conta no tempo limite)
+            try:
+                status, payload = self._extract_with(self._take_worker(), data)
+            except _WorkerGone as e:
+                # Processo morto enquanto esperava no pool: troca por um novo e tenta uma vez mais
+                logger.warning(f"{e}; tentando em um processo novo")
+                status, payload = self._extract_with(self._take_worker(), data)
+
+        if status == "ok":
+            return payload
+        if status == "memory":
+            raise PdfExtractionError(f"PDF excedeu o limite de {self.max_memory_mb}MB de memória")
+        raise PdfExtractionError(f"PDF inválido ou corrompido: {payload}")
+
+    def _extract_with(self, worker: _ExtractionProcess, data: bytes) -> Tuple[str, str]:
+        """Roda a extração no processo; se ele falhar, é encerrado (e não volta ao pool)."""
+        try:
+            result = worker.run(data, self.max_chars, self.max_pages, self.timeout)
+        except _WorkerGone:
+            worker.stop()
+            raise
+        except multiprocessing.TimeoutError:
+            logger.warning(f"Extração de PDF excedeu {self.timeout}s, reiniciando o processo")
+            worker.stop()
+            raise PdfExtractionError(f"Tempo limite de {self.timeout}s excedido ao ler o PDF")
+        except (EOFError, OSError) as e:
+            # Processo morreu no meio (ex.: memória esgotada fora do Python)
+            worker.stop()
+            raise PdfExtractionError(f"Processo de extração encerrado ao ler o PDF: {e}")
+        self._give_back(worker)
+        return result
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+    def _take_worker(self) -> _ExtractionProcess:
+        """Processo livre ou um novo (criados no primeiro uso: o boot da aplicação fica mais leve)."""
+        dead = []
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    break
+                dead.append(worker)  # Morreu parado no pool (ex.: morto pelo sistema)
+            else:
+                worker = None
+        for gone in dead:
+            gone.stop()
+        if worker is not None:
+            return worker
+        # forkserver/spawn: não herdam as threads do worker do gunicorn
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        return _ExtractionProcess(context, self.max_memory_mb)
+
+    def _give_back(self, worker: _ExtractionProcess) -> None:
+        if worker.tasks >= _TASKS_PER_PROCESS:
+            worker.stop()  # Recicla processos para não acumular memória
+            return
+        with self._lock:
+            self._idle.append(worker)
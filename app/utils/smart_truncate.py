@@ -0,0 +1,133 @@
+"""
+Truncamento "inteligente" do email para caber no orçamento de tokens do Gemini.
+
+Para devs iniciantes:
+- Cortar nos primeiros 1000 caracteres perde o que fica no fim do email: a
+  assinatura, o pedido escrito depois do texto citado, etc.
+- Aqui o orçamento é em TOKENS (estimados localmente, sem chamar a API) e o
+  texto é montado por partes, nesta ordem de prioridade:
+  1. cabeçalhos (From/Subject/...)
+  2. parágrafos do corpo alternando começo e fim (1º, último, 2º, penúltimo...)
+  Trechos pulados viram um marcador "[...]".
+- Histórico citado é descartado antes: linhas começando com ">" e tudo depois
+  de "-----Mensagem original-----" / "Em <data>, <fulano> escreveu:".
+- É determinístico (mesma entrada -> mesma saída), então a chave do cache
+  continua estável. Emails que já cabem no orçamento passam sem mudança.
+- Só usa regex compiladas e fatiamento de strings: custa microssegundos.
+"""
+import re
+from typing import Dict, List, Tuple
+
+# Estimativa usada pelo Gemini para textos em português/inglês: ~4 caracteres por token
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = 250  # ~1000 caracteres, o mesmo tamanho do corte antigo
+GAP_MARKER = "[...]"
+_SEPARATOR = "\n\n"
+
+# Fração máxima do orçamento que os cabeçalhos podem ocupar
+_HEADER_SHARE = 0.4
+# Parágrafo cortado só entra se sobrar pelo menos isto de orçamento
+_MIN_PIECE_TOKENS = 12
+
+_HEADER_LINE = re.compile(
+    r"(?:from|de|to|para|cc|subject|assunto|date|data|enviado|sent|reply-to|message-id):",
+    re.IGNORECASE
+)
+_QUOTED_LINES = re.compile(r"^[ \t]*>.*(?:\n|$)", re.MULTILINE)
+_HISTORY_MARKER = re.compile(
+    r"^[ \t]*(?:"
+    r"-{2,}[ \t]*(?:original message|mensagem original|forwarded message|mensagem encaminhada)[ \t]*-{2,}"
+    r"|(?:on|em)\b[^\n]{0,200}\b(?:wrote|escreveu):"
+    r")[ \t]*$",
+    re.IGNORECASE | re.MULTILINE
+)
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n+")
+_SENTENCE_END = re.compile(r"[.!?](?=\s)")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa rápida de tokens (arredonda para cima)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_headers(text: str) -> Tuple[str, str]:
+    """Separa o bloco inicial de cabeçalhos ("Nome: valor" até a 1ª linha em branco) do corpo."""
+    if not _HEADER_LINE.match(text):
+        return "", text
+    end = text.find("\n\n")
+    if end == -1:
+        return text, ""
+    return text[:end], text[end + 2:]
+
+
+def strip_quoted_history(body: str) -> str:
+    """Remove linhas citadas (">") e o histórico depois de "Mensagem original"/"escreveu:"."""
+    marker = _HISTORY_MARKER.search(body)
+    if marker:
+        body = body[:marker.start()]
+    return _QUOTED_LINES.sub("", body)
+
+
+def cut_to_tokens(text: str, tokens: int) -> str:
+    """Corta `text` para caber em `tokens`, preferindo o fim de uma frase ou palavra."""
+    max_chars = tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    window = text[:max_chars]
+    sentence_ends = [match.end() for match in _SENTENCE_END.finditer(window)]
+    if sentence_ends and sentence_ends[-1] > max_chars * 0.6:
+        return window[:sentence_ends[-1]]
+    last_space = window.rfind(" ")
+    return window[:last_space] if last_space > max_chars * 0.6 else window
+
+
+def _head_tail_order(count: int) -> List[int]:
+    """0, n-1, 1, n-2, ...: alterna começo e fim do email."""
+    order = []
+    low, high = 0, count - 1
+    while low <= high:
+        order.append(low)
+        if high != low:
+            order.append(high)
+        low, high = low + 1, high - 1
+    return order
+
+
+def smart_truncate(text: str, token_budget: int = DEFAULT_TOKEN_BUDGET) -> str:
+    """Versão do email que cabe em `token_budget` tokens (ver docstring do módulo)."""
+    text = text.strip()
+    if estimate_tokens(text) <= token_budget:
+        return text
+
+    # As contas são feitas em caracteres (orçamento * 4) para incluir separadores e o "[...]"
+    budget_chars = token_budget * CHARS_PER_TOKEN
+    headers, body = split_headers(text)
+    if headers:
+        headers = cut_to_tokens(headers, int(token_budget * _HEADER_SHARE))
+    # Como a escolha alterna começo e fim, sobra no máximo um trecho pulado ("[...]")
+    remaining = budget_chars - len(headers) - len(_SEPARATOR) * 2 - len(GAP_MARKER)
+
+    paragraphs = [paragraph.strip() for paragraph in _PARAGRAPH_BREAK.split(strip_quoted_history(body))]
+    paragraphs = [paragraph for paragraph in paragraphs if paragraph]
+
+    chosen: Dict[int, str] = {}
+    for index in _head_tail_order(len(paragraphs)):
+        cost = len(paragraphs[index]) + len(_SEPARATOR)
+        if cost <= remaining:
+            chosen[index] = paragraphs[index]
+            remaining -= cost
+        else:
+            if remaining >= _MIN_PIECE_TOKENS * CHARS_PER_TOKEN:
+                chosen[index] = cut_to_tokens(paragraphs[index], (remaining - len(_SEPARATOR)) // CHARS_PER_TOKEN)
+            break
+
+    parts = [headers] if headers else []
+    previous = -1
+    for index in sorted(chosen):
+        if index != previous + 1:
+            parts.append(GAP_MARKER)
+        parts.append(chosen[index])
+        previous = index
+    if paragraphs and previous != len(paragraphs) - 1:
+        parts.append(GAP_MARKER)
+    return _SEPARATOR.join(parts)
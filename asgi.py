@@ -0,0 +1,15 @@
+# asgi.py
+from app.asgi import create_asgi_app
+
+# Mesmas rotas do wsgi.py; as de análise rodam no event loop (ver app/asgi.py)
+app = create_asgi_app()
+
+# Para compatibilidade com servidores ASGI
+application = app
+
+if __name__ == "__main__":
+    # Executa a aplicação quando o arquivo é chamado diretamente
+    import os
+    import uvicorn
+    port = int(os.environ.get("PORT", 8080))
+    uvicorn.run(app, host='0.0.0.0', port=port)
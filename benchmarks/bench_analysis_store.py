@@ -0,0 +1,107 @@
+"""
+Benchmark: histórico de análises em SQLite (gravação em lotes e consultas).
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_analysis_store                  # 50000 análises, 8 threads
+    python -m benchmarks.bench_analysis_store --analyses 200000 --threads 16 --batch-size 1000
+
+Para devs iniciantes:
+- Várias threads (como as das requisições) chamam `add` ao mesmo tempo.
+  Medimos quanto cada chamada segura a thread (p50/p99, em microssegundos) e
+  quantas análises por segundo chegam ao disco.
+- Depois medimos as consultas que a aplicação faz: a busca pelo hash antes do
+  Gemini e uma página de /api/analyses filtrada por remetente.
+- O comando termina com erro se a gravação ficar abaixo de `--min-rate`
+  análises/s (padrão: 2000).
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from typing import List
+
+from app.services.analysis_store import AnalysisStore
+
+CATEGORIES = ("Produtivo", "Consulta", "Reclamação", "Spam", "Urgente", "Outro")
+
+
+def cache_key(i: int) -> str:
+    return f"analysis:v2:benchmark000:{i:064x}"
+
+
+def result_for(i: int) -> dict:
+    return {
+        "categoria": CATEGORIES[i % len(CATEGORIES)],
+        "atencao_humana": "SIM" if i % 5 == 0 else "NÃO",
+        "resumo": f"Cliente {i} pede revisão do contrato e do cronograma do projeto. " * 3,
+        "sugestao": "Responder com o cronograma atualizado",
+        "acao": "✅ Processado com sucesso",
+        "sender": f"cliente{i % 500}@empresa.com",
+        "cached": False,
+    }
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--analyses", type=int, default=50000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--min-rate", type=float, default=2000, help="análises/s mínimas gravadas no disco")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        store = AnalysisStore(os.path.join(folder, "analyses.db"), batch_size=args.batch_size)
+        results = [result_for(i) for i in range(args.analyses)]
+        add_latencies: List[List[float]] = [[] for _ in range(args.threads)]
+
+        def writer(worker: int) -> None:
+            latencies = add_latencies[worker]
+            for i in range(worker, args.analyses, args.threads):
+                started = time.perf_counter()
+                store.add(cache_key(i), results[i])
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=writer, args=(worker,)) for worker in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        enqueued = time.perf_counter() - started
+        store.flush(timeout=600)
+        persisted = time.perf_counter() - started
+
+        latencies = [value for worker in add_latencies for value in worker]
+        rate = args.analyses / persisted
+        print(f"{args.analyses} análises, {args.threads} threads, lotes de {args.batch_size}")
+        print(f"add: p50 {percentile(latencies, 0.5) * 1e6:.1f}µs  p99 {percentile(latencies, 0.99) * 1e6:.1f}µs  "
+              f"({args.analyses / enqueued:,.0f}/s enfileiradas)")
+        print(f"gravadas: {rate:,.0f}/s ({store.stats()['written']} linhas, {store.stats()['dropped']} descartadas)")
+
+        lookups = []
+        for i in range(0, args.analyses, max(1, args.analyses // 2000)):
+            lookup_started = time.perf_counter()
+            assert store.find(cache_key(i)) is not None
+            lookups.append(time.perf_counter() - lookup_started)
+        pages = []
+        for i in range(500):
+            page_started = time.perf_counter()
+            store.query(limit=50, sender=f"cliente{i}@empresa.com")
+            pages.append(time.perf_counter() - page_started)
+        print(f"busca por hash: p50 {statistics.median(lookups) * 1e6:.0f}µs  p99 {percentile(lookups, 0.99) * 1e6:.0f}µs")
+        print(f"página por remetente: p50 {statistics.median(pages) * 1e6:.0f}µs  p99 {percentile(pages, 0.99) * 1e6:.0f}µs")
+        store.close()
+
+    if rate < args.min_rate:
+        raise SystemExit(f"ERRO: {rate:,.0f} análises/s abaixo do mínimo de {args.min_rate:,.0f}/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Benchmark ponta a ponta de /analyze e /webhook/email com o Gemini falso.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_e2e                          # todos os cenários
+    python -m benchmarks.bench_e2e --scenario batch_10 --requests 100 --concurrency 8
+    python -m benchmarks.bench_e2e --latency lognormal:300:0.4 --error-rate 0.05
+    python -m benchmarks.bench_e2e --save-baseline          # grava benchmarks/baselines/e2e.json
+    python -m benchmarks.bench_e2e --max-regression 0.2     # falha se p95 ou req/s piorar >20%
+    python -m benchmarks.bench_e2e --system-instruction off  # prompt completo em toda chamada (comparação)
+
+Para devs iniciantes:
+- Cada cenário cria um app novo (cache vazio) e dispara requisições pelo
+  `test_client` do Flask, em várias threads ao mesmo tempo (`--concurrency`).
+- O Gemini é o `FakeGeminiClient` (ver fake_gemini.py): sem rede e sem cota,
+  com latência, erros e rajadas de 429 configuráveis.
+- Medimos por requisição: latência (p50/p95/p99), vazão (req/s), tempo de CPU
+  do processo dividido pelo número de requisições e taxa de erros.
+- "cold" usa emails sempre diferentes (todo email vai ao Gemini); "hot" repete
+  o mesmo email (depois do primeiro, tudo vem do cache).
+- Tokens de entrada por chamada: "conteúdo" é o que vai em cada requisição;
+  "cobrados" soma o system_instruction, que o Gemini conta como entrada.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Ambiente isolado (antes de importar o app): sem rate limit, sem SMTP e cache em memória
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-fake-key")
+os.environ.update({"RATE_LIMIT_ENABLED": "false", "SMTP_ENABLED": "false", "CACHE_TYPE": "SimpleCache"})
+os.environ.pop("REDIS_URL", None)
+
+from benchmarks.fake_gemini import FakeGeminiProfile, LatencyDistribution, estimate_tokens, use_fake_gemini
+from benchmarks.sample_pdf import build_pdf
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+_WORDS = (
+    "pedido fatura entrega prazo contrato reunião proposta orçamento relatório "
+    "cliente suporte acesso sistema senha cadastro pagamento boleto nota fiscal "
+    "produto estoque envio transportadora atraso desconto renovação plano equipe "
+    "projeto cronograma aprovação documento assinatura revisão dúvida urgente"
+).split()
+
+
+def build_email(rng: random.Random, index: int, paragraphs: int = 3) -> str:
+    """Email sintético com palavras aleatórias (emails diferentes não viram quase-duplicatas)."""
+    body = "\n\n".join(
+        " ".join(rng.choice(_WORDS) for _ in range(rng.randint(25, 60))).capitalize() + "."
+        for _ in range(paragraphs)
+    )
+    return f"From: cliente{index}@empresa.com.br\nSubject: Assunto {index}\n\n{body}"
+
+
+def build_pdf_bytes(text: str) -> bytes:
+    """PDF de uma página com o texto (mesmo gerador usado nos testes)."""
+    return build_pdf([line for line in text.splitlines() if line.strip()])
+
+
+# --- Cenários: cada um devolve uma função que faz a i-ésima requisição ---
+
+Request = Callable[[object, int], Tuple[int, dict]]
+
+
+def _post_form(client, data: dict, content_type: Optional[str] = None) -> Tuple[int, dict]:
+    response = client.post("/analyze", data=data, content_type=content_type)
+    return response.status_code, response.get_json(silent=True) or {}
+
+
+def scenario_single_text(rng: random.Random, hot: bool) -> Request:
+    fixed = build_email(rng, 0)
+
+    def request(client, index: int) -> Tuple[int, dict]:
+        text = fixed if hot else build_email(random.Random(index), index)
+        return _post_form(client, {"email_text": text})
+    return request
+
+
+def scenario_batch_10(rng: random.Random, hot: bool) -> Request:
+    fixed = "\n---\n".join(build_email(rng, i) for i in range(10))
+
+    def request(client, index: int) -> Tuple[int, dict]:
+        if hot:
+            text = fixed
+        else:
+            local = random.Random(index)
+            text = "\n---\n".join(build_email(local, index * 10 + i) for i in range(10))
+        return _post_form(client, {"email_text": text})
+    return request
+
+
+def scenario_pdf_upload(rng: random.Random, hot: bool) -> Request:
+    fixed = build_pdf_bytes(build_email(rng, 0, paragraphs=1))
+
+    def request(client, index: int) -> Tuple[int, dict]:
+        pdf = fixed if hot else build_pdf_bytes(build_email(random.Random(index), index, paragraphs=1))
+        return _post_form(client, {"email_file": (io.BytesIO(pdf), "email.pdf")}, "multipart/form-data")
+    return request
+
+
+def scenario_webhook(rng: random.Random, hot: bool) -> Request:
+    fixed = build_email(rng, 0).split("\n\n", 1)[1]
+
+    def request(client, index: int) -> Tuple[int, dict]:
+        body = fixed if hot else build_email(random.Random(index), index).split("\n\n", 1)[1]
+        response = client.post("/webhook/email", json={
+            "sender": f"cliente{index}@empresa.com.br",
+            "subject": "Webhook",
+            "email_content": body,
+        })
+        return response.status_code, response.get_json(silent=True) or {}
+    return request
+
+
+SCENARIOS: Dict[str, Tuple[Callable[[random.Random, bool], Request], bool]] = {
+    "single_text_cold": (scenario_single_text, False),
+    "single_text_hot": (scenario_single_text, True),
+    "batch_10_cold": (scenario_batch_10, False),
+    "batch_10_hot": (scenario_batch_10, True),
+    "pdf_upload_cold": (scenario_pdf_upload, False),
+    "webhook_cold": (scenario_webhook, False),
+}
+
+
+def _has_error(status: int, payload: dict) -> bool:
+    """Erro HTTP ou algum email analisado com categoria 'Erro'."""
+    if status != 200 or "error" in payload:
+        return True
+    results = payload.get("results", [payload])
+    return any(result.get("categoria") == "Erro" for result in results)
+
+
+# --- Execução e estatísticas ---
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    requests: int
+    concurrency: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    requests_per_second: float
+    cpu_ms_per_request: float
+    error_rate: float
+    gemini_calls: int
+    content_tokens_per_call: float = 0.0
+    billed_tokens_per_call: float = 0.0
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Percentil por interpolação linear (valores já ordenados)."""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def run_scenario(name: str, profile: FakeGeminiProfile, total: int, concurrency: int) -> ScenarioResult:
+    build, hot = SCENARIOS[name]
+    request = build(random.Random(profile.seed), hot)
+
+    with use_fake_gemini(profile) as created:
+        from app.app import create_app
+        app = create_app()
+    app.config["TESTING"] = True
+
+    # Requisição 0 fica fora da medida: aquece o pool de PDF e, nos cenários "hot", o cache
+    request(app.test_client(), 0)
+
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(index: int) -> None:
+        nonlocal errors
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        started = time.perf_counter()
+        status, payload = request(client, index + 1)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            errors += _has_error(status, payload)
+
+    cpu_started, wall_started = time.process_time(), time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(total)))
+    wall = time.perf_counter() - wall_started
+    cpu = time.process_time() - cpu_started
+
+    latencies.sort()
+    calls = sum(client.model.calls for client in created)  # Os modelos de um cliente dividem o contador
+    return ScenarioResult(
+        scenario=name,
+        requests=total,
+        concurrency=concurrency,
+        p50_ms=round(percentile(latencies, 0.50) * 1000, 2),
+        p95_ms=round(percentile(latencies, 0.95) * 1000, 2),
+        p99_ms=round(percentile(latencies, 0.99) * 1000, 2),
+        requests_per_second=round(total / wall, 2),
+        cpu_ms_per_request=round(cpu / total * 1000, 3),
+        error_rate=round(errors / total, 4),
+        gemini_calls=calls,
+        content_tokens_per_call=round(sum(model.content_tokens for client in created for model in client.models) / max(1, calls), 1),
+        billed_tokens_per_call=round(sum(model.billed_input_tokens for client in created for model in client.models) / max(1, calls), 1),
+    )
+
+
+def prompt_token_comparison(pack_size: int = 5) -> List[Tuple[str, int, int, int]]:
+    """
+    Tokens de entrada por chamada com o prompt completo x com system_instruction,
+    para um email e para um lote de `pack_size` emails:
+    (formato, prompt completo, conteúdo com system_instruction, system_instruction).
+    """
+    from app.services.email_analyzer import BATCH_SYSTEM_INSTRUCTION, SYSTEM_INSTRUCTION, EmailAnalyzerService
+
+    full, compact = EmailAnalyzerService(client=None), EmailAnalyzerService(client=None, use_system_instruction=True)
+    rng = random.Random(0)
+    emails = [build_email(rng, index) for index in range(pack_size)]
+    return [
+        ("1 email", estimate_tokens(full.build_prompt(emails[0])), estimate_tokens(compact.build_prompt(emails[0])),
+         estimate_tokens(SYSTEM_INSTRUCTION)),
+        (f"lote de {pack_size}", estimate_tokens(full.build_batch_prompt(emails)),
+         estimate_tokens(compact.build_batch_prompt(emails)), estimate_tokens(BATCH_SYSTEM_INSTRUCTION)),
+    ]
+
+
+# --- Baselines ---
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def load_baseline(name: str) -> Dict[str, dict]:
+    try:
+        with open(baseline_path(name), encoding="utf-8") as handle:
+            return {entry["scenario"]: entry for entry in json.load(handle)["results"]}
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(name: str, results: List[ScenarioResult], settings: dict) -> str:
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    path = baseline_path(name)
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump({"settings": settings, "results": [asdict(r) for r in results]}, handle, indent=2)
+        handle.write("\n")
+    return path
+
+
+def compare(result: ScenarioResult, baseline: Optional[dict], max_regression: float) -> Tuple[str, bool]:
+    """Texto com a variação em relação à baseline e se houve regressão acima do limite."""
+    if not baseline:
+        return "sem baseline", False
+    p95_change = result.p95_ms / baseline["p95_ms"] - 1 if baseline["p95_ms"] else 0.0
+    rps_change = result.requests_per_second / baseline["requests_per_second"] - 1 if baseline["requests_per_second"] else 0.0
+    regressed = p95_change > max_regression or rps_change < -max_regression
+    return f"p95 {p95_change:+.0%}, req/s {rps_change:+.0%}", regressed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark ponta a ponta com Gemini falso")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="cenário (repetível; padrão: todos)")
+    parser.add_argument("--requests", type=int, default=50, help="requisições por cenário")
+    parser.add_argument("--concurrency", type=int, default=4, help="requisições simultâneas")
+    parser.add_argument("--latency", default="lognormal:50:0.5", help="latência do Gemini falso (fixed:ms, uniform:min:max, lognormal:mediana:sigma)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração de chamadas ao Gemini com erro 500")
+    parser.add_argument("--burst-every", type=int, default=0, help="a cada N chamadas ao Gemini começa uma rajada de 429")
+    parser.add_argument("--burst-length", type=int, default=0, help="chamadas com 429 em cada rajada")
+    parser.add_argument("--system-instruction", choices=["on", "off"], default="on",
+                        help="instruções fixas no system_instruction (on) ou repetidas em todo prompt (off)")
+    parser.add_argument("--baseline", default="e2e", help="nome do arquivo de baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="grava os resultados como nova baseline")
+    parser.add_argument("--max-regression", type=float, default=None, help="falha (exit 1) se p95 ou req/s piorar mais que esta fração")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)  # Logs por requisição distorcem a medida
+    os.environ["GEMINI_SYSTEM_INSTRUCTION"] = "true" if args.system_instruction == "on" else "false"
+
+    profile = FakeGeminiProfile(
+        latency=LatencyDistribution.parse(args.latency),
+        error_rate=args.error_rate,
+        burst_every=args.burst_every,
+        burst_length=args.burst_length,
+    )
+    settings = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "latency": str(profile.latency),
+        "error_rate": args.error_rate,
+        "burst_every": args.burst_every,
+        "burst_length": args.burst_length,
+        "system_instruction": args.system_instruction,
+    }
+    baseline = load_baseline(args.baseline)
+
+    results: List[ScenarioResult] = []
+    regressions = []
+    print(f"Gemini falso: latência={profile.latency}, erros={args.error_rate:.0%}, "
+          f"429 a cada {args.burst_every or '-'} chamadas (x{args.burst_length}), "
+          f"system_instruction={args.system_instruction}")
+    print(f"{'cenário':<18} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'CPU ms/req':>11} {'erros':>7} {'gemini':>7} "
+          f"{'tok/cham':>9} {'cobrados':>9}  baseline")
+    for name in args.scenario or list(SCENARIOS):
+        result = run_scenario(name, profile, args.requests, args.concurrency)
+        results.append(result)
+        note, regressed = compare(result, baseline.get(name), args.max_regression or float("inf"))
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<18} {result.p50_ms:>9.1f} {result.p95_ms:>9.1f} {result.p99_ms:>9.1f} "
+              f"{result.requests_per_second:>8.1f} {result.cpu_ms_per_request:>11.2f} "
+              f"{result.error_rate:>7.1%} {result.gemini_calls:>7} "
+              f"{result.content_tokens_per_call:>9.0f} {result.billed_tokens_per_call:>9.0f}  {note}")
+
+    print("\nTokens de entrada por chamada (estimativa ~4 caracteres/token):")
+    print(f"{'formato':<12} {'prompt completo':>16} {'só conteúdo':>12} {'system_instruction':>19}")
+    for label, full_tokens, content_tokens, system_tokens in prompt_token_comparison():
+        print(f"{label:<12} {full_tokens:>16} {content_tokens:>12} {system_tokens:>19}")
+
+    if args.save_baseline:
+        print(f"Baseline gravada em {save_baseline(args.baseline, results, settings)}")
+    if regressions:
+        print(f"REGRESSÃO acima de {args.max_regression:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
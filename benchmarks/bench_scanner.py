@@ -0,0 +1,156 @@
+"""
+Micro-benchmark: scanner de passada única x funções antigas de divisão/preparo.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_scanner            # arquivo sintético de 10MB
+    python -m benchmarks.bench_scanner --mb 2 --repeat 5
+
+Para devs iniciantes:
+- O "antigo" abaixo é uma cópia fiel do pipeline anterior: `split_multiple_emails`
+  compilando as regex a cada chamada, depois truncar, `basic_preprocess`
+  (normaliza espaços + tokeniza para tirar stopwords) e buscar o remetente.
+- O "novo" é `scan_emails`, que faz tudo isso de uma vez.
+- Antes de medir, conferimos que os dois produzem os mesmos emails e remetentes.
+  O texto para o Gemini difere de propósito: o scanner usa o truncamento por
+  orçamento de tokens (smart_truncate.py; ver bench_truncation.py).
+"""
+import argparse
+import random
+import re
+import time
+from typing import List, Tuple
+
+from app.utils.email_scanner import scan_emails
+
+_STOPWORDS = [
+    "a", "o", "e", "de", "da", "do", "das", "dos", "um", "uma",
+    "em", "para", "por", "no", "na", "nos", "nas", "com", "sem",
+    "que", "se", "os", "as", "ao", "à", "às", "aos"
+]
+
+
+# --- Pipeline antigo (cópia para comparação) ---
+
+def legacy_split(content: str) -> List[str]:
+    separator_pattern = re.compile(r'\n[-=]{3,}\n', re.MULTILINE)
+    parts = separator_pattern.split(content)
+    if len(parts) > 1:
+        emails = [part.strip() for part in parts if part.strip() and len(part.strip()) > 50]
+        return emails if emails else [content.strip()]
+
+    from_pattern = re.compile(r'^From:\s', re.MULTILINE | re.IGNORECASE)
+    from_matches = list(from_pattern.finditer(content))
+    if len(from_matches) > 1:
+        emails = []
+        for i, match in enumerate(from_matches):
+            end = from_matches[i + 1].start() if i + 1 < len(from_matches) else len(content)
+            email_part = content[match.start():end].strip()
+            if email_part and len(email_part) > 50:
+                emails.append(email_part)
+        return emails if emails else [content.strip()]
+    return [content.strip()]
+
+
+def legacy_truncate(text: str, max_chars: int = 1000) -> str:
+    if len(text) <= max_chars:
+        return text
+    truncated = text[:max_chars]
+    last_period = truncated.rfind('.')
+    if last_period > max_chars * 0.8:
+        truncated = truncated[:last_period + 1]
+    return truncated
+
+
+def legacy_preprocess(text: str) -> str:
+    if len(text) > 5000:
+        text = text[:5000]
+    text = re.sub(r'\s+', ' ', text).strip()
+    if len(text) < 2000:
+        tokens = re.findall(r"[\wÀ-ÿ'-]+", text.lower())
+        text = " ".join(t for t in tokens if t not in _STOPWORDS)
+    return text
+
+
+def legacy_sender(text: str) -> str:
+    match = re.search(r'From:\s*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})', text, re.IGNORECASE)
+    return match.group(1).strip() if match else ""
+
+
+def legacy_pipeline(content: str) -> List[Tuple[str, str, str]]:
+    results = []
+    for email in legacy_split(content):
+        truncated = legacy_truncate(email)
+        gemini_input = legacy_preprocess(truncated) if len(truncated) > 500 else truncated
+        results.append((email, legacy_sender(email), gemini_input))
+    return results
+
+
+def scanner_pipeline(content: str) -> List[Tuple[str, str, str]]:
+    return [(e.text, e.sender, e.gemini_input) for e in scan_emails(content)]
+
+
+# --- Dados sintéticos ---
+
+_WORDS = (
+    "olá equipe segue em anexo o relatório mensal de vendas com os números "
+    "do trimestre favor revisar até sexta-feira e responder para o time de "
+    "suporte caso haja dúvidas sobre a fatura ou o pedido número"
+).split()
+
+
+def build_synthetic_file(size_mb: float, seed: int = 42) -> str:
+    """Arquivo com vários emails separados por '---' até atingir `size_mb`."""
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    emails, total, index = [], 0, 0
+    while total < target:
+        paragraphs = []
+        for _ in range(rng.randint(2, 6)):
+            words = [rng.choice(_WORDS) for _ in range(rng.randint(20, 80))]
+            paragraphs.append(" ".join(words).capitalize() + ".")
+        email = (
+            f"From: cliente{index}@empresa{index % 50}.com.br\n"
+            f"To: suporte@mailmind.ai\n"
+            f"Subject: Pedido {index}\n\n" + "\n\n".join(paragraphs)
+        )
+        emails.append(email)
+        total += len(email) + 5
+        index += 1
+    return "\n---\n".join(emails)
+
+
+def measure(func, content: str, repeat: int) -> float:
+    """Melhor tempo (segundos) entre `repeat` execuções."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(content)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mb", type=float, default=10, help="tamanho do arquivo sintético (MB)")
+    parser.add_argument("--repeat", type=int, default=3, help="execuções por medida (vale a melhor)")
+    args = parser.parse_args()
+
+    content = build_synthetic_file(args.mb)
+    size_mb = len(content.encode("utf-8")) / (1024 * 1024)
+
+    if [item[:2] for item in legacy_pipeline(content)] != [item[:2] for item in scanner_pipeline(content)]:
+        raise SystemExit("ERRO: scanner e pipeline antigo produziram resultados diferentes")
+
+    legacy_time = measure(legacy_pipeline, content, args.repeat)
+    scanner_time = measure(scanner_pipeline, content, args.repeat)
+    emails = len(scanner_pipeline(content))
+
+    print(f"Arquivo sintético: {size_mb:.1f}MB, {emails} emails (mesma divisão)")
+    print(f"{'pipeline':<10} {'tempo (s)':>10} {'MB/s':>10}")
+    print(f"{'antigo':<10} {legacy_time:>10.3f} {size_mb / legacy_time:>10.1f}")
+    print(f"{'scanner':<10} {scanner_time:>10.3f} {size_mb / scanner_time:>10.1f}")
+    print(f"Ganho: {legacy_time / scanner_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
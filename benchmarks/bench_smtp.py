@@ -0,0 +1,142 @@
+"""
+Benchmark: envio SMTP com uma conexão por email x pool de conexões (send / send_many).
+
+Uso (na raiz do projeto; requer `pip install aiosmtpd`):
+    python -m benchmarks.bench_smtp                       # 200 emails, 5ms por comando
+    python -m benchmarks.bench_smtp --emails 500 --rtt-ms 20 --threads 4
+
+Para devs iniciantes:
+- O servidor é um `aiosmtpd` local (aceita tudo e só conta) que espera
+  `--rtt-ms` em cada comando (EHLO, MAIL, RCPT, DATA), imitando a ida e volta
+  até um provedor real. Login é aceito sem TLS.
+- "legado" é uma cópia do envio antigo: conecta, autentica, envia e fecha a
+  cada email. "pool" chama `EmailSender.send` para cada email e "send_many"
+  manda lotes de `--batch` emails de uma vez, as duas reaproveitando sessões.
+- Sem TLS aqui, o ganho medido é um piso: em produção cada conexão nova
+  também paga o handshake do STARTTLS.
+"""
+import argparse
+import asyncio
+import logging
+import smtplib
+import socket
+import time
+from email.message import EmailMessage
+from typing import Callable, List
+
+from app.utils.concurrency import map_bounded
+from app.utils.email_sender import EmailSender
+
+USERNAME = "bench"
+PASSWORD = "segredo"
+
+
+class CountingHandler:
+    """Handler do aiosmtpd: atrasa cada comando em `rtt` segundos e conta sessões e mensagens."""
+
+    def __init__(self, rtt: float) -> None:
+        self.rtt = rtt
+        self.sessions = 0
+        self.messages = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        await asyncio.sleep(self.rtt)
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_MAIL(self, server, session, envelope, address, mail_options):
+        await asyncio.sleep(self.rtt)
+        envelope.mail_from = address
+        return "250 OK"
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        await asyncio.sleep(self.rtt)
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.rtt)
+        self.messages += 1
+        return "250 Message accepted for delivery"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(rtt: float):
+    """Sobe o aiosmtpd em uma porta livre; devolve (controller, handler)."""
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.smtp import AuthResult
+
+    logging.getLogger("mail.log").setLevel(logging.ERROR)  # Avisos do próprio aiosmtpd a cada login
+
+    def authenticator(server, session, envelope, mechanism, auth_data):
+        return AuthResult(success=auth_data.login.decode() == USERNAME and auth_data.password.decode() == PASSWORD)
+
+    handler = CountingHandler(rtt)
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port(), authenticator=authenticator,
+                            auth_require_tls=False)
+    controller.start()
+    return controller, handler
+
+
+def legacy_send(host: str, port: int, msg: EmailMessage) -> None:
+    """Envio antigo: uma conexão (com login) por email (STARTTLS omitido: o servidor local não tem TLS)."""
+    with smtplib.SMTP(host, port, timeout=30) as smtp:
+        smtp.login(USERNAME, PASSWORD)
+        smtp.send_message(msg)
+
+
+def run(name: str, send_all: Callable[[], None], handler: CountingHandler, emails: int) -> None:
+    sessions, messages = handler.sessions, handler.messages
+    started = time.perf_counter()
+    send_all()
+    elapsed = time.perf_counter() - started
+    if handler.messages - messages != emails:
+        raise SystemExit(f"ERRO: {name} entregou {handler.messages - messages} de {emails} emails")
+    print(f"{name:<10} {elapsed:>9.2f} {emails / elapsed:>10.1f} {elapsed / emails * 1000:>11.2f} "
+          f"{handler.sessions - sessions:>9}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=5, help="atraso do servidor em cada comando SMTP")
+    parser.add_argument("--threads", type=int, default=2, help="envios simultâneos (e tamanho do pool)")
+    parser.add_argument("--batch", type=int, default=20, help="emails por chamada de send_many")
+    args = parser.parse_args()
+
+    controller, handler = start_server(args.rtt_ms / 1000)
+    host, port = controller.hostname, controller.port
+    sender = EmailSender(host, port, USERNAME, PASSWORD, default_from="nao-responda@exemplo.com",
+                         pool_size=args.threads, starttls=False)
+    messages: List[EmailMessage] = [
+        sender.build_message(f"curador{i % 7}@exemplo.com", f"Email {i} para curadoria", "Revisar manualmente.\n" * 20)
+        for i in range(args.emails)
+    ]
+    batches = [messages[i:i + args.batch] for i in range(0, len(messages), args.batch)]
+
+    def send_batch(batch: List[EmailMessage]) -> None:
+        failures = [error for error in sender.send_many(batch) if error is not None]
+        if failures:
+            raise failures[0]
+
+    print(f"{args.emails} emails, {args.rtt_ms:g}ms por comando SMTP, {args.threads} thread(s)")
+    print(f"{'modo':<10} {'total (s)':>9} {'emails/s':>10} {'ms/email':>11} {'conexões':>9}")
+    try:
+        run("legado", lambda: map_bounded(lambda msg: legacy_send(host, port, msg), messages, args.threads),
+            handler, args.emails)
+        run("pool", lambda: map_bounded(lambda msg: sender.send_many([msg]), messages, args.threads),
+            handler, args.emails)
+        run("send_many", lambda: map_bounded(send_batch, batches, args.threads), handler, args.emails)
+    finally:
+        sender.close()
+        controller.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark: tempo de boot de um worker (import do `wsgi` + `create_app`), com perfil de imports.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_startup                  # 3 boots por modo, 15 imports mais lentos
+    python -m benchmarks.bench_startup --repeat 5 --top 30 --max-ms 1500
+
+Para devs iniciantes:
+- Cada boot roda em um processo Python novo (como um worker do gunicorn numa
+  instância fria do Cloud Run) com `python -X importtime`, que escreve no
+  stderr o tempo de cada import ("self" = só o módulo, "cumulative" = com
+  tudo o que ele importa).
+- Compara `LAZY_STARTUP=true` (padrão: SDK do Gemini e SMTP só no primeiro
+  uso) com `LAZY_STARTUP=false` (SDK carregado ao criar o app). No modo lazy,
+  o custo do SDK vai para a primeira análise: mostramos quanto ele é.
+- Depois do boot conferimos quais dependências pesadas já estão carregadas:
+  no modo lazy nenhuma delas deveria estar.
+- O comando termina com erro se o boot lazy (mediana) passar de `--max-ms`
+  ou se alguma dependência pesada for importada no boot lazy.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependências que só devem ser importadas quando usadas
+HEAVY_MODULES = ("google.generativeai", "google.ai.generativelanguage", "PyPDF2", "sentry_sdk", "smtplib")
+
+BOOT_MARKER = "--- boot concluído ---"
+
+# Roda no processo filho: importa o wsgi (cria o app uma vez) e mede o import do SDK à parte
+CHILD_CODE = f"""
+import json, sys, time
+started = time.perf_counter()
+import wsgi
+boot = time.perf_counter() - started
+loaded = [name for name in {HEAVY_MODULES!r} if name in sys.modules]
+sys.stderr.write({BOOT_MARKER!r} + "\\n")
+sys.stderr.flush()
+started = time.perf_counter()
+import google.ai.generativelanguage, google.generativeai
+sdk = time.perf_counter() - started
+print(json.dumps({{"boot": boot, "loaded": loaded, "sdk": sdk}}))
+"""
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """(módulo, self µs, cumulative µs, nível) de cada import feito antes do fim do boot."""
+    imports = []
+    for line in stderr.splitlines():
+        if line.startswith(BOOT_MARKER):
+            break
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            imports.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return imports
+
+
+def boot_once(lazy: bool) -> dict:
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "benchmark-fake-key")  # create_app exige a chave (nada chega ao Gemini)
+    env.update({"LAZY_STARTUP": "true" if lazy else "false", "PYTHONDONTWRITEBYTECODE": "1"})
+    env.pop("REDIS_URL", None)
+    started = time.perf_counter()
+    child = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD_CODE],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=False
+    )
+    wall = time.perf_counter() - started
+    if child.returncode != 0:
+        raise SystemExit(f"ERRO: o boot falhou\n{child.stderr[-2000:]}")
+    result = json.loads(child.stdout.strip().splitlines()[-1])
+    result["wall"] = wall - result["sdk"]  # Processo inteiro até o fim do boot (interpretador incluído)
+    result["imports"] = parse_importtime(child.stderr)
+    return result
+
+
+def by_package(imports: List[Tuple[str, int, int, int]]) -> Dict[str, int]:
+    """Tempo próprio (µs) somado por pacote de topo (ex.: tudo de `google.*`)."""
+    totals: Dict[str, int] = defaultdict(int)
+    for module, self_us, _, _ in imports:
+        totals[module.split(".")[0]] += self_us
+    return totals
+
+
+def print_profile(imports: List[Tuple[str, int, int, int]], top: int) -> None:
+    print(f"\n{'self (ms)':>10} {'cumul. (ms)':>12}  módulo (mais lentos, no formato do -X importtime)")
+    for module, self_us, cumulative_us, level in sorted(imports, key=lambda item: -item[2])[:top]:
+        print(f"{self_us / 1000:>10.1f} {cumulative_us / 1000:>12.1f}  {'  ' * level}{module}")
+    print(f"\n{'self (ms)':>10}  pacote (soma do tempo próprio)")
+    for package, self_us in sorted(by_package(imports).items(), key=lambda item: -item[1])[:top]:
+        print(f"{self_us / 1000:>10.1f}  {package}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3, help="boots por modo (vale a mediana)")
+    parser.add_argument("--top", type=int, default=15, help="imports mostrados no perfil")
+    parser.add_argument("--max-ms", type=float, default=1000, help="boot lazy máximo (mediana, em ms)")
+    args = parser.parse_args()
+
+    print(f"{'modo':<6} {'boot (ms)':>10} {'processo (ms)':>14} {'SDK depois (ms)':>16}  já importados")
+    runs: Dict[str, List[dict]] = {}
+    for mode in ("eager", "lazy"):
+        runs[mode] = [boot_once(lazy=mode == "lazy") for _ in range(max(1, args.repeat))]
+        boot = statistics.median(run["boot"] for run in runs[mode]) * 1000
+        wall = statistics.median(run["wall"] for run in runs[mode]) * 1000
+        sdk = statistics.median(run["sdk"] for run in runs[mode]) * 1000
+        loaded = runs[mode][-1]["loaded"]
+        print(f"{mode:<6} {boot:>10.0f} {wall:>14.0f} {sdk:>16.0f}  {', '.join(loaded) or '-'}")
+
+    lazy = runs["lazy"][-1]
+    print_profile(lazy["imports"], args.top)
+
+    lazy_boot = statistics.median(run["boot"] for run in runs["lazy"]) * 1000
+    if lazy["loaded"]:
+        raise SystemExit(f"ERRO: importado(s) no boot lazy: {', '.join(lazy['loaded'])}")
+    if lazy_boot > args.max_ms:
+        raise SystemExit(f"ERRO: boot lazy de {lazy_boot:.0f}ms acima do máximo de {args.max_ms:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Micro-benchmark: truncamento por orçamento de tokens (smart_truncate) x corte por caracteres.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_truncation                  # 2000 emails de 1KB a 50KB
+    python -m benchmarks.bench_truncation --emails 500 --budget 400
+
+Para devs iniciantes:
+- Os emails sintéticos imitam respostas reais: cabeçalhos, alguns parágrafos
+  novos, o pedido no último parágrafo, assinatura e o histórico citado
+  ("Em ..., fulano escreveu:" + linhas com ">") ocupando o resto.
+- Medimos o tempo por email (p50/p99, em microssegundos) e quantas vezes o
+  pedido final chega ao Gemini em cada estratégia.
+- O comando termina com erro se o p99 passar de `--max-us` (padrão: 1ms).
+"""
+import argparse
+import random
+import time
+from typing import List, Tuple
+
+from app.utils.email_scanner import truncation_point
+from app.utils.smart_truncate import DEFAULT_TOKEN_BUDGET, CHARS_PER_TOKEN, estimate_tokens, smart_truncate
+
+_WORDS = (
+    "olá equipe segue em anexo o relatório mensal de vendas com os números "
+    "do trimestre favor revisar até sexta-feira e responder para o time de "
+    "suporte caso haja dúvidas sobre a fatura ou o pedido número"
+).split()
+
+_ASK = "PEDIDO-FINAL"
+
+
+def _paragraph(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def build_email(rng: random.Random, size: int, index: int) -> str:
+    """Email com ~`size` caracteres; o marcador do pedido fica no último parágrafo novo."""
+    new_content = "\n\n".join(_paragraph(rng, rng.randint(30, 90)) for _ in range(rng.randint(2, 6)))
+    email = (
+        f"From: cliente{index}@empresa.com.br\nTo: suporte@mailmind.ai\nSubject: Re: Pedido {index}\n\n"
+        f"{new_content}\n\n{_ASK}: por favor confirmem o reembolso até sexta.\n\n"
+        f"Atenciosamente,\nCliente {index}\n\n"
+        f"Em 10/05/2024 09:{index % 60:02d}, suporte@mailmind.ai escreveu:\n"
+    )
+    quoted = []
+    while len(email) + sum(len(line) + 1 for line in quoted) < size:
+        quoted.append("> " + _paragraph(rng, rng.randint(10, 30)))
+    return email + "\n".join(quoted)
+
+
+def build_corpus(count: int, seed: int = 42) -> List[str]:
+    rng = random.Random(seed)
+    return [build_email(rng, rng.randint(1024, 50 * 1024), index) for index in range(count)]
+
+
+def char_cut(text: str, token_budget: int) -> str:
+    """Estratégia antiga: primeiros N caracteres (N = orçamento * 4)."""
+    return text[:truncation_point(text, token_budget * CHARS_PER_TOKEN)]
+
+
+def time_per_email(func, corpus: List[str], token_budget: int) -> Tuple[List[float], List[str]]:
+    """Tempos (microssegundos) e saídas de `func` para cada email."""
+    timings, outputs = [], []
+    for email in corpus:
+        started = time.perf_counter()
+        output = func(email, token_budget)
+        timings.append((time.perf_counter() - started) * 1e6)
+        outputs.append(output)
+    return timings, outputs
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--emails", type=int, default=2000)
+    parser.add_argument("--budget", type=int, default=DEFAULT_TOKEN_BUDGET, help="orçamento de tokens por email")
+    parser.add_argument("--max-us", type=float, default=1000, help="p99 máximo aceito (microssegundos)")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.emails)
+    time_per_email(smart_truncate, corpus[:50], args.budget)  # Aquecimento
+
+    print(f"{args.emails} emails de 1KB a 50KB, orçamento de {args.budget} tokens")
+    print(f"{'estratégia':<14} {'p50 (µs)':>9} {'p99 (µs)':>9} {'tokens (média)':>15} {'pedido mantido':>15}")
+    smart_p99 = 0.0
+    for name, func in (("corte_chars", char_cut), ("smart_truncate", smart_truncate)):
+        timings, outputs = time_per_email(func, corpus, args.budget)
+        tokens = sum(estimate_tokens(output) for output in outputs) / len(outputs)
+        kept = sum(_ASK in output for output in outputs) / len(outputs)
+        print(f"{name:<14} {percentile(timings, 0.5):>9.1f} {percentile(timings, 0.99):>9.1f} "
+              f"{tokens:>15.1f} {kept:>15.0%}")
+        if func is smart_truncate:
+            smart_p99 = percentile(timings, 0.99)
+            if smart_truncate(corpus[0], args.budget) != outputs[0]:
+                raise SystemExit("ERRO: smart_truncate não é determinístico")
+
+    if smart_p99 > args.max_us:
+        raise SystemExit(f"ERRO: p99 de {smart_p99:.0f}µs acima do limite de {args.max_us:.0f}µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Gemini "de mentira" para benchmarks: mesma interface, sem rede e sem cota.
+
+Para devs iniciantes:
+- `FakeGeminiClient` herda do `GeminiClient` real e troca só o modelo
+  (`self.model`). Assim o código de retry/backoff do cliente real continua
+  sendo exercitado; o que muda é quem responde a `generate_content`.
+- O modelo falso responde com análises baseadas em regras (palavras-chave),
+  no formato individual ou em lote ("### EMAIL i"), igual ao Gemini.
+- Latência, taxa de erros, JSON truncado e rajadas de 429 são configuráveis e
+  determinísticas (gerador aleatório com semente fixa).
+
+Exemplo:
+    profile = FakeGeminiProfile(latency=LatencyDistribution.parse("lognormal:300:0.4"))
+    with use_fake_gemini(profile):
+        app = create_app()  # o app usa o Gemini falso
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.providers.gemini_client import GeminiClient
+
+_EMAIL_BLOCK_PATTERN = re.compile(r"^### EMAIL (\d+)\n", re.MULTILINE)
+
+# Palavras-chave -> (categoria, precisa de humano)
+_RULES = [
+    (("urgente", "imediato", "parado", "fora do ar"), "Urgente", True),
+    (("reclamação", "insatisfeito", "péssimo", "cancelar"), "Reclamação", True),
+    (("promoção", "ganhe", "clique aqui", "grátis"), "Spam", False),
+    (("dúvida", "como faço", "gostaria de saber", "?"), "Consulta", False),
+]
+
+
+def rule_based_analysis(email_content: str) -> Dict[str, Any]:
+    """Análise determinística por palavras-chave, no formato do RESULT_SCHEMA."""
+    text = email_content.lower()
+    category, needs_human = "Produtivo", False
+    for keywords, rule_category, rule_needs_human in _RULES:
+        if any(keyword in text for keyword in keywords):
+            category, needs_human = rule_category, rule_needs_human
+            break
+    return {
+        "atencao_humana": "SIM" if needs_human else "NÃO",
+        "categoria": category,
+        "resumo": " ".join(email_content.split()[:30]),
+        "sugestao_resposta_ou_acao": "Encaminhar para a equipe responsável" if needs_human else "Responder com o modelo padrão",
+        "acao": "ENCAMINHAR_CURADORIA" if needs_human else "RESPOSTA_AUTOMATICA",
+    }
+
+
+def respond_to_prompt(prompt: str) -> str:
+    """Resposta JSON (texto) para um prompt individual ou em lote."""
+    blocks = list(_EMAIL_BLOCK_PATTERN.finditer(prompt))
+    if not blocks:
+        return json.dumps(rule_based_analysis(prompt.rsplit("Email:", 1)[-1]), ensure_ascii=False)
+
+    items = []
+    for position, match in enumerate(blocks):
+        end = blocks[position + 1].start() if position + 1 < len(blocks) else len(prompt)
+        item = {"indice": int(match.group(1))}
+        item.update(rule_based_analysis(prompt[match.end():end]))
+        items.append(item)
+    return json.dumps(items, ensure_ascii=False)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa grosseira usada pelo Gemini para português: ~4 caracteres por token."""
+    return max(1, len(text) // 4)
+
+
+@dataclass
+class LatencyDistribution:
+    """
+    Latência simulada em milissegundos.
+    - fixed:<ms>
+    - uniform:<min_ms>:<max_ms>
+    - lognormal:<mediana_ms>:<sigma>  (cauda longa, parecida com APIs reais)
+    """
+    kind: str = "fixed"
+    params: List[float] = field(default_factory=lambda: [0.0])
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        kind, *raw_params = spec.split(":")
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2}
+        if kind not in expected or len(raw_params) != expected[kind]:
+            raise ValueError(f"Latência inválida: {spec!r} (ex.: fixed:50, uniform:20:80, lognormal:300:0.4)")
+        return cls(kind, [float(value) for value in raw_params])
+
+    def sample(self, rng: random.Random) -> float:
+        """Uma amostra em segundos."""
+        if self.kind == "fixed":
+            milliseconds = self.params[0]
+        elif self.kind == "uniform":
+            milliseconds = rng.uniform(self.params[0], self.params[1])
+        else:
+            median, sigma = self.params
+            milliseconds = median * rng.lognormvariate(0, sigma)
+        return max(0.0, milliseconds) / 1000
+
+    def __str__(self) -> str:
+        return ":".join([self.kind] + [f"{value:g}" for value in self.params])
+
+
+@dataclass
+class FakeGeminiProfile:
+    """
+    Comportamento do Gemini falso.
+    - `error_rate`: fração de chamadas que falham com erro 500
+    - `unavailable_rate`: fração de chamadas que falham com erro 503 (o SDK
+      tenta de novo sozinho, a menos que o retry dele esteja desligado)
+    - `truncated_rate`: fração de respostas com JSON cortado no meio
+    - `burst_every` / `burst_length`: a cada N chamadas, as próximas M recebem 429
+    """
+    latency: LatencyDistribution = field(default_factory=LatencyDistribution)
+    error_rate: float = 0.0
+    unavailable_rate: float = 0.0
+    truncated_rate: float = 0.0
+    burst_every: int = 0
+    burst_length: int = 0
+    seed: int = 42
+
+
+# Resultados possíveis de uma chamada simulada
+OUTCOME_OK = "ok"
+OUTCOME_RATE_LIMITED = "429"
+OUTCOME_SERVER_ERROR = "500"
+OUTCOME_UNAVAILABLE = "503"
+OUTCOME_TRUNCATED = "truncated"
+
+
+class FaultInjector:
+    """
+    Sorteia latência e resultado de cada chamada segundo o perfil (thread-safe).
+    Compartilhado pelo modelo falso em processo e pelo servidor HTTP stub.
+    """
+
+    def __init__(self, profile: FakeGeminiProfile) -> None:
+        self.profile = profile
+        self._rng = random.Random(profile.seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.outcomes: Dict[str, int] = {}
+
+    def next_call(self) -> Tuple[float, str]:
+        """(atraso em segundos, resultado) da próxima chamada."""
+        profile = self.profile
+        with self._lock:
+            call_number = self.calls
+            self.calls += 1
+            delay = profile.latency.sample(self._rng)
+            draw = self._rng.random()
+
+            if profile.burst_every and call_number % profile.burst_every < profile.burst_length:
+                outcome = OUTCOME_RATE_LIMITED
+            elif draw < profile.error_rate:
+                outcome = OUTCOME_SERVER_ERROR
+            elif draw < profile.error_rate + profile.unavailable_rate:
+                outcome = OUTCOME_UNAVAILABLE
+            elif draw < profile.error_rate + profile.unavailable_rate + profile.truncated_rate:
+                outcome = OUTCOME_TRUNCATED
+            else:
+                outcome = OUTCOME_OK
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        return delay, outcome
+
+
+def truncate_json(text: str) -> str:
+    """Corta a resposta no meio, como quando o modelo esgota os tokens de saída."""
+    return text[:max(1, len(text) // 2)]
+
+
+def _api_error(status: int, message: str) -> Exception:
+    """Mesmas exceções que o SDK lança (google.api_core), quando disponível."""
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return RuntimeError(f"{status} {message}")
+    if status == 429:
+        return exceptions.ResourceExhausted(message)
+    if status == 503:
+        return exceptions.ServiceUnavailable(message)
+    return exceptions.InternalServerError(message)
+
+
+class _FakePart:
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+
+class _FakeContent:
+    def __init__(self, text: str) -> None:
+        self.parts = [_FakePart(text)]
+
+
+class _FakeCandidate:
+    def __init__(self, text: str) -> None:
+        self.content = _FakeContent(text)
+
+
+class _FakeUsage:
+    def __init__(self, prompt_tokens: int, output_tokens: int) -> None:
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class FakeResponse:
+    """
+    Imita o objeto de resposta do SDK (candidates, text e usage_metadata).
+    Como no Gemini, `prompt_token_count` inclui o system_instruction.
+    """
+
+    def __init__(self, text: str, prompt: str, system_instruction: Optional[str] = None) -> None:
+        self.text = text
+        self.candidates = [_FakeCandidate(text)]
+        prompt_tokens = estimate_tokens(prompt) + (estimate_tokens(system_instruction) if system_instruction else 0)
+        self.usage_metadata = _FakeUsage(prompt_tokens, estimate_tokens(text))
+
+
+class FakeGenerativeModel:
+    """Substituto de `genai.GenerativeModel` com latência e falhas simuladas."""
+
+    def __init__(self, model_name: str, profile: FakeGeminiProfile, system_instruction: Optional[str] = None) -> None:
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.faults = FaultInjector(profile)
+        self._lock = threading.Lock()
+        self.content_tokens = 0  # Tokens do conteúdo enviado em cada chamada (somados)
+        self.billed_input_tokens = 0  # Conteúdo + system_instruction (o que o Gemini cobra)
+
+    @property
+    def calls(self) -> int:
+        return self.faults.calls
+
+    def generate_content(self, prompt: str, generation_config: Optional[dict] = None,
+                         request_options: Optional[dict] = None) -> FakeResponse:
+        delay, outcome = self._next_call(prompt)
+        time.sleep(delay)
+        return self._respond(prompt, outcome)
+
+    async def generate_content_async(self, prompt: str, generation_config: Optional[dict] = None,
+                                     request_options: Optional[dict] = None) -> FakeResponse:
+        """Mesmo comportamento, esperando no event loop (como o cliente assíncrono do SDK)."""
+        delay, outcome = self._next_call(prompt)
+        await asyncio.sleep(delay)
+        return self._respond(prompt, outcome)
+
+    def _next_call(self, prompt: str) -> Tuple[float, str]:
+        delay, outcome = self.faults.next_call()
+        content_tokens = estimate_tokens(prompt)
+        with self._lock:
+            self.content_tokens += content_tokens
+            self.billed_input_tokens += content_tokens + (estimate_tokens(self.system_instruction) if self.system_instruction else 0)
+        return delay, outcome
+
+    def _respond(self, prompt: str, outcome: str) -> FakeResponse:
+        if outcome == OUTCOME_RATE_LIMITED:
+            raise _api_error(429, "Resource has been exhausted (simulado)")
+        if outcome == OUTCOME_SERVER_ERROR:
+            raise _api_error(500, "Internal error (simulado)")
+        if outcome == OUTCOME_UNAVAILABLE:
+            raise _api_error(503, "The model is overloaded (simulado)")
+        text = respond_to_prompt(prompt)
+        if outcome == OUTCOME_TRUNCATED:
+            text = truncate_json(text)
+        return FakeResponse(text, prompt, self.system_instruction)
+
+
+@dataclass
+class FakeGeminiClient(GeminiClient):
+    """GeminiClient com o modelo trocado pelo falso (o retry do cliente real continua valendo)."""
+    profile: FakeGeminiProfile = field(default_factory=FakeGeminiProfile)
+
+    def __post_init__(self) -> None:
+        # Sem genai.configure: nada de chave real ou rede
+        self.model = FakeGenerativeModel(self.model_name, self.profile, self.system_instruction)
+        self.batch_model = None
+        if self.batch_system_instruction:
+            self.batch_model = FakeGenerativeModel(self.model_name, self.profile, self.batch_system_instruction)
+            self.batch_model.faults = self.model.faults  # Mesmo "servidor": chamadas, falhas e rajadas somadas
+
+    @property
+    def models(self) -> List[FakeGenerativeModel]:
+        """Modelos falsos criados (individual e, se houver, o de lote)."""
+        return [model for model in (self.model, self.batch_model) if model is not None]
+
+
+@contextmanager
+def use_fake_gemini(profile: FakeGeminiProfile) -> Iterator[List[FakeGeminiClient]]:
+    """
+    Durante o bloco, `create_app()` cria um FakeGeminiClient no lugar do real.
+    Devolve a lista de clientes criados (para inspecionar chamadas e falhas).
+    """
+    import app.app as app_module
+
+    created: List[FakeGeminiClient] = []
+
+    def factory(**kwargs) -> FakeGeminiClient:
+        client = FakeGeminiClient(profile=profile, **kwargs)
+        created.append(client)
+        return client
+
+    original = app_module.GeminiClient
+    app_module.GeminiClient = factory
+    try:
+        yield created
+    finally:
+        app_module.GeminiClient = original
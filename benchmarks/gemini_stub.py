@@ -0,0 +1,197 @@
+"""
+Servidor HTTP local que imita o endpoint `generateContent` da API do Gemini.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.gemini_stub --port 8090 --latency lognormal:800:0.5 --error-rate 0.02
+    GEMINI_ENDPOINT=http://localhost:8090 GEMINI_API_KEY=qualquer gunicorn wsgi:app ...
+
+Para devs iniciantes:
+- Com `GEMINI_ENDPOINT` definido, o `GeminiClient` usa o transporte REST do
+  `google.generativeai` e manda as requisições para cá. Assim o caminho de
+  rede real (timeout, retries, reuso de conexão) é exercitado, sem internet
+  e sem gastar cota.
+- As respostas vêm das mesmas regras do Gemini falso em processo
+  (fake_gemini.py), ou de um arquivo JSON fixo (`--canned`).
+- Latência, erros 429/500 e JSON truncado seguem o mesmo `FakeGeminiProfile`.
+- O servidor usa HTTP/1.1 com keep-alive e uma thread por conexão.
+"""
+import argparse
+import json
+import logging
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+from benchmarks.fake_gemini import (
+    OUTCOME_RATE_LIMITED,
+    OUTCOME_SERVER_ERROR,
+    OUTCOME_UNAVAILABLE,
+    OUTCOME_TRUNCATED,
+    FakeGeminiProfile,
+    FaultInjector,
+    LatencyDistribution,
+    estimate_tokens,
+    respond_to_prompt,
+    truncate_json,
+)
+
+logger = logging.getLogger(__name__)
+
+# POST /v1beta/models/<modelo>:generateContent (o SDK também aceita /v1/)
+_GENERATE_PATH = re.compile(r"^/v1(?:beta)?/models/(?P<model>[^/:]+):generateContent(?:\?.*)?$")
+
+_ERRORS = {
+    OUTCOME_RATE_LIMITED: (429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota)."),
+    OUTCOME_SERVER_ERROR: (500, "INTERNAL", "An internal error has occurred."),
+    OUTCOME_UNAVAILABLE: (503, "UNAVAILABLE", "The model is overloaded. Please try again later."),
+}
+
+
+def prompt_from_request(body: dict) -> str:
+    """Junta o texto de todas as partes de `contents` (formato da API REST)."""
+    texts = []
+    for content in body.get("contents", []):
+        for part in content.get("parts", []):
+            if "text" in part:
+                texts.append(part["text"])
+    return "\n".join(texts)
+
+
+def system_instruction_from_request(body: dict) -> str:
+    """Texto do `systemInstruction` (vazio se a requisição não tiver)."""
+    parts = (body.get("systemInstruction") or {}).get("parts", [])
+    return "\n".join(part["text"] for part in parts if "text" in part)
+
+
+def build_response_body(text: str, prompt: str, system_instruction: str = "") -> dict:
+    """
+    Corpo no formato GenerateContentResponse (candidates + usageMetadata).
+    Como no Gemini, os tokens de entrada incluem o system_instruction.
+    """
+    prompt_tokens = estimate_tokens(prompt) + (estimate_tokens(system_instruction) if system_instruction else 0)
+    output_tokens = estimate_tokens(text)
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens,
+        },
+    }
+
+
+class GeminiStubServer(ThreadingHTTPServer):
+    """Servidor com o perfil de falhas e a resposta fixa opcional."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], profile: FakeGeminiProfile, canned: Optional[str] = None) -> None:
+        super().__init__(address, _GeminiStubHandler)
+        self.faults = FaultInjector(profile)
+        self.canned = canned
+        self.last_request: Optional[dict] = None  # Último corpo recebido (para inspeção em testes)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start_in_background(self) -> threading.Thread:
+        """Sobe o servidor em uma thread (útil em testes)."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class _GeminiStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive: o cliente reaproveita a conexão
+    server: GeminiStubServer
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length)
+
+        if not _GENERATE_PATH.match(self.path):
+            self._send_json(404, {"error": {"code": 404, "message": f"Rota não emulada: {self.path}", "status": "NOT_FOUND"}})
+            return
+        try:
+            body = self.server.last_request = json.loads(raw_body or b"{}")
+            prompt, system_instruction = prompt_from_request(body), system_instruction_from_request(body)
+        except ValueError:
+            self._send_json(400, {"error": {"code": 400, "message": "JSON inválido", "status": "INVALID_ARGUMENT"}})
+            return
+
+        delay, outcome = self.server.faults.next_call()
+        time.sleep(delay)
+
+        if outcome in _ERRORS:
+            code, status, message = _ERRORS[outcome]
+            self._send_json(code, {"error": {"code": code, "message": message, "status": status}})
+            return
+
+        text = self.server.canned if self.server.canned is not None else respond_to_prompt(prompt)
+        if outcome == OUTCOME_TRUNCATED:
+            text = truncate_json(text)
+        self._send_json(200, build_response_body(text, prompt, system_instruction))
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stub local do endpoint generateContent do Gemini")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", default="lognormal:800:0.5", help="fixed:ms, uniform:min:max ou lognormal:mediana:sigma")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração de respostas 500")
+    parser.add_argument("--unavailable-rate", type=float, default=0.0, help="fração de respostas 503")
+    parser.add_argument("--truncated-rate", type=float, default=0.0, help="fração de respostas com JSON cortado")
+    parser.add_argument("--burst-every", type=int, default=0, help="a cada N chamadas começa uma rajada de 429")
+    parser.add_argument("--burst-length", type=int, default=0, help="chamadas com 429 em cada rajada")
+    parser.add_argument("--canned", help="arquivo com a resposta (texto JSON) devolvida em toda chamada")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    canned = None
+    if args.canned:
+        with open(args.canned, encoding="utf-8") as handle:
+            canned = handle.read()
+
+    profile = FakeGeminiProfile(
+        latency=LatencyDistribution.parse(args.latency),
+        error_rate=args.error_rate,
+        unavailable_rate=args.unavailable_rate,
+        truncated_rate=args.truncated_rate,
+        burst_every=args.burst_every,
+        burst_length=args.burst_length,
+        seed=args.seed,
+    )
+    server = GeminiStubServer((args.host, args.port), profile, canned)
+    logger.info(f"Stub do Gemini em {server.url} (latência={profile.latency}, erros={args.error_rate:.0%}, "
+                f"truncados={args.truncated_rate:.0%}, 429 a cada {args.burst_every or '-'} x{args.burst_length})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info(f"Chamadas atendidas: {server.faults.calls} {server.faults.outcomes}")
+
+
+if __name__ == "__main__":
+    main()
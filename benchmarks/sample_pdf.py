@@ -0,0 +1,36 @@
+"""
+PDF mínimo gerado na hora, sem dependências (usado pelos benchmarks e pelos testes).
+
+Para devs iniciantes:
+- Cada página tem uma linha de texto em Helvetica; é o suficiente para o
+  PyPDF2 extrair o texto de volta.
+- Fica em `benchmarks/` (e não em `tests/`) para os benchmarks rodarem sem
+  o pacote de testes; o `tests/conftest.py` reexporta `build_pdf`.
+"""
+from typing import List
+
+
+def build_pdf(pages: List[str]) -> bytes:
+    """Monta um PDF mínimo (uma linha de texto por página)."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Contents {len(objects)} 0 R /Resources << /Font << /F1 3 0 R >> >> >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    
+    body = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(body)
+    body += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    body += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    body += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return body
@@ -0,0 +1,30 @@
+"""
+Configuração do gunicorn (carregada automaticamente a partir da raiz do projeto).
+
+Para devs iniciantes:
+- As opções de bind/workers/threads continuam na linha de comando (Dockerfile).
+- Aqui ficam só os "hooks" das métricas do Prometheus em modo multiprocesso:
+  a pasta PROMETHEUS_MULTIPROC_DIR é recriada vazia na subida e, quando um
+  worker termina, os gauges dele deixam de ser somados.
+"""
+import os
+import shutil
+
+
+def on_starting(server):
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        # Arquivos de uma execução anterior somariam valores antigos
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return
+    try:
+        # Import direto (sem o pacote app): o processo master não carrega a aplicação
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
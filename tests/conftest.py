@@ -8,6 +8,8 @@ import sys
 # Adiciona o diretório raiz ao path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from benchmarks.sample_pdf import build_pdf  # noqa: E402,F401 - usado pelos testes via `tests.conftest`
+
 
 @pytest.fixture
 def app():
@@ -40,6 +42,57 @@ def runner(app):
     return app.test_cli_runner()
 
 
+def build_eml(sender="cliente@empresa.com", subject="Assunto", body="Corpo do email",
+              html=None, attachment=None, message_id=None, in_reply_to=None):
+    """Monta um email .eml (bytes) com partes opcionais de HTML e anexo."""
+    from email.message import EmailMessage
+    
+    message = EmailMessage()
+    message["From"] = sender
+    message["Subject"] = subject
+    if message_id:
+        message["Message-ID"] = message_id
+    if in_reply_to:
+        message["In-Reply-To"] = in_reply_to
+    if body is not None:
+        message.set_content(body)
+        if html:
+            message.add_alternative(html, subtype="html")
+    elif html:
+        message.set_content(html, subtype="html")
+    if attachment:
+        message.add_attachment(attachment, maintype="application", subtype="octet-stream", filename="anexo.bin")
+    return bytes(message)
+
+
+@pytest.fixture
+def mock_analysis(monkeypatch):
+    """
+    Substitui a chamada ao Gemini por uma resposta fixa (sem rede).
+    Retorna a lista de textos recebidos, para os testes inspecionarem.
+    """
+    from app.services.email_analyzer import EmailAnalyzerService
+    
+    calls = []
+    
+    def fake_analyze(self, email_content):
+        calls.append(email_content)
+        return {
+            "categoria": "Produtivo",
+            "atencao_humana": "NÃO",
+            "resumo": email_content[:60],
+            "sugestao_resposta_ou_acao": "Responder",
+            "acao": "RESPOSTA_AUTOMATICA"
+        }
+    
+    def fake_analyze_batch(self, emails):
+        return [fake_analyze(self, email_content) for email_content in emails]
+    
+    monkeypatch.setattr(EmailAnalyzerService, "analyze", fake_analyze)
+    monkeypatch.setattr(EmailAnalyzerService, "analyze_batch", fake_analyze_batch)
+    return calls
+
+
 @pytest.fixture
 def sample_email():
     """Email de exemplo para testes."""
@@ -1,8 +1,14 @@
 """
 Testes para as rotas da aplicação Flask.
 """
+import asyncio
+import io
+import os
 import pytest
 import json
+import subprocess
+import sys
+import time
 
 
 class TestHealthEndpoint:
@@ -90,6 +96,495 @@ class TestAnalyzeEndpoint:
         assert response.status_code in [200, 500]
 
 
+class TestPdfUpload:
+    """Testes para upload de arquivos PDF."""
+    
+    def test_pdf_upload_is_analyzed(self, client, mock_analysis):
+        """Verifica se o texto do PDF chega à análise."""
+        from tests.conftest import build_pdf
+        
+        pdf = build_pdf(["From: cliente@empresa.com Solicito proposta comercial"])
+        response = client.post('/analyze', data={'email_file': (io.BytesIO(pdf), 'email.pdf')},
+                               content_type='multipart/form-data')
+        
+        assert response.status_code == 200
+        assert "proposta" in mock_analysis[0]
+    
+    def test_invalid_pdf_returns_400(self, client, mock_analysis):
+        """Verifica se um PDF ilegível retorna erro 400."""
+        response = client.post('/analyze', data={'email_file': (io.BytesIO(b"corrompido"), 'email.pdf')},
+                               content_type='multipart/form-data')
+        
+        assert response.status_code == 400
+        assert not mock_analysis
+
+
+class TestTxtUpload:
+    """Testes para upload de arquivos .txt com vários emails."""
+    
+    def test_txt_upload_is_split_into_emails(self, client, batch_emails, mock_analysis):
+        """Verifica se o arquivo .txt é dividido em um resultado por email."""
+        data = {'email_file': (io.BytesIO(batch_emails.encode('utf-8')), 'emails.txt')}
+        response = client.post('/analyze', data=data, content_type='multipart/form-data')
+        
+        assert response.status_code == 200
+        assert json.loads(response.data)['total_emails'] == 3
+    
+    def test_txt_upload_over_batch_limit_returns_400(self, client, batch_emails, mock_analysis):
+        """Verifica se arquivos com emails demais são recusados sem analisar nada."""
+        data = {'email_file': (io.BytesIO((batch_emails + "\n---\n").encode('utf-8') * 5), 'emails.txt')}
+        response = client.post('/analyze', data=data, content_type='multipart/form-data')
+        
+        assert response.status_code == 400
+        assert not mock_analysis
+
+
+class TestEmlUpload:
+    """Testes para upload de arquivos .eml e .mbox."""
+    
+    def test_eml_upload_uses_parsed_headers(self, client, mock_analysis):
+        """Verifica se remetente e Message-ID vêm dos cabeçalhos do .eml."""
+        from tests.conftest import build_eml
+        
+        eml = build_eml(sender="Ana <ana@empresa.com>", body="Gostaria de agendar uma reunião.",
+                        message_id="<123@empresa.com>")
+        response = client.post('/analyze', data={'email_file': (io.BytesIO(eml), 'email.eml')},
+                               content_type='multipart/form-data')
+        data = json.loads(response.data)
+        
+        assert data['sender'] == 'ana@empresa.com'
+        assert data['message_id'] == '<123@empresa.com>'
+
+
+class TestAnalyzeBatch:
+    """Testes para o processamento de lotes (múltiplos emails)."""
+    
+    def test_batch_preserves_input_order(self, client, batch_emails, mock_analysis):
+        """Verifica se os resultados do lote seguem a ordem dos emails enviados."""
+        response = client.post('/analyze', data={'email_text': batch_emails * 2})
+        data = json.loads(response.data)
+        
+        assert response.status_code == 200
+        senders = [r['sender'] for r in data['results']]
+        assert senders[:3] == ['cliente1@empresa.com', 'suporte@empresa.com', 'spam@bad.com']
+        assert data['total_emails'] == len(senders)
+    
+    def test_batch_isolates_errors_per_email(self, client, batch_emails, monkeypatch):
+        """Verifica se a falha de um email não derruba o lote inteiro."""
+        from app.services.email_analyzer import EmailAnalyzerService
+        
+        def failing_batch(self, emails):
+            raise RuntimeError("falha simulada no pacote")
+        
+        def flaky_analyze(self, email_content):
+            if "suporte" in email_content:
+                raise RuntimeError("falha simulada")
+            return {"categoria": "Outro", "atencao_humana": "NÃO"}
+        
+        # O pacote falha inteiro e cada email é reanalisado sozinho
+        monkeypatch.setattr(EmailAnalyzerService, "analyze_batch", failing_batch)
+        monkeypatch.setattr(EmailAnalyzerService, "analyze", flaky_analyze)
+        response = client.post('/analyze', data={'email_text': batch_emails})
+        results = json.loads(response.data)['results']
+        
+        assert [r['categoria'] for r in results] == ['Outro', '❌ ERRO', 'Outro']
+
+
+    def test_batch_second_request_hits_cache(self, client, batch_emails, mock_analysis):
+        """Verifica se um lote repetido é servido inteiramente do cache."""
+        client.post('/analyze', data={'email_text': batch_emails})
+        calls_after_first = len(mock_analysis)
+        
+        response = client.post('/analyze', data={'email_text': batch_emails})
+        results = json.loads(response.data)['results']
+        
+        assert len(mock_analysis) == calls_after_first
+        assert all(r['cached'] for r in results)
+
+
+class TestAsyncJobs:
+    """Testes para jobs assíncronos (async=true + rota de status)."""
+    
+    def wait_for_job(self, client, status_url, timeout=5):
+        """Consulta a rota de status até o job terminar."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            data = json.loads(client.get(status_url).data)
+            if data['status'] in ('done', 'failed'):
+                return data
+            time.sleep(0.05)
+        raise AssertionError("Job não terminou a tempo")
+    
+    def test_async_returns_job_id_immediately(self, client, batch_emails, mock_analysis):
+        """Verifica se async=true devolve 202 com job_id e URL de status."""
+        response = client.post('/analyze', data={'email_text': batch_emails, 'async': 'true'})
+        data = json.loads(response.data)
+        
+        assert response.status_code == 202
+        assert data['job_id']
+        assert data['status_url'] == f"/analyze/status/{data['job_id']}"
+        self.wait_for_job(client, data['status_url'])
+    
+    def test_async_job_reports_results_in_order(self, client, batch_emails, mock_analysis):
+        """Verifica se o job conclui com um resultado por email, na ordem."""
+        response = client.post('/analyze',
+            data=json.dumps({'email_content': batch_emails, 'async': True}),
+            content_type='application/json'
+        )
+        job = self.wait_for_job(client, json.loads(response.data)['status_url'])
+        
+        assert job['status'] == 'done'
+        assert job['progress'] == 100
+        assert [r['index'] for r in job['results']] == [0, 1, 2]
+        assert job['results'][0]['sender'] == 'cliente1@empresa.com'
+    
+    def test_unknown_job_returns_404(self, client):
+        """Verifica se um job inexistente retorna 404."""
+        response = client.get('/analyze/status/nao-existe')
+        assert response.status_code == 404
+
+
+class TestCacheKeys:
+    """Testes para as chaves de cache das análises."""
+    
+    def test_cache_key_uses_full_content(self):
+        """Verifica se emails com o mesmo cabeçalho longo geram chaves diferentes."""
+        from app.app import get_cache_key
+        
+        header = "Cabeçalho padrão da newsletter. " * 50
+        assert get_cache_key(header + "fim A", "v") != get_cache_key(header + "fim B", "v")
+    
+    def test_cache_key_changes_with_version(self):
+        """Verifica se trocar o modelo ou o prompt invalida a chave."""
+        from app.app import get_cache_key, build_cache_version
+        
+        v1 = build_cache_version("gemini-2.5-flash", "prompt-a")
+        assert v1 != build_cache_version("gemini-2.5-pro", "prompt-a")
+        assert v1 != build_cache_version("gemini-2.5-flash", "prompt-b")
+        assert get_cache_key("email", v1).startswith(f"analysis:v2:{v1}:")
+    
+    def test_purge_legacy_cache_keys_only_removes_old_format(self):
+        """Verifica se a limpeza remove só as chaves `analysis:<8 hex>`."""
+        from app.app import purge_legacy_cache_keys
+        
+        class FakeRedis:
+            def __init__(self, keys):
+                self.keys = set(keys)
+            
+            def scan_iter(self, match, count):
+                return [k for k in list(self.keys) if k.startswith(match.rstrip("*"))]
+            
+            def delete(self, key):
+                self.keys.discard(key)
+                return 1
+        
+        fake = FakeRedis(["flask_cache_analysis:deadbeef", "flask_cache_analysis:v2:abc:" + "0" * 64])
+        
+        assert purge_legacy_cache_keys(fake) == 1
+        assert fake.keys == {"flask_cache_analysis:v2:abc:" + "0" * 64}
+
+
+class TestNearDuplicates:
+    """Testes para o reaproveitamento de análises de emails de template."""
+    
+    TEMPLATE = (
+        "From: loja@exemplo.com\nSubject: Pedido {pedido} enviado\n\n"
+        "Olá {nome}, seu pedido número {pedido} foi enviado hoje e deve chegar em até cinco dias "
+        "úteis. Acompanhe a entrega pelo código de rastreio {rastreio} no site da transportadora "
+        "parceira. Em caso de dúvidas responda este email ou fale com nossa central de atendimento, "
+        "disponível de segunda a sexta das oito às dezoito horas. Obrigado por comprar conosco!"
+    )
+    
+    def test_templated_email_reuses_previous_analysis(self, client, mock_analysis):
+        """Verifica se o segundo email do template não chama o Gemini."""
+        first = self.TEMPLATE.format(nome="Ana", pedido="1001", rastreio="BR1")
+        second = self.TEMPLATE.format(nome="Bruno", pedido="2002", rastreio="BR2")
+        
+        client.post('/analyze', data={'email_text': first})
+        response = client.post('/analyze', data={'email_text': second})
+        data = json.loads(response.data)
+        
+        assert len(mock_analysis) == 1
+        assert data['near_duplicate_of'].startswith('analysis:v2:')
+        assert data['similarity'] >= 0.9
+    
+    def test_near_duplicate_does_not_leak_original_summary(self, client, mock_analysis):
+        """Verifica se só a classificação é reaproveitada (o resumo do original cita outro cliente)."""
+        first = self.TEMPLATE.format(nome="Ana", pedido="1001", rastreio="BR1")
+        second = self.TEMPLATE.format(nome="Bruno", pedido="2002", rastreio="BR2")
+        
+        original = json.loads(client.post('/analyze', data={'email_text': first}).data)
+        data = json.loads(client.post('/analyze', data={'email_text': second}).data)
+        
+        assert "1001" in original['resumo']
+        assert data['categoria'] == original['categoria']
+        assert data['acao'] == original['acao']
+        assert "1001" not in data['resumo'] and "1001" not in data['sugestao']
+
+
+class TestAnalysisStore:
+    """Testes para o histórico persistente de análises (SQLite)."""
+    
+    @pytest.fixture
+    def store_path(self, app, tmp_path, monkeypatch):
+        path = str(tmp_path / "analyses.db")
+        monkeypatch.setenv("ANALYSIS_STORE_PATH", path)
+        return path
+    
+    @staticmethod
+    def build_app():
+        from app.app import create_app
+        
+        new_app = create_app()
+        new_app.config['TESTING'] = True
+        return new_app
+    
+    def test_restart_reuses_stored_analysis(self, store_path, sample_email, mock_analysis):
+        """Verifica se, com o cache vazio (novo processo), a análise vem do histórico sem Gemini."""
+        first = self.build_app()
+        first.test_client().post('/analyze', data={'email_text': sample_email})
+        first.extensions["mailmind"]["analysis_store"].close()
+        
+        second = self.build_app()
+        data = json.loads(second.test_client().post('/analyze', data={'email_text': sample_email}).data)
+        second.extensions["mailmind"]["analysis_store"].close()
+        
+        assert len(mock_analysis) == 1
+        assert data['cached'] is True
+        assert data['categoria'] == 'Produtivo'
+    
+    def test_list_analyses_filters_and_paginates(self, store_path, batch_emails, mock_analysis):
+        """Verifica os filtros e a paginação por cursor de /api/analyses."""
+        test_app = self.build_app()
+        client = test_app.test_client()
+        client.post('/analyze', data={'email_text': batch_emails})
+        test_app.extensions["mailmind"]["analysis_store"].flush()
+        
+        first_page = json.loads(client.get('/api/analyses?limit=2&categoria=Produtivo').data)
+        second_page = json.loads(client.get(f"/api/analyses?limit=2&cursor={first_page['next_cursor']}").data)
+        everything = json.loads(client.get('/api/analyses?limit=100').data)
+        test_app.extensions["mailmind"]["analysis_store"].close()
+        
+        assert len(first_page['items']) == 2
+        assert [item['id'] for item in everything['items']] == sorted(
+            (item['id'] for item in everything['items']), reverse=True)
+        assert first_page['items'] + second_page['items'] == everything['items'][:4]
+        assert everything['next_cursor'] is None
+        assert client.get('/api/analyses?since=ontem').status_code == 400
+    
+    def test_list_analyses_disabled_without_path(self, client):
+        """Verifica se a rota avisa quando o histórico está desligado."""
+        assert client.get('/api/analyses').status_code == 503
+
+
+class TestCacheWarmup:
+    """Testes para o aquecimento do cache de uma instância nova."""
+    
+    def test_snapshot_warms_new_instance(self, app, tmp_path, sample_email, mock_analysis, monkeypatch):
+        """Verifica o ciclo: histórico -> export-cache-snapshot -> instância nova já com cache."""
+        from app.app import create_app
+        
+        monkeypatch.setenv("ANALYSIS_STORE_PATH", str(tmp_path / "analyses.db"))
+        monkeypatch.setenv("CACHE_WARMUP_BACKGROUND", "false")
+        first = create_app()
+        first.test_client().post('/analyze', data={'email_text': sample_email})
+        first.extensions["mailmind"]["analysis_store"].flush()
+        snapshot = str(tmp_path / "snapshot.jsonl")
+        result = first.test_cli_runner().invoke(args=["export-cache-snapshot", snapshot])
+        assert "1 análise(s)" in result.output
+        first.extensions["mailmind"]["analysis_store"].close()
+        
+        monkeypatch.delenv("ANALYSIS_STORE_PATH")
+        monkeypatch.setenv("CACHE_WARMUP_SNAPSHOT", snapshot)
+        second = create_app().test_client()
+        warmup = json.loads(second.get('/health').data)['components']['cache_warmup']
+        data = json.loads(second.post('/analyze', data={'email_text': sample_email}).data)
+        
+        assert warmup['source'] == 'snapshot' and warmup['loaded'] == 1 and warmup['status'] == 'done'
+        assert data['cached'] is True
+        assert len(mock_analysis) == 1
+    
+    def test_no_warmup_without_source(self, client):
+        """Verifica se, sem snapshot nem histórico, o aquecimento fica desligado."""
+        assert json.loads(client.get('/health').data)['components']['cache_warmup'] == 'disabled'
+
+
+class TestLazyStartup:
+    """Testes para o boot rápido (app criado uma vez, SDKs pesados só no primeiro uso)."""
+    
+    CHILD = (
+        "import sys\n"
+        "import app.app as module\n"
+        "assert not hasattr(module, 'app'), 'app criado no import'\n"
+        "module.create_app()\n"
+        "print(','.join(m for m in ('google.generativeai', 'smtplib') if m in sys.modules))\n"
+    )
+    
+    def _boot(self, lazy):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, GEMINI_API_KEY="test-api-key-123", LAZY_STARTUP=lazy, SMTP_ENABLED="false")
+        env.pop("REDIS_URL", None)
+        child = subprocess.run([sys.executable, "-c", self.CHILD], cwd=root, env=env,
+                               capture_output=True, text=True, timeout=120)
+        assert child.returncode == 0, child.stderr[-2000:]
+        return child.stdout.strip()
+    
+    def test_boot_does_not_import_heavy_sdks(self):
+        """Verifica se importar o módulo não cria o app e se create_app não importa o SDK do Gemini nem o smtplib."""
+        assert self._boot("true") == ""
+    
+    def test_eager_mode_preloads_gemini_sdk(self):
+        """Verifica se LAZY_STARTUP=false carrega o SDK do Gemini já no create_app."""
+        assert self._boot("false") == "google.generativeai"
+
+
+class TestPreClassifier:
+    """Testes para o atalho do pré-classificador local no pipeline."""
+    
+    SPAM = "From: promo@ofertas.com\nSubject: Oferta\n\nGanhe prêmio grátis, clique aqui! Promoção imperdível."
+    
+    @pytest.fixture
+    def model_path(self, tmp_path):
+        from app.services.pre_classifier import PreClassifier
+        from tests.test_services import build_training_samples
+        
+        path = str(tmp_path / "pre_classifier.json")
+        PreClassifier.train(build_training_samples()).save(path)
+        return path
+    
+    @pytest.fixture
+    def classified_client(self, app, model_path, monkeypatch):
+        from app.app import create_app
+        
+        monkeypatch.setenv("PRE_CLASSIFIER_MODEL_PATH", model_path)
+        monkeypatch.setenv("PRE_CLASSIFIER_THRESHOLD", "0.9")
+        classified_app = create_app()
+        classified_app.config['TESTING'] = True
+        return classified_app.test_client()
+    
+    def test_obvious_spam_skips_gemini(self, classified_client, mock_analysis):
+        """Verifica se spam óbvio é respondido sem Gemini e marcado na resposta."""
+        from prometheus_client import REGISTRY
+        before = REGISTRY.get_sample_value('mailmind_pre_classifier_decisions_total', {'decision': 'Spam'}) or 0.0
+        
+        data = json.loads(classified_client.post('/analyze', data={'email_text': self.SPAM}).data)
+        
+        assert not mock_analysis
+        assert data['categoria'] == 'Spam'
+        assert data['classified_by'] == 'pre_classifier'
+        assert data['confidence'] >= 0.9
+        assert REGISTRY.get_sample_value('mailmind_pre_classifier_decisions_total', {'decision': 'Spam'}) == before + 1
+    
+    def test_batch_sends_only_uncertain_emails_to_gemini(self, classified_client, mock_analysis):
+        """Verifica se, no lote, só os emails incertos vão ao Gemini."""
+        business = "From: ana@empresa.com\nSubject: Projeto\n\nPrecisamos revisar o contrato e o cronograma do projeto até sexta."
+        response = classified_client.post('/analyze', data={'email_text': f"{self.SPAM}\n---\n{business}"})
+        results = json.loads(response.data)['results']
+        
+        assert results[0]['classified_by'] == 'pre_classifier'
+        assert 'classified_by' not in results[1]
+        assert len(mock_analysis) == 1
+    
+    def test_train_command_writes_model(self, runner, tmp_path):
+        """Verifica o comando de treino offline a partir de um JSONL de análises."""
+        from app.services.pre_classifier import PreClassifier
+        
+        lines = []
+        for i in range(5):
+            lines.append(json.dumps({"text": f"ganhe prêmio grátis {i}", "categoria": "Spam"}))
+            lines.append(json.dumps({"text": f"revisar contrato {i}", "categoria": "Produtivo"}))
+        analyses = tmp_path / "analises.jsonl"
+        analyses.write_text("\n".join(lines), encoding="utf-8")
+        output = str(tmp_path / "modelo.json")
+        
+        result = runner.invoke(args=["train-pre-classifier", str(analyses), "--output", output, "--holdout", "0"])
+        
+        assert result.exit_code == 0, result.output
+        assert PreClassifier.load(output).documents == {"Spam": 5, "gemini": 5}
+    
+    def test_train_command_calibrates_threshold_on_holdout(self, runner, tmp_path):
+        """Verifica se o comando mede a precisão no holdout e salva o limiar calibrado."""
+        from app.services.pre_classifier import PreClassifier
+        from tests.test_services import build_training_samples
+        
+        analyses = tmp_path / "analises.jsonl"
+        analyses.write_text("\n".join(
+            json.dumps({"text": text, "categoria": "Produtivo" if label == "gemini" else label, "atencao_humana": "NÃO"})
+            for text, label in build_training_samples(60)
+        ), encoding="utf-8")
+        output = str(tmp_path / "modelo.json")
+        
+        result = runner.invoke(args=["train-pre-classifier", str(analyses), "--output", output])
+        model = PreClassifier.load(output)
+        
+        assert result.exit_code == 0, result.output
+        assert "Holdout" in result.output
+        assert model.calibration["held_out"] > 0
+        assert model.calibration["precision"] >= 0.99
+
+
+class TestMetrics:
+    """Testes para o endpoint /metrics (Prometheus)."""
+    
+    @staticmethod
+    def sample(name, **labels):
+        from prometheus_client import REGISTRY
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+    
+    def test_metrics_exposes_stage_histograms(self, client, mock_analysis, sample_email):
+        """Verifica se /metrics responde no formato do Prometheus com as etapas."""
+        client.post('/analyze', data={'email_text': sample_email})
+        response = client.get('/metrics')
+        body = response.data.decode()
+        
+        assert response.status_code == 200
+        assert response.content_type.startswith('text/plain')
+        assert 'mailmind_stage_duration_seconds_bucket{le="0.001",stage="cache_lookup"}' in body
+        assert 'stage="request:analyze"' in body
+    
+    def test_cache_hit_and_miss_are_counted(self, client, mock_analysis, sample_email):
+        """Verifica se acertos e erros do cache viram contadores."""
+        hits = self.sample('mailmind_cache_events_total', result='hit')
+        misses = self.sample('mailmind_cache_events_total', result='miss')
+        
+        client.post('/analyze', data={'email_text': sample_email + "métricas"})
+        client.post('/analyze', data={'email_text': sample_email + "métricas"})
+        
+        assert self.sample('mailmind_cache_events_total', result='miss') == misses + 1
+        assert self.sample('mailmind_cache_events_total', result='hit') == hits + 1
+    
+    def test_gemini_tokens_and_retries_are_counted(self, monkeypatch):
+        """Verifica se tokens de usage_metadata e retries por exceção são contados."""
+        from types import SimpleNamespace
+        from app.providers import gemini_client
+        from app.providers.gemini_client import GeminiClient
+        
+        class FlakyModel:
+            calls = 0
+            
+            def generate_content(self, prompt, generation_config=None, request_options=None):
+                FlakyModel.calls += 1
+                if FlakyModel.calls == 1:
+                    raise TimeoutError("lento demais")
+                part = SimpleNamespace(text='{"categoria": "Outro"}')
+                return SimpleNamespace(
+                    text=part.text,
+                    candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))],
+                    usage_metadata=SimpleNamespace(prompt_token_count=120, candidates_token_count=30)
+                )
+        
+        monkeypatch.setattr(gemini_client.time, "sleep", lambda seconds: None)
+        client = GeminiClient(api_key="chave-teste", model_name="gemini-2.5-flash")
+        client.model = FlakyModel()
+        prompt_tokens = self.sample('mailmind_gemini_tokens_total', kind='prompt')
+        retries = self.sample('mailmind_gemini_retries_total', exception='TimeoutError')
+        
+        client.generate_json("prompt")
+        
+        assert self.sample('mailmind_gemini_tokens_total', kind='prompt') == prompt_tokens + 120
+        assert self.sample('mailmind_gemini_retries_total', exception='TimeoutError') == retries + 1
+
+
 class TestWebhookEndpoint:
     """Testes para o endpoint de webhook."""
     
@@ -115,6 +610,168 @@ class TestWebhookEndpoint:
         assert response.status_code in [200, 500]
 
 
+def call_asgi(asgi_app, method, path, payload=None, headers=None):
+    """Faz uma requisição HTTP direto na aplicação ASGI; retorna (status, corpo JSON)."""
+    body = json.dumps(payload).encode() if payload is not None else b""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "server": ("testserver", 80), "client": ("127.0.0.1", 5000),
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + [
+            (key.lower().encode(), value.encode()) for key, value in (headers or {}).items()
+        ],
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+    
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)  # Cliente "conectado" esperando a resposta
+    
+    async def send(message):
+        sent.append(message)
+    
+    async def run():
+        await asgi_app(scope, receive, send)
+    
+    return run, sent
+
+
+def asgi_response(sent):
+    status = next(message["status"] for message in sent if message["type"] == "http.response.start")
+    body = b"".join(message.get("body", b"") for message in sent if message["type"] == "http.response.body")
+    return status, json.loads(body)
+
+
+class TestAsgiMode:
+    """Testes para o modo ASGI (análises no event loop, resto no Flask)."""
+    
+    @pytest.fixture
+    def async_analysis(self, monkeypatch):
+        """Substitui `analyze_async` por uma resposta fixa que demora um pouco (sem rede)."""
+        from app.services.email_analyzer import EmailAnalyzerService
+        
+        state = {"calls": [], "running": 0, "peak": 0}
+        
+        async def fake_analyze_async(self, email_content):
+            state["calls"].append(email_content)
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+            await asyncio.sleep(0.02)
+            state["running"] -= 1
+            return {
+                "categoria": "Produtivo",
+                "atencao_humana": "NÃO",
+                "resumo": email_content[:60],
+                "sugestao_resposta_ou_acao": "Responder",
+                "acao": "RESPOSTA_AUTOMATICA"
+            }
+        
+        monkeypatch.setattr(EmailAnalyzerService, "analyze_async", fake_analyze_async)
+        return state
+    
+    @pytest.fixture
+    def asgi_app(self, app, monkeypatch):
+        from app.app import create_app
+        from app.asgi import create_asgi_app
+        
+        monkeypatch.setenv("ASGI_GEMINI_CONCURRENCY", "4")
+        flask_app = create_app()
+        flask_app.config['TESTING'] = True
+        return create_asgi_app(flask_app)
+    
+    def test_webhook_is_answered_on_event_loop(self, asgi_app, async_analysis, mock_analysis):
+        """Verifica se o webhook JSON usa a análise assíncrona (e não a síncrona do Flask)."""
+        run, sent = call_asgi(asgi_app, "POST", "/webhook/email",
+                              {"email_content": "Preciso revisar o contrato", "sender": "ana@empresa.com"})
+        asyncio.run(run())
+        status, data = asgi_response(sent)
+        
+        assert status == 200
+        assert data["categoria"] == "Produtivo"
+        assert data["sender"] == "ana@empresa.com"
+        assert len(async_analysis["calls"]) == 1
+        assert not mock_analysis
+    
+    def test_concurrent_requests_respect_gemini_limit(self, asgi_app, async_analysis):
+        """Verifica se muitas requisições simultâneas passam no máximo N por vez pelo Gemini."""
+        requests = [call_asgi(asgi_app, "POST", "/analyze", {"email_content": f"Pedido número {i} para revisar"})
+                    for i in range(20)]
+        
+        async def run_all():
+            await asyncio.gather(*(run() for run, _ in requests))
+        
+        asyncio.run(run_all())
+        
+        assert all(asgi_response(sent)[0] == 200 for _, sent in requests)
+        assert len(async_analysis["calls"]) == 20
+        assert async_analysis["peak"] == 4
+    
+    def test_identical_emails_share_one_analysis(self, asgi_app, async_analysis):
+        """Verifica se emails idênticos em paralelo aguardam a mesma chamada ao Gemini."""
+        requests = [call_asgi(asgi_app, "POST", "/analyze", {"email_content": "Mesmo email repetido"})
+                    for _ in range(5)]
+        
+        async def run_all():
+            await asyncio.gather(*(run() for run, _ in requests))
+        
+        asyncio.run(run_all())
+        results = [asgi_response(sent)[1] for _, sent in requests]
+        
+        assert len(async_analysis["calls"]) == 1
+        assert sum(bool(result.get("coalesced") or result.get("cached")) for result in results) == 4
+    
+    def test_flask_routes_run_in_parallel(self, asgi_app, monkeypatch):
+        """Verifica se as rotas repassadas ao Flask não ficam presas numa única thread."""
+        import threading
+        
+        barrier = threading.Barrier(3, timeout=5)
+        
+        @asgi_app.flask_app.before_request
+        def wait_for_the_others():
+            barrier.wait()  # Só libera quando 3 requisições estão no Flask ao mesmo tempo
+        
+        requests = [call_asgi(asgi_app, "GET", "/health") for _ in range(3)]
+        
+        async def run_all():
+            await asyncio.gather(*(run() for run, _ in requests))
+        
+        asyncio.run(run_all())
+        
+        assert all(asgi_response(sent)[0] == 200 for _, sent in requests)
+    
+    def test_other_routes_fall_back_to_flask(self, asgi_app, async_analysis):
+        """Verifica se rotas sem versão assíncrona (e erros de validação) continuam no Flask."""
+        run, sent = call_asgi(asgi_app, "GET", "/health")
+        asyncio.run(run())
+        assert asgi_response(sent)[0] == 200
+        
+        run, sent = call_asgi(asgi_app, "POST", "/webhook/email", {})
+        asyncio.run(run())
+        assert asgi_response(sent)[0] == 400
+        assert not async_analysis["calls"]
+    
+    def test_webhook_requires_api_key_when_configured(self, app, async_analysis, monkeypatch):
+        """Verifica se a API key do webhook também vale no modo ASGI."""
+        from app.app import create_app
+        from app.asgi import create_asgi_app
+        
+        monkeypatch.setenv("API_KEY_REQUIRED", "true")
+        monkeypatch.setenv("VALID_API_KEYS", "chave-boa")
+        asgi_app = create_asgi_app(create_app())
+        payload = {"email_content": "Preciso revisar o contrato"}
+        
+        run, sent = call_asgi(asgi_app, "POST", "/webhook/email", payload)
+        asyncio.run(run())
+        assert asgi_response(sent)[0] == 401
+        
+        run, sent = call_asgi(asgi_app, "POST", "/webhook/email", payload, {"X-API-Key": "chave-boa"})
+        asyncio.run(run())
+        assert asgi_response(sent)[0] == 200
+        assert len(async_analysis["calls"]) == 1
+
+
 class TestErrorHandlers:
     """Testes para handlers de erro."""
     
@@ -1,9 +1,10 @@
 """
 Testes para o serviço de análise de emails.
 """
+import json
 import pytest
 from unittest.mock import Mock, MagicMock
-from app.services.email_analyzer import EmailAnalyzerService
+from app.services.email_analyzer import BATCH_SYSTEM_INSTRUCTION, SYSTEM_INSTRUCTION, EmailAnalyzerService
 
 
 class TestEmailAnalyzerService:
@@ -32,6 +33,42 @@ class TestEmailAnalyzerService:
         assert "Produtivo" in prompt
         assert "Reclamação" in prompt
     
+    def test_prompt_version_is_stable(self):
+        """Verifica se a versão do prompt é determinística (usada na chave de cache)."""
+        service = EmailAnalyzerService(client=Mock())
+        assert service.prompt_version() == EmailAnalyzerService(client=Mock()).prompt_version()
+    
+    def test_system_instruction_prompts_carry_only_emails(self):
+        """Verifica se, com system_instruction, os prompts levam só os emails."""
+        service = EmailAnalyzerService(client=Mock(), use_system_instruction=True)
+        
+        assert service.build_prompt("Teste de email") == "Email: Teste de email"
+        batch = service.build_batch_prompt(["primeiro", "segundo"])
+        assert "### EMAIL 1\nsegundo" in batch
+        assert "CATEGORIAS:" not in batch
+        assert "CATEGORIAS:" in SYSTEM_INSTRUCTION and "CATEGORIAS:" in BATCH_SYSTEM_INSTRUCTION
+    
+    def test_single_instruction_has_no_batch_rules(self):
+        """Verifica se a chamada individual não paga pelas regras do lote."""
+        assert '"indice"' not in SYSTEM_INSTRUCTION
+        assert '"indice"' in BATCH_SYSTEM_INSTRUCTION
+        assert len(SYSTEM_INSTRUCTION) < len(BATCH_SYSTEM_INSTRUCTION)
+    
+    def test_batch_calls_use_batch_model(self):
+        """Verifica se o lote pede ao cliente o modelo com a instrução de lote."""
+        mock_client = Mock()
+        mock_client.generate_json = MagicMock(return_value='[{"indice": 0, "categoria": "Spam"}, {"indice": 1, "categoria": "Spam"}]')
+        
+        EmailAnalyzerService(client=mock_client, use_system_instruction=True).analyze_batch(["a", "b"])
+        
+        assert mock_client.generate_json.call_args.kwargs["batch"] is True
+    
+    def test_prompt_version_depends_on_system_instruction(self):
+        """Verifica se trocar o modo do prompt invalida o cache (outra versão)."""
+        full = EmailAnalyzerService(client=Mock())
+        compact = EmailAnalyzerService(client=Mock(), use_system_instruction=True)
+        assert full.prompt_version() != compact.prompt_version()
+    
     def test_analyze_calls_client_generate_json(self):
         """Verifica se analyze chama o método correto do cliente."""
         mock_client = Mock()
@@ -63,3 +100,58 @@ class TestEmailAnalyzerService:
         result = service.analyze("teste")
         
         assert isinstance(result, dict)
+
+
+class TestAnalyzeBatch:
+    """Testes para a análise de vários emails em um único prompt."""
+    
+    def test_batch_prompt_includes_every_email_once(self):
+        """Verifica se o prompt em lote traz cada email e as instruções uma só vez."""
+        service = EmailAnalyzerService(client=Mock())
+        prompt = service.build_batch_prompt(["primeiro email", "segundo email"])
+        
+        assert "### EMAIL 0\nprimeiro email" in prompt
+        assert "### EMAIL 1\nsegundo email" in prompt
+        assert prompt.count("CATEGORIAS:") == 1
+    
+    def test_analyze_batch_uses_single_call(self):
+        """Verifica se um array JSON válido resolve o lote com uma chamada só."""
+        mock_client = Mock()
+        mock_client.generate_json = MagicMock(return_value=json.dumps([
+            {"indice": 1, "categoria": "Spam"},
+            {"indice": 0, "categoria": "Produtivo"},
+        ]))
+        service = EmailAnalyzerService(client=mock_client)
+        
+        results = service.analyze_batch(["a", "b"])
+        
+        mock_client.generate_json.assert_called_once()
+        assert [r["categoria"] for r in results] == ["Produtivo", "Spam"]
+    
+    def test_analyze_batch_falls_back_only_for_invalid_items(self):
+        """Verifica se só o item inválido é reanalisado individualmente."""
+        mock_client = Mock()
+        mock_client.generate_json = MagicMock(side_effect=[
+            json.dumps([{"indice": 0, "categoria": "Spam"}, {"indice": 1, "resumo": "sem categoria"}]),
+            '{"categoria": "Consulta"}',
+        ])
+        service = EmailAnalyzerService(client=mock_client)
+        
+        results = service.analyze_batch(["a", "b"])
+        
+        assert mock_client.generate_json.call_count == 2
+        assert [r["categoria"] for r in results] == ["Spam", "Consulta"]
+    
+    def test_analyze_batch_falls_back_when_response_is_not_json(self):
+        """Verifica se uma resposta inválida leva todos os emails ao modo individual."""
+        mock_client = Mock()
+        mock_client.generate_json = MagicMock(side_effect=[
+            "isto não é json",
+            '{"categoria": "Outro"}',
+            '{"categoria": "Urgente"}',
+        ])
+        service = EmailAnalyzerService(client=mock_client)
+        
+        results = service.analyze_batch(["a", "b"])
+        
+        assert [r["categoria"] for r in results] == ["Outro", "Urgente"]
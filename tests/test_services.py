@@ -0,0 +1,1207 @@
+"""
+Testes para os serviços de apoio ao pipeline de análise.
+"""
+import threading
+import time
+import pytest
+from app.services.single_flight import SingleFlight
+from app.services.near_duplicate import NearDuplicateIndex, simhash, tokenize
+from app.services.pre_classifier import (
+    LABEL_GEMINI, LABEL_OTHER, LABEL_SPAM, PreClassifier, iter_training_samples, label_for_analysis, split_holdout
+)
+
+
+class TestSingleFlight:
+    """Testes para a coalescência de análises idênticas em andamento."""
+    
+    def test_concurrent_calls_share_one_computation(self):
+        """Verifica se chamadas simultâneas com a mesma chave calculam uma vez só."""
+        flight = SingleFlight()
+        calls = []
+        
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"categoria": "Spam"}
+        
+        outcomes = []
+        threads = [
+            threading.Thread(target=lambda: outcomes.append(flight.do("k", compute, lambda: None)))
+            for _ in range(5)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        assert len(calls) == 1
+        assert all(result == {"categoria": "Spam"} for result, _ in outcomes)
+        assert sorted(coalesced for _, coalesced in outcomes) == [False, True, True, True, True]
+        assert flight.stats()["coalesced_local"] == 4
+    
+    def test_leader_error_propagates_to_followers(self):
+        """Verifica se o erro do líder chega às requisições que esperavam por ele."""
+        flight = SingleFlight()
+        started = threading.Event()
+        
+        def failing():
+            started.set()
+            time.sleep(0.05)
+            raise RuntimeError("Gemini fora do ar")
+        
+        errors = []
+        
+        def run():
+            try:
+                flight.do("k", failing, lambda: None)
+            except RuntimeError as e:
+                errors.append(e)
+        
+        leader = threading.Thread(target=run)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=run)
+        follower.start()
+        leader.join()
+        follower.join()
+        
+        assert len(errors) == 2
+    
+    def test_remote_follower_reads_shared_cache(self):
+        """Verifica se, sem o lease do Redis, o worker espera o resultado no cache."""
+        class FakeRedis:
+            def set(self, key, value, nx, px):
+                return False  # Outro worker já tem o lease
+            
+            def exists(self, key):
+                return True
+        
+        flight = SingleFlight(poll_interval=0.01)
+        flight._redis = FakeRedis()
+        shared_cache = []
+        threading.Timer(0.05, lambda: shared_cache.append({"categoria": "Consulta"})).start()
+        
+        result, coalesced = flight.do(
+            "k",
+            compute=lambda: pytest.fail("não deveria chamar o Gemini"),
+            fetch=lambda: shared_cache[0] if shared_cache else None
+        )
+        
+        assert coalesced is True
+        assert result == {"categoria": "Consulta"}
+        assert flight.stats()["coalesced_remote"] == 1
+
+    
+    def test_async_remote_follower_waits_without_blocking_loop(self):
+        """Verifica se `do_async` respeita o lease do Redis e deixa o loop livre enquanto espera."""
+        import asyncio
+        
+        class FakeRedis:
+            def set(self, key, value, nx, px):
+                return False
+            
+            def exists(self, key):
+                return True
+        
+        flight = SingleFlight(poll_interval=0.01)
+        flight._redis = FakeRedis()
+        shared_cache = []
+        
+        async def compute():
+            pytest.fail("não deveria chamar o Gemini")
+        
+        async def other_worker_finishes():
+            await asyncio.sleep(0.05)  # Só roda se o loop não estiver travado
+            shared_cache.append({"categoria": "Consulta"})
+        
+        async def run():
+            fetch = lambda: shared_cache[0] if shared_cache else None
+            outcome, _ = await asyncio.gather(flight.do_async("k", compute, fetch), other_worker_finishes())
+            return outcome
+        
+        result, coalesced = asyncio.run(run())
+        
+        assert coalesced is True
+        assert result == {"categoria": "Consulta"}
+
+
+NOTIFICATION_TEMPLATE = (
+    "Olá {nome}, seu pedido número {pedido} foi enviado hoje e deve chegar em até cinco dias úteis. "
+    "Acompanhe a entrega pelo código de rastreio {rastreio} no site da transportadora parceira. "
+    "Em caso de dúvidas responda este email ou fale com nossa central de atendimento ao cliente, "
+    "disponível de segunda a sexta das oito às dezoito horas. Obrigado por comprar conosco!"
+)
+
+
+class TestNearDuplicateIndex:
+    """Testes para o índice de quase-duplicatas (SimHash + LSH)."""
+    
+    def make_email(self, nome, pedido, rastreio):
+        return NOTIFICATION_TEMPLATE.format(nome=nome, pedido=pedido, rastreio=rastreio)
+    
+    def test_templated_emails_are_found(self):
+        """Verifica se emails do mesmo template (nomes/IDs diferentes) são encontrados."""
+        index = NearDuplicateIndex(threshold=0.85)
+        first = index.fingerprint(self.make_email("Ana", "12345", "BR998877"))
+        index.add("k1", first, {"categoria": "Outro"})
+        
+        match = index.find(index.fingerprint(self.make_email("Bruno", "67890", "BR112233")))
+        
+        assert match is not None
+        assert match[0] == "k1"
+        assert match[1] == {"categoria": "Outro"}
+    
+    def test_different_emails_are_not_matched(self):
+        """Verifica se um email com outro assunto não reaproveita a análise."""
+        index = NearDuplicateIndex(threshold=0.85)
+        index.add("k1", index.fingerprint(self.make_email("Ana", "1", "X")), {"categoria": "Outro"})
+        
+        other = index.fingerprint(
+            "Prezados, identificamos uma cobrança duplicada na fatura de março referente ao contrato "
+            "de manutenção dos servidores. Solicitamos o estorno imediato do valor e uma explicação "
+            "formal sobre o ocorrido, pois esta é a terceira vez que o problema acontece neste ano. "
+            "Aguardamos retorno urgente da equipe financeira responsável pela nossa conta."
+        )
+        assert index.find(other) is None
+    
+    def test_short_texts_are_ignored(self):
+        """Verifica se textos curtos demais não geram impressão digital."""
+        assert NearDuplicateIndex().fingerprint("oi tudo bem") is None
+    
+    def test_lru_eviction_bounds_memory(self):
+        """Verifica se o índice descarta as entradas menos usadas ao passar do limite."""
+        index = NearDuplicateIndex(max_entries=2)
+        words = ["alfa", "beta", "gama"]
+        for i, word in enumerate(words):
+            index.add(f"k{i}", simhash(tokenize(f"{word} email " * 10)), {"i": i})
+        
+        assert len(index) == 2
+        assert index.find(simhash(tokenize("alfa email " * 10))) is None
+        assert index.find(simhash(tokenize("gama email " * 10)))[0] == "k2"
+    
+    def test_persistent_index_survives_restart(self, tmp_path):
+        """Verifica se o índice em SQLite é recarregado ao recriar o objeto."""
+        db_path = str(tmp_path / "near_dup.db")
+        fingerprint = simhash(tokenize(self.make_email("Ana", "1", "X")))
+        NearDuplicateIndex(db_path=db_path).add("k1", fingerprint, {"categoria": "Outro"})
+        
+        reloaded = NearDuplicateIndex(db_path=db_path)
+        
+        assert reloaded.find(fingerprint)[0] == "k1"
+    
+    def test_version_bump_invalidates_persisted_entries(self, tmp_path):
+        """Verifica se, com outro modelo/prompt (versão do cache), a entrada antiga não é reaproveitada."""
+        db_path = str(tmp_path / "near_dup.db")
+        fingerprint = simhash(tokenize(self.make_email("Ana", "1", "X")))
+        NearDuplicateIndex(db_path=db_path, cache_version="v1").add("k1", fingerprint, {"categoria": "Outro"})
+        
+        bumped = NearDuplicateIndex(db_path=db_path, cache_version="v2")
+        assert bumped.find(fingerprint) is None
+        
+        bumped.add("k2", fingerprint, {"categoria": "Consulta"})
+        assert NearDuplicateIndex(db_path=db_path, cache_version="v1").find(fingerprint)[0] == "k1"
+        assert NearDuplicateIndex(db_path=db_path, cache_version="v2").find(fingerprint)[0] == "k2"
+
+
+class TestGeminiEndpointOverride:
+    """Testes do GeminiClient apontando para o stub HTTP local (caminho de rede real)."""
+    
+    @pytest.fixture
+    def stub(self):
+        from benchmarks.fake_gemini import FakeGeminiProfile
+        from benchmarks.gemini_stub import GeminiStubServer
+        
+        server = GeminiStubServer(("127.0.0.1", 0), FakeGeminiProfile())
+        server.start_in_background()
+        yield server
+        server.shutdown()
+        server.server_close()
+    
+    def _service(self, endpoint, system_instruction=False):
+        from app.providers.gemini_client import GeminiClient
+        from app.services.email_analyzer import BATCH_SYSTEM_INSTRUCTION, SYSTEM_INSTRUCTION, EmailAnalyzerService
+        
+        client = GeminiClient(api_key="chave-teste", model_name="gemini-2.5-flash", timeout=5, endpoint=endpoint,
+                              system_instruction=SYSTEM_INSTRUCTION if system_instruction else None,
+                              batch_system_instruction=BATCH_SYSTEM_INSTRUCTION if system_instruction else None)
+        return EmailAnalyzerService(client=client, use_system_instruction=system_instruction)
+    
+    def test_analyze_goes_through_stub(self, stub):
+        """Verifica se a análise individual e em lote passam pelo endpoint configurado."""
+        service = self._service(stub.url)
+        
+        single = service.analyze("From: a@b.com\nSubject: Sistema fora do ar\n\nUrgente!")
+        batch = service.analyze_batch(["Tenho uma dúvida sobre a fatura?", "Ganhe um prêmio, clique aqui"])
+        
+        assert single["categoria"] == "Urgente"
+        assert [item["categoria"] for item in batch] == ["Consulta", "Spam"]
+        assert stub.faults.calls == 2
+    
+    def test_system_instruction_sent_apart_from_email(self, stub):
+        """Verifica se as instruções vão no systemInstruction e o conteúdo leva só o email."""
+        from benchmarks.gemini_stub import prompt_from_request, system_instruction_from_request
+        
+        result = self._service(stub.url, system_instruction=True).analyze("Sistema parado, urgente!")
+        
+        assert result["categoria"] == "Urgente"
+        assert "CATEGORIAS:" in system_instruction_from_request(stub.last_request)
+        assert prompt_from_request(stub.last_request) == "Email: Sistema parado, urgente!"
+        assert '"indice"' not in system_instruction_from_request(stub.last_request)
+    
+    def test_batch_sends_batch_instruction(self, stub):
+        """Verifica se o lote usa a instrução de lote (com o campo "indice")."""
+        from benchmarks.gemini_stub import system_instruction_from_request
+        
+        results = self._service(stub.url, system_instruction=True).analyze_batch(
+            ["Tenho uma dúvida sobre a fatura?", "Ganhe um prêmio, clique aqui"]
+        )
+        
+        assert [item["categoria"] for item in results] == ["Consulta", "Spam"]
+        assert '"indice"' in system_instruction_from_request(stub.last_request)
+    
+    def test_truncated_json_falls_back_to_curation(self, stub):
+        """Verifica se um JSON cortado vira encaminhamento para curadoria."""
+        stub.faults.profile.truncated_rate = 1.0
+        
+        result = self._service(stub.url).analyze("Email qualquer para análise")
+        
+        assert result["acao"] == "ENCAMINHAR_CURADORIA"
+        assert stub.faults.outcomes == {"truncated": 1}
+    
+    def test_async_analyze_goes_through_stub(self, stub):
+        """Verifica se a análise assíncrona também usa o endpoint configurado (REST em thread)."""
+        import asyncio
+        
+        service = self._service(stub.url)
+        
+        result = asyncio.run(service.analyze_async("Sistema parado, urgente!"))
+        
+        assert result["categoria"] == "Urgente"
+        assert stub.faults.calls == 1
+    
+    def test_sdk_retry_on_503_does_not_outlive_deadline(self, stub):
+        """Verifica se erros 503 (que o SDK repetiria por até 600s) respeitam o prazo da requisição."""
+        from app.providers.resilience import deadline_scope
+        
+        stub.faults.profile.unavailable_rate = 1.0
+        service = self._service(stub.url)
+        service.client.timeout = 2
+        
+        started = time.monotonic()
+        with deadline_scope(3):
+            result = service.analyze("Email qualquer para análise")
+        
+        assert time.monotonic() - started < 4
+        assert result["acao"] == "ENCAMINHAR_CURADORIA"
+        assert stub.faults.calls <= service.client.max_retries  # Só os retries do GeminiClient
+    
+    def test_config_reads_gemini_endpoint(self, monkeypatch):
+        """Verifica se GEMINI_ENDPOINT chega ao AppConfig."""
+        from app.config import load_config
+        
+        monkeypatch.setenv("GEMINI_API_KEY", "chave-teste")
+        monkeypatch.setenv("GEMINI_ENDPOINT", "http://localhost:8090")
+        
+        assert load_config().gemini_endpoint == "http://localhost:8090"
+
+
+class TestGeminiClientPool:
+    """Testes para o pool de chaves do Gemini (roteamento pela cota e castigo após 429)."""
+    
+    class Clock:
+        def __init__(self):
+            self.now = 0.0
+        
+        def __call__(self):
+            return self.now
+    
+    def _pool(self, profiles, **kwargs):
+        """Pool com um modelo falso por chave (`profiles`: chave -> FakeGeminiProfile)."""
+        from app.providers.gemini_pool import GeminiClientPool
+        from benchmarks.fake_gemini import FakeGenerativeModel
+        
+        class FakePool(GeminiClientPool):
+            def _build_model(self, model_name, api_key, system_instruction):
+                model = FakeGenerativeModel(model_name, profiles[api_key], system_instruction)
+                model.api_key = api_key
+                return model
+        
+        keys = list(profiles)
+        return FakePool(api_key=keys[0], model_name="gemini-2.5-flash", api_keys=keys, **kwargs)
+    
+    def test_calls_spread_across_keys(self):
+        """Verifica se, sem cota conhecida, as chamadas vão para a chave menos usada."""
+        from benchmarks.fake_gemini import FakeGeminiProfile
+        
+        pool = self._pool({"chave-a": FakeGeminiProfile(), "chave-b": FakeGeminiProfile()})
+        for i in range(4):
+            pool.generate_json(f"Email {i}: reunião amanhã")
+        
+        assert [slot.model.calls for slot in pool.slots] == [2, 2]
+        assert [entry["requests_in_window"] for entry in pool.stats()] == [2, 2]
+        assert all(entry["tokens_in_window"] > 0 for entry in pool.stats())
+    
+    def test_routes_to_key_with_most_headroom(self):
+        """Verifica se a chamada vai para a chave com a menor fração da cota usada na janela."""
+        from benchmarks.fake_gemini import FakeGeminiProfile
+        
+        clock = self.Clock()
+        pool = self._pool({"chave-a": FakeGeminiProfile(), "chave-b": FakeGeminiProfile()},
+                          rpm_limit=10, clock=clock)
+        for _ in range(5):
+            pool.slots[0].requests.add(clock.now)  # Chave A já gastou metade da cota
+        
+        pool.generate_json("Email: reunião amanhã")
+        assert [slot.model.calls for slot in pool.slots] == [0, 1]
+        
+        clock.now = 61  # A janela de 60s passou: as duas estão livres de novo
+        assert [entry["requests_in_window"] for entry in pool.stats()] == [0, 0]
+    
+    def test_rate_limited_key_cools_down_and_call_fails_over(self, monkeypatch):
+        """Verifica se um 429 deixa a chave de castigo e a nova tentativa vai para outra, sem backoff."""
+        from app.providers import gemini_client
+        from benchmarks.fake_gemini import FakeGeminiProfile
+        
+        sleeps = []
+        monkeypatch.setattr(gemini_client.time, "sleep", sleeps.append)
+        clock = self.Clock()
+        limited = FakeGeminiProfile(burst_every=1000, burst_length=1000)  # Sempre 429
+        pool = self._pool({"chave-a": limited, "chave-b": FakeGeminiProfile()}, cooldown_seconds=30, clock=clock)
+        
+        result = pool.generate_json("Email: sistema fora do ar, urgente")
+        for i in range(3):
+            pool.generate_json(f"Email {i}: reunião amanhã")
+        
+        assert '"categoria"' in result
+        assert not any(sleeps)  # Só as latências zeradas do modelo falso
+        assert [slot.model.calls for slot in pool.slots] == [1, 4]
+        key_a = pool.stats()[0]
+        assert key_a["rate_limited_total"] == 1
+        assert key_a["cooldown_remaining"] == 30
+        assert key_a["in_flight"] == 0
+        
+        clock.now = 31  # Fim do castigo: a chave A volta a ser tentada (e cai na B de novo)
+        pool.generate_json("Email: outra mensagem")
+        assert [slot.model.calls for slot in pool.slots] == [2, 5]
+        assert pool.stats()[0]["rate_limited_total"] == 2
+    
+    def test_cancelled_call_releases_in_flight(self):
+        """Verifica se uma chamada cancelada não deixa o slot contando uma chamada em andamento."""
+        import asyncio
+        from benchmarks.fake_gemini import FakeGeminiProfile
+        
+        pool = self._pool({"chave-a": FakeGeminiProfile(), "chave-b": FakeGeminiProfile()})
+        started = []
+        
+        async def hang(prompt, generation_config=None, request_options=None):
+            started.append(prompt)
+            await asyncio.sleep(3600)
+        
+        for slot in pool.slots:
+            slot.model.generate_content_async = hang
+        
+        async def cancel_call():
+            task = asyncio.create_task(pool.generate_json_async("Email: reunião amanhã"))
+            while not started:
+                await asyncio.sleep(0)
+            assert sum(entry["in_flight"] for entry in pool.stats()) == 1
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        
+        asyncio.run(cancel_call())
+        assert [entry["in_flight"] for entry in pool.stats()] == [0, 0]
+    
+    def test_each_key_has_its_own_sdk_client(self, monkeypatch):
+        """Verifica se cada chave usa o seu cliente, sem o genai.configure global."""
+        import google.generativeai as genai
+        from app.providers.gemini_pool import GeminiClientPool
+        
+        monkeypatch.setattr(genai, "configure", lambda **kwargs: pytest.fail("genai.configure global"))
+        pool = GeminiClientPool(api_key="chave-a", model_name="gemini-2.5-flash", api_keys=["chave-a", "chave-b"],
+                                model_names=["gemini-2.5-flash", "gemini-2.0-flash"])
+        
+        assert [(slot.label, slot.model_name) for slot in pool.slots] == [
+            ("...ve-a", "gemini-2.5-flash"), ("...ve-a", "gemini-2.0-flash"),
+            ("...ve-b", "gemini-2.5-flash"), ("...ve-b", "gemini-2.0-flash"),
+        ]
+        assert [slot.model._client_options["api_key"] for slot in pool.slots] == ["chave-a", "chave-a", "chave-b", "chave-b"]
+        assert len({id(slot.model._client) for slot in pool.slots}) == 4
+    
+    def test_sdk_model_created_on_first_use(self):
+        """Verifica se o modelo do SDK só é criado na primeira chamada (uma vez só)."""
+        from app.providers.gemini_client import GeminiClient
+        
+        client = GeminiClient(api_key="chave-a", model_name="gemini-2.5-flash", system_instruction="Classifique")
+        assert client.model._model is None
+        
+        client.preload()
+        sdk_model = client.model._model
+        assert sdk_model is not None
+        assert client.model.load() is sdk_model
+        assert client.model._client is sdk_model._client
+    
+    def test_config_accepts_key_list(self, monkeypatch):
+        """Verifica se GEMINI_API_KEYS sozinho basta e a primeira chave vira a principal."""
+        from app.config import load_config
+        
+        monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+        monkeypatch.setenv("GEMINI_API_KEYS", "chave-a, chave-b")
+        monkeypatch.setenv("GEMINI_KEY_RPM", "15")
+        config = load_config()
+        
+        assert config.gemini_api_key == "chave-a"
+        assert config.gemini_api_keys == ("chave-a", "chave-b")
+        assert config.gemini_key_rpm == 15
+
+
+class TestAdaptiveConcurrencyLimiter:
+    """Testes para o limitador adaptativo (AIMD) de chamadas ao Gemini."""
+    
+    class Clock:
+        def __init__(self):
+            self.now = 0.0
+        
+        def __call__(self):
+            return self.now
+    
+    @staticmethod
+    def rate_limited_error():
+        from google.api_core import exceptions
+        return exceptions.ResourceExhausted("cota esgotada")
+    
+    def _run_round(self, limiter, latency=1.0, error=None):
+        """Ocupa todas as vagas e devolve cada uma com o resultado informado."""
+        taken = limiter.limit
+        assert all(limiter.acquire(0) for _ in range(taken))
+        for _ in range(taken):
+            limiter.release(latency, error)
+    
+    def test_limit_grows_additively_while_healthy(self):
+        """Verifica se o limite sobe ~1 por rodada de respostas rápidas com as vagas em uso."""
+        from app.providers.resilience import AdaptiveConcurrencyLimiter
+        
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=6)
+        assert all(limiter.acquire(0) for _ in range(4))
+        for _ in range(5):  # Uma rodada: cada resposta libera a vaga para a próxima chamada
+            limiter.release(1.0)
+            assert limiter.acquire(0)
+        assert limiter.limit == 5
+        
+        for _ in range(50):
+            limiter.release(1.0)
+            assert limiter.acquire(0)
+        assert limiter.limit == 6  # Nunca passa do máximo
+    
+    def test_idle_limit_does_not_grow(self):
+        """Verifica se o limite não sobe quando quase nenhuma vaga está em uso."""
+        from app.providers.resilience import AdaptiveConcurrencyLimiter
+        
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=16)
+        for _ in range(100):
+            assert limiter.acquire(0)
+            limiter.release(1.0)
+        assert limiter.limit == 16
+    
+    def test_rate_limit_halves_once_per_round(self):
+        """Verifica se 429s simultâneos cortam o limite uma vez só, e de novo na rodada seguinte."""
+        from app.providers.resilience import AdaptiveConcurrencyLimiter
+        
+        clock = self.Clock()
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=16, min_limit=2, clock=clock)
+        self._run_round(limiter, error=self.rate_limited_error())
+        assert limiter.limit == 8
+        
+        clock.now = 5
+        self._run_round(limiter, error=self.rate_limited_error())
+        clock.now = 10
+        self._run_round(limiter, error=self.rate_limited_error())
+        clock.now = 15
+        self._run_round(limiter, error=self.rate_limited_error())
+        assert limiter.limit == 2  # Nunca abaixo do mínimo
+        assert limiter.stats()["decreases"] == 4
+    
+    def test_latency_spike_cuts_and_other_errors_only_hold(self):
+        """Verifica se um pico de latência corta o limite e erros comuns só impedem o aumento."""
+        from app.providers.resilience import AdaptiveConcurrencyLimiter
+        
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=8, latency_spike_factor=3.0)
+        assert limiter.acquire(0)
+        limiter.release(1.0)  # Referência de latência: 1s
+        assert all(limiter.acquire(0) for _ in range(8))
+        for _ in range(8):
+            limiter.release(1.0, ConnectionError("falha"))
+        assert limiter.limit == 8
+        
+        assert limiter.acquire(0)
+        limiter.release(5.0)  # 5x a referência
+        assert limiter.limit == 4
+    
+    def test_queue_is_bounded_and_fifo(self):
+        """Verifica se quem passa do limite espera na fila e desiste após o tempo máximo."""
+        from app.providers.resilience import AdaptiveConcurrencyLimiter
+        
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1, min_limit=1)
+        assert limiter.acquire(0)
+        
+        started = time.monotonic()
+        assert limiter.acquire(0.05) is False
+        assert time.monotonic() - started >= 0.05
+        
+        outcomes = []
+        waiter = threading.Thread(target=lambda: outcomes.append(limiter.acquire(5)))
+        waiter.start()
+        while limiter.stats()["queued"] == 0:
+            time.sleep(0.001)
+        limiter.release()  # Sem latência: a vaga passa para a fila sem ajustar o limite
+        waiter.join()
+        
+        assert outcomes == [True]
+        assert limiter.stats() == {
+            "limit": 1, "in_flight": 1, "queued": 0, "baseline_latency": None, "decreases": 0, "rejected_calls": 1
+        }
+    
+    def test_async_waiter_gets_released_slot(self):
+        """Verifica se a fila também funciona no event loop (sem prender threads)."""
+        import asyncio
+        from app.providers.resilience import AdaptiveConcurrencyLimiter
+        
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1, min_limit=1)
+        
+        async def scenario():
+            assert await limiter.acquire_async(0)
+            waiting = asyncio.ensure_future(limiter.acquire_async(5))
+            timed_out = await limiter.acquire_async(0.01)
+            limiter.release(0.1)
+            return timed_out, await waiting
+        
+        assert asyncio.run(scenario()) == (False, True)
+        assert limiter.stats()["in_flight"] == 1
+    
+    def test_overload_degrades_to_curation(self, monkeypatch):
+        """Verifica se, com o limite tomado, a análise vai para curadoria sem chamar o Gemini (nem em lote)."""
+        from app.providers.gemini_client import GeminiClient
+        from app.providers.resilience import AdaptiveConcurrencyLimiter
+        from app.services.email_analyzer import EmailAnalyzerService
+        
+        class CountingModel:
+            calls = 0
+            
+            def generate_content(self, *args, **kwargs):
+                CountingModel.calls += 1
+                raise AssertionError("não deveria chamar o Gemini")
+        
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1, min_limit=1, queue_timeout=0.01)
+        client = GeminiClient(api_key="chave-teste", model_name="gemini-2.5-flash", limiter=limiter)
+        client.model = CountingModel()
+        service = EmailAnalyzerService(client=client)
+        assert limiter.acquire(0)  # Outra requisição ocupa a única vaga
+        
+        single = service.analyze("email")
+        batch = service.analyze_batch(["email 1", "email 2", "email 3"])
+        
+        assert CountingModel.calls == 0
+        assert single["acao"] == "ENCAMINHAR_CURADORIA"
+        assert single["resumo"] == "Erro ao analisar: serviço de IA sobrecarregado no momento"
+        assert [result["resumo"] for result in batch] == [single["resumo"]] * 3
+        assert limiter.stats()["rejected_calls"] == 2
+    
+    def test_slot_returned_with_call_outcome(self, monkeypatch):
+        """Verifica se cada tentativa devolve a vaga (também entre retries) e informa o 429 ao limitador."""
+        from app.providers import gemini_client
+        from app.providers.resilience import AdaptiveConcurrencyLimiter
+        from benchmarks.fake_gemini import FakeGeminiClient, FakeGeminiProfile
+        
+        monkeypatch.setattr(gemini_client.time, "sleep", lambda seconds: None)
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=8)
+        client = FakeGeminiClient(api_key="chave-teste", model_name="gemini-2.5-flash", limiter=limiter,
+                                  profile=FakeGeminiProfile(burst_every=100, burst_length=1))
+        
+        assert '"categoria"' in client.generate_json("Email: reunião amanhã")
+        assert limiter.stats()["in_flight"] == 0
+        assert limiter.limit == 4  # O 429 da primeira tentativa cortou o limite
+
+
+class TestCircuitBreaker:
+    """Testes para o circuit breaker e o prazo das chamadas ao Gemini."""
+    
+    class Clock:
+        def __init__(self):
+            self.now = 0.0
+        
+        def __call__(self):
+            return self.now
+    
+    def test_opens_after_threshold_and_recovers_with_probe(self):
+        """Verifica fechado -> aberto -> meio-aberto (uma chamada de teste) -> fechado."""
+        from app.providers.resilience import CircuitBreaker
+        
+        clock = self.Clock()
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=10, clock=clock)
+        breaker.record_failure()
+        assert breaker.state == "closed"
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert not breaker.allow_request()
+        
+        clock.now = 10
+        assert breaker.state == "half_open"
+        assert breaker.allow_request()
+        assert not breaker.allow_request()  # Só uma chamada de teste por vez
+        breaker.record_success()
+        assert breaker.state == "closed"
+    
+    def test_failed_probe_reopens(self):
+        """Verifica se a chamada de teste que falha abre o circuito de novo."""
+        from app.providers.resilience import CircuitBreaker
+        
+        clock = self.Clock()
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=5, clock=clock)
+        breaker.record_failure()
+        clock.now = 5
+        assert breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert breaker.stats()["rejected_calls"] == 0
+    
+    def _client(self, model, **kwargs):
+        from app.providers.gemini_client import GeminiClient
+        
+        client = GeminiClient(api_key="chave-teste", model_name="gemini-2.5-flash", **kwargs)
+        client.model = model
+        return client
+    
+    class FailingModel:
+        def __init__(self):
+            self.calls = 0
+        
+        def generate_content(self, prompt, generation_config=None, request_options=None):
+            self.calls += 1
+            raise ConnectionError("Gemini fora do ar")
+    
+    def test_open_circuit_fails_fast_to_curation(self, monkeypatch):
+        """Verifica se, com o circuito aberto, a análise vai direto para curadoria sem chamar o Gemini."""
+        from app.providers import gemini_client
+        from app.providers.resilience import CircuitBreaker
+        from app.services.email_analyzer import EmailAnalyzerService
+        
+        monkeypatch.setattr(gemini_client.time, "sleep", lambda seconds: None)
+        model = self.FailingModel()
+        client = self._client(model, breaker=CircuitBreaker(failure_threshold=3, recovery_timeout=60))
+        service = EmailAnalyzerService(client=client)
+        
+        service.analyze("primeiro email")  # 3 tentativas falham e abrem o circuito
+        calls = model.calls
+        result = service.analyze("segundo email")
+        
+        assert calls == 3
+        assert model.calls == calls
+        assert result["acao"] == "ENCAMINHAR_CURADORIA"
+        assert result["resumo"].startswith("Erro ao")
+    
+    def test_retries_stop_at_deadline(self, monkeypatch):
+        """Verifica se nenhum retry começa quando não há tempo para ele."""
+        from app.providers import gemini_client
+        from app.providers.resilience import deadline_scope
+        
+        sleeps = []
+        monkeypatch.setattr(gemini_client.time, "sleep", sleeps.append)
+        model = self.FailingModel()
+        client = self._client(model, timeout=60)
+        
+        with deadline_scope(0.3):  # Menos que o menor backoff (0,5s)
+            with pytest.raises(ConnectionError):
+                client.generate_json("prompt")
+        
+        assert model.calls == 1
+        assert sleeps == []
+    
+    class FailingAsyncModel:
+        def __init__(self):
+            self.calls = 0
+        
+        async def generate_content_async(self, prompt, generation_config=None, request_options=None):
+            self.calls += 1
+            raise ConnectionError("Gemini fora do ar")
+    
+    def test_async_retries_wait_on_event_loop_and_open_circuit(self, monkeypatch):
+        """Verifica se a versão assíncrona faz os retries com asyncio.sleep e respeita o circuito."""
+        import asyncio
+        from app.providers import gemini_client
+        from app.providers.resilience import CircuitBreaker
+        from app.services.email_analyzer import EmailAnalyzerService
+        
+        sleeps = []
+        
+        async def fake_sleep(seconds):
+            sleeps.append(seconds)
+        
+        monkeypatch.setattr(gemini_client.time, "sleep", lambda seconds: pytest.fail("time.sleep no event loop"))
+        monkeypatch.setattr(gemini_client.asyncio, "sleep", fake_sleep)
+        model = self.FailingAsyncModel()
+        client = self._client(model, breaker=CircuitBreaker(failure_threshold=3, recovery_timeout=60))
+        service = EmailAnalyzerService(client=client)
+        
+        first = asyncio.run(service.analyze_async("primeiro email"))
+        second = asyncio.run(service.analyze_async("segundo email"))
+        
+        assert model.calls == 3
+        assert len(sleeps) == 2
+        assert first["acao"] == second["acao"] == "ENCAMINHAR_CURADORIA"
+    
+    def test_cancelled_probe_releases_half_open_circuit(self):
+        """Verifica se cancelar a chamada de teste (meio-aberto) não deixa o circuito recusando tudo."""
+        import asyncio
+        from app.providers.resilience import CircuitBreaker
+        
+        class HangingModel:
+            def __init__(self):
+                self.started = asyncio.Event()
+            
+            async def generate_content_async(self, prompt, generation_config=None, request_options=None):
+                self.started.set()
+                await asyncio.sleep(3600)
+        
+        clock = self.Clock()
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=5, clock=clock)
+        breaker.record_failure()
+        clock.now = 5  # Meio-aberto: a próxima chamada é a de teste
+        
+        async def cancel_probe():
+            model = HangingModel()
+            client = self._client(model, breaker=breaker)
+            task = asyncio.create_task(client.generate_json_async("prompt"))
+            await model.started.wait()
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        
+        asyncio.run(cancel_probe())
+        assert breaker.state == "half_open"
+        assert breaker.allow_request()  # Uma nova chamada de teste pode ser feita
+    
+    def test_attempt_timeout_is_capped_by_deadline(self):
+        """Verifica se o timeout da tentativa usa só o tempo que resta do prazo."""
+        from types import SimpleNamespace
+        from app.providers.resilience import deadline_scope
+        from app.utils.concurrency import map_bounded
+        
+        timeouts = []
+        
+        class RecordingModel:
+            def generate_content(self, prompt, generation_config=None, request_options=None):
+                timeouts.append(request_options["timeout"])
+                part = SimpleNamespace(text="{}")
+                return SimpleNamespace(text="{}", candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+        
+        client = self._client(RecordingModel(), timeout=600)
+        with deadline_scope(5):
+            # Também dentro das threads do lote (o contexto é copiado)
+            map_bounded(client.generate_json, ["a", "b"], max_workers=2)
+        
+        assert len(timeouts) == 2
+        assert all(0 < timeout <= 5 for timeout in timeouts)
+
+
+def build_training_samples(count=40):
+    """Exemplos sintéticos: spam, notificações automáticas e emails de trabalho."""
+    samples = []
+    for i in range(count):
+        samples.append((f"ganhe prêmio grátis clique aqui promoção imperdível desconto {i} oferta exclusiva", LABEL_SPAM))
+        samples.append((f"notificação automática pedido {i} enviado código rastreio acompanhe entrega não responda", LABEL_OTHER))
+        samples.append((f"reunião projeto cronograma cliente {i} precisa revisar contrato proposta prazo sexta", LABEL_GEMINI))
+    return samples
+
+
+class TestPreClassifier:
+    """Testes para o pré-classificador local (Naive Bayes com hashing)."""
+    
+    @pytest.fixture
+    def model(self):
+        return PreClassifier.train(build_training_samples(), threshold=0.9)
+    
+    def test_obvious_spam_skips_gemini(self, model):
+        """Verifica se spam óbvio é decidido localmente com alta confiança."""
+        label, confidence = model.decide("promoção imperdível: ganhe prêmio grátis, clique aqui")
+        assert label == LABEL_SPAM
+        assert confidence >= 0.9
+    
+    def test_business_email_goes_to_gemini(self, model):
+        """Verifica se emails de trabalho não são decididos localmente."""
+        assert model.predict("precisamos revisar o contrato e o cronograma do projeto")[0] == LABEL_GEMINI
+        assert model.decide("precisamos revisar o contrato e o cronograma do projeto") is None
+    
+    def test_low_confidence_goes_to_gemini(self):
+        """Verifica se o limiar de confiança é respeitado."""
+        model = PreClassifier.train(build_training_samples(), threshold=1.01)
+        assert model.decide("ganhe prêmio grátis clique aqui") is None
+    
+    def test_save_and_load_round_trip(self, model, tmp_path):
+        """Verifica se o modelo salvo em JSON prevê igual ao original."""
+        path = str(tmp_path / "modelo.json")
+        model.save(path)
+        loaded = PreClassifier.load(path, threshold=0.9)
+        
+        text = "notificação automática: seu pedido foi enviado, acompanhe a entrega"
+        assert loaded.predict(text) == model.predict(text)
+    
+    def test_calibration_raises_threshold_above_confident_mistakes(self, model):
+        """Verifica se o limiar calibrado deixa de fora erros que o modelo dá com confiança ~1."""
+        complaint = "reclamação da fatura cobrada em dobro: ganhe prêmio grátis clique aqui oferta desconto"
+        label, confidence = model.predict(complaint)
+        assert label == LABEL_SPAM and confidence > 0.9  # Confiante demais (o motivo da calibração)
+        
+        held_out = [(complaint, LABEL_GEMINI)] + [
+            (f"ganhe prêmio grátis clique aqui promoção imperdível desconto {i} oferta exclusiva cupom", LABEL_SPAM)
+            for i in range(200, 300)
+        ]
+        report = model.calibrate(held_out, target_precision=0.995)
+        
+        assert model.decide(complaint) is None
+        assert report["precision"] >= 0.995
+        assert report["coverage"] > 0.5
+    
+    def test_calibration_disables_shortcut_when_target_is_unreachable(self, model, tmp_path):
+        """Verifica se, sem limiar com a precisão pedida, o atalho fica desligado (também após salvar)."""
+        held_out = [("ganhe prêmio grátis clique aqui", LABEL_GEMINI)] * 3
+        
+        assert model.calibrate(held_out, target_precision=0.99)["threshold"] is None
+        path = str(tmp_path / "modelo.json")
+        model.save(path)
+        assert PreClassifier.load(path).decide("ganhe prêmio grátis clique aqui") is None
+    
+    def test_split_holdout_is_stable(self):
+        """Verifica se o holdout é reprodutível e não separa emails repetidos."""
+        samples = build_training_samples() + [("email repetido", LABEL_GEMINI)] * 5
+        train, held_out = split_holdout(samples, 0.2)
+        
+        assert (train, held_out) == split_holdout(samples, 0.2)
+        assert 0 < len(held_out) < len(samples)
+        assert ("email repetido", LABEL_GEMINI) not in train or ("email repetido", LABEL_GEMINI) not in held_out
+    
+    def test_training_requires_gemini_class(self):
+        """Verifica se um modelo sem a classe 'gemini' é recusado (ficaria confiante demais)."""
+        with pytest.raises(ValueError):
+            PreClassifier.train([("ganhe prêmio", LABEL_SPAM), ("pedido enviado", LABEL_OTHER)])
+    
+    def test_label_for_analysis(self):
+        """Verifica como as análises do Gemini viram classes de treino."""
+        assert label_for_analysis({"categoria": "Spam"}) == LABEL_SPAM
+        assert label_for_analysis({"categoria": "Outro", "atencao_humana": "NÃO"}) == LABEL_OTHER
+        assert label_for_analysis({"categoria": "Outro", "atencao_humana": "SIM"}) == LABEL_GEMINI
+        assert label_for_analysis({"categoria": "Urgente"}) == LABEL_GEMINI
+        assert label_for_analysis({"categoria": "Outro", "resumo": "Erro ao analisar: x"}) is None
+    
+    def test_iter_training_samples_skips_invalid_lines(self, tmp_path):
+        """Verifica a leitura do JSONL de análises (linhas inválidas são ignoradas)."""
+        path = tmp_path / "analises.jsonl"
+        path.write_text(
+            '{"text": "ganhe prêmio", "categoria": "Spam"}\n'
+            'não é json\n'
+            '{"categoria": "Spam"}\n'
+            '\n'
+            '{"email_content": "revisar contrato", "categoria": "Produtivo"}\n',
+            encoding="utf-8"
+        )
+        assert list(iter_training_samples(str(path))) == [("ganhe prêmio", LABEL_SPAM), ("revisar contrato", LABEL_GEMINI)]
+
+
+class TestOutboundDispatcher:
+    """Testes para os envios em background (resumo do curador, respostas automáticas)."""
+    
+    class FakeMailer:
+        """Mailer que guarda as mensagens; `failures` são devolvidas (em ordem) no lugar do envio."""
+        
+        def __init__(self, failures=(), delay=0.0):
+            from app.utils.email_sender import EmailSender
+            self.builder = EmailSender("smtp.exemplo.com", 587, "", "", default_from="mailmind@exemplo.com")
+            self.failures = list(failures)
+            self.delay = delay
+            self.sent = []
+            self.calls = 0
+        
+        def build_message(self, *args, **kwargs):
+            return self.builder.build_message(*args, **kwargs)
+        
+        def send_many(self, messages):
+            self.calls += 1
+            time.sleep(self.delay)
+            results = []
+            for msg in messages:
+                error = self.failures.pop(0) if self.failures else None
+                if error is None:
+                    self.sent.append(msg)
+                results.append(error)
+            return results
+    
+    @staticmethod
+    def record(sender="Cliente <cliente@empresa.com>", subject="Pedido 42", message_id="", content="Corpo"):
+        from app.utils.mail_parser import EmailRecord
+        return EmailRecord(content=content, sender=sender, subject=subject, message_id=message_id)
+    
+    @staticmethod
+    def wait_for(condition, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            assert time.monotonic() < deadline, "condição não atendida a tempo"
+            time.sleep(0.01)
+    
+    CURATION = {"categoria": "Reclamação", "atencao_humana": "SIM", "resumo": "Cliente irritado", "sugestao": "Ligar"}
+    RESOLVED = {"categoria": "Consulta", "atencao_humana": "NÃO", "resumo": "Dúvida", "sugestao": "Responder"}
+    
+    def test_curator_notifications_are_coalesced_into_digest(self):
+        """Verifica se vários emails para curadoria viram um único resumo ao curador."""
+        from app.services.outbound_dispatcher import OutboundDispatcher
+        
+        mailer = self.FakeMailer()
+        dispatcher = OutboundDispatcher(mailer, "curador@exemplo.com", digest_seconds=60, digest_max=3)
+        for i in range(3):
+            dispatcher.submit(self.record(subject=f"Problema {i}"), self.CURATION)
+        self.wait_for(lambda: dispatcher.stats()["sent"] == 1)
+        dispatcher.close()
+        
+        assert len(mailer.sent) == 1
+        digest = mailer.sent[0]
+        assert digest["To"] == "curador@exemplo.com"
+        assert digest["Subject"] == "[MailMind] 3 email(s) para curadoria"
+        body = digest.get_content()
+        assert all(f"Problema {i}" in body for i in range(3))
+        assert "Cliente irritado" in body
+    
+    def test_digest_is_sent_after_window(self):
+        """Verifica se um resumo incompleto sai quando o prazo de espera acaba."""
+        from app.services.outbound_dispatcher import OutboundDispatcher
+        
+        mailer = self.FakeMailer()
+        dispatcher = OutboundDispatcher(mailer, "curador@exemplo.com", digest_seconds=0.05, digest_max=100)
+        dispatcher.submit(self.record(), self.CURATION)
+        self.wait_for(lambda: len(mailer.sent) == 1)
+        dispatcher.close()
+        assert mailer.sent[0]["Subject"] == "[MailMind] 1 email(s) para curadoria"
+    
+    def test_submit_does_not_wait_for_smtp(self):
+        """Verifica se enfileirar é instantâneo mesmo com o SMTP lento."""
+        from app.services.outbound_dispatcher import OutboundDispatcher
+        
+        mailer = self.FakeMailer(delay=0.5)
+        dispatcher = OutboundDispatcher(mailer, "curador@exemplo.com", auto_reply=True, digest_max=1)
+        started = time.perf_counter()
+        for i in range(5):
+            dispatcher.submit(self.record(message_id=f"<{i}@x>"), self.CURATION)
+            dispatcher.submit(self.record(message_id=f"<{i}@x>"), self.RESOLVED)
+        assert time.perf_counter() - started < 0.1
+        dispatcher.close()
+        assert len(mailer.sent) == 10
+    
+    def test_auto_reply_rules(self):
+        """Verifica se só remetentes humanos de emails resolvidos recebem resposta automática."""
+        from app.services.outbound_dispatcher import OutboundDispatcher
+        
+        mailer = self.FakeMailer()
+        dispatcher = OutboundDispatcher(mailer, "", auto_reply=True, reply_from="nao-responda@exemplo.com")
+        dispatcher.submit(self.record(message_id="<1@x>"), self.RESOLVED)
+        dispatcher.submit(self.record(message_id="<1@x>"), self.RESOLVED)  # Mesmo email de novo
+        dispatcher.submit(self.record(sender="no-reply@loja.com"), self.RESOLVED)
+        dispatcher.submit(self.record(), {**self.RESOLVED, "categoria": "Spam"})
+        dispatcher.submit(self.record(), {**self.RESOLVED, "categoria": "Outro"})
+        dispatcher.submit(self.record(), {**self.RESOLVED, "classified_by": "pre_classifier"})
+        dispatcher.submit(self.record(), self.CURATION)  # Sem curador configurado: nada
+        dispatcher.close()
+        
+        assert len(mailer.sent) == 1
+        reply = mailer.sent[0]
+        assert reply["To"] == "cliente@empresa.com"
+        assert reply["From"] == "nao-responda@exemplo.com"
+        assert reply["Subject"] == "Re: Pedido 42"
+        assert reply["In-Reply-To"] == "<1@x>"
+        assert reply["Auto-Submitted"] == "auto-generated"
+    
+    def test_model_action_wins_over_atencao_humana(self):
+        """Verifica se a `acao_modelo` decide o envio quando discorda de `atencao_humana`."""
+        from app.app import build_result_data
+        from app.services.outbound_dispatcher import OutboundDispatcher
+        
+        analysis = {"categoria": "Consulta", "atencao_humana": "NÃO", "acao": "ENCAMINHAR_CURADORIA"}
+        assert build_result_data(analysis, self.record())["acao_modelo"] == "ENCAMINHAR_CURADORIA"
+        
+        mailer = self.FakeMailer()
+        dispatcher = OutboundDispatcher(mailer, "curador@exemplo.com", auto_reply=True, digest_max=1)
+        dispatcher.submit(self.record(message_id="<1@x>"), {**self.RESOLVED, "acao_modelo": "ENCAMINHAR_CURADORIA"})
+        dispatcher.submit(self.record(message_id="<2@x>"), {**self.CURATION, "acao_modelo": "RESPOSTA_AUTOMATICA"})
+        dispatcher.close()
+        
+        digest, = [msg for msg in mailer.sent if msg["To"] == "curador@exemplo.com"]
+        reply, = [msg for msg in mailer.sent if msg["To"] == "cliente@empresa.com"]
+        assert "Dúvida" in digest.get_content()
+        assert reply["In-Reply-To"] == "<2@x>"
+    
+    def test_failed_send_is_retried(self):
+        """Verifica se uma falha temporária é repetida depois do backoff."""
+        import smtplib
+        from app.services.outbound_dispatcher import OutboundDispatcher
+        
+        mailer = self.FakeMailer(failures=[smtplib.SMTPServerDisconnected("caiu")])
+        dispatcher = OutboundDispatcher(mailer, "curador@exemplo.com", digest_max=1, retry_seconds=0.01)
+        dispatcher.submit(self.record(), self.CURATION)
+        self.wait_for(lambda: len(mailer.sent) == 1)
+        dispatcher.close()
+        
+        assert mailer.calls == 2
+        assert dispatcher.stats()["retried"] == 1
+        assert dispatcher.dead_letters() == []
+    
+    def test_dead_letters_after_attempts_or_permanent_failure(self):
+        """Verifica se tentativas esgotadas e recusas 5xx vão para a lista de dead letters."""
+        import smtplib
+        from app.services.outbound_dispatcher import OutboundDispatcher
+        
+        refused = smtplib.SMTPRecipientsRefused({"cliente@empresa.com": (550, b"no such user")})
+        mailer = self.FakeMailer(failures=[refused] + [ConnectionError("recusada")] * 3)
+        dispatcher = OutboundDispatcher(mailer, "curador@exemplo.com", auto_reply=True, digest_max=1,
+                                        max_attempts=3, retry_seconds=0.01, workers=1)
+        dispatcher.submit(self.record(), self.RESOLVED)
+        self.wait_for(lambda: len(dispatcher.dead_letters()) == 1)
+        dispatcher.submit(self.record(), self.CURATION)
+        self.wait_for(lambda: len(dispatcher.dead_letters()) == 2)
+        dispatcher.close()
+        
+        reply, digest = dispatcher.dead_letters()
+        assert reply["kind"] == "reply" and reply["attempts"] == 1
+        assert "SMTPRecipientsRefused" in reply["error"]
+        assert digest["kind"] == "curator" and digest["attempts"] == 3
+        assert mailer.sent == []
+    
+    def test_close_sends_pending_digest(self):
+        """Verifica se o encerramento envia o resumo que ainda estava acumulando."""
+        from app.services.outbound_dispatcher import OutboundDispatcher
+        
+        mailer = self.FakeMailer()
+        dispatcher = OutboundDispatcher(mailer, "curador@exemplo.com", digest_seconds=3600)
+        dispatcher.submit(self.record(), self.CURATION)
+        dispatcher.submit(self.record(), self.CURATION)
+        dispatcher.close()
+        assert [msg["Subject"] for msg in mailer.sent] == ["[MailMind] 2 email(s) para curadoria"]
+
+
+class TestAnalysisStoreService:
+    """Testes para a gravação em lotes e as consultas do histórico de análises."""
+    
+    VERSION = "abc123def456"
+    
+    @classmethod
+    def key(cls, n):
+        return f"analysis:v2:{cls.VERSION}:{n:064x}"
+    
+    @pytest.fixture
+    def store(self, tmp_path):
+        from app.services.analysis_store import AnalysisStore
+        
+        store = AnalysisStore(str(tmp_path / "analyses.db"), batch_size=100)
+        yield store
+        store.close()
+    
+    def test_inserts_are_batched_off_the_caller_thread(self, store):
+        """Verifica se `add` só enfileira e a escritora grava tudo em poucas transações."""
+        started = time.perf_counter()
+        for i in range(2000):
+            store.add(self.key(i), {"categoria": "Produtivo", "atencao_humana": "NÃO", "sender": f"c{i}@x.com"})
+        enqueue_seconds = time.perf_counter() - started
+        assert store.flush()
+        
+        assert store.stats() == {"queued": 0, "written": 2000, "dropped": 0}
+        assert enqueue_seconds < 1.0
+    
+    def test_find_returns_latest_reusable_analysis(self, store):
+        """Verifica se a consulta antes do Gemini ignora análises de fallback e de outro conteúdo."""
+        store.add(self.key(1), {"categoria": "Consulta", "resumo": "antiga"})
+        store.add(self.key(1), {"categoria": "Consulta", "resumo": "nova"})
+        store.add(self.key(1), {"categoria": "Erro", "resumo": "Erro ao analisar"}, reusable=False)
+        store.flush()
+        
+        assert store.find(self.key(1))["resumo"] == "nova"
+        assert store.find(self.key(2)) is None
+        assert store.find(f"analysis:v2:outraversao:{1:064x}") is None
+    
+    def test_query_filters_and_cursor(self, store):
+        """Verifica filtros (remetente normalizado, categoria, curadoria) e paginação."""
+        for i in range(5):
+            store.add(self.key(i), {"categoria": "Urgente" if i % 2 else "Spam", "atencao_humana": "SIM" if i % 2 else "NÃO",
+                                    "sender": f"Cliente <Cliente{i % 2}@Empresa.com>"})
+        store.flush()
+        
+        page = store.query(limit=1, categoria="Urgente", atencao_humana="SIM")
+        rest = store.query(limit=10, before_id=page["next_cursor"], categoria="Urgente")
+        assert [item["sender"] for item in page["items"] + rest["items"]] == ["Cliente <Cliente1@Empresa.com>"] * 2
+        assert rest["next_cursor"] is None
+        assert len(store.query(sender="cliente0@empresa.com")["items"]) == 3
+        assert store.query(until=0)["items"] == []
+        with pytest.raises(ValueError):
+            store.query(assunto="x")
+
+
+class TestCacheWarmup:
+    """Testes para o aquecimento do cache ao subir uma instância."""
+    
+    @staticmethod
+    def entries(count, size=10):
+        return [(f"analysis:v2:v1:{i:064x}", '{"resumo": "' + "x" * size + '"}') for i in range(count)]
+    
+    def test_loads_entries_until_source_ends(self):
+        """Verifica se tudo é carregado (em blocos) quando cabe nos limites."""
+        from app.services.cache_warmup import WarmupReport, warm_cache
+        
+        loaded = {}
+        report = warm_cache(loaded.update, self.entries(250), WarmupReport("snapshot"),
+                            max_entries=1000, max_seconds=10, max_bytes=1 << 20)
+        
+        assert len(loaded) == report.loaded == 250
+        assert report.status == "done" and report.stopped_by == ""
+        assert loaded[self.entries(1)[0][0]] == {"resumo": "x" * 10}
+    
+    def test_stops_at_entry_memory_and_time_limits(self):
+        """Verifica cada limite do aquecimento."""
+        from app.services.cache_warmup import WarmupReport, warm_cache
+        
+        by_entries = warm_cache(lambda chunk: None, self.entries(50), WarmupReport("s"),
+                                max_entries=20, max_seconds=10, max_bytes=1 << 20)
+        by_memory = warm_cache(lambda chunk: None, self.entries(50, size=100), WarmupReport("s"),
+                               max_entries=1000, max_seconds=10, max_bytes=1000)
+        ticks = iter(range(100))
+        by_time = warm_cache(lambda chunk: None, self.entries(50), WarmupReport("s"),
+                             max_entries=1000, max_seconds=5, max_bytes=1 << 20, clock=lambda: next(ticks))
+        
+        assert (by_entries.loaded, by_entries.stopped_by) == (20, "entries")
+        assert (by_memory.loaded, by_memory.stopped_by) == (8, "memory")
+        assert by_time.stopped_by == "seconds" and by_time.loaded < 50
+    
+    def test_snapshot_round_trip_skips_other_versions(self, tmp_path):
+        """Verifica o formato do snapshot e o filtro pela versão atual do cache."""
+        from app.services.cache_warmup import iter_snapshot, write_snapshot
+        
+        path = str(tmp_path / "snapshot.jsonl")
+        entries = self.entries(3) + [("analysis:v2:antiga:" + "0" * 64, '{"resumo": "velho"}')]
+        assert write_snapshot(path, entries) == 4
+        with open(path, "a", encoding="utf-8") as snapshot:
+            snapshot.write("linha quebrada\n")
+        
+        assert list(iter_snapshot(path, "analysis:v2:v1:")) == [
+            (key, '{"resumo": "xxxxxxxxxx"}') for key, _ in self.entries(3)
+        ]
+
+
+class TestJobStore:
+    """Testes para a interface dos stores de jobs."""
+    
+    def test_incomplete_store_fails_on_creation(self):
+        """Verifica se um store sem todos os métodos falha ao ser criado, não no meio da requisição."""
+        from app.services.job_manager import InMemoryJobStore, JobStore
+        
+        class PartialStore(JobStore):
+            def create(self, job_id, total):
+                pass
+        
+        with pytest.raises(TypeError):
+            PartialStore()
+        store = InMemoryJobStore()
+        store.create("job-1", 2)
+        assert store.get("job-1")["total_emails"] == 2
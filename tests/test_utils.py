@@ -2,7 +2,16 @@
 Testes para funções utilitárias.
 """
 import pytest
+import io
+import time
 from app.utils.text_preprocess import normalize_whitespace, remove_stopwords, basic_preprocess
+from app.utils.concurrency import map_bounded
+from app.utils.pdf_extractor import PdfExtractor, PdfExtractionError, extract_pdf_text
+from app.utils.email_stream import iter_emails_from_stream, detect_split_mode
+from app.utils.mail_parser import EmailRecord, html_to_text, iter_mbox, parse_eml
+from app.utils.email_scanner import prepare_text, scan_emails, truncation_point
+from app.utils.smart_truncate import GAP_MARKER, estimate_tokens, smart_truncate
+from tests.conftest import build_pdf, build_eml
 
 
 class TestTextPreprocess:
@@ -61,3 +70,472 @@ class TestTextPreprocess:
         result = basic_preprocess(text)
         # Resultado pode ser vazio ou conter apenas espaços
         assert len(result.strip()) == 0
+
+
+class TestConcurrency:
+    """Testes para os helpers de concorrência."""
+    
+    def test_map_bounded_preserves_order(self):
+        """Verifica se a ordem de saída é a mesma da entrada, mesmo com tempos diferentes."""
+        def slow_double(n):
+            time.sleep(0.01 * (5 - n))
+            return n * 2
+        
+        assert map_bounded(slow_double, range(5), max_workers=5) == [0, 2, 4, 6, 8]
+    
+    def test_map_bounded_sequential_when_single_worker(self):
+        """Verifica se max_workers=1 processa tudo sem threads extras."""
+        assert map_bounded(str.upper, ["a", "b"], max_workers=1) == ["A", "B"]
+
+
+class TestPdfExtractor:
+    """Testes para a extração de texto de PDF."""
+    
+    def test_extract_reads_all_pages_within_budget(self):
+        """Verifica se todas as páginas são lidas quando cabem no limite."""
+        pdf = build_pdf(["Primeira pagina", "Segunda pagina", "Terceira pagina", "Quarta pagina"])
+        assert extract_pdf_text(pdf, max_chars=1000, max_pages=10) == (
+            "Primeira pagina Segunda pagina Terceira pagina Quarta pagina"
+        )
+    
+    def test_extract_stops_at_character_budget(self):
+        """Verifica se a leitura respeita o limite de caracteres configurado."""
+        pdf = build_pdf(["A" * 30, "B" * 30, "C" * 30])
+        text = extract_pdf_text(pdf, max_chars=40, max_pages=10)
+        
+        assert len(text) <= 40
+        assert "C" not in text
+    
+    def test_pool_extracts_text(self):
+        """Verifica se o pool de processos devolve o texto do PDF."""
+        extractor = PdfExtractor(max_workers=1)
+        try:
+            assert extractor.extract(build_pdf(["Texto do anexo"])) == "Texto do anexo"
+        finally:
+            extractor.close()
+    
+    def test_pool_rejects_invalid_pdf(self):
+        """Verifica se arquivos inválidos viram PdfExtractionError."""
+        extractor = PdfExtractor(max_workers=1)
+        try:
+            with pytest.raises(PdfExtractionError):
+                extractor.extract(b"isto nao e um pdf")
+        finally:
+            extractor.close()
+    
+    def test_pool_enforces_timeout(self):
+        """Verifica se o tempo limite por arquivo é aplicado."""
+        extractor = PdfExtractor(max_workers=1, timeout=0.001)
+        try:
+            with pytest.raises(PdfExtractionError):
+                extractor.extract(build_pdf([f"Pagina {i}" for i in range(300)]))
+            
+            extractor.timeout = 20  # Só o processo que estourou foi trocado
+            assert extractor.extract(build_pdf(["Depois"])) == "Depois"
+        finally:
+            extractor.close()
+    
+    def test_dead_idle_worker_is_replaced(self, monkeypatch):
+        """Verifica se um processo que morreu parado no pool é trocado e a extração repetida."""
+        extractor = PdfExtractor(max_workers=1)
+        try:
+            assert extractor.extract(build_pdf(["Antes"])) == "Antes"
+            dead = extractor._idle[0]
+            dead.process.kill()
+            dead.process.join(timeout=5)
+            monkeypatch.setattr(dead.process, "is_alive", lambda: True)  # Morte ainda não percebida
+            
+            assert extractor.extract(build_pdf(["Depois"])) == "Depois"
+            assert extractor._idle[0] is not dead
+        finally:
+            extractor.close()
+    
+    def test_queue_wait_does_not_count_towards_timeout(self):
+        """Verifica se o tempo limite começa quando o PDF chega ao processo (não na fila)."""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        pdf = build_pdf([f"Pagina {i} " * 20 for i in range(300)])
+        extractor = PdfExtractor(max_workers=1, max_chars=10 ** 7, max_pages=1000)
+        try:
+            extractor.extract(build_pdf(["Aquecimento"]))  # Processo já iniciado
+            started = time.perf_counter()
+            extractor.extract(pdf)
+            single = time.perf_counter() - started
+            extractor.timeout = single * 3 + 0.1
+            
+            # O último da fila espera ~5x o tempo de um PDF antes de começar
+            with ThreadPoolExecutor(max_workers=6) as executor:
+                texts = list(executor.map(extractor.extract, [pdf] * 6))
+            
+            assert all(text.startswith("Pagina 0") for text in texts)
+        finally:
+            extractor.close()
+
+
+class TestEmailStream:
+    """Testes para a divisão de emails em streaming."""
+    
+    def split(self, content):
+        return list(iter_emails_from_stream(io.BytesIO(content.encode("utf-8"))))
+    
+    def test_splits_on_separator_lines(self, batch_emails):
+        """Verifica se linhas --- separam os emails."""
+        emails = self.split(batch_emails.replace("Ganhe dinheiro rápido!", "Ganhe dinheiro rápido com esta oferta!"))
+        
+        assert [e.splitlines()[0] for e in emails] == [
+            "From: cliente1@empresa.com", "From: suporte@empresa.com", "From: spam@bad.com"
+        ]
+    
+    def test_splits_on_from_lines_without_separators(self):
+        """Verifica se, sem separadores, cada From: inicia um email."""
+        content = (
+            "cabeçalho ignorado\n"
+            "From: a@x.com\nSubject: Primeiro\n\nConteúdo suficiente para passar do mínimo.\n"
+            "From: b@x.com\nSubject: Segundo\n\nOutro conteúdo suficiente para passar do mínimo.\n"
+        )
+        emails = self.split(content)
+        
+        assert len(emails) == 2
+        assert emails[0].startswith("From: a@x.com")
+        assert emails[1].startswith("From: b@x.com")
+    
+    def test_single_email_is_returned_whole(self, sample_email):
+        """Verifica se um email sem fronteiras volta inteiro."""
+        assert self.split(sample_email) == [sample_email.strip()]
+    
+    def test_small_fragments_fall_back_to_whole_content(self):
+        """Verifica se, quando todos os trechos são pequenos, o arquivo vira um email só."""
+        assert self.split("oi\n---\ntchau\n") == ["oi\n---\ntchau"]
+    
+    def test_separator_has_priority_over_from_lines(self):
+        """Verifica se o modo separador é escolhido mesmo com vários From:."""
+        content = "From: a@x.com\nFrom: b@x.com\n---\nresto"
+        assert detect_split_mode(io.BytesIO(content.encode())) == "separator"
+
+
+class TestMailParser:
+    """Testes para a leitura de arquivos .eml e mbox."""
+    
+    def test_parse_eml_extracts_headers_once(self):
+        """Verifica se os cabeçalhos principais vão para o EmailRecord."""
+        record = parse_eml(io.BytesIO(build_eml(
+            sender="Ana <ana@empresa.com>", subject="Proposta", body="Segue a proposta.",
+            message_id="<abc@empresa.com>", in_reply_to="<xyz@cliente.com>"
+        )))
+        
+        assert record.sender == "ana@empresa.com"
+        assert record.subject == "Proposta"
+        assert record.message_id == "<abc@empresa.com>"
+        assert record.in_reply_to == "<xyz@cliente.com>"
+        assert record.content.startswith("From: Ana <ana@empresa.com>\nSubject: Proposta")
+    
+    def test_parse_eml_prefers_plain_text_and_skips_attachments(self):
+        """Verifica se o corpo vem do text/plain e anexos ficam de fora."""
+        record = parse_eml(io.BytesIO(build_eml(
+            body="Texto simples", html="<p>Versão HTML</p>", attachment=b"SEGREDO-DO-ANEXO"
+        )))
+        
+        assert "Texto simples" in record.content
+        assert "HTML" not in record.content
+        assert "SEGREDO" not in record.content
+    
+    def test_parse_eml_converts_html_only_body(self):
+        """Verifica se um email só com HTML vira texto."""
+        record = parse_eml(io.BytesIO(build_eml(body=None, html="<p>Olá</p><script>x()</script><p>mundo</p>")))
+        assert record.content.endswith("Olá\nmundo")
+    
+    def test_html_to_text_ignores_style(self):
+        """Verifica se CSS não aparece no texto convertido."""
+        assert html_to_text("<style>p {color: red}</style><div>conteúdo</div>") == "conteúdo"
+    
+    def test_iter_mbox_yields_each_message(self):
+        """Verifica se cada mensagem do mbox vira um EmailRecord."""
+        first = build_eml(sender="a@x.com", subject="Um", body="Corpo um\n>From aqui")
+        second = build_eml(sender="b@x.com", subject="Dois", body="Corpo dois")
+        mbox = b"From a@x.com Mon Jan  1 00:00:00 2024\n" + first + b"\n"
+        mbox += b"From b@x.com Mon Jan  1 00:00:00 2024\n" + second + b"\n"
+        
+        records = list(iter_mbox(io.BytesIO(mbox)))
+        
+        assert [r.sender for r in records] == ["a@x.com", "b@x.com"]
+        assert "From aqui" in records[0].content
+    
+    def test_record_from_text_uses_regex_headers(self, sample_email):
+        """Verifica se texto livre também vira EmailRecord com remetente e assunto."""
+        record = EmailRecord.from_text(sample_email)
+        assert record.sender == "teste@exemplo.com"
+        assert record.subject == "Teste de Email"
+
+
+class TestEmailScanner:
+    """Testes para o scanner de emails em passada única."""
+    
+    def test_scan_splits_by_separator_with_headers(self):
+        """Verifica divisão por separador junto com remetente e assunto."""
+        first = "From: ana@exemplo.com\nSubject: Primeiro\n\n" + "Conteúdo do primeiro email. " * 3
+        second = "From: bia@exemplo.com\nSubject: Segundo\n\n" + "Conteúdo do segundo email. " * 3
+        
+        emails = scan_emails(f"{first}\n---\n{second}")
+        
+        assert [e.text for e in emails] == [first.strip(), second.strip()]
+        assert [e.sender for e in emails] == ["ana@exemplo.com", "bia@exemplo.com"]
+        assert [e.subject for e in emails] == ["Primeiro", "Segundo"]
+    
+    def test_scan_splits_by_from_lines(self):
+        """Verifica divisão por linhas From: quando não há separador."""
+        content = "".join(
+            f"From: user{i}@exemplo.com\nSubject: Email {i}\n\n{'texto do email ' * 5}\n" for i in range(3)
+        )
+        emails = scan_emails(content)
+        assert [e.sender for e in emails] == [f"user{i}@exemplo.com" for i in range(3)]
+    
+    def test_scan_matches_previous_functions(self, sample_email):
+        """Verifica se o scanner produz o mesmo resultado das funções separadas."""
+        long_email = sample_email + "\n" + "Texto longo com várias palavras para o Gemini. " * 40
+        
+        scanned = scan_emails(long_email)[0]
+        record = EmailRecord.from_text(long_email.strip())
+        
+        assert scanned.sender == record.sender
+        assert scanned.subject == record.subject
+        assert scanned.gemini_input == basic_preprocess(smart_truncate(long_email.strip()))
+    
+    def test_prepare_text_keeps_short_text(self):
+        """Verifica se textos curtos vão ao Gemini sem pré-processamento."""
+        assert prepare_text("Olá,  tudo bem?") == "Olá,  tudo bem?"
+    
+    def test_truncation_point_prefers_last_period(self):
+        """Verifica se o corte recua até o último ponto perto do limite."""
+        text = "a" * 90 + "." + "b" * 50
+        assert truncation_point(text, 100) == 91
+        assert truncation_point("curto", 100) == 5
+    
+    def test_to_record_carries_gemini_input(self, sample_email):
+        """Verifica se o EmailRecord reaproveita o texto já preparado."""
+        record = scan_emails(sample_email)[0].to_record()
+        assert record.sender == "teste@exemplo.com"
+        assert record.gemini_input == prepare_text(record.content)
+    
+    def test_scan_respects_token_budget(self):
+        """Verifica se o orçamento de tokens chega ao texto preparado."""
+        content = "Texto comprido sobre o pedido do cliente. " * 100
+        small = scan_emails(content, token_budget=50)[0]
+        large = scan_emails(content, token_budget=500)[0]
+        assert len(small.gemini_input) < len(large.gemini_input)
+        assert estimate_tokens(small.gemini_input) <= 50
+
+
+class TestSmartTruncate:
+    """Testes para o truncamento por orçamento de tokens."""
+    
+    @pytest.fixture
+    def long_thread(self):
+        """Email com cabeçalhos, vários parágrafos, assinatura e histórico citado."""
+        paragraphs = [f"Parágrafo {i} com detalhes do pedido número {i} e mais contexto." * 3 for i in range(12)]
+        return (
+            "From: cliente@exemplo.com\nSubject: Pedido atrasado\n\n"
+            + "\n\n".join(paragraphs)
+            + "\n\nPreciso de uma resposta até sexta.\nAtenciosamente, Maria"
+            + "\n\nEm 10/05/2024, suporte@empresa.com escreveu:\n> Recebemos seu pedido.\n> " + "histórico " * 200
+        )
+    
+    def test_short_text_unchanged(self):
+        """Verifica se emails dentro do orçamento passam sem mudança (nem o histórico é cortado)."""
+        assert smart_truncate("  Olá, tudo bem?  ", 100) == "Olá, tudo bem?"
+    
+    def test_respects_budget(self, long_thread):
+        """Verifica se o resultado cabe no orçamento."""
+        for budget in (40, 100, 250, 600):
+            assert estimate_tokens(smart_truncate(long_thread, budget)) <= budget
+    
+    def test_keeps_headers_beginning_and_end(self, long_thread):
+        """Verifica se cabeçalhos, primeiro parágrafo e fechamento são mantidos."""
+        result = smart_truncate(long_thread, 250)
+        assert result.startswith("From: cliente@exemplo.com\nSubject: Pedido atrasado")
+        assert "Parágrafo 0" in result
+        assert "Preciso de uma resposta até sexta." in result
+        assert GAP_MARKER in result
+    
+    def test_drops_quoted_history(self, long_thread):
+        """Verifica se o histórico citado é descartado (e o corpo novo inteiro cabe)."""
+        result = smart_truncate(long_thread, 1000)
+        assert GAP_MARKER not in result
+        assert "escreveu:" not in result
+        assert "Recebemos seu pedido" not in result
+        assert "histórico" not in result
+    
+    def test_strips_quoted_lines_and_original_message(self):
+        """Verifica linhas com ">" e o marcador de mensagem original."""
+        body = ("Resposta nova. " * 30 + "\n> citado antigo\n" + "Mais resposta. " * 30
+                + "\n\n-----Original Message-----\nFrom: x@y.com\n" + "velho " * 100)
+        result = smart_truncate(body, 300)
+        assert "citado antigo" not in result
+        assert "velho" not in result
+        assert "Mais resposta." in result
+    
+    def test_deterministic(self, long_thread):
+        """Verifica se a mesma entrada sempre gera a mesma saída (chave de cache estável)."""
+        assert smart_truncate(long_thread, 120) == smart_truncate(long_thread, 120)
+    
+    def test_single_huge_paragraph_cut_at_boundary(self):
+        """Verifica o corte de um parágrafo único no fim de uma frase."""
+        text = "Frase curta número um. " * 200
+        result = smart_truncate(text, 50)
+        assert estimate_tokens(result) <= 50
+        assert result.split(GAP_MARKER)[0].strip().endswith(".")
+
+
+class FakeSMTP:
+    """Substituto de `smtplib.SMTP`: registra conexões, logins e mensagens."""
+    instances = []
+    
+    def __init__(self, host, port, timeout=None):
+        self.logins = 0
+        self.sent = []
+        self.closed = False
+        self.fail_next = None  # Exceção lançada no próximo send_message
+        FakeSMTP.instances.append(self)
+    
+    def starttls(self):
+        pass
+    
+    def login(self, username, password):
+        self.logins += 1
+    
+    def send_message(self, msg):
+        if self.fail_next is not None:
+            error, self.fail_next = self.fail_next, None
+            raise error
+        self.sent.append(msg["To"])
+    
+    def quit(self):
+        self.closed = True
+    
+    def close(self):
+        self.closed = True
+
+
+class TestEmailSender:
+    """Testes para o pool de conexões SMTP do EmailSender."""
+    
+    @pytest.fixture(autouse=True)
+    def fake_smtp(self, monkeypatch):
+        from app.utils import email_sender
+        
+        FakeSMTP.instances = []
+        monkeypatch.setattr(email_sender.smtplib, "SMTP", FakeSMTP)
+        return FakeSMTP
+    
+    def _sender(self, **kwargs):
+        from app.utils.email_sender import EmailSender
+        return EmailSender("smtp.exemplo.com", 587, "usuario", "senha", default_from="nao-responda@exemplo.com", **kwargs)
+    
+    def test_connection_is_reused_between_sends(self):
+        """Verifica se vários envios usam a mesma conexão, com um login só."""
+        sender = self._sender()
+        for i in range(5):
+            sender.send(f"destino{i}@exemplo.com", "Assunto", "Corpo")
+        
+        assert len(FakeSMTP.instances) == 1
+        assert FakeSMTP.instances[0].logins == 1
+        assert len(FakeSMTP.instances[0].sent) == 5
+    
+    def test_connection_recycled_after_max_messages(self):
+        """Verifica se a conexão é trocada depois de N mensagens."""
+        sender = self._sender(max_messages_per_connection=2)
+        for i in range(5):
+            sender.send(f"destino{i}@exemplo.com", "Assunto", "Corpo")
+        
+        assert [len(smtp.sent) for smtp in FakeSMTP.instances] == [2, 2, 1]
+        assert [smtp.closed for smtp in FakeSMTP.instances] == [True, True, False]
+    
+    def test_idle_connection_is_replaced(self):
+        """Verifica se uma conexão parada além do idle_timeout é fechada e substituída."""
+        sender = self._sender(idle_timeout=60)
+        sender.send("a@exemplo.com", "Assunto", "Corpo")
+        sender._idle[0].last_used -= 61
+        sender.send("b@exemplo.com", "Assunto", "Corpo")
+        
+        assert len(FakeSMTP.instances) == 2
+        assert FakeSMTP.instances[0].closed
+    
+    def test_dead_connection_reconnects_and_delivers(self):
+        """Verifica se uma conexão reaproveitada que caiu é reaberta e a mensagem entregue."""
+        import smtplib
+        
+        sender = self._sender()
+        sender.send("a@exemplo.com", "Assunto", "Corpo")
+        FakeSMTP.instances[0].fail_next = smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        sender.send("b@exemplo.com", "Assunto", "Corpo")
+        
+        assert len(FakeSMTP.instances) == 2
+        assert FakeSMTP.instances[1].sent == ["b@exemplo.com"]
+        assert sender._idle[0].smtp is FakeSMTP.instances[1]
+    
+    def test_send_many_reports_each_message(self):
+        """Verifica se uma recusa não interrompe o lote e a sessão continua em uso."""
+        import smtplib
+        
+        sender = self._sender()
+        messages = [sender.build_message(f"destino{i}@exemplo.com", "Assunto", "Corpo") for i in range(3)]
+        sender.send("aquecimento@exemplo.com", "Assunto", "Corpo")
+        FakeSMTP.instances[0].fail_next = smtplib.SMTPRecipientsRefused({"destino0@exemplo.com": (550, b"no")})
+        
+        results = sender.send_many(messages)
+        
+        assert isinstance(results[0], smtplib.SMTPRecipientsRefused)
+        assert results[1:] == [None, None]
+        assert len(FakeSMTP.instances) == 1
+        assert FakeSMTP.instances[0].sent == ["aquecimento@exemplo.com", "destino1@exemplo.com", "destino2@exemplo.com"]
+    
+    def test_send_many_recycles_session_mid_batch(self):
+        """Verifica se um lote grande troca de conexão ao chegar no máximo de mensagens."""
+        sender = self._sender(max_messages_per_connection=2)
+        messages = [sender.build_message(f"destino{i}@exemplo.com", "Assunto", "Corpo") for i in range(5)]
+        
+        assert sender.send_many(messages) == [None] * 5
+        assert [len(smtp.sent) for smtp in FakeSMTP.instances] == [2, 2, 1]
+        assert [smtp.closed for smtp in FakeSMTP.instances] == [True, True, False]
+    
+    def test_service_closing_421_retries_on_new_session(self):
+        """Verifica se um 421 no meio do lote reenvia a mensagem uma vez por uma sessão nova."""
+        import smtplib
+        
+        sender = self._sender()
+        messages = [sender.build_message(f"destino{i}@exemplo.com", "Assunto", "Corpo") for i in range(3)]
+        sender.send("aquecimento@exemplo.com", "Assunto", "Corpo")
+        FakeSMTP.instances[0].fail_next = smtplib.SMTPDataError(421, b"Service not available, closing channel")
+        
+        assert sender.send_many(messages) == [None, None, None]
+        assert FakeSMTP.instances[0].closed
+        assert FakeSMTP.instances[1].sent == ["destino0@exemplo.com", "destino1@exemplo.com", "destino2@exemplo.com"]
+    
+    def test_send_raises_on_failure(self):
+        """Verifica se `send` continua lançando a exceção do envio."""
+        import smtplib
+        
+        sender = self._sender()
+        sender.send("a@exemplo.com", "Assunto", "Corpo")
+        FakeSMTP.instances[0].fail_next = smtplib.SMTPDataError(554, b"rejeitada")
+        
+        with pytest.raises(smtplib.SMTPDataError):
+            sender.send("b@exemplo.com", "Assunto", "Corpo")
+        sender.send("c@exemplo.com", "Assunto", "Corpo")  # A sessão continua boa
+        assert len(FakeSMTP.instances) == 1
+    
+    def test_concurrent_sends_bounded_by_pool_size(self, monkeypatch):
+        """Verifica se envios simultâneos abrem no máximo `pool_size` conexões."""
+        sender = self._sender(pool_size=2)
+        original = FakeSMTP.send_message
+        
+        def slow_send(smtp, msg):
+            time.sleep(0.01)
+            original(smtp, msg)
+        
+        monkeypatch.setattr(FakeSMTP, "send_message", slow_send)
+        map_bounded(lambda i: sender.send(f"destino{i}@exemplo.com", "Assunto", "Corpo"), range(20), max_workers=8)
+        
+        assert len(FakeSMTP.instances) == 2
+        assert sum(len(smtp.sent) for smtp in FakeSMTP.instances) == 20
+        sender.close()
+        assert all(smtp.closed for smtp in FakeSMTP.instances)